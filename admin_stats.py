@@ -0,0 +1,166 @@
+"""
+Admin dashboard counters from a shared, short-lived snapshot.
+
+The dashboard header and the admin sidebar show counts over the whole user,
+item and contact message tables. Instead of ten COUNT/SUM queries per admin
+page load, one conditional-aggregate query per table (SUM(CASE WHEN ...))
+fills a per-process snapshot that is reused for ADMIN_STATS_TTL seconds.
+
+A commit that changes an item, a contact message, a user's ban/appeal
+fields or adds/deletes a user marks the snapshot stale, so this process
+shows its own writes immediately; other processes catch up within the TTL.
+
+Usage:
+    stats = get_admin_stats()
+    stats['pending_items']
+"""
+
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import case, event, func, inspect
+
+from app import db
+from models import User, Item, ContactMessage
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+# User columns that feed the counters; other user updates (logins, credits) do not
+_USER_STAT_FIELDS = ('is_banned', 'appeal_message', 'unban_request_date')
+
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def compute_admin_stats():
+    """Run the three aggregate queries and return a fresh stats dict."""
+    users = db.session.query(
+        func.count(User.id),
+        _count_if(db.and_(User.is_banned == True,
+                          User.appeal_message != None,
+                          User.unban_request_date != None)),
+    ).one()
+
+    items = db.session.query(
+        func.count(Item.id),
+        _count_if(Item.status == 'approved'),
+        _count_if(Item.status == 'pending'),
+        _count_if(Item.status == 'rejected'),
+        _count_if(Item.is_available == False),
+        func.coalesce(func.sum(case((Item.is_available == False, Item.value), else_=0)), 0),
+    ).one()
+
+    pending_messages = db.session.query(
+        _count_if(db.and_(ContactMessage.is_read == False, ContactMessage.status == 'pending'))
+    ).scalar()
+
+    return {
+        'total_users': users[0],
+        'pending_appeals': users[1],
+        'total_items': items[0],
+        'approved_items': items[1],
+        'pending_items': items[2],
+        'rejected_items': items[3],
+        'traded_items': items[4],
+        'total_credits_traded': items[5],
+        'pending_messages': pending_messages,
+    }
+
+
+class StatsSnapshot:
+    """Per-process stats dict, recomputed by one thread when older than ttl or invalidated."""
+
+    def __init__(self, ttl=5):
+        self.ttl = ttl
+        self._stats = None
+        self._taken_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        stats = self._stats
+        if stats is not None and time.monotonic() - self._taken_at < self.ttl:
+            return stats
+
+        # Another thread is refreshing: serve the previous snapshot rather than queue up
+        if not self._lock.acquire(blocking=stats is None):
+            return stats
+        try:
+            if self._stats is not None and time.monotonic() - self._taken_at < self.ttl:
+                return self._stats
+            self._stats = compute_admin_stats()
+            self._taken_at = time.monotonic()
+            return self._stats
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        self._taken_at = 0.0
+
+
+def get_snapshot(app=None):
+    """Return the app's stats snapshot, creating it on first use."""
+    app = app or current_app._get_current_object()
+    snapshot = app.extensions.get('barterex_admin_stats')
+    if snapshot is None:
+        snapshot = StatsSnapshot(ttl=app.config.get('ADMIN_STATS_TTL', 5))
+        app.extensions['barterex_admin_stats'] = snapshot
+    return snapshot
+
+
+def get_admin_stats():
+    """Current admin counters (keys as returned by compute_admin_stats)."""
+    return get_snapshot().get()
+
+
+def invalidate_admin_stats():
+    get_snapshot().invalidate()
+
+
+# ==================== INVALIDATION ON WRITES ====================
+
+def _affects_stats(obj, deleted=False):
+    if isinstance(obj, (Item, ContactMessage)):
+        return True
+    if isinstance(obj, User):
+        state = inspect(obj)
+        if deleted or state.pending or not state.has_identity:
+            return True
+        return any(state.attrs[field].history.has_changes() for field in _USER_STAT_FIELDS)
+    return False
+
+
+@event.listens_for(db.session, 'before_flush')
+def _mark_stats_writes(session, flush_context, instances):
+    if session.info.get('admin_stats_dirty'):
+        return
+    if (any(_affects_stats(obj) for obj in session.new)
+            or any(_affects_stats(obj) for obj in session.dirty)
+            or any(_affects_stats(obj, deleted=True) for obj in session.deleted)):
+        session.info['admin_stats_dirty'] = True
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _mark_stats_bulk_writes(orm_execute_state):
+    # Item.mark_sold / Item.approve and other UPDATE/DELETE statements bypass the flush.
+    # Bulk User updates only touch credits/points, which the counters ignore.
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in (Item, ContactMessage):
+            orm_execute_state.session.info['admin_stats_dirty'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('admin_stats_dirty', False):
+        try:
+            invalidate_admin_stats()
+        except RuntimeError:
+            pass  # committed outside an app context; the TTL covers it
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('admin_stats_dirty', None)
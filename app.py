@@ -31,6 +31,21 @@ app.config['ALLOWED_EXTENSIONS'] = ALLOWED_EXTENSIONS
 app.config['FILE_UPLOAD_MAX_SIZE'] = 10 * 1024 * 1024  # 10MB default per file
 app.config['FILE_UPLOAD_ENABLE_VIRUS_SCAN'] = False  # Set to True if ClamAV is available (apt-get install clamav)
 
+# ✅ Image storage backend: 'local' (static/uploads) or 's3' (AWS S3 / MinIO, needs boto3)
+app.config['STORAGE_BACKEND'] = os.getenv('STORAGE_BACKEND', 'local')
+app.config['S3_BUCKET'] = os.getenv('S3_BUCKET')
+app.config['S3_ENDPOINT_URL'] = os.getenv('S3_ENDPOINT_URL')  # e.g. http://localhost:9000 for MinIO
+app.config['S3_REGION'] = os.getenv('S3_REGION', 'us-east-1')
+app.config['S3_PRESIGN_EXPIRES'] = int(os.getenv('S3_PRESIGN_EXPIRES', 3600))  # Presigned GET lifetime (seconds)
+app.config['STORAGE_ASYNC_UPLOADS'] = os.getenv('STORAGE_ASYNC_UPLOADS', 'True').lower() in ['true', '1', 'yes']
+app.config['S3_UPLOAD_ATTEMPTS'] = int(os.getenv('S3_UPLOAD_ATTEMPTS', 5))  # Tries per upload, with exponential backoff
+app.config['S3_UPLOAD_RETRY_AFTER'] = int(os.getenv('S3_UPLOAD_RETRY_AFTER', 300))  # Seconds before a failed upload is retried again
+
+# ✅ Media serving (/media/<filename>): optional web-server offload
+app.config['MEDIA_URL_PREFIX'] = '/media'
+app.config['MEDIA_X_ACCEL_PREFIX'] = os.getenv('MEDIA_X_ACCEL_PREFIX')  # nginx internal location, e.g. /protected-uploads/
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', 'False').lower() in ['true', '1', 'yes']  # Apache/lighttpd
+
 # ✅ Load config from environment variables
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-change-in-production')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///barter.db')
@@ -60,6 +75,51 @@ app.config['MAIL_DEFAULT_SENDER'] = (mail_sender_name.strip(), mail_sender_email
 # ✅ Suppress Flask-Mail debug output
 app.config['MAIL_DEBUG'] = os.getenv('MAIL_DEBUG', 'False').lower() in ['true', '1', 'yes']
 
+# ✅ Mail queue - durable outgoing_email table drained by one pooled SMTP sender per process
+# Set MAIL_QUEUE_WORKER_ENABLED=False when a separate `flask mail run` process delivers the queue
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = os.getenv('MAIL_QUEUE_WORKER_ENABLED', 'True').lower() in ['true', '1', 'yes']
+app.config['MAIL_QUEUE_BATCH_SIZE'] = int(os.getenv('MAIL_QUEUE_BATCH_SIZE', 50))
+app.config['MAIL_QUEUE_POLL_INTERVAL'] = int(os.getenv('MAIL_QUEUE_POLL_INTERVAL', 10))  # seconds between idle polls
+app.config['MAIL_RATE_LIMIT'] = float(os.getenv('MAIL_RATE_LIMIT', 10))  # messages/second per process, 0 = unlimited
+app.config['MAIL_MAX_ATTEMPTS'] = int(os.getenv('MAIL_MAX_ATTEMPTS', 6))
+app.config['MAIL_CONNECTION_IDLE_TIMEOUT'] = int(os.getenv('MAIL_CONNECTION_IDLE_TIMEOUT', 60))  # close idle SMTP connection
+app.config['MAIL_MAX_EMAILS'] = int(os.getenv('MAIL_MAX_EMAILS', 0)) or None  # reconnect after N messages (None = never)
+app.config['EMAIL_BUILD_DIR'] = os.getenv('EMAIL_BUILD_DIR')  # precompiled email templates (`flask emails build`), default instance/email_templates
+
+# ✅ Outbox worker (post-commit side effects: notifications, emails, bonuses)
+# Set OUTBOX_WORKER_ENABLED=False when a separate `flask outbox run` process handles the queue
+app.config['OUTBOX_WORKER_ENABLED'] = os.getenv('OUTBOX_WORKER_ENABLED', 'True').lower() in ['true', '1', 'yes']
+app.config['OUTBOX_POLL_INTERVAL'] = int(os.getenv('OUTBOX_POLL_INTERVAL', 5))  # seconds between idle polls
+app.config['BASE_URL'] = os.getenv('BASE_URL', 'http://localhost:5000')  # external links in background emails
+
+# ✅ Idempotency keys (checkout, payment verification, Paystack webhooks)
+app.config['IDEMPOTENCY_KEY_TTL'] = int(os.getenv('IDEMPOTENCY_KEY_TTL', 86400))  # seconds a recorded result is replayed
+app.config['IDEMPOTENCY_LEASE_SECONDS'] = int(os.getenv('IDEMPOTENCY_LEASE_SECONDS', 120))  # unfinished claim older than this is taken over
+app.config['IDEMPOTENCY_CACHE_SIZE'] = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 4096))  # in-process LRU of recorded results
+
+# ✅ PDF receipts - pre-generated by the outbox, cached per order version
+app.config['RECEIPT_CACHE_DIR'] = os.getenv('RECEIPT_CACHE_DIR')  # default instance/receipts
+
+# ✅ Admin dashboard counters - shared snapshot, recomputed after this long or on relevant writes
+app.config['ADMIN_STATS_TTL'] = float(os.getenv('ADMIN_STATS_TTL', 5))  # seconds
+
+# ✅ Admin order SSE stream - one shared broadcaster per process (LISTEN/NOTIFY on PostgreSQL)
+app.config['ORDER_STREAM_POLL_INTERVAL'] = int(os.getenv('ORDER_STREAM_POLL_INTERVAL', 5))  # seconds between count checks
+app.config['ORDER_STREAM_HEARTBEAT'] = int(os.getenv('ORDER_STREAM_HEARTBEAT', 15))  # keepalive comment on idle connections
+app.config['ORDER_UPDATES_SETTLE_SECONDS'] = int(os.getenv('ORDER_UPDATES_SETTLE_SECONDS', 30))  # /api/order-updates cursor trails now by this (longest order transaction)
+
+# ✅ User notification SSE stream - one broadcaster per process, pushes on commit (LISTEN/NOTIFY on PostgreSQL)
+app.config['NOTIFICATION_STREAM_POLL_INTERVAL'] = int(os.getenv('NOTIFICATION_STREAM_POLL_INTERVAL', 5))  # other-process changes, non-PostgreSQL only
+app.config['NOTIFICATION_STREAM_HEARTBEAT'] = int(os.getenv('NOTIFICATION_STREAM_HEARTBEAT', 15))  # keepalive comment on idle connections
+app.config['BROADCAST_EMAIL_CHUNK'] = int(os.getenv('BROADCAST_EMAIL_CHUNK', 500))  # broadcast emails queued per outbox event
+
+# ✅ Approval queue - items shown to an admin are claimed for this long
+app.config['APPROVAL_CLAIM_SECONDS'] = int(os.getenv('APPROVAL_CLAIM_SECONDS', 300))
+
+# ✅ Wishlist matching - in-memory trigram/category index, rebuilt after this long or on wishlist writes
+app.config['WISHLIST_INDEX_TTL'] = int(os.getenv('WISHLIST_INDEX_TTL', 60))  # seconds
+app.config['LISTING_SNAPSHOT_TTL'] = int(os.getenv('LISTING_SNAPSHOT_TTL', 60))  # live listings a new wishlist is backfilled from
+
 # ✅ Initialize extensions FIRST
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
@@ -89,6 +149,7 @@ from routes.notifications_api import notifications_bp
 from routes.wishlist import wishlist_bp
 from routes_account import account_bp
 from routes.payments import payment_bp
+from routes.media import media_bp, is_media_request
 from notifications import NotificationService
 
 # ✅ User loader for Flask-Login
@@ -117,6 +178,12 @@ def format_image_url(url):
     if url.startswith('/static/'):
         return url.replace('//', '/')
     
+    # Remote storage backends (S3/MinIO) build their own (presigned) URLs
+    from storage import get_storage
+    storage = get_storage()
+    if storage.name != 'local':
+        return storage.url(url)
+    
     upload_dir = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
     
     # Extract filename from any path format
@@ -130,7 +197,7 @@ def format_image_url(url):
     file_path = os.path.join(upload_dir, filename)
     if os.path.exists(file_path):
         logger.debug(f"✅ File found at: {file_path}")
-        return f'/static/uploads/{filename}'
+        return storage.url(filename)
     
     logger.debug(f"❌ File not found at: {file_path}")
     
@@ -143,7 +210,7 @@ def format_image_url(url):
             alt_path = os.path.join(upload_dir, alt_filename)
             if os.path.exists(alt_path):
                 logger.debug(f"✅ File found with alt name: {alt_filename}")
-                return f'/static/uploads/{alt_filename}'
+                return storage.url(alt_filename)
             logger.debug(f"❌ Alt file not found: {alt_path}")
     
     # File not found, return placeholder
@@ -160,6 +227,10 @@ def check_maintenance_mode():
     if request.blueprint and request.blueprint.startswith('admin'):
         return
     
+    # Media requests skip the settings lookup entirely
+    if is_media_request(request):
+        return
+    
     # Check maintenance mode
     settings = SystemSettings.get_settings()
     if settings.maintenance_mode:
@@ -234,6 +305,25 @@ app.register_blueprint(wishlist_bp)
 app.register_blueprint(account_bp)
 app.register_blueprint(contact_bp)
 app.register_blueprint(payment_bp)
+app.register_blueprint(media_bp)
+
+# Image requests must not count against the per-IP page limits
+if limiter is not None:
+    limiter.exempt(media_bp)
+
+# ✅ CLI commands (flask images ..., flask outbox ..., flask mail ..., flask emails ..., flask idempotency ..., flask wishlist ...)
+from image_backfill import images_cli
+from outbox import outbox_cli
+from mail_queue import mail_cli
+from email_templates import emails_cli
+from idempotency import idempotency_cli
+from wishlist_digest import wishlist_cli
+app.cli.add_command(images_cli)
+app.cli.add_command(outbox_cli)
+app.cli.add_command(mail_cli)
+app.cli.add_command(emails_cli)
+app.cli.add_command(idempotency_cli)
+app.cli.add_command(wishlist_cli)
 
 # ✅ Error Handlers
 from logger_config import setup_logger
@@ -331,6 +421,8 @@ def handle_unexpected_error(error):
 @app.before_request
 def log_request():
     """Log incoming requests."""
+    if is_media_request(request):
+        return
     logger.debug(f"Request: {request.method} {request.path} from {request.remote_addr}")
 
 @app.after_request
@@ -343,6 +435,10 @@ def apply_cache_control_headers(response):
     - Files with static extensions (.css, .js, .png, .jpg, .gif, .ico, .svg, .woff, .woff2, .ttf, .eot)
     - Files served from /static/ directory
     """
+    # Media responses carry their own immutable caching headers
+    if is_media_request(request):
+        return response
+    
     # Get the request path to check if it's a static file
     path = request.path.lower()
     static_extensions = ('.css', '.js', '.png', '.jpg', '.jpeg', '.gif', '.ico', '.svg', '.woff', '.woff2', '.ttf', '.eot', '.mp4', '.webm')
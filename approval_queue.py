@@ -0,0 +1,252 @@
+"""
+Prioritized, paginated item approval queue with claim leases.
+
+Pending items are reviewed in order of a priority score: time waiting plus a
+boost for trusted sellers, minus a penalty for images the upload analysis
+flagged (those take longer to review). The score is stored as an effective
+timestamp, review_priority_at = submitted_at - boost, so the order never
+changes as items age. The queue is then an index scan on
+(status, review_priority_at, id), keyset-paginated with a cursor.
+
+Items shown to an admin are claimed for APPROVAL_CLAIM_SECONDS with a
+conditional UPDATE, so two admins working the queue get different items.
+Approving or rejecting ends the claim. An expired claim (admin closed the
+tab) makes the item available again.
+
+bulk_approve() approves a whole batch in one transaction: set-based UPDATEs
+for the items, owners' credits and trading points, one INSERT each for the
+audit rows and notifications, and outbox events for everything slow
+(approval emails, wishlist matching, referral bonuses, level-up emails).
+
+Usage:
+    set_review_priority(item)                         # at submission, after images
+    items, cursor = next_page(admin_id, after=cursor)
+    if not claim(item_id, admin_id): ...              # someone else is reviewing it
+    approved = bulk_approve({item_id: value}, admin_id)
+"""
+
+import json
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, or_, and_, update, insert
+from sqlalchemy.orm import joinedload, selectinload
+
+from app import db
+from models import Item, User, AuditLog, Notification, Referral
+from outbox import enqueue
+from trading_points import award_points_for_uploads, POINTS_PER_UPLOAD_APPROVAL
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+# Hours added to an item's wait time, by seller tier
+TIER_BOOST_HOURS = {
+    'Beginner': 0,
+    'Novice': 2,
+    'Intermediate': 6,
+    'Advanced': 12,
+    'Expert': 24,
+}
+
+# Hours taken off for image problems found by image_analyzer at upload
+IMAGE_PENALTY_HOURS = {
+    'error': 12,
+    'warning': 4,
+}
+NO_IMAGE_PENALTY_HOURS = 12
+
+QUEUE_PAGE_SIZE = 20
+BULK_APPROVE_MAX_ITEMS = 500
+REFERRAL_UPLOAD_BONUS = 100
+
+
+def _claim_seconds():
+    return current_app.config.get('APPROVAL_CLAIM_SECONDS', 300)
+
+
+def priority_boost_hours(item):
+    """Seller tier boost minus the worst image-quality penalty for item."""
+    boost = TIER_BOOST_HOURS.get(item.user.tier if item.user else None, 0)
+
+    if not item.images:
+        return boost - NO_IMAGE_PENALTY_HOURS
+
+    severities = {flag.get('severity') for image in item.images for flag in image.get_quality_flags()}
+    penalty = max((hours for severity, hours in IMAGE_PENALTY_HOURS.items() if severity in severities), default=0)
+    return boost - penalty
+
+
+def set_review_priority(item):
+    """Compute item.review_priority_at from its submission time, seller and images (does not commit)."""
+    submitted_at = item.submitted_at or datetime.utcnow()
+    item.submitted_at = submitted_at
+    item.review_priority_at = submitted_at - timedelta(hours=priority_boost_hours(item))
+
+
+# ==================== CURSOR ====================
+
+def encode_cursor(item):
+    return f"{item.review_priority_at.isoformat()}_{item.id}"
+
+
+def decode_cursor(value):
+    """Return (review_priority_at, id) from a cursor, or raise ValueError."""
+    timestamp, _, item_id = value.rpartition('_')
+    return datetime.fromisoformat(timestamp), int(item_id)
+
+
+# ==================== CLAIMS ====================
+
+def _claimable(admin_id, now):
+    return or_(
+        Item.review_claimed_by == None,
+        Item.review_claimed_by == admin_id,
+        Item.review_claimed_until < now,
+    )
+
+
+def claim(item_id, admin_id):
+    """Claim (or extend the claim on) a pending item for admin_id. False if another admin holds it."""
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(Item)
+        .where(Item.id == item_id, Item.status == 'pending', _claimable(admin_id, now))
+        .values(review_claimed_by=admin_id, review_claimed_until=now + timedelta(seconds=_claim_seconds()))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def claimed_by_other(item, admin_id):
+    """True if another admin holds a live claim on item."""
+    return (item.review_claimed_by is not None
+            and item.review_claimed_by != admin_id
+            and item.review_claimed_until is not None
+            and item.review_claimed_until >= datetime.utcnow())
+
+
+def release_claims(admin_id, item_ids=None):
+    """Drop admin_id's claims (all of them, or on item_ids). Caller commits."""
+    query = Item.query.filter(Item.review_claimed_by == admin_id)
+    if item_ids is not None:
+        query = query.filter(Item.id.in_(item_ids))
+    return query.update({'review_claimed_by': None, 'review_claimed_until': None}, synchronize_session=False)
+
+
+# ==================== QUEUE ====================
+
+def next_page(admin_id, after=None, limit=QUEUE_PAGE_SIZE):
+    """
+    Claim and return the next page of the queue for admin_id.
+
+    Returns (items, next_cursor); next_cursor is None at the end of the
+    queue. Items claimed by other admins are skipped. Commits the claims.
+    """
+    now = datetime.utcnow()
+    query = Item.query.filter(Item.status == 'pending', _claimable(admin_id, now))
+    if after:
+        after_at, after_id = after
+        query = query.filter(or_(
+            Item.review_priority_at > after_at,
+            and_(Item.review_priority_at == after_at, Item.id > after_id),
+        ))
+
+    candidates = query.options(
+        joinedload(Item.user),
+        selectinload(Item.images),
+    ).order_by(Item.review_priority_at, Item.id).limit(limit + 1).all()
+
+    has_more = len(candidates) > limit
+    candidates = candidates[:limit]
+
+    # Another admin may claim between the SELECT and our UPDATE; drop those
+    items = [item for item in candidates if claim(item.id, admin_id)]
+    db.session.commit()
+
+    next_cursor = encode_cursor(candidates[-1]) if has_more and candidates else None
+    return items, next_cursor
+
+
+def queue_counts(admin_id):
+    """Pending totals for the queue header, in one aggregate query."""
+    now = datetime.utcnow()
+
+    def count_if(condition):
+        return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+    row = db.session.query(
+        func.count(Item.id),
+        count_if(and_(Item.review_claimed_by != None,
+                      Item.review_claimed_by != admin_id,
+                      Item.review_claimed_until >= now)),
+        count_if(Item.category == 'Electronics'),
+    ).filter(Item.status == 'pending').one()
+    return {'pending': row[0], 'in_review_by_others': row[1], 'electronics': row[2]}
+
+
+# ==================== BULK APPROVAL ====================
+
+def bulk_approve(values, admin_id, ip_address=None):
+    """
+    Approve {item_id: value} in the caller's transaction with set-based statements.
+
+    Items already approved or claimed by another admin are skipped. Returns
+    the approved items as [{'id', 'user_id', 'name', 'value'}]. Slow side
+    effects are enqueued on the outbox; the caller commits and wakes the worker.
+    """
+    rows = Item.approve_many(values, _claimable(admin_id, datetime.utcnow()))
+    if not rows:
+        return []
+    approved = [{'id': row[0], 'user_id': row[1], 'name': row[2], 'value': row[3]} for row in rows]
+
+    credits = defaultdict(int)
+    for item in approved:
+        credits[item['user_id']] += int(item['value'])
+    balances = User.add_credits_many(dict(credits))
+    level_ups = award_points_for_uploads(Counter(item['user_id'] for item in approved))
+
+    now = datetime.utcnow()
+    db.session.execute(insert(AuditLog), [{
+        'admin_id': admin_id,
+        'action_type': 'approve_item',
+        'target_type': 'item',
+        'target_id': item['id'],
+        'target_name': item['name'],
+        'description': f'Item "{item["name"]}" approved with value {item["value"]} credits for user ID {item["user_id"]} (bulk)',
+        'after_value': json.dumps({'value': item['value'], 'status': 'approved', 'is_available': True}),
+        'timestamp': now,
+        'ip_address': ip_address,
+    } for item in approved])
+
+    db.session.execute(insert(Notification), [{
+        'user_id': item['user_id'],
+        'message': (f"🎉 Your item '{item['name']}' has been approved for ₦{item['value']} credits! "
+                    f"You earned {POINTS_PER_UPLOAD_APPROVAL} trading points. "
+                    f"New Balance: ₦{balances.get(item['user_id'], 0):,} credits.")[:255],
+        'notification_type': 'listing',
+        'category': 'status_update',
+        'data': {'item_id': item['id']},
+        'created_at': now,
+        'timestamp': now,
+    } for item in approved])
+
+    for item in approved:
+        enqueue('item_approval_email', item_id=item['id'])
+    # One matching run for the batch, so instant digests cover all of it
+    enqueue('wishlist_matching', item_ids=[item['id'] for item in approved])
+    for user_id, level_up_info in level_ups.items():
+        enqueue('level_up', user_id=user_id, level_up_info=level_up_info)
+
+    # One lookup for the owners whose referrer has not had the upload bonus yet
+    referred = db.session.query(Referral.referred_user_id).filter(
+        Referral.referred_user_id.in_(credits),
+        or_(Referral.item_upload_bonus_earned == False, Referral.item_upload_bonus_earned.is_(None)),
+    ).distinct()
+    for (user_id,) in referred:
+        enqueue('referral_bonus', user_id=user_id, bonus_type='item_upload', amount=REFERRAL_UPLOAD_BONUS)
+
+    logger.info(f"Bulk approval - Approved: {len(approved)}/{len(values)}, Owners: {len(credits)}, "
+                f"Level ups: {len(level_ups)}, Admin ID: {admin_id}")
+    return approved
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark: render time per transactional email type.
+
+Compares, for every template in templates/emails/:
+  string    - render_template_string(open(...).read()) (parse + compile per send,
+              as notify_credit_purchase used to do)
+  flask     - Flask render_template (cached compile, CSS left in <style>)
+  email     - email_templates.render_email (cached compile, CSS inlined once)
+
+    python bench_email_render.py            # 200 renders per template
+    RENDERS=1000 python bench_email_render.py
+"""
+import os
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, '.')
+
+from flask import render_template, render_template_string
+
+from app import app
+from email_templates import get_email_renderer, render_email
+
+RENDERS = int(os.getenv('RENDERS', 200))
+
+item = SimpleNamespace(name='Vintage Camera', description='Working, lightly used', item_number='ITM-000123')
+station = SimpleNamespace(name='Ikeja Hub', address='12 Allen Avenue, Ikeja')
+
+SAMPLE_CONTEXT = {
+    'username': 'ada', 'user_name': 'ada', 'reason': 'Spam listings', 'ban_date': datetime.utcnow(),
+    'unban_url': 'https://example.com/banned', 'approval_url': 'https://example.com/items/1',
+    'item_name': item.name, 'item_number': item.item_number, 'item_value': 2500,
+    'credits_awarded': 100, 'level': 5, 'tier': 'Silver', 'total_points': 540, 'new_balance': 1200,
+    'order_id': 'ORD-20261019-00042', 'order_date': 'October 19, 2026',
+    'delivery_method': 'pickup', 'delivery_address': '1 Test Street', 'pickup_station': station,
+    'items': [item, item, item], 'total_credits': 7500, 'status': 'shipped', 'status_class': 'shipped',
+    'status_text': 'Shipped', 'status_message': 'On its way', 'updated_date': 'October 19, 2026',
+    'action_url': 'https://example.com/orders/42', 'item_category': 'Electronics', 'item_condition': 'Used',
+    'item_description': item.description, 'item_price': 2500, 'recommendation_reason': 'Based on your wishlist',
+    'reset_url': 'https://example.com/reset/abc', 'support_url': 'https://example.com/help',
+    'verification_link': 'https://example.com/verify/abc', 'verification_token': 'abc',
+    'amount': 5000, 'credits_purchased': 5000, 'previous_balance': 100, 'reference': 'MNFY-123',
+    'transaction_date': 'October 19, 2026 at 10:00 AM', 'wishlist_name': 'Cameras',
+    'item_location': 'Lagos', 'item_image': '/media/1_0_1700000000_camera.jpg',
+    'view_item_url': 'https://example.com/item/1', 'unsubscribe_url': 'https://example.com/settings',
+    'marketplace_url': 'https://example.com/marketplace', 'dashboard_url': 'https://example.com/dashboard',
+    'wishlist_url': 'https://example.com/wishlist', 'help_url': 'https://example.com/help', 'current_year': 2026,
+}
+
+# level_up_notification reads now.year, item_approved calls now() when it is defined
+EXTRA_CONTEXT = {'emails/level_up_notification.html': {'now': datetime.utcnow()}}
+
+
+def per_render_us(fn):
+    fn()  # warm-up (first compile)
+    started = time.perf_counter()
+    for _ in range(RENDERS):
+        fn()
+    return (time.perf_counter() - started) / RENDERS * 1e6
+
+
+with app.test_request_context(base_url='https://barterex.example'):
+    names = get_email_renderer().precompile()
+
+    print(f"Email render benchmark - {RENDERS} renders per template (µs per render)")
+    print(f"{'template':<34}{'string':>10}{'flask':>10}{'email':>10}{'speedup':>9}{'size':>14}")
+    totals = [0.0, 0.0, 0.0]
+    for name in names:
+        path = os.path.join(app.template_folder, name)
+        context = {**SAMPLE_CONTEXT, **EXTRA_CONTEXT.get(name, {})}
+        timings = [
+            per_render_us(lambda: render_template_string(open(path).read(), **context)),
+            per_render_us(lambda: render_template(name, **context)),
+            per_render_us(lambda: render_email(name, **context)),
+        ]
+        totals = [t + v for t, v in zip(totals, timings)]
+        before = len(render_template(name, **context))
+        after = len(render_email(name, **context))
+        print(f"{name.split('/', 1)[1]:<34}{timings[0]:>10.0f}{timings[1]:>10.0f}{timings[2]:>10.0f}"
+              f"{timings[0] / timings[2]:>8.0f}x{before:>7}>{after:<6}")
+    print(f"{'total':<34}{totals[0]:>10.0f}{totals[1]:>10.0f}{totals[2]:>10.0f}{totals[0] / totals[2]:>8.0f}x")
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Benchmark: wishlist matching for an approved item, 100k active wishlists.
+
+Compares
+  scan   - the previous approach: load every active wishlist and run difflib
+           SequenceMatcher against each name
+  index  - services.wishlist_index: trigram/category inverted index, length
+           filter and quick upper bound before scoring (rapidfuzz if installed)
+
+and checks both find the same wishlists. Uses a throwaway SQLite database.
+
+    python bench_wishlist_matching.py               # 100k wishlists, 20 items
+    WISHLISTS=20000 ITEMS=200 python bench_wishlist_matching.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from difflib import SequenceMatcher
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'bench_wishlist.db')}"
+
+from sqlalchemy import insert
+
+from app import app, db
+from models import User, Wishlist
+from services.wishlist_index import WishlistIndex, RAPIDFUZZ_AVAILABLE, MATCH_THRESHOLD
+
+WISHLISTS = int(os.getenv('WISHLISTS', 100_000))
+ITEMS = int(os.getenv('ITEMS', 20))
+CATEGORY_SHARE = 0.2
+
+BRANDS = ['apple', 'samsung', 'sony', 'lg', 'nokia', 'canon', 'nikon', 'dell', 'hp', 'lenovo',
+          'ikea', 'nike', 'adidas', 'puma', 'tecno', 'infinix', 'xiaomi', 'huawei', 'bose', 'jbl']
+PRODUCTS = ['iphone', 'galaxy', 'laptop', 'camera', 'headphones', 'speaker', 'television', 'monitor',
+            'sofa', 'wardrobe', 'sneakers', 'jacket', 'watch', 'tablet', 'printer', 'router',
+            'blender', 'microwave', 'fridge', 'generator']
+MODIFIERS = ['pro', 'max', 'mini', 'plus', 'ultra', 'lite', '2020', '2021', '2022', '2023',
+             'black', 'white', 'silver', 'used', 'new', '64gb', '128gb', '256gb', 'xl', 's']
+CATEGORIES = ['Electronics', 'Furniture', 'Fashion', 'Home', 'Phones', 'Computers', 'Appliances', 'Sports']
+
+
+def random_name(rng):
+    words = [rng.choice(BRANDS), rng.choice(PRODUCTS)]
+    words += rng.sample(MODIFIERS, rng.randint(0, 2))
+    return ' '.join(words)
+
+
+def scan_match(rows, item_name, item_category):
+    """The old find_wishlist_matches loop, minus the per-match queries."""
+    matched = set()
+    for wishlist_id, search_type, wish_name, category in rows:
+        if search_type == 'item' and wish_name:
+            if SequenceMatcher(None, wish_name.lower(), item_name.lower()).ratio() >= MATCH_THRESHOLD:
+                matched.add(wishlist_id)
+        elif search_type == 'category' and category:
+            if item_category and item_category.lower() == category.lower():
+                matched.add(wishlist_id)
+    return matched
+
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    rng = random.Random(42)
+
+    print(f"Seeding {WISHLISTS:,} wishlists ...")
+    db.session.execute(insert(User), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x'}
+        for i in range(1, WISHLISTS // 10 + 1)
+    ])
+    rows = []
+    for i in range(WISHLISTS):
+        user_id = i // 10 + 1
+        if rng.random() < CATEGORY_SHARE:
+            rows.append({'user_id': user_id, 'search_type': 'category', 'category': rng.choice(CATEGORIES),
+                         'item_name': f'category-{i}'})
+        else:
+            rows.append({'user_id': user_id, 'search_type': 'item', 'item_name': f'{random_name(rng)} {i % 10}'})
+    db.session.execute(insert(Wishlist), rows)
+    db.session.commit()
+
+    items = [(random_name(rng), rng.choice(CATEGORIES)) for _ in range(ITEMS)]
+
+    # scan: load + score everything, per item (as before)
+    started = time.perf_counter()
+    scan_results = []
+    for name, category in items:
+        all_rows = db.session.query(Wishlist.id, Wishlist.search_type, Wishlist.item_name, Wishlist.category) \
+            .filter(Wishlist.is_active == True).all()
+        scan_results.append(scan_match(all_rows, name, category))
+    scan_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = WishlistIndex.build()
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index_results = [{wishlist_id for wishlist_id, _ in index.match(name, category)} for name, category in items]
+    index_seconds = time.perf_counter() - started
+
+    same = sum(1 for a, b in zip(scan_results, index_results) if a == b)
+    missed = sum(len(a - b) for a, b in zip(scan_results, index_results))
+    extra = sum(len(b - a) for a, b in zip(scan_results, index_results))
+    total_matches = sum(len(result) for result in index_results)
+
+    print(f"\nsimilarity: {'rapidfuzz Indel' if RAPIDFUZZ_AVAILABLE else 'difflib SequenceMatcher'}")
+    print(f"{'method':<8} {'per item (ms)':>14} {'total (s)':>10}")
+    print(f"{'scan':<8} {scan_seconds / ITEMS * 1000:>14.1f} {scan_seconds:>10.2f}")
+    print(f"{'index':<8} {index_seconds / ITEMS * 1000:>14.1f} {index_seconds:>10.2f}   (+ {build_seconds:.2f}s one-off build)")
+    print(f"\nspeedup per item: {scan_seconds / max(index_seconds, 1e-9):.0f}x")
+    print(f"matches: {total_matches:,} across {ITEMS} items; identical result sets: {same}/{ITEMS}"
+          f" (missed {missed}, extra {extra})")
+
+    db.session.remove()
+    db.drop_all()
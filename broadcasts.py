@@ -0,0 +1,189 @@
+"""
+System notices (maintenance, policy changes, promotions) sent to a segment of users.
+
+broadcast() writes every recipient's in-app notification with one
+INSERT ... SELECT from the user table, and bumps their notification counters
+and versions (see notifications.py) with one UPDATE that finds exactly the
+rows just inserted through idx_notification_user_read_created. Open
+notification streams are woken once for everyone. Nothing is looped per user
+in Python, so a broadcast to every user costs three statements.
+
+Segments:
+- all:    every user who is not banned
+- state:  users whose profile state matches value (case-insensitive)
+- tier:   users in a rank tier (rank_rewards.RANK_TIERS)
+- active: users who logged in within the last value days
+
+Membership is fixed when the broadcast is sent: users who register later are
+not included, and the email fan-out uses the same criteria.
+
+Emails go through the outbox and the mail queue: a 'broadcast_email' event
+queues BROADCAST_EMAIL_CHUNK emails (one per recipient, respecting the
+user's email preference for the notice type) and enqueues the next chunk in
+the same transaction, so a retried chunk never emails anyone twice.
+
+Usage:
+    count = broadcast('Scheduled maintenance tonight', admin_id)
+    count = broadcast('Promo for Lagos traders', admin_id, 'state', 'Lagos', send_email=True)
+"""
+
+import json
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, exists, func, insert, literal, or_, select, update
+
+from app import db
+from models import AuditLog, Notification, User
+from email_templates import render_email
+from mail_queue import queue_email
+from notification_events import publish_notification_changes
+from outbox import enqueue
+from rank_rewards import RANK_TIERS
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+SEGMENTS = ('all', 'state', 'tier', 'active')
+MAX_ACTIVE_DAYS = 365
+
+
+def validate_segment(segment, value=None):
+    """Return the normalized segment value, or raise ValueError."""
+    if segment not in SEGMENTS:
+        raise ValueError(f"segment must be one of: {', '.join(SEGMENTS)}")
+    if segment == 'all':
+        return None
+    if segment == 'active':
+        try:
+            days = int(value)
+        except (TypeError, ValueError):
+            raise ValueError('active segment needs a number of days')
+        if not 1 <= days <= MAX_ACTIVE_DAYS:
+            raise ValueError(f'days must be between 1 and {MAX_ACTIVE_DAYS}')
+        return days
+    if segment == 'tier' and value not in RANK_TIERS:
+        raise ValueError(f"tier must be one of: {', '.join(RANK_TIERS)}")
+    if not value or not str(value).strip():
+        raise ValueError(f'{segment} segment needs a value')
+    return str(value).strip()
+
+
+def segment_criteria(segment, value, sent_at):
+    """WHERE criteria on User for a segment, as of sent_at."""
+    criteria = [
+        or_(User.is_banned == False, User.is_banned == None),
+        or_(User.created_at == None, User.created_at <= sent_at),
+    ]
+    if segment == 'state':
+        criteria.append(func.lower(User.state) == value.lower())
+    elif segment == 'tier':
+        criteria.append(User.tier == value)
+    elif segment == 'active':
+        criteria.append(User.last_login >= sent_at - timedelta(days=value))
+    return criteria
+
+
+def broadcast(message, admin_id, segment='all', value=None, title=None, notification_type='system',
+              category='alert', priority='normal', action_url=None, send_email=False, ip_address=None):
+    """
+    Send an in-app notice to every user in the segment, in the current transaction.
+    Returns the number of recipients; the caller commits (and wakes the outbox worker).
+    """
+    value = validate_segment(segment, value)
+    sent_at = datetime.utcnow()
+    criteria = segment_criteria(segment, value, sent_at)
+    message = message[:255]
+    data = {'broadcast': True, 'segment': segment, 'segment_value': value, 'title': title}
+
+    columns = ['user_id', 'message', 'notification_type', 'category', 'priority', 'action_url',
+               'data', 'is_read', 'is_email_sent', 'created_at', 'timestamp']
+    recipients = select(
+        User.id,
+        literal(message),
+        literal(notification_type),
+        literal(category),
+        literal(priority),
+        literal(action_url, type_=Notification.action_url.type),
+        literal(data, type_=Notification.data.type),
+        literal(False),
+        literal(False),
+        literal(sent_at, type_=Notification.created_at.type),
+        literal(sent_at, type_=Notification.timestamp.type),
+    ).where(*criteria)
+    result = db.session.execute(
+        insert(Notification).from_select(columns, recipients)
+        # Counters are updated below for exactly these rows
+        .execution_options(notification_counters_updated=True)
+    )
+    count = result.rowcount
+
+    # The rows just inserted, found per user through (user_id, is_read, created_at)
+    received = exists().where(and_(
+        Notification.user_id == User.id,
+        Notification.is_read == False,
+        Notification.created_at == sent_at,
+        Notification.message == message,
+    ))
+    db.session.execute(
+        update(User).where(received).values(
+            notification_count=User.notification_count + 1,
+            unread_notification_count=User.unread_notification_count + 1,
+            notification_version=User.notification_version + 1,
+        ).execution_options(synchronize_session=False)
+    )
+    publish_notification_changes(db.session, None)
+
+    description = f'Broadcast to {count} user(s), segment {segment}' + (f' = {value}' if value is not None else '')
+    db.session.add(AuditLog(
+        admin_id=admin_id,
+        action_type='broadcast_notification',
+        target_type='notification',
+        target_name=(title or message)[:255],
+        description=description,
+        after_value=json.dumps({'message': message, 'segment': segment, 'value': value,
+                                'send_email': send_email, 'recipients': count}),
+        timestamp=sent_at,
+        ip_address=ip_address,
+    ))
+
+    if send_email and count:
+        enqueue('broadcast_email', message=message, title=title or 'A notice from Barterex',
+                notification_type=notification_type, action_url=action_url,
+                segment=segment, value=value, sent_at=sent_at.isoformat(), after_user_id=0)
+
+    logger.info(f"Broadcast queued - Segment: {segment}={value}, Recipients: {count}, Email: {send_email}, Admin ID: {admin_id}")
+    return count
+
+
+def queue_broadcast_emails(message, title, notification_type, action_url, segment, value,
+                           sent_at, after_user_id=0):
+    """
+    Queue emails for the next chunk of the segment's users after after_user_id, and
+    enqueue the event for the chunk after that. Returns the number of emails queued.
+    """
+    chunk = current_app.config.get('BROADCAST_EMAIL_CHUNK', 500)
+    sent_at = datetime.fromisoformat(sent_at)
+    rows = db.session.query(User.id, User.email, User.notification_preferences).filter(
+        *segment_criteria(segment, value, sent_at),
+        User.id > after_user_id,
+        User.email != None,
+    ).order_by(User.id).limit(chunk).all()
+    if not rows:
+        return 0
+
+    # Same preference key as NotificationService.send_email_notification
+    pref_key = f'email_{notification_type}s'
+    html = render_email('emails/system_notice.html', title=title, message=message, action_url=action_url)
+    queued = 0
+    for user_id, email, preferences in rows:
+        if (preferences or {}).get(pref_key, True):
+            queue_email(title, [email], html)
+            queued += 1
+
+    if len(rows) == chunk:
+        enqueue('broadcast_email', message=message, title=title, notification_type=notification_type,
+                action_url=action_url, segment=segment, value=value, sent_at=sent_at.isoformat(),
+                after_user_id=rows[-1][0])
+    logger.info(f"Broadcast emails queued - Segment: {segment}={value}, Users {rows[0][0]}-{rows[-1][0]}, Emails: {queued}")
+    return queued
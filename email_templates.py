@@ -0,0 +1,307 @@
+"""
+Transactional email rendering.
+
+Email templates (templates/emails/*.html) are rendered through a dedicated
+Jinja environment instead of render_template():
+
+- CSS from <style> blocks is inlined into style="" attributes when a template
+  is compiled, not on every send. Rules that cannot be inlined (:hover,
+  @media, descendant selectors, classes only set dynamically) stay in a
+  trimmed <style> block.
+- Compiled templates are cached for the life of the process (no auto-reload).
+  `flask emails build` goes one step further and writes the inlined templates
+  as precompiled Python modules to EMAIL_BUILD_DIR, which are loaded instead
+  of parsing the HTML at all (ignored with a warning if older than the
+  sources).
+- Values shared by every email (base links, current year) are computed once
+  per process and passed as default context.
+
+Usage:
+    html = render_email('emails/order_confirmation.html', username=..., ...)
+"""
+
+import os
+import re
+import time
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from jinja2 import BaseLoader, ChoiceLoader, ModuleLoader
+
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+emails_cli = AppGroup('emails', help='Email template commands.')
+
+EMAIL_TEMPLATE_PREFIX = 'emails/'
+BUILD_MARKER = '.built'
+
+
+# ==================== CSS INLINING ====================
+
+_STYLE_BLOCK = re.compile(r'<style[^>]*>(.*?)</style>\s*', re.S | re.I)
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_SIMPLE_SELECTOR = re.compile(r'^([a-zA-Z][a-zA-Z0-9]*)?((?:[.#][\w-]+)*)$')
+_START_TAG = re.compile(
+    r'<([a-zA-Z][\w-]*)((?:\s+[^\s"\'>/=]+(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s"\'>]+))?)*)\s*(/?)>'
+)
+_ATTRIBUTE = re.compile(r'([^\s"\'>/=]+)(?:\s*=\s*("[^"]*"|\'[^\']*\'|[^\s"\'>]+))?')
+_BODY_START = re.compile(r'<body\b', re.I)
+
+
+_INNER_BODY = re.compile(r'\{([^{}]*)\}')
+
+
+def _important(body):
+    declarations = [' '.join(d.split()) for d in body.split(';') if d.strip()]
+    return '; '.join(d if '!important' in d else f"{d} !important" for d in declarations) + ';'
+
+
+def _parse_css(css):
+    """Split a stylesheet into inlinable simple rules and the residual CSS text."""
+    css = _CSS_COMMENT.sub('', css)
+    rules = []      # (selector, tag, classes, ids, declarations, order)
+    residual = []
+    pos = 0
+    while True:
+        brace = css.find('{', pos)
+        if brace == -1:
+            break
+        prelude = css[pos:brace].strip()
+        if prelude.startswith('@'):
+            # At-rule block (@media, @font-face, ...): keep verbatim, nested braces included
+            depth, end = 0, brace
+            while end < len(css):
+                if css[end] == '{':
+                    depth += 1
+                elif css[end] == '}':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                end += 1
+            block = css[pos:end + 1].strip()
+            if prelude.lower().startswith('@media'):
+                # Inlined styles would otherwise beat responsive/dark-mode overrides
+                block = _INNER_BODY.sub(lambda m: '{ ' + _important(m.group(1)) + ' }', block)
+            residual.append(block)
+            pos = end + 1
+            continue
+
+        close = css.find('}', brace)
+        if close == -1:
+            break
+        body = ' '.join(css[brace + 1:close].split())
+        declarations = [d.strip() for d in body.split(';') if ':' in d]
+        for selector in (s.strip() for s in prelude.split(',')):
+            match = _SIMPLE_SELECTOR.match(selector)
+            if not selector or not match:
+                residual.append(f"{selector} {{ {body} }}")
+                continue
+            simple = match.group(2)
+            rules.append((
+                selector,
+                match.group(1).lower() if match.group(1) else None,
+                set(re.findall(r'\.([\w-]+)', simple)),
+                set(re.findall(r'#([\w-]+)', simple)),
+                declarations,
+                len(rules),
+            ))
+        pos = close + 1
+    return rules, residual
+
+
+def _element_attributes(attr_text):
+    attrs = {}
+    for name, value in _ATTRIBUTE.findall(attr_text or ''):
+        if value[:1] in ('"', "'"):
+            value = value[1:-1]
+        attrs[name.lower()] = value
+    return attrs
+
+
+def inline_css(html):
+    """
+    Move simple CSS rules (tag, .class, #id and combinations) from <style>
+    blocks into style attributes. Jinja expressions are left untouched;
+    class names produced by expressions keep their rules in <style>.
+    """
+    blocks = _STYLE_BLOCK.findall(html)
+    if not blocks:
+        return html
+    rules, residual = _parse_css('\n'.join(blocks))
+    used = set()
+
+    def apply(match):
+        tag, attr_text, self_closing = match.group(1).lower(), match.group(2) or '', match.group(3)
+        attrs = _element_attributes(attr_text)
+        classes = {c for c in attrs.get('class', '').split() if '{' not in c}
+        ids = {attrs['id']} if 'id' in attrs and '{' not in attrs['id'] else set()
+
+        matched = [
+            rule for rule in rules
+            if (rule[1] is None or rule[1] == tag) and rule[2] <= classes and rule[3] <= ids
+            and (rule[1] or rule[2] or rule[3])
+        ]
+        if not matched:
+            return match.group(0)
+
+        # Lower specificity first, then source order; later declarations win
+        matched.sort(key=lambda r: (len(r[3]), len(r[2]), 1 if r[1] else 0, r[5]))
+        merged = {}
+        for rule in matched:
+            used.add(rule[5])
+            for declaration in rule[4]:
+                prop, value = declaration.split(':', 1)
+                merged[prop.strip().lower()] = value.strip().replace('"', "'")
+        style = '; '.join(f"{prop}: {value}" for prop, value in merged.items()) + ';'
+
+        # Existing inline style keeps precedence by coming last
+        existing = re.search(r'\sstyle\s*=\s*("[^"]*"|\'[^\']*\')', attr_text)
+        if existing:
+            style = f"{style} {existing.group(1)[1:-1]}"
+            attr_text = attr_text[:existing.start()] + attr_text[existing.end():]
+        return f'<{match.group(1)}{attr_text} style="{style}"{" /" if self_closing else ""}>'
+
+    body = _BODY_START.search(html)
+    split_at = body.start() if body else 0
+    head, content = html[:split_at], html[split_at:]
+    content = _START_TAG.sub(apply, content)
+
+    # Unused simple rules may target classes set by Jinja expressions - keep them
+    residual = [f"{r[0]} {{ {'; '.join(r[4])} }}" for r in rules if r[5] not in used] + residual
+    style_block = f"<style>\n{chr(10).join(residual)}\n</style>\n" if residual else ''
+
+    first = True
+
+    def replace_block(_match):
+        nonlocal first
+        if first:
+            first = False
+            return style_block
+        return ''
+
+    return _STYLE_BLOCK.sub(replace_block, head) + content
+
+
+class InlinedEmailLoader(BaseLoader):
+    """Wraps the app's template loader and inlines CSS when an email template is loaded."""
+
+    def __init__(self, source_loader):
+        self.source_loader = source_loader
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = self.source_loader.get_source(environment, template)
+        if template.startswith(EMAIL_TEMPLATE_PREFIX):
+            source = inline_css(source)
+        return source, filename, uptodate
+
+    def list_templates(self):
+        return [
+            name for name in self.source_loader.list_templates()
+            if name.startswith(EMAIL_TEMPLATE_PREFIX) and name.endswith('.html')
+        ]
+
+
+# ==================== RENDERING ====================
+
+def _build_dir(app):
+    return app.config.get('EMAIL_BUILD_DIR') or os.path.join(app.instance_path, 'email_templates')
+
+
+def _sources_mtime(loader):
+    mtimes = [0]
+    for name in loader.list_templates():
+        _, filename, _ = loader.source_loader.get_source(None, name)
+        mtimes.append(os.path.getmtime(filename))
+    return max(mtimes)
+
+
+class EmailRenderer:
+    """Per-app email environment (compiled templates cached for the process lifetime)."""
+
+    def __init__(self, app):
+        self.app = app
+        self.inlined_loader = InlinedEmailLoader(app.jinja_loader)
+        loader = self.inlined_loader
+
+        build_dir = _build_dir(app)
+        marker = os.path.join(build_dir, BUILD_MARKER)
+        if os.path.exists(marker):
+            if os.path.getmtime(marker) >= _sources_mtime(self.inlined_loader):
+                loader = ChoiceLoader([ModuleLoader(build_dir), self.inlined_loader])
+            else:
+                logger.warning(f"Precompiled email templates in {build_dir} are older than templates/emails - "
+                               f"ignoring them; run `flask emails build`")
+
+        self.env = app.jinja_env.overlay(loader=loader, cache_size=-1, auto_reload=False)
+        self._static_key = None
+        self._static_context = {}
+
+    def static_context(self):
+        """Context shared by every email; rebuilt only when BASE_URL or the year changes."""
+        base_url = self.app.config.get('BASE_URL', 'http://localhost:5000').rstrip('/')
+        year = datetime.utcnow().year
+        if self._static_key != (base_url, year):
+            self._static_context = {
+                'base_url': base_url,
+                'marketplace_url': f"{base_url}/marketplace",
+                'dashboard_url': f"{base_url}/dashboard",
+                'wishlist_url': f"{base_url}/wishlist",
+                'help_url': f"{base_url}/help",
+                'current_year': year,
+            }
+            self._static_key = (base_url, year)
+        return self._static_context
+
+    def precompile(self):
+        """Load and compile every email template now (e.g. at worker start-up)."""
+        names = self.inlined_loader.list_templates()
+        for name in names:
+            self.env.get_template(name)
+        return names
+
+    def render(self, template_name, **context):
+        template = self.env.get_template(template_name)
+        return template.render({**self.static_context(), **context})
+
+
+def get_email_renderer(app=None):
+    """Return the app's EmailRenderer, creating it on first use."""
+    app = app or current_app._get_current_object()
+    renderer = app.extensions.get('barterex_email_renderer')
+    if renderer is None:
+        renderer = EmailRenderer(app)
+        app.extensions['barterex_email_renderer'] = renderer
+    return renderer
+
+
+def render_email(template_name, **context):
+    """Render a transactional email template (CSS already inlined, template cached)."""
+    return get_email_renderer().render(template_name, **context)
+
+
+# ==================== CLI ====================
+
+@emails_cli.command('build')
+@click.option('--output', default=None, type=click.Path(file_okay=False),
+              help='Target directory (default: EMAIL_BUILD_DIR or instance/email_templates).')
+def build(output):
+    """Inline CSS and precompile email templates to Python modules."""
+    app = current_app._get_current_object()
+    output = output or _build_dir(app)
+    os.makedirs(output, exist_ok=True)
+
+    loader = InlinedEmailLoader(app.jinja_loader)
+    env = app.jinja_env.overlay(loader=loader, cache_size=-1, auto_reload=False)
+    started = time.monotonic()
+    env.compile_templates(output, zip=None, ignore_errors=False)
+    with open(os.path.join(output, BUILD_MARKER), 'w') as f:
+        f.write(datetime.utcnow().isoformat())
+
+    # Drop the cached renderer so this process picks up the new build
+    app.extensions.pop('barterex_email_renderer', None)
+    click.echo(f"Compiled {len(loader.list_templates())} email templates to {output} "
+               f"in {time.monotonic() - started:.2f}s")
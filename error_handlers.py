@@ -179,3 +179,53 @@ def retry_operation(max_retries=3, delay=1, backoff=2):
         
         return decorated_function
     return decorator
+
+# SQLSTATEs for transient write conflicts: serialization_failure, deadlock_detected
+CONFLICT_SQLSTATES = {'40001', '40P01'}
+
+
+def is_conflict_error(error):
+    """True for database errors caused by concurrent writers that are safe to retry."""
+    from sqlalchemy.exc import DBAPIError, OperationalError
+    
+    if not isinstance(error, DBAPIError):
+        return False
+    orig = error.orig
+    if getattr(orig, 'pgcode', None) in CONFLICT_SQLSTATES or getattr(orig, 'sqlstate', None) in CONFLICT_SQLSTATES:
+        return True
+    # SQLite: another connection held the write lock past the busy timeout
+    return isinstance(error, OperationalError) and 'database is locked' in str(orig)
+
+
+def retry_on_conflict(max_attempts=3, delay=0.05, backoff=2):
+    """
+    Decorator for retrying a unit of work that lost a write conflict.
+    
+    Rolls the session back and reruns the function when it raises a deadlock,
+    serialization failure or SQLite lock timeout; any other error propagates
+    immediately. The function must do all its writes in the session it
+    commits, so a rerun starts from a clean transaction.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            import time
+            from app import db
+            current_delay = delay
+            
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    return f(*args, **kwargs)
+                except Exception as e:
+                    if not is_conflict_error(e) or attempt == max_attempts:
+                        raise
+                    db.session.rollback()
+                    logger.warning(
+                        f"Write conflict in {f.__name__} (attempt {attempt} of {max_attempts}), "
+                        f"retrying in {current_delay}s: {e.orig}"
+                    )
+                    time.sleep(current_delay)
+                    current_delay *= backoff
+        
+        return decorated_function
+    return decorator
@@ -0,0 +1,35 @@
+"""
+Gunicorn settings (read automatically by `gunicorn app:app` from this directory).
+
+Long-lived connections such as the admin order SSE stream and every logged-in
+user's notification stream would tie up a sync worker each, so gevent workers
+are used when gevent is installed: every connection is a greenlet and waiting
+on the shared broadcasters is free.
+Override with GUNICORN_WORKER_CLASS=sync (or gthread) if needed.
+"""
+
+import os
+
+try:
+    import gevent  # noqa: F401
+    GEVENT_AVAILABLE = True
+except ImportError:
+    GEVENT_AVAILABLE = False
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent' if GEVENT_AVAILABLE else 'sync')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))  # per gevent worker
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = 5
+
+
+def post_fork(server, worker):
+    if worker_class != 'gevent':
+        return
+    # Let psycopg2 yield to other greenlets while waiting on PostgreSQL
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        server.log.warning("psycogreen not installed - PostgreSQL queries block the gevent worker")
@@ -0,0 +1,221 @@
+"""
+Idempotency keys for requests that must not run twice.
+
+A double-clicked "Confirm purchase", a retried POST or a repeated Paystack
+charge.success webhook should get the outcome of the first request, not
+lock rows, deduct credits or call Paystack again. Each such request is
+keyed (scope + key) and:
+
+1. begin() returns the recorded result if the key has completed - from an
+   in-process LRU first, then the idempotency_key table - otherwise it
+   claims the key by inserting an 'in_progress' row.
+2. The request does its work, then complete() stores the result in the
+   same transaction. It is copied into the LRU after commit.
+3. If the work fails the claim is rolled back or release()d, so a retry
+   runs normally.
+
+A duplicate that arrives while the first request is still running waits on
+the unique index until the first transaction ends (claim left uncommitted)
+or gets IdempotencyInProgress (claim committed up front). Claims older than
+IDEMPOTENCY_LEASE_SECONDS belong to a dead request and are taken over.
+
+Usage:
+    recorded = begin('payment_verification', reference)
+    if recorded is not None:
+        return render(recorded)
+    result = do_work()
+    complete('payment_verification', reference, result)
+    db.session.commit()
+
+    flask idempotency purge     # delete expired keys (cron)
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, or_, and_, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import IdempotencyKey
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+idempotency_cli = AppGroup('idempotency', help='Idempotency key commands.')
+
+
+class IdempotencyInProgress(Exception):
+    """Another request holding the same key has not finished yet."""
+
+
+class LRUCache:
+    """Small thread-safe LRU of completed results: (scope, key) -> (response, expires_at)."""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            response, expires_at = entry
+            if expires_at is not None and expires_at <= datetime.utcnow():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def set(self, key, response, expires_at):
+        with self._lock:
+            self._entries[key] = (response, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def get_cache(app=None):
+    """Return the app's completed-key LRU, creating it on first use."""
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('barterex_idempotency_cache')
+    if cache is None:
+        cache = LRUCache(app.config.get('IDEMPOTENCY_CACHE_SIZE', 4096))
+        app.extensions['barterex_idempotency_cache'] = cache
+    return cache
+
+
+def _is_live(row, now):
+    if row.status == 'completed':
+        return row.expires_at is None or row.expires_at > now
+    lease = timedelta(seconds=current_app.config.get('IDEMPOTENCY_LEASE_SECONDS', 120))
+    return row.created_at > now - lease
+
+
+def lookup(scope, key):
+    """Return the recorded result for (scope, key) without claiming it, or None."""
+    cache = get_cache()
+    recorded = cache.get((scope, key))
+    if recorded is not None:
+        return recorded
+    row = IdempotencyKey.query.filter_by(scope=scope, key=key, status='completed').first()
+    if row is None or not _is_live(row, datetime.utcnow()):
+        return None
+    cache.set((scope, key), row.response, row.expires_at)
+    return row.response
+
+
+def begin(scope, key, user_id=None):
+    """
+    Return the recorded result for (scope, key), or claim the key and return None.
+
+    The claim is flushed, not committed - it becomes visible with the
+    caller's commit. Call this before changing anything else in the session:
+    a lost race rolls the session back. Raises IdempotencyInProgress if
+    another request holds the key.
+    """
+    cache = get_cache()
+    recorded = cache.get((scope, key))
+    if recorded is not None:
+        return recorded
+
+    now = datetime.utcnow()
+    row = IdempotencyKey.query.filter_by(scope=scope, key=key).first()
+    if row is not None:
+        if _is_live(row, now):
+            if row.status == 'completed':
+                cache.set((scope, key), row.response, row.expires_at)
+                return row.response
+            raise IdempotencyInProgress(f"{scope}:{key}")
+
+        # Expired result or abandoned claim - take it over (one winner)
+        result = db.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.id == row.id,
+                   IdempotencyKey.status == row.status,
+                   IdempotencyKey.created_at == row.created_at)
+            .values(status='in_progress', user_id=user_id, response=None,
+                    created_at=now, completed_at=None, expires_at=None)
+        )
+        if not result.rowcount:
+            raise IdempotencyInProgress(f"{scope}:{key}")
+        db.session.expire(row)
+        return None
+
+    db.session.add(IdempotencyKey(scope=scope, key=key, user_id=user_id, created_at=now))
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # A concurrent request claimed the key first; the insert waited for it to finish
+        db.session.rollback()
+        row = IdempotencyKey.query.filter_by(scope=scope, key=key).populate_existing().first()
+        if row is not None and row.status == 'completed':
+            cache.set((scope, key), row.response, row.expires_at)
+            return row.response
+        raise IdempotencyInProgress(f"{scope}:{key}")
+    return None
+
+
+def complete(scope, key, response):
+    """Record the result for a claimed key (caller commits; cached after commit)."""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=current_app.config.get('IDEMPOTENCY_KEY_TTL', 86400))
+    db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+        .values(status='completed', response=response, completed_at=now, expires_at=expires_at)
+    )
+    db.session.info.setdefault('idempotency_completed', []).append(((scope, key), response, expires_at))
+
+
+def release(scope, key):
+    """Drop an unfinished claim so the request can be retried (caller commits)."""
+    IdempotencyKey.query.filter_by(scope=scope, key=key, status='in_progress').delete(synchronize_session=False)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _cache_after_commit(session):
+    completed = session.info.pop('idempotency_completed', None)
+    if completed:
+        cache = get_cache()
+        for cache_key, response, expires_at in completed:
+            cache.set(cache_key, response, expires_at)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('idempotency_completed', None)
+
+
+def purge_expired():
+    """Delete expired results and claims abandoned for longer than the key TTL."""
+    now = datetime.utcnow()
+    abandoned = now - timedelta(seconds=current_app.config.get('IDEMPOTENCY_KEY_TTL', 86400))
+    deleted = IdempotencyKey.query.filter(or_(
+        IdempotencyKey.expires_at <= now,
+        and_(IdempotencyKey.status == 'in_progress', IdempotencyKey.created_at < abandoned),
+    )).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+# ==================== CLI ====================
+
+@idempotency_cli.command('purge')
+def purge():
+    """Delete expired idempotency keys."""
+    deleted = purge_expired()
+    click.echo(f"Deleted {deleted} expired idempotency key(s)")
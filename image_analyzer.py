@@ -10,6 +10,157 @@ import os
 
 logger = logging.getLogger(__name__)
 
+def _read_from_storage(image_url):
+    """Read image bytes via the configured storage backend, or None if unavailable"""
+    import sys
+    if 'app' not in sys.modules:
+        return None
+    try:
+        from app import app
+        from storage import get_storage
+        return get_storage(app).open(image_url)
+    except Exception as e:
+        logger.warning(f"Could not read {image_url} from storage: {e}")
+        return None
+
+
+def _collect_metadata(img, file_size, result):
+    """Fill result with dimensions and quality flags for an opened PIL image"""
+    # Get dimensions
+    width, height = img.size
+    result['width'] = width
+    result['height'] = height
+
+    # Analyze for suspicious patterns
+    quality_flags = []
+
+    # Check for unusually low resolution (less than 400x300)
+    if width < 400 or height < 300:
+        quality_flags.append({
+            'type': 'low_resolution',
+            'message': f'Low resolution: {width}x{height}px (recommend 400x300 minimum)',
+            'severity': 'warning'
+        })
+
+    # Check for unusually high resolution (over 5000px)
+    if width > 5000 or height > 5000:
+        quality_flags.append({
+            'type': 'excessive_resolution',
+            'message': f'Excessive resolution: {width}x{height}px',
+            'severity': 'info'
+        })
+
+    # Check for unusual aspect ratios (very wide or very tall)
+    aspect_ratio = width / height if height > 0 else 0
+    if aspect_ratio > 4 or aspect_ratio < 0.25:
+        quality_flags.append({
+            'type': 'unusual_aspect_ratio',
+            'message': f'Unusual aspect ratio: {aspect_ratio:.2f}:1',
+            'severity': 'warning'
+        })
+
+    # Check file size (alert if very large > 10MB)
+    if file_size > 10 * 1024 * 1024:  # 10MB
+        quality_flags.append({
+            'type': 'large_file',
+            'message': f'Large file size: {file_size / (1024*1024):.1f}MB',
+            'severity': 'info'
+        })
+
+    # Check file size (alert if very small < 5KB, might be corrupt)
+    if file_size < 5 * 1024:  # 5KB
+        quality_flags.append({
+            'type': 'small_file',
+            'message': f'Very small file size: {file_size / 1024:.1f}KB (possibly corrupt)',
+            'severity': 'warning'
+        })
+
+    # Check for EXIF data (possible watermark or metadata)
+    has_exif = False
+    try:
+        exif_data = img._getexif()
+        if exif_data:
+            has_exif = True
+            quality_flags.append({
+                'type': 'has_metadata',
+                'message': 'Image contains EXIF metadata (camera/location info)',
+                'severity': 'info'
+            })
+    except:
+        pass
+
+    # Check for potential watermarks by analyzing image format and mode
+    # GIF with animation might indicate a watermark video
+    if img.format == 'GIF':
+        try:
+            img.seek(1)  # Try to get second frame
+            quality_flags.append({
+                'type': 'animated_image',
+                'message': 'Animated GIF detected',
+                'severity': 'info'
+            })
+            img.seek(0)
+        except EOFError:
+            pass  # Not animated
+
+    # Check color mode (grayscale images might indicate watermarks)
+    if img.mode in ['L', '1']:
+        quality_flags.append({
+            'type': 'grayscale_image',
+            'message': f'Grayscale image ({img.mode} mode) - consider using color photos',
+            'severity': 'warning'
+        })
+
+    # Analyze color histogram for potential watermark patterns
+    # Sample: Check if image has very uniform colors (blank/placeholder)
+    try:
+        if img.mode == 'RGB' or img.mode == 'RGBA':
+            img_small = img.resize((20, 20))  # Small sample
+            colors = list(img_small.getdata())
+            unique_colors = len(set(colors))
+
+            # If very few unique colors, might be placeholder or watermarked
+            if unique_colors < 10:
+                quality_flags.append({
+                    'type': 'limited_colors',
+                    'message': f'Image has very limited color palette ({unique_colors} unique colors)',
+                    'severity': 'warning'
+                })
+    except Exception as e:
+        logger.warning(f"Could not analyze color histogram: {e}")
+
+    result['quality_flags'] = quality_flags
+    result['has_issues'] = len(quality_flags) > 0
+
+
+def analyze_image_bytes(file_content):
+    """
+    Analyze raw image bytes and extract metadata.
+    
+    Pure function (no app or network access), safe to run in worker processes.
+    Returns the same dict shape as analyze_image_url().
+    """
+    result = {
+        'width': None,
+        'height': None,
+        'file_size': len(file_content),
+        'quality_flags': [],
+        'has_issues': False
+    }
+    try:
+        img = Image.open(BytesIO(file_content))
+        _collect_metadata(img, len(file_content), result)
+    except Exception as e:
+        logger.error(f"Error analyzing image bytes: {e}")
+        result['quality_flags'].append({
+            'type': 'analysis_error',
+            'message': f'Error analyzing image: {str(e)}',
+            'severity': 'error'
+        })
+        result['has_issues'] = True
+    return result
+
+
 def analyze_image_url(image_url):
     """
     Analyze an image from a URL or file path and extract metadata
@@ -71,8 +222,15 @@ def analyze_image_url(image_url):
             # Normalize path
             file_path = os.path.normpath(file_path)
             
-            # Check if file exists
-            if not os.path.exists(file_path):
+            if os.path.exists(file_path):
+                # Read local file
+                with open(file_path, 'rb') as f:
+                    file_content = f.read()
+            else:
+                # Not on this instance's disk - fetch through the storage backend (S3/MinIO)
+                file_content = _read_from_storage(image_url)
+            
+            if file_content is None:
                 logger.error(f"Image file not found: {file_path}")
                 result['quality_flags'].append({
                     'type': 'file_not_found',
@@ -81,121 +239,13 @@ def analyze_image_url(image_url):
                 })
                 result['has_issues'] = True
                 return result
-            
-            # Read local file
-            with open(file_path, 'rb') as f:
-                file_content = f.read()
             file_size = len(file_content)
             result['file_size'] = file_size
             
             # Open image with PIL
             img = Image.open(BytesIO(file_content))
         
-        # Get dimensions
-        width, height = img.size
-        result['width'] = width
-        result['height'] = height
-        
-        # Analyze for suspicious patterns
-        quality_flags = []
-        
-        # Check for unusually low resolution (less than 400x300)
-        if width < 400 or height < 300:
-            quality_flags.append({
-                'type': 'low_resolution',
-                'message': f'Low resolution: {width}x{height}px (recommend 400x300 minimum)',
-                'severity': 'warning'
-            })
-        
-        # Check for unusually high resolution (over 5000px)
-        if width > 5000 or height > 5000:
-            quality_flags.append({
-                'type': 'excessive_resolution',
-                'message': f'Excessive resolution: {width}x{height}px',
-                'severity': 'info'
-            })
-        
-        # Check for unusual aspect ratios (very wide or very tall)
-        aspect_ratio = width / height if height > 0 else 0
-        if aspect_ratio > 4 or aspect_ratio < 0.25:
-            quality_flags.append({
-                'type': 'unusual_aspect_ratio',
-                'message': f'Unusual aspect ratio: {aspect_ratio:.2f}:1',
-                'severity': 'warning'
-            })
-        
-        # Check file size (alert if very large > 10MB)
-        if file_size > 10 * 1024 * 1024:  # 10MB
-            quality_flags.append({
-                'type': 'large_file',
-                'message': f'Large file size: {file_size / (1024*1024):.1f}MB',
-                'severity': 'info'
-            })
-        
-        # Check file size (alert if very small < 5KB, might be corrupt)
-        if file_size < 5 * 1024:  # 5KB
-            quality_flags.append({
-                'type': 'small_file',
-                'message': f'Very small file size: {file_size / 1024:.1f}KB (possibly corrupt)',
-                'severity': 'warning'
-            })
-        
-        # Check for EXIF data (possible watermark or metadata)
-        has_exif = False
-        try:
-            exif_data = img._getexif()
-            if exif_data:
-                has_exif = True
-                quality_flags.append({
-                    'type': 'has_metadata',
-                    'message': 'Image contains EXIF metadata (camera/location info)',
-                    'severity': 'info'
-                })
-        except:
-            pass
-        
-        # Check for potential watermarks by analyzing image format and mode
-        # GIF with animation might indicate a watermark video
-        if img.format == 'GIF':
-            try:
-                img.seek(1)  # Try to get second frame
-                quality_flags.append({
-                    'type': 'animated_image',
-                    'message': 'Animated GIF detected',
-                    'severity': 'info'
-                })
-                img.seek(0)
-            except EOFError:
-                pass  # Not animated
-        
-        # Check color mode (grayscale images might indicate watermarks)
-        if img.mode in ['L', '1']:
-            quality_flags.append({
-                'type': 'grayscale_image',
-                'message': f'Grayscale image ({img.mode} mode) - consider using color photos',
-                'severity': 'warning'
-            })
-        
-        # Analyze color histogram for potential watermark patterns
-        # Sample: Check if image has very uniform colors (blank/placeholder)
-        try:
-            if img.mode == 'RGB' or img.mode == 'RGBA':
-                img_small = img.resize((20, 20))  # Small sample
-                colors = list(img_small.getdata())
-                unique_colors = len(set(colors))
-                
-                # If very few unique colors, might be placeholder or watermarked
-                if unique_colors < 10:
-                    quality_flags.append({
-                        'type': 'limited_colors',
-                        'message': f'Image has very limited color palette ({unique_colors} unique colors)',
-                        'severity': 'warning'
-                    })
-        except Exception as e:
-            logger.warning(f"Could not analyze color histogram: {e}")
-        
-        result['quality_flags'] = quality_flags
-        result['has_issues'] = len(quality_flags) > 0
+        _collect_metadata(img, file_size, result)
         
     except requests.RequestException as e:
         logger.error(f"Error downloading image from {image_url}: {e}")
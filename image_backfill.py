@@ -0,0 +1,176 @@
+"""
+Batch backfill / re-analysis of ItemImage metadata.
+
+Usage:
+    flask images backfill                  # rows missing width/height/file_size
+    flask images backfill --all            # re-analyse every image
+    flask images backfill --reset          # ignore the saved checkpoint
+
+Rows are read in id order in keyset batches, analysed in a process pool,
+written back with one bulk UPDATE per batch, and the last committed id is
+saved to a checkpoint file so an interrupted run resumes where it stopped.
+"""
+
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import or_, update
+
+from app import db
+from models import ItemImage
+from image_analyzer import analyze_image_bytes
+from storage import get_storage
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+images_cli = AppGroup('images', help='Image maintenance commands.')
+
+DEFAULT_CHECKPOINT = 'image_backfill_checkpoint.json'
+
+
+def _analyze_path(task):
+    """Worker-process entry point: (image_id, path) -> (image_id, analysis)."""
+    image_id, path = task
+    if path is None:
+        return image_id, None
+    try:
+        with open(path, 'rb') as f:
+            return image_id, analyze_image_bytes(f.read())
+    except OSError:
+        return image_id, None
+
+
+def _missing_result(image_url):
+    return {
+        'width': None,
+        'height': None,
+        'file_size': None,
+        'quality_flags': [{
+            'type': 'file_not_found',
+            'message': f'Image file not found: {image_url}',
+            'severity': 'error'
+        }],
+    }
+
+
+def _load_checkpoint(path):
+    if not os.path.exists(path):
+        return {'last_id': 0, 'processed': 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_checkpoint(path, last_id, processed):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'last_id': last_id, 'processed': processed, 'updated_at': time.time()}, f)
+    os.replace(tmp_path, path)
+
+
+def _iter_batches(last_id, batch_size, reanalyze_all):
+    """Yield lists of (id, image_url) in id order, one short query per batch."""
+    query = db.session.query(ItemImage.id, ItemImage.image_url)
+    if not reanalyze_all:
+        query = query.filter(or_(
+            ItemImage.width.is_(None),
+            ItemImage.height.is_(None),
+            ItemImage.file_size.is_(None),
+        ))
+    while True:
+        rows = query.filter(ItemImage.id > last_id).order_by(ItemImage.id).limit(batch_size).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def _resolve_local_path(storage, image_url):
+    """Local path for an image, pulling it into the cache for remote backends."""
+    path = storage.local_path(image_url)
+    if path and os.path.exists(path):
+        return path
+    if storage.open(image_url) is None:
+        return None
+    return storage.local_path(image_url)
+
+
+@images_cli.command('backfill')
+@click.option('--batch-size', default=200, show_default=True, help='Rows per bulk update / checkpoint.')
+@click.option('--workers', default=None, type=int, help='Analysis processes (default: CPU count).')
+@click.option('--all', 'reanalyze_all', is_flag=True, help='Re-analyse every image, not only rows missing metadata.')
+@click.option('--limit', default=None, type=int, help='Stop after this many images.')
+@click.option('--checkpoint', 'checkpoint_path', default=None, type=click.Path(dir_okay=False),
+              help='Checkpoint file (default: instance/image_backfill_checkpoint.json).')
+@click.option('--reset', is_flag=True, help='Ignore any saved checkpoint and start from the first image.')
+def backfill(batch_size, workers, reanalyze_all, limit, checkpoint_path, reset):
+    """Fill in width/height/file_size/quality_flags for existing item images."""
+    if checkpoint_path is None:
+        os.makedirs(current_app.instance_path, exist_ok=True)
+        checkpoint_path = os.path.join(current_app.instance_path, DEFAULT_CHECKPOINT)
+
+    checkpoint = {'last_id': 0, 'processed': 0} if reset else _load_checkpoint(checkpoint_path)
+    last_id = checkpoint['last_id']
+    processed_total = checkpoint['processed']
+    if last_id:
+        click.echo(f"Resuming after ItemImage id {last_id} ({processed_total} already processed)")
+
+    storage = get_storage()
+    processed = 0
+    analysed = 0
+    started = time.monotonic()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rows in _iter_batches(last_id, batch_size, reanalyze_all):
+            if limit is not None:
+                rows = rows[:max(limit - processed, 0)]
+                if not rows:
+                    break
+
+            batch_started = time.monotonic()
+            urls = {row.id: row.image_url for row in rows}
+            tasks = [(row.id, _resolve_local_path(storage, row.image_url)) for row in rows]
+            chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 4))
+
+            updates = []
+            for image_id, result in pool.map(_analyze_path, tasks, chunksize=chunksize):
+                if result is None:
+                    result = _missing_result(urls[image_id])
+                else:
+                    analysed += 1
+                updates.append({
+                    'id': image_id,
+                    'width': result['width'],
+                    'height': result['height'],
+                    'file_size': result['file_size'],
+                    'quality_flags': json.dumps(result['quality_flags']),
+                })
+
+            db.session.execute(update(ItemImage), updates)
+            db.session.commit()
+
+            last_id = rows[-1].id
+            processed += len(rows)
+            processed_total += len(rows)
+            _save_checkpoint(checkpoint_path, last_id, processed_total)
+
+            batch_elapsed = time.monotonic() - batch_started
+            click.echo(
+                f"  batch up to id {last_id}: {len(rows)} images in {batch_elapsed:.2f}s "
+                f"({len(rows) / batch_elapsed if batch_elapsed else 0:.1f} img/s)"
+            )
+            if limit is not None and processed >= limit:
+                break
+
+    elapsed = time.monotonic() - started
+    rate = processed / elapsed if elapsed else 0
+    click.echo(
+        f"Processed {processed} images ({analysed} analysed, {processed - analysed} missing files) "
+        f"in {elapsed:.1f}s - {rate:.1f} img/s. Checkpoint: {checkpoint_path}"
+    )
+    logger.info(f"Image backfill finished - processed={processed}, analysed={analysed}, rate={rate:.1f}/s, last_id={last_id}")
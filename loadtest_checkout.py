@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+"""
+Concurrent checkout load test.
+
+Seeds a throwaway database with N buyers and M "hot" items, then fires
+buyers x attempts /finalize_purchase requests (each for a random hot item)
+through the Flask test client from a pool of threads, and reports:
+
+  throughput   requests/s and completed purchases/s
+  latency      p50 / p95 / p99 / max per request
+  lock waits   statements blocked longer than --lock-threshold ms
+               (+ sampled pg_stat_activity lock waiters on Postgres)
+  violations   items sold twice, more sales than hot items, orders without
+               a success response, negative balances, lost credit or
+               trading point updates
+
+Every backend runs in its own subprocess (the app binds its database at
+import time); the parent collects the results into one report.
+
+    python loadtest_checkout.py                                      # SQLite
+    python loadtest_checkout.py --postgres postgresql://localhost/barterex_load
+    python loadtest_checkout.py --buyers 200 --items 10 --attempts 3 --concurrency 32 --report checkout_load.md
+
+The Postgres database is dropped and recreated - point it at a scratch
+database only. Exit status is 1 when any backend reports a violation.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+RESULT_MARKER = 'LOADTEST_RESULT '
+BASE_URL = 'https://localhost'
+ITEM_VALUE = 100
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent finalize_purchase load test.')
+    parser.add_argument('--buyers', type=int, default=100, help='simulated buyers (default: 100)')
+    parser.add_argument('--items', type=int, default=10, help='hot items all buyers compete for (default: 10)')
+    parser.add_argument('--attempts', type=int, default=3, help='checkouts per buyer (default: 3)')
+    parser.add_argument('--concurrency', type=int, default=16, help='requests in flight (default: 16)')
+    parser.add_argument('--credits', type=int, default=250,
+                        help=f'starting credits per buyer; items cost {ITEM_VALUE} (default: 250)')
+    parser.add_argument('--lock-threshold', type=float, default=5.0,
+                        help='statement time in ms counted as a lock wait (default: 5)')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for the request mix')
+    parser.add_argument('--sqlite', default=None, help='SQLite URL (default: a temporary file)')
+    parser.add_argument('--no-sqlite', action='store_true', help='skip the SQLite run')
+    parser.add_argument('--postgres', default=os.getenv('LOADTEST_POSTGRES_URL'),
+                        help='scratch Postgres URL (or LOADTEST_POSTGRES_URL); dropped and recreated')
+    parser.add_argument('--report', default=None, help='also write the report (markdown) to this file')
+    parser.add_argument('--run', default=None, help=argparse.SUPPRESS)  # child mode: database URL
+    return parser.parse_args(argv)
+
+
+# ==================== CHILD: ONE BACKEND ====================
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class StatementTimer:
+    """Times every statement on the engine; slow ones are counted as lock waits."""
+
+    def __init__(self, engine, threshold_ms):
+        from sqlalchemy import event
+
+        self.threshold = threshold_ms / 1000.0
+        self.waits = []
+        self.by_kind = Counter()
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('loadtest_started', []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['loadtest_started'].pop()
+        if elapsed >= self.threshold:
+            words = statement.lstrip().split(None, 1)
+            kind = words[0].upper() if words else '?'
+            if kind == 'SELECT' and 'FOR UPDATE' in statement.upper():
+                kind = 'SELECT FOR UPDATE'
+            with self._lock:
+                self.waits.append(elapsed)
+                self.by_kind[kind] += 1
+
+
+class PostgresLockSampler(threading.Thread):
+    """Samples the number of backends waiting on a lock every interval seconds."""
+
+    def __init__(self, url, interval=0.02):
+        super().__init__(daemon=True)
+        from sqlalchemy import create_engine, text
+
+        self.engine = create_engine(url, pool_size=1)
+        self.query = text(
+            "SELECT count(*) FROM pg_stat_activity "
+            "WHERE datname = current_database() AND wait_event_type = 'Lock'"
+        )
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+
+    def run(self):
+        with self.engine.connect() as conn:
+            while not self._stop.is_set():
+                self.samples.append(conn.execute(self.query).scalar())
+                conn.rollback()
+                time.sleep(self.interval)
+
+    def stop(self):
+        self._stop.set()
+        self.join()
+        self.engine.dispose()
+
+
+def classify(status, flashes):
+    if status >= 500:
+        return 'error'
+    text = ' '.join(message for _, message in flashes)
+    if 'Purchase complete' in text:
+        return 'purchased'
+    if 'no longer available' in text or 'not found' in text or 'already own' in text:
+        return 'sold_out'
+    if 'Insufficient' in text or 'credits' in text.lower():
+        return 'insufficient_credits'
+    if 'already being processed' in text:
+        return 'duplicate'
+    return 'error'
+
+
+def run_backend(url, args):
+    os.environ['SQLALCHEMY_DATABASE_URI'] = url
+
+    import logging
+    logging.disable(logging.WARNING)  # per-request INFO/WARNING logs would dominate the run
+
+    from app import app, db, limiter
+    from models import User, Item, Order, OrderItem, Trade, SystemSettings
+    from trading_points import POINTS_PER_PURCHASE, CREDITS_PER_LEVEL_UP, calculate_level_from_points
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['MAIL_SUPPRESS_SEND'] = True
+    app.config['OUTBOX_WORKER_ENABLED'] = False
+    app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+    app.extensions['mail'].suppress = True
+    if limiter is not None:
+        limiter.enabled = False
+
+    # ---- seed ----
+    seed_started = time.perf_counter()
+    with app.app_context():
+        backend = db.engine.dialect.name
+        db.drop_all()
+        db.create_all()
+        SystemSettings.get_settings()
+
+        seller = User(username='loadtest_seller', email='seller@loadtest.example', password_hash='x')
+        db.session.add(seller)
+        db.session.flush()
+        buyers = [
+            User(username=f'loadtest_buyer{n}', email=f'buyer{n}@loadtest.example',
+                 password_hash='x', credits=args.credits)
+            for n in range(args.buyers)
+        ]
+        items = [
+            Item(name=f'Hot item {n}', category='Electronics', value=ITEM_VALUE, user_id=seller.id,
+                 is_available=True, is_approved=True, status='approved')
+            for n in range(args.items)
+        ]
+        db.session.add_all(buyers + items)
+        db.session.commit()
+        buyer_ids = [b.id for b in buyers]
+        item_ids = [i.id for i in items]
+        timer = StatementTimer(db.engine, args.lock_threshold)
+    seed_seconds = time.perf_counter() - seed_started
+
+    rng = random.Random(args.seed)
+    tasks = [(buyer_id, rng.choice(item_ids)) for buyer_id in buyer_ids for _ in range(args.attempts)]
+    rng.shuffle(tasks)
+
+    outcomes = Counter()
+    latencies = []
+    purchases = Counter()  # buyer_id -> successful checkouts
+    results_lock = threading.Lock()
+
+    def checkout(task):
+        buyer_id, item_id = task
+        client = app.test_client()
+        with client.session_transaction(base_url=BASE_URL) as sess:
+            sess['_user_id'] = str(buyer_id)
+            sess['_fresh'] = True
+            sess['pending_checkout_items'] = [item_id]
+            sess['pending_delivery'] = {'method': 'home delivery', 'delivery_address': '1 Load Test Street'}
+        started = time.perf_counter()
+        try:
+            status = client.post('/finalize_purchase', base_url=BASE_URL).status_code
+        except Exception:
+            status = 599
+        elapsed = time.perf_counter() - started
+        flashes = []
+        if status < 500:
+            with client.session_transaction(base_url=BASE_URL) as sess:
+                flashes = sess.get('_flashes', [])
+        outcome = classify(status, flashes)
+        with results_lock:
+            latencies.append(elapsed)
+            outcomes[outcome] += 1
+            if outcome == 'purchased':
+                purchases[buyer_id] += 1
+
+    sampler = PostgresLockSampler(url) if backend == 'postgresql' else None
+    if sampler:
+        sampler.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(checkout, tasks))
+    wall = time.perf_counter() - started
+    if sampler:
+        sampler.stop()
+
+    # ---- verify ----
+    with app.app_context():
+        sold_counts = dict(
+            db.session.query(OrderItem.item_id, db.func.count(OrderItem.id)).group_by(OrderItem.item_id).all()
+        )
+        trade_counts = dict(
+            db.session.query(Trade.item_id, db.func.count(Trade.id)).group_by(Trade.item_id).all()
+        )
+        double_sold = sorted({item_id for item_id, n in sold_counts.items() if n > 1}
+                             | {item_id for item_id, n in trade_counts.items() if n > 1})
+        owners = {i.id: i.user_id for i in Item.query.filter(Item.id.in_(item_ids))}
+        buyer_of = dict(
+            db.session.query(OrderItem.item_id, Order.user_id).join(Order, Order.id == OrderItem.order_id).all()
+        )
+        wrong_owner = sorted(item_id for item_id, user_id in buyer_of.items() if owners.get(item_id) != user_id)
+        orders = Order.query.count()
+        spent = dict(
+            db.session.query(Order.user_id, db.func.coalesce(db.func.sum(Order.credits_used), 0))
+            .group_by(Order.user_id).all()
+        )
+        items_bought = dict(
+            db.session.query(Order.user_id, db.func.count(OrderItem.id))
+            .join(OrderItem, OrderItem.order_id == Order.id).group_by(Order.user_id).all()
+        )
+
+        negative, lost_credits, lost_points = [], [], []
+        for user in User.query.filter(User.id.in_(buyer_ids)):
+            bought = items_bought.get(user.id, 0)
+            expected_points = bought * POINTS_PER_PURCHASE
+            level_bonus = (calculate_level_from_points(expected_points) - 1) * CREDITS_PER_LEVEL_UP
+            expected_credits = args.credits - float(spent.get(user.id, 0)) + level_bonus
+            if user.credits < 0:
+                negative.append(user.id)
+            if abs(user.credits - expected_credits) > 0.001:
+                lost_credits.append(user.id)
+            if user.trading_points != expected_points:
+                lost_points.append(user.id)
+        db.session.remove()
+
+    waits = timer.waits
+    result = {
+        'backend': backend,
+        'url': url.split('@')[-1],
+        'requests': len(tasks),
+        'seed_seconds': seed_seconds,
+        'wall_seconds': wall,
+        'throughput_rps': len(tasks) / wall if wall else 0.0,
+        'purchases_per_second': outcomes['purchased'] / wall if wall else 0.0,
+        'outcomes': dict(outcomes),
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000,
+            'p95': percentile(latencies, 95) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'max': max(latencies) * 1000 if latencies else 0.0,
+        },
+        'lock_waits': {
+            'count': len(waits),
+            'total_ms': sum(waits) * 1000,
+            'p99_ms': percentile(waits, 99) * 1000,
+            'by_statement': dict(timer.by_kind),
+            'pg_max_waiters': max(sampler.samples) if sampler and sampler.samples else None,
+            'pg_avg_waiters': (sum(sampler.samples) / len(sampler.samples)) if sampler and sampler.samples else None,
+        },
+        'violations': {
+            'double_sold_items': double_sold,
+            'oversold': max(0, sum(sold_counts.values()) - len(item_ids)),
+            'wrong_owner_items': wrong_owner,
+            'orders_without_success': max(0, orders - outcomes['purchased']),
+            'negative_balances': negative,
+            'lost_credit_updates': lost_credits,
+            'lost_point_updates': lost_points,
+        },
+    }
+    return result
+
+
+# ==================== PARENT: REPORT ====================
+
+def violation_count(result):
+    total = 0
+    for value in result['violations'].values():
+        total += len(value) if isinstance(value, list) else value
+    return total
+
+
+def render_report(args, results, errors):
+    lines = [
+        '# Checkout load test',
+        '',
+        f"{datetime.utcnow():%Y-%m-%d %H:%M} UTC - {args.buyers} buyers x {args.attempts} attempts "
+        f"on {args.items} hot items, concurrency {args.concurrency}, {args.credits} credits per buyer "
+        f"(items cost {ITEM_VALUE}), lock wait threshold {args.lock_threshold:g} ms",
+        '',
+        '| | ' + ' | '.join(r['backend'] for r in results) + ' |',
+        '|---|' + '---|' * len(results),
+    ]
+
+    def row(label, fmt):
+        lines.append(f"| {label} | " + ' | '.join(fmt(r) for r in results) + ' |')
+
+    row('requests', lambda r: str(r['requests']))
+    row('wall time (s)', lambda r: f"{r['wall_seconds']:.2f}")
+    row('throughput (req/s)', lambda r: f"{r['throughput_rps']:.1f}")
+    row('purchases/s', lambda r: f"{r['purchases_per_second']:.1f}")
+    for outcome in ('purchased', 'sold_out', 'insufficient_credits', 'duplicate', 'error'):
+        row(f'outcome: {outcome}', lambda r, o=outcome: str(r['outcomes'].get(o, 0)))
+    for pct in ('p50', 'p95', 'p99', 'max'):
+        row(f'latency {pct} (ms)', lambda r, p=pct: f"{r['latency_ms'][p]:.1f}")
+    row('lock waits (statements)', lambda r: str(r['lock_waits']['count']))
+    row('lock wait total (ms)', lambda r: f"{r['lock_waits']['total_ms']:.0f}")
+    row('lock wait p99 (ms)', lambda r: f"{r['lock_waits']['p99_ms']:.1f}")
+    row('blocked statement kinds', lambda r: ', '.join(
+        f"{kind} {n}" for kind, n in sorted(r['lock_waits']['by_statement'].items())) or '-')
+    row('pg lock waiters max / avg', lambda r: '-' if r['lock_waits']['pg_max_waiters'] is None else
+        f"{r['lock_waits']['pg_max_waiters']} / {r['lock_waits']['pg_avg_waiters']:.2f}")
+    for name in ('double_sold_items', 'oversold', 'wrong_owner_items', 'orders_without_success',
+                 'negative_balances', 'lost_credit_updates', 'lost_point_updates'):
+        row(f'violation: {name}', lambda r, n=name: str(
+            len(r['violations'][n]) if isinstance(r['violations'][n], list) else r['violations'][n]))
+    row('**verdict**', lambda r: '**OK**' if not violation_count(r) else f"**{violation_count(r)} violation(s)**")
+
+    for backend, message in errors:
+        lines += ['', f"**{backend} run failed:**", '', '```', message.strip()[-2000:], '```']
+    return '\n'.join(lines) + '\n'
+
+
+def run_child(url, args):
+    argv = [sys.executable, os.path.abspath(__file__), '--run', url,
+            '--buyers', str(args.buyers), '--items', str(args.items), '--attempts', str(args.attempts),
+            '--concurrency', str(args.concurrency), '--credits', str(args.credits),
+            '--lock-threshold', str(args.lock_threshold), '--seed', str(args.seed)]
+    proc = subprocess.run(argv, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):]), None
+    return None, (proc.stderr or proc.stdout or f'exit status {proc.returncode}')
+
+
+def main():
+    args = parse_args()
+    if args.run:
+        print(RESULT_MARKER + json.dumps(run_backend(args.run, args)))
+        return 0
+
+    targets = []
+    if not args.no_sqlite:
+        targets.append(('sqlite', args.sqlite or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'checkout_load.db')}"))
+    if args.postgres:
+        targets.append(('postgresql', args.postgres))
+    if not targets:
+        print('Nothing to run: pass --postgres URL or drop --no-sqlite')
+        return 2
+
+    results, errors = [], []
+    for backend, url in targets:
+        print(f"Running {backend} ({args.buyers * args.attempts} checkouts)...", flush=True)
+        result, error = run_child(url, args)
+        if result:
+            results.append(result)
+        else:
+            errors.append((backend, error))
+
+    report = render_report(args, results, errors)
+    print()
+    print(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(report)
+        print(f"Report written to {args.report}")
+    return 1 if errors or any(violation_count(r) for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
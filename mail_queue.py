@@ -0,0 +1,249 @@
+"""
+Durable, pooled email delivery.
+
+queue_email() adds an OutgoingEmail row to the current transaction; after
+the commit a single delivery thread per process claims pending rows in
+batches and sends them over one reused SMTP connection, paced to
+MAIL_RATE_LIMIT messages per second. Transient failures are retried with
+exponential backoff; refused recipients and exhausted retries are parked as
+'failed'. The connection is closed after MAIL_CONNECTION_IDLE_TIMEOUT
+seconds without work and reopened on demand (Flask-Mail also reconnects
+every MAIL_MAX_EMAILS messages when that is set).
+
+Usage:
+    queue_email(subject, [user.email], html)   # caller commits
+    send_email_async(...)                      # routes.auth - same, with logging
+
+    flask mail run              # dedicated sender (set MAIL_QUEUE_WORKER_ENABLED=False)
+    flask mail run --once       # drain the queue and exit
+"""
+
+import time
+import smtplib
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from flask_mail import Connection, Message
+from sqlalchemy import event
+
+from app import db
+from models import OutgoingEmail
+from outbox import claim_due, backoff_seconds
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+mail_cli = AppGroup('mail', help='Mail queue commands.')
+
+MAIL_LEASE_SECONDS = 300
+
+
+class SMTPUnavailable(Exception):
+    """The SMTP connection could not be opened or was lost (not a per-message error)."""
+
+
+def _is_connection_error(error):
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                          smtplib.SMTPHeloError, smtplib.SMTPAuthenticationError)):
+        return True
+    # SMTPException subclasses OSError; any other OSError is a socket/TLS failure
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def queue_email(subject, recipients, html_body, sender=None):
+    """Add an email to the current transaction; it is delivered after commit."""
+    email = OutgoingEmail(
+        subject=subject,
+        sender=list(sender) if isinstance(sender, tuple) else sender,
+        recipients=recipients if isinstance(recipients, list) else [recipients],
+        html_body=html_body,
+    )
+    db.session.add(email)
+    db.session.info['mail_queued'] = True
+    return email
+
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_after_commit(session):
+    if session.info.pop('mail_queued', False):
+        wake_worker()
+
+
+def _build_message(email):
+    sender = email.sender or current_app.config.get('MAIL_DEFAULT_SENDER', 'noreply@barterex.com')
+    return Message(
+        subject=email.subject,
+        sender=tuple(sender) if isinstance(sender, list) else sender,
+        recipients=list(email.recipients),
+        html=email.html_body,
+    )
+
+
+class MailDeliveryWorker:
+    """One sender thread and one SMTP connection per process."""
+
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config.get('MAIL_QUEUE_BATCH_SIZE', 50)
+        self.rate_limit = app.config.get('MAIL_RATE_LIMIT', 10)
+        self.max_attempts = app.config.get('MAIL_MAX_ATTEMPTS', 6)
+        self.poll_interval = app.config.get('MAIL_QUEUE_POLL_INTERVAL', 10)
+        self.idle_timeout = app.config.get('MAIL_CONNECTION_IDLE_TIMEOUT', 60)
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._connection = None
+        self._last_used = 0.0
+        self._next_send_at = 0.0
+
+    # ---- thread lifecycle ----
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='mail-delivery', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    self.drain()
+            except Exception as e:
+                logger.error(f"Mail delivery worker error: {e}", exc_info=True)
+            if self._connection is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                self.close()
+
+    # ---- delivery ----
+
+    def drain(self):
+        """Send everything currently due. Returns the number of emails sent."""
+        sent = 0
+        while True:
+            claimed = claim_due(OutgoingEmail, self.batch_size, MAIL_LEASE_SECONDS)
+            if not claimed:
+                break
+            emails = OutgoingEmail.query.filter(OutgoingEmail.id.in_(claimed)).order_by(OutgoingEmail.id).all()
+            for index, email in enumerate(emails):
+                try:
+                    if self._deliver(email):
+                        sent += 1
+                except SMTPUnavailable as e:
+                    # SMTP server unreachable - back off the rest of the batch instead of
+                    # paying a connect timeout per message
+                    for remaining in emails[index:]:
+                        self._mark_failed(remaining, e)
+                    db.session.commit()
+                    db.session.remove()
+                    return sent
+            db.session.commit()
+        db.session.remove()
+        if sent:
+            logger.info(f"Mail queue: {sent} email(s) sent")
+        return sent
+
+    def _deliver(self, email):
+        """Send one email; connection-level errors propagate to drain()."""
+        try:
+            msg = _build_message(email)
+            self._throttle()
+            try:
+                self._send(msg)
+            except smtplib.SMTPServerDisconnected:
+                # Idle connection dropped by the server - reconnect once
+                self.close()
+                self._send(msg)
+        except Exception as e:
+            if _is_connection_error(e):
+                self.close()
+                raise SMTPUnavailable(f"{type(e).__name__}: {e}") from e
+            self._mark_failed(email, e)
+            return False
+
+        email.status = 'sent'
+        email.sent_at = datetime.utcnow()
+        email.locked_at = None
+        email.last_error = None
+        return True
+
+    def _send(self, msg):
+        if self._connection is None:
+            self._connection = Connection(current_app.extensions['mail']).__enter__()
+        self._connection.send(msg)
+        self._last_used = time.monotonic()
+
+    def _throttle(self):
+        if not self.rate_limit:
+            return
+        now = time.monotonic()
+        if self._next_send_at > now:
+            time.sleep(self._next_send_at - now)
+        self._next_send_at = max(now, self._next_send_at) + 1.0 / self.rate_limit
+
+    def _mark_failed(self, email, error):
+        email.last_error = str(error) if isinstance(error, SMTPUnavailable) else f"{type(error).__name__}: {error}"
+        email.locked_at = None
+        permanent = isinstance(error, (smtplib.SMTPRecipientsRefused, AssertionError))
+        if permanent or email.attempts >= self.max_attempts:
+            email.status = 'failed'
+            logger.error(f"❌ Email {email.id} to {email.recipients} failed permanently after {email.attempts} attempt(s): {error}")
+        else:
+            email.status = 'pending'
+            email.available_at = datetime.utcnow() + timedelta(seconds=backoff_seconds(email.attempts))
+            logger.warning(f"Email {email.id} to {email.recipients} attempt {email.attempts} failed, will retry: {error}")
+
+    def close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None and connection.host is not None:
+            try:
+                connection.host.quit()
+            except Exception:
+                connection.host.close()
+
+
+def get_worker(app=None):
+    """Return the app's mail delivery worker, creating it on first use."""
+    app = app or current_app._get_current_object()
+    worker = app.extensions.get('barterex_mail_worker')
+    if worker is None:
+        worker = MailDeliveryWorker(app)
+        app.extensions['barterex_mail_worker'] = worker
+    return worker
+
+
+def wake_worker():
+    """Start (if needed) and wake the in-process sender."""
+    if not current_app.config.get('MAIL_QUEUE_WORKER_ENABLED', True):
+        return
+    try:
+        get_worker().wake()
+    except Exception as e:
+        # Rows stay pending and are sent on the next poll / by `flask mail run`
+        logger.warning(f"Could not wake mail delivery worker: {e}")
+
+
+@mail_cli.command('run')
+@click.option('--once', is_flag=True, help='Send everything currently due, then exit.')
+def run(once):
+    """Run the mail delivery worker in the foreground."""
+    worker = MailDeliveryWorker(current_app._get_current_object())
+    total = 0
+    try:
+        while True:
+            sent = worker.drain()
+            total += sent
+            if once:
+                break
+            time.sleep(worker.poll_interval)
+    finally:
+        worker.close()
+    click.echo(f"Sent {total} email(s)")
@@ -0,0 +1,34 @@
+"""Add order.updated_at change cursor
+
+Revision ID: a3d6e9f2c4b7
+Revises: f5c3d9a7b1e8
+Create Date: 2026-10-19 16:05:12.418377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d6e9f2c4b7'
+down_revision = 'f5c3d9a7b1e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    # Existing orders: last known change is when they were placed
+    order = sa.table('order', sa.column('updated_at', sa.DateTime()), sa.column('date_ordered', sa.DateTime()))
+    op.execute(order.update().values(updated_at=sa.func.coalesce(order.c.date_ordered, sa.func.now())))
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.create_index('idx_order_updated_at', ['updated_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index('idx_order_updated_at')
+        batch_op.drop_column('updated_at')
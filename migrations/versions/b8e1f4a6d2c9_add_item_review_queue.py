@@ -0,0 +1,44 @@
+"""Add item approval queue priority and claim columns
+
+Revision ID: b8e1f4a6d2c9
+Revises: a3d6e9f2c4b7
+Create Date: 2026-10-19 17:20:44.903112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e1f4a6d2c9'
+down_revision = 'a3d6e9f2c4b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('submitted_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('review_priority_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('review_claimed_by', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('review_claimed_until', sa.DateTime(), nullable=True))
+
+    # Existing items: submitted when their first image was stored, no priority boost
+    op.execute(
+        "UPDATE item SET submitted_at = COALESCE("
+        "(SELECT MIN(item_image.created_at) FROM item_image WHERE item_image.item_id = item.id), "
+        "CURRENT_TIMESTAMP)"
+    )
+    op.execute("UPDATE item SET review_priority_at = submitted_at")
+
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.create_index('idx_item_review_queue', ['status', 'review_priority_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.drop_index('idx_item_review_queue')
+        batch_op.drop_column('review_claimed_until')
+        batch_op.drop_column('review_claimed_by')
+        batch_op.drop_column('review_priority_at')
+        batch_op.drop_column('submitted_at')
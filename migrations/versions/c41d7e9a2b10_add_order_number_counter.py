@@ -0,0 +1,38 @@
+"""Add per-day order number counter
+
+Revision ID: c41d7e9a2b10
+Revises: aa551f877817
+Create Date: 2026-10-19 09:12:44.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d7e9a2b10'
+down_revision = 'aa551f877817'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('order_number_counter',
+        sa.Column('day', sa.String(length=8), nullable=False),
+        sa.Column('last_value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('day')
+    )
+
+    # Seed counters from existing ORD-YYYYMMDD-NNNNN numbers so new orders
+    # continue each day's sequence instead of colliding with it
+    op.execute("""
+        INSERT INTO order_number_counter (day, last_value)
+        SELECT substr(order_number, 5, 8), MAX(CAST(substr(order_number, 14) AS INTEGER))
+        FROM "order"
+        WHERE order_number LIKE 'ORD-________-%'
+        GROUP BY substr(order_number, 5, 8)
+    """)
+
+
+def downgrade():
+    op.drop_table('order_number_counter')
@@ -0,0 +1,28 @@
+"""Index pending wishlist matches for digest delivery
+
+Revision ID: c4f7a2e9b1d3
+Revises: b8e1f4a6d2c9
+Create Date: 2026-10-19 17:42:08.215904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f7a2e9b1d3'
+down_revision = 'b8e1f4a6d2c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # notification_sent_at is now NULL until a digest delivers the match; existing rows
+    # were notified when they were created and keep their timestamps
+    with op.batch_alter_table('wishlist_match', schema=None) as batch_op:
+        batch_op.create_index('idx_wishlist_match_pending', ['notification_sent_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('wishlist_match', schema=None) as batch_op:
+        batch_op.drop_index('idx_wishlist_match_pending')
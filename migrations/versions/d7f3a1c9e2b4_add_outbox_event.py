@@ -0,0 +1,41 @@
+"""Add outbox_event table for post-commit side effects
+
+Revision ID: d7f3a1c9e2b4
+Revises: c41d7e9a2b10
+Create Date: 2026-10-19 11:02:17.530917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7f3a1c9e2b4'
+down_revision = 'c41d7e9a2b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('event_type', sa.String(length=50), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('available_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('outbox_event', schema=None) as batch_op:
+        batch_op.create_index('idx_outbox_event_status_available', ['status', 'available_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('outbox_event', schema=None) as batch_op:
+        batch_op.drop_index('idx_outbox_event_status_available')
+
+    op.drop_table('outbox_event')
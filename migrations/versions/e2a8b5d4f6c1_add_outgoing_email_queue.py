@@ -0,0 +1,43 @@
+"""Add outgoing_email table for the durable mail queue
+
+Revision ID: e2a8b5d4f6c1
+Revises: d7f3a1c9e2b4
+Create Date: 2026-10-19 13:40:05.771342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a8b5d4f6c1'
+down_revision = 'd7f3a1c9e2b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outgoing_email',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('subject', sa.String(length=255), nullable=False),
+        sa.Column('sender', sa.JSON(), nullable=True),
+        sa.Column('recipients', sa.JSON(), nullable=False),
+        sa.Column('html_body', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('available_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('outgoing_email', schema=None) as batch_op:
+        batch_op.create_index('idx_outgoing_email_status_available', ['status', 'available_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('outgoing_email', schema=None) as batch_op:
+        batch_op.drop_index('idx_outgoing_email_status_available')
+
+    op.drop_table('outgoing_email')
@@ -0,0 +1,42 @@
+"""Add per-user notification counters and the (user_id, is_read, created_at) index
+
+Revision ID: e9b3c6f1a4d8
+Revises: c4f7a2e9b1d3
+Create Date: 2026-10-19 18:05:31.442718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9b3c6f1a4d8'
+down_revision = 'c4f7a2e9b1d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.create_index('idx_notification_user_read_created', ['user_id', 'is_read', 'created_at'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('notification_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('unread_notification_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Existing users: count what they already have
+    op.execute(
+        'UPDATE "user" SET '
+        'notification_count = (SELECT COUNT(*) FROM notification WHERE notification.user_id = "user".id), '
+        'unread_notification_count = (SELECT COUNT(*) FROM notification '
+        'WHERE notification.user_id = "user".id AND notification.is_read = false)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('unread_notification_count')
+        batch_op.drop_column('notification_count')
+
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.drop_index('idx_notification_user_read_created')
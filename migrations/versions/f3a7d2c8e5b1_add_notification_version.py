@@ -0,0 +1,26 @@
+"""Add a per-user notification version for conditional polling
+
+Revision ID: f3a7d2c8e5b1
+Revises: e9b3c6f1a4d8
+Create Date: 2026-10-19 18:31:12.087354
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a7d2c8e5b1'
+down_revision = 'e9b3c6f1a4d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('notification_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('notification_version')
@@ -0,0 +1,42 @@
+"""Add idempotency_key table for checkout and payment verification
+
+Revision ID: f5c3d9a7b1e8
+Revises: e2a8b5d4f6c1
+Create Date: 2026-10-19 15:12:41.208934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5c3d9a7b1e8'
+down_revision = 'e2a8b5d4f6c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('idempotency_key',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('scope', sa.String(length=50), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('response', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('scope', 'key', name='uq_idempotency_key_scope_key')
+    )
+    with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+        batch_op.create_index('idx_idempotency_key_expires_at', ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+        batch_op.drop_index('idx_idempotency_key_expires_at')
+
+    op.drop_table('idempotency_key')
@@ -4,7 +4,41 @@ from datetime import datetime
 import random
 import secrets
 import json
+from sqlalchemy import update, select
 from sqlalchemy.orm import validates
+from sqlalchemy.orm.util import identity_key
+
+
+def _expire_cached(model, row_id, attributes):
+    """Expire attributes of an already-loaded instance after a Core UPDATE changed them in the database"""
+    instance = db.session.identity_map.get(identity_key(model, row_id))
+    if instance is not None:
+        db.session.expire(instance, attributes)
+
+
+def _update_returning(stmt, model, row_id, column):
+    """Run a conditional UPDATE and return column's new value, or None if no row matched"""
+    stmt = stmt.execution_options(synchronize_session=False)
+    if db.session.get_bind().dialect.update_returning:
+        return db.session.execute(stmt.returning(column)).scalar_one_or_none()
+    if not db.session.execute(stmt).rowcount:
+        return None
+    return db.session.execute(select(column).where(model.id == row_id)).scalar_one()
+
+
+def _update_returning_many(model, criteria, values, *columns):
+    """Run a set-based UPDATE and return (id, *columns) rows, as updated, for every row it matched"""
+    if db.session.get_bind().dialect.update_returning:
+        stmt = update(model).where(*criteria).values(values).returning(model.id, *columns)
+        return db.session.execute(stmt.execution_options(synchronize_session=False)).all()
+    # No RETURNING: lock the matching rows first so the read-back sees exactly what we updated
+    ids = db.session.execute(select(model.id).where(*criteria).with_for_update()).scalars().all()
+    if not ids:
+        return []
+    db.session.execute(
+        update(model).where(model.id.in_(ids)).values(values).execution_options(synchronize_session=False)
+    )
+    return db.session.execute(select(model.id, *columns).where(model.id.in_(ids))).all()
 
 
 class User(db.Model, UserMixin):
@@ -70,6 +104,11 @@ class User(db.Model, UserMixin):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime, nullable=True)
 
+    # Notification counters, kept in step with the notification table on commit (see notifications.py)
+    notification_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    unread_notification_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    notification_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # bumped on every change, for ETags
+
     # Notification Preferences (Consignment Model)
     notification_preferences = db.Column(db.JSON, default=lambda: {
         'email_order_updates': True,
@@ -151,6 +190,75 @@ class User(db.Model, UserMixin):
         if not self.state:
             incomplete.append('State')
         return incomplete
+    
+    # Balance and points changes are single UPDATE ... SET col = col + :delta statements,
+    # so concurrent requests never overwrite each other with a stale value read into Python
+    # and no row lock is held while Python code runs. None of these commit.
+    
+    @classmethod
+    def change_credits(cls, user_id, amount, allow_negative=False):
+        """
+        Atomically add amount (negative to deduct) to a user's credits.
+        A deduction only applies if the balance covers it.
+        Returns the new balance, or None if the user is missing or short of credits.
+        """
+        balance = db.func.coalesce(cls.credits, 0)
+        stmt = update(cls).where(cls.id == user_id).values(credits=balance + amount)
+        if amount < 0 and not allow_negative:
+            stmt = stmt.where(balance + amount >= 0)
+        new_balance = _update_returning(stmt, cls, user_id, cls.credits)
+        _expire_cached(cls, user_id, ['credits'])
+        return new_balance
+    
+    @classmethod
+    def add_trading_points(cls, user_id, points):
+        """Atomically add trading points; returns the new total (None if the user is missing)"""
+        stmt = update(cls).where(cls.id == user_id).values(
+            trading_points=db.func.coalesce(cls.trading_points, 0) + points
+        )
+        total = _update_returning(stmt, cls, user_id, cls.trading_points)
+        _expire_cached(cls, user_id, ['trading_points'])
+        return total
+    
+    @classmethod
+    def add_credits_many(cls, amounts):
+        """Add {user_id: amount} to many users' credits with one UPDATE; returns {user_id: new balance}"""
+        if not amounts:
+            return {}
+        rows = _update_returning_many(
+            cls, [cls.id.in_(amounts)],
+            {'credits': db.func.coalesce(cls.credits, 0) + db.case(amounts, value=cls.id, else_=0)},
+            cls.credits,
+        )
+        for user_id in amounts:
+            _expire_cached(cls, user_id, ['credits'])
+        return {row[0]: row[1] for row in rows}
+    
+    @classmethod
+    def add_trading_points_many(cls, points):
+        """Add {user_id: points} to many users with one UPDATE; returns {user_id: new total}"""
+        if not points:
+            return {}
+        rows = _update_returning_many(
+            cls, [cls.id.in_(points)],
+            {'trading_points': db.func.coalesce(cls.trading_points, 0) + db.case(points, value=cls.id, else_=0)},
+            cls.trading_points,
+        )
+        for user_id in points:
+            _expire_cached(cls, user_id, ['trading_points'])
+        return {row[0]: row[1] for row in rows}
+    
+    @classmethod
+    def raise_level(cls, user_id, level, tier):
+        """Set level and tier unless the stored level is already as high; returns True if changed"""
+        result = db.session.execute(
+            update(cls)
+            .where(cls.id == user_id, db.func.coalesce(cls.level, 1) < level)
+            .values(level=level, tier=tier)
+            .execution_options(synchronize_session=False)
+        )
+        _expire_cached(cls, user_id, ['level', 'tier'])
+        return bool(result.rowcount)
 
 
 class Admin(db.Model):
@@ -292,6 +400,12 @@ class Item(db.Model):
     category = db.Column(db.String(100), nullable=False)  # Electronics, etc.
     credited = db.Column(db.Boolean, default=False)
     location = db.Column(db.String(100))  # New field
+    
+    # Approval queue (approval_queue.py): ordered by review_priority_at = submitted_at - priority boost
+    submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    review_priority_at = db.Column(db.DateTime, default=datetime.utcnow)
+    review_claimed_by = db.Column(db.Integer, nullable=True)  # Admin.id holding the review lease
+    review_claimed_until = db.Column(db.DateTime, nullable=True)
     # Unique number in format EA-XXXXXX (cryptographically secure)
     item_number = db.Column(
         db.String(20), 
@@ -327,6 +441,61 @@ class Item(db.Model):
                 raise ValueError(f'Invalid condition. Must be one of: {valid_options}')
         return condition
     
+    @classmethod
+    def mark_sold(cls, item_id, buyer_id):
+        """
+        Transfer an available item to buyer_id with one conditional UPDATE.
+        Returns False if it was sold or withdrawn in the meantime. Does not commit.
+        """
+        result = db.session.execute(
+            update(cls)
+            .where(cls.id == item_id, cls.is_available == True, cls.user_id != buyer_id)
+            .values(user_id=buyer_id, is_available=False)
+            .execution_options(synchronize_session=False)
+        )
+        _expire_cached(cls, item_id, ['user_id', 'is_available', 'user'])
+        return result.rowcount == 1
+    
+    @classmethod
+    def approve(cls, item_id, value):
+        """
+        Approve a pending item at value with one conditional UPDATE.
+        Returns False if it was already approved (e.g. by a concurrent request). Does not commit.
+        """
+        result = db.session.execute(
+            update(cls)
+            .where(cls.id == item_id, db.or_(cls.is_approved == False, cls.is_approved.is_(None)))
+            .values(value=value, is_approved=True, is_available=True, status='approved', credited=True)
+            .execution_options(synchronize_session=False)
+        )
+        _expire_cached(cls, item_id, ['value', 'is_approved', 'is_available', 'status', 'credited'])
+        return result.rowcount == 1
+    
+    @classmethod
+    def approve_many(cls, values, *criteria):
+        """
+        Approve {item_id: value} pending items with one conditional UPDATE (extra criteria are ANDed).
+        Returns (id, user_id, name, value) rows for the items it approved; already-approved
+        items are skipped, so owners are credited once. Does not commit.
+        """
+        if not values:
+            return []
+        rows = _update_returning_many(
+            cls,
+            [cls.id.in_(values), db.or_(cls.is_approved == False, cls.is_approved.is_(None)), *criteria],
+            {
+                'value': db.case(values, value=cls.id),
+                'is_approved': True,
+                'is_available': True,
+                'status': 'approved',
+                'credited': True,
+            },
+            cls.user_id, cls.name, cls.value,
+        )
+        for row in rows:
+            _expire_cached(cls, row[0], ['value', 'is_approved', 'is_available', 'status', 'credited'])
+        return rows
+    
     # Database indexes for frequently queried fields (performance optimization)
     # ✅ user_id: Used in dashboard, user profile, "my items" queries
     # ✅ category: Used in marketplace filtering and search
@@ -339,6 +508,8 @@ class Item(db.Model):
         db.Index('idx_item_status', 'status'),
         # Composite index for common combined queries
         db.Index('idx_item_category_available', 'category', 'is_available'),
+        # Approval queue keyset scan
+        db.Index('idx_item_review_queue', 'status', 'review_priority_at', 'id'),
     )
 
 
@@ -437,10 +608,65 @@ class Order(db.Model):
     actual_delivery_date = db.Column(db.DateTime, nullable=True)  # Actual delivery date
     receipt_downloaded = db.Column(db.Boolean, default=False)  # Track if receipt was downloaded
     transaction_notes = db.Column(db.Text, nullable=True)  # Additional notes about the transaction
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Change cursor for /admin/api/order-updates
     
     user = db.relationship('User', back_populates='orders')
     pickup_station = db.relationship('PickupStation', backref='orders')
     items = db.relationship('OrderItem', back_populates='order', cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        db.Index('idx_order_updated_at', 'updated_at', 'id'),
+    )
+
+
+class OrderNumberCounter(db.Model):
+    """
+    Per-day order number sequence (ORD-YYYYMMDD-NNNNN).
+    
+    next_order_number() increments the day's row with a single upsert inside the
+    caller's transaction, so the row lock is held until the checkout commits:
+    concurrent checkouts serialize on it and a rolled-back checkout releases its
+    number, keeping the sequence gap-free.
+    """
+    __tablename__ = 'order_number_counter'
+    
+    day = db.Column(db.String(8), primary_key=True)  # YYYYMMDD (UTC)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<OrderNumberCounter {self.day}={self.last_value}>'
+    
+    @classmethod
+    def next_value(cls, day):
+        """Atomically increment and return the counter for day (does not commit)"""
+        dialect = db.session.get_bind().dialect.name
+        
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(cls.__table__).values(day=day, last_value=1)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[cls.__table__.c.day],
+                set_={'last_value': cls.__table__.c.last_value + 1}
+            ).returning(cls.__table__.c.last_value)
+            return db.session.execute(stmt).scalar_one()
+        
+        # Other backends: lock the row, creating it on first use
+        counter = cls.query.filter_by(day=day).with_for_update().first()
+        if counter is None:
+            counter = cls(day=day, last_value=0)
+            db.session.add(counter)
+        counter.last_value += 1
+        db.session.flush()
+        return counter.last_value
+    
+    @classmethod
+    def next_order_number(cls, when=None):
+        """Return the next order number for when (default: now, UTC)"""
+        day = (when or datetime.utcnow()).strftime('%Y%m%d')
+        return f"ORD-{day}-{cls.next_value(day):05d}"
 
 
 class OrderItem(db.Model):
@@ -478,10 +704,101 @@ class Notification(db.Model):
     is_email_sent = db.Column(db.Boolean, default=False)  # Track if email notification was sent
     priority = db.Column(db.String(20), default='normal')  # low, normal, high, urgent
     
+    __table_args__ = (
+        # Per-user unread lists and recounts, newest first
+        db.Index('idx_notification_user_read_created', 'user_id', 'is_read', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<Notification {self.id}: {self.notification_type}>'
 
 
+class OutboxEvent(db.Model):
+    """
+    Post-commit side effect (notification, email, referral bonus, ...).
+    
+    Rows are added in the same transaction as the change that caused them, so
+    an event exists if and only if that change committed. outbox.py claims and
+    runs pending rows in the background, retrying failures with backoff.
+    """
+    __tablename__ = 'outbox_event'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)  # handler name, see outbox.py
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # not before (retry backoff)
+    locked_at = db.Column(db.DateTime, nullable=True)  # claim time, for reclaiming after a worker crash
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('idx_outbox_event_status_available', 'status', 'available_at'),
+    )
+    
+    def __repr__(self):
+        return f'<OutboxEvent {self.id}: {self.event_type} ({self.status})>'
+
+
+class OutgoingEmail(db.Model):
+    """
+    Durable mail queue. send_email_async()/queue_email() insert rows and
+    mail_queue.py delivers them over a reused SMTP connection with rate
+    limiting and retry, so queued mail survives a process restart.
+    """
+    __tablename__ = 'outgoing_email'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.JSON, nullable=True)  # "addr" or [name, addr]; None = MAIL_DEFAULT_SENDER
+    recipients = db.Column(db.JSON, nullable=False)
+    html_body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # not before (retry backoff)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('idx_outgoing_email_status_available', 'status', 'available_at'),
+    )
+    
+    def __repr__(self):
+        return f'<OutgoingEmail {self.id}: {self.subject!r} ({self.status})>'
+
+
+class IdempotencyKey(db.Model):
+    """
+    Recorded outcome of a non-repeatable request (checkout, payment
+    verification), keyed by scope + client/reference key. idempotency.py
+    claims the key before running the request and stores the result, so
+    retries and duplicate webhooks replay it instead of running again.
+    """
+    __tablename__ = 'idempotency_key'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(50), nullable=False)  # finalize_purchase, payment_verification
+    key = db.Column(db.String(255), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, completed
+    response = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'key', name='uq_idempotency_key_scope_key'),
+        db.Index('idx_idempotency_key_expires_at', 'expires_at'),
+    )
+    
+    def __repr__(self):
+        return f'<IdempotencyKey {self.scope}:{self.key} ({self.status})>'
+
+
 class CreditTransaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -775,7 +1092,7 @@ class WishlistMatch(db.Model):
     item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False, index=True)
     
     # Notification tracking
-    notification_sent_at = db.Column(db.DateTime, default=datetime.utcnow)
+    notification_sent_at = db.Column(db.DateTime, nullable=True)  # NULL until delivered in a digest (wishlist_digest.py)
     email_sent = db.Column(db.Boolean, default=False)
     app_notification_sent = db.Column(db.Boolean, default=False)
     notification_id = db.Column(db.Integer, db.ForeignKey('notification.id'), nullable=True)
@@ -790,6 +1107,7 @@ class WishlistMatch(db.Model):
         db.UniqueConstraint('wishlist_id', 'item_id', name='unique_wishlist_match'),
         db.Index('idx_wishlist_match_wishlist_id', 'wishlist_id'),
         db.Index('idx_wishlist_match_item_id', 'item_id'),
+        db.Index('idx_wishlist_match_pending', 'notification_sent_at'),
     )
     
     def __repr__(self):
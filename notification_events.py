@@ -0,0 +1,388 @@
+"""
+Per-user push channel for in-app notifications (SSE).
+
+Every logged-in page holds an EventSource on /api/notifications/stream
+instead of polling /api/notifications/real-time. Each process runs one
+broadcaster thread; connections wait on a per-connection queue, so under the
+gevent worker (gunicorn.conf.py) an idle user costs an idle greenlet and no
+queries.
+
+Commits that create, read or delete notifications publish the affected user
+ids (see notifications.py, which already tracks them for the counters):
+- PostgreSQL: NOTIFY barterex_notification_events inside the transaction,
+  delivered to every LISTENing process when it commits.
+- Other databases: the commit wakes this process's broadcaster directly;
+  other processes pick changes up on their next counter poll
+  (NOTIFICATION_STREAM_POLL_INTERVAL), one query for all their subscribers.
+
+On a change the broadcaster loads, for the subscribed users only, their
+unread counters and the unread notifications they have not been sent yet
+(two queries however many users changed) and pushes one event per user.
+Long-poll requests wait on the same feed (wait()) for the user's
+notification_version to move.
+
+Usage:
+    return get_broadcaster().stream(user_id, after_id, version, unread_count), {'Content-Type': 'text/event-stream'}
+    changed = get_broadcaster().wait(user_id, version, timeout=25)
+"""
+
+import json
+import queue
+import select
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, text
+
+from app import db
+from models import User, Notification
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+NOTIFICATION_EVENTS_CHANNEL = 'barterex_notification_events'
+NOTIFY_USERS_PER_PAYLOAD = 500  # keeps NOTIFY payloads under PostgreSQL's 8000 byte limit
+MAX_NOTIFICATIONS_PER_EVENT = 10
+SUBSCRIBER_QUEUE_SIZE = 16
+
+
+def _format_event(data):
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def serialize_notification(notification):
+    return {
+        'id': notification.id,
+        'message': notification.message,
+        'type': notification.notification_type,
+        'category': notification.category,
+        'timestamp': notification.timestamp.isoformat() if notification.timestamp else None,
+        'priority': notification.priority,
+        'action_url': notification.action_url,
+        'data': notification.data or {}
+    }
+
+
+class NotificationBroadcaster:
+    """One background loop per process pushing to every user's open streams."""
+
+    def __init__(self, app, poll_interval=5, heartbeat=15):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self._subscribers = defaultdict(set)  # user_id -> queues
+        self._last_ids = {}    # user_id -> newest notification id already pushed
+        self._versions = {}    # user_id -> notification_version last pushed
+        self._waiters = defaultdict(dict)  # user_id -> {threading.Event: version} for long polls
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._has_subscribers = threading.Event()
+        self._pending_users = set()
+        self._pending_all = False
+        self._thread = None
+
+    # ---- subscribers ----
+
+    def _start(self):
+        # Called with self._lock held
+        self._has_subscribers.set()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='notification-events', daemon=True)
+            self._thread.start()
+
+    def _watched_users(self):
+        # Called with self._lock held
+        return set(self._subscribers) | set(self._waiters)
+
+    def subscribe(self, user_id, after_id=0, version=None):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if not self._subscribers.get(user_id):
+                self._last_ids[user_id] = after_id
+                self._versions[user_id] = version
+            self._subscribers[user_id].add(q)
+            self._start()
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(q)
+                if not queues:
+                    del self._subscribers[user_id]
+                    self._last_ids.pop(user_id, None)
+                    self._versions.pop(user_id, None)
+            if not self._watched_users():
+                self._has_subscribers.clear()
+
+    def wait(self, user_id, version, timeout, current_version=None):
+        """
+        Block until user_id's notification_version differs from version, up to timeout
+        seconds. Returns True if it changed. current_version, if given, is called once
+        the wait is registered, to catch a change committed just before.
+        """
+        waiter = threading.Event()
+        with self._lock:
+            self._waiters[user_id][waiter] = version
+            self._start()
+        try:
+            if current_version is not None and current_version() != version:
+                return True
+            return waiter.wait(timeout)
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(user_id)
+                if waiters is not None:
+                    waiters.pop(waiter, None)
+                    if not waiters:
+                        del self._waiters[user_id]
+                if not self._watched_users():
+                    self._has_subscribers.clear()
+
+    def _wake_waiters(self, user_ids):
+        with self._lock:
+            waiters = [waiter for user_id in user_ids for waiter in self._waiters.get(user_id, ())]
+        for waiter in waiters:
+            waiter.set()
+
+    def subscriber_count(self):
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def stream(self, user_id, after_id=0, version=0, unread_count=0):
+        """
+        SSE generator for one connection of user_id.
+
+        after_id is the user's newest notification at connect time; only newer
+        ones are pushed. version and unread_count come from the (already loaded)
+        user row.
+        """
+        q = self.subscribe(user_id, after_id, version)
+        try:
+            yield _format_event({'type': 'initial', 'unread_count': unread_count,
+                                 'timestamp': datetime.utcnow().isoformat()})
+            while True:
+                try:
+                    yield q.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(user_id, q)
+
+    def _send(self, user_id, message):
+        with self._lock:
+            queues = list(self._subscribers.get(user_id, ()))
+        for q in queues:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Slow client: drop its oldest event rather than block the loop
+                try:
+                    q.get_nowait()
+                    q.put_nowait(message)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    # ---- change feed ----
+
+    def notify(self, user_ids):
+        """Wake the loop for users whose notifications changed in this process (None: everyone)."""
+        with self._lock:
+            if user_ids is None:
+                self._pending_all = True
+            else:
+                self._pending_users.update(user_ids)
+        self._wakeup.set()
+
+    def _take_changes(self):
+        with self._lock:
+            if self._pending_all:
+                changed = self._watched_users()
+            else:
+                changed = self._pending_users & self._watched_users()
+            self._pending_users, self._pending_all = set(), False
+        return changed
+
+    def _publish(self, user_ids):
+        """Push new unread notifications and counts to the subscribed users among user_ids."""
+        with self._lock:
+            targets = {user_id: self._last_ids.get(user_id, 0) for user_id in user_ids if user_id in self._subscribers}
+        if not targets:
+            return
+
+        with self.app.app_context():
+            try:
+                counts = {
+                    user_id: (version, unread) for user_id, version, unread in db.session.query(
+                        User.id, User.notification_version, User.unread_notification_count
+                    ).filter(User.id.in_(targets))
+                }
+                fresh = defaultdict(list)
+                rows = Notification.query.filter(
+                    Notification.user_id.in_(targets),
+                    Notification.id > min(targets.values()),
+                    Notification.is_read == False
+                ).order_by(Notification.id)
+                for notification in rows:
+                    if notification.id > targets[notification.user_id]:
+                        fresh[notification.user_id].append(serialize_notification(notification))
+            finally:
+                db.session.remove()
+
+        for user_id in targets:
+            notifications = fresh.get(user_id, [])
+            version, unread = counts.get(user_id, (None, 0))
+            with self._lock:
+                if user_id not in self._subscribers:
+                    continue
+                if notifications:
+                    self._last_ids[user_id] = max(self._last_ids.get(user_id, 0), notifications[-1]['id'])
+                changed = version != self._versions.get(user_id)
+                self._versions[user_id] = version
+            if not notifications and not changed:
+                continue
+            self._send(user_id, _format_event({
+                'type': 'update',
+                'version': version,
+                'unread_count': unread,
+                'notifications': notifications[-MAX_NOTIFICATIONS_PER_EVENT:],
+                'timestamp': datetime.utcnow().isoformat(),
+            }))
+
+    def _poll_versions(self):
+        """Watched users whose notification_version moved (changes committed by other processes)."""
+        with self._lock:
+            known = {user_id: {self._versions.get(user_id)} if user_id in self._subscribers else set()
+                     for user_id in self._watched_users()}
+            for user_id, waiters in self._waiters.items():
+                known[user_id].update(waiters.values())
+        if not known:
+            return set()
+        with self.app.app_context():
+            try:
+                rows = db.session.query(User.id, User.notification_version).filter(User.id.in_(known)).all()
+            finally:
+                db.session.remove()
+        return {user_id for user_id, version in rows if known[user_id] != {version}}
+
+    def _run(self):
+        while True:
+            self._has_subscribers.wait()
+            try:
+                with self.app.app_context():
+                    use_listen = db.engine.dialect.name == 'postgresql'
+                if use_listen:
+                    self._run_listen()
+                else:
+                    self._run_poll()
+            except Exception as e:
+                logger.error(f"Notification event broadcaster error: {e}", exc_info=True)
+                time.sleep(self.poll_interval)
+
+    def _run_poll(self):
+        last_poll = time.monotonic()
+        while self._has_subscribers.is_set():
+            woken = self._wakeup.wait(max(0, last_poll + self.poll_interval - time.monotonic()))
+            self._wakeup.clear()
+            if not self._has_subscribers.is_set():
+                break
+            changed = self._take_changes() if woken else set()
+            # Local commits wake the loop early; other processes' commits are only seen by
+            # polling, so poll on schedule however busy this process is
+            if time.monotonic() - last_poll >= self.poll_interval:
+                changed |= self._poll_versions()
+                last_poll = time.monotonic()
+            if changed:
+                self._wake_waiters(changed)
+                self._publish(changed)
+
+    def _run_listen(self):
+        with self.app.app_context():
+            connection = db.engine.raw_connection()
+        try:
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFICATION_EVENTS_CHANNEL}")
+
+            while self._has_subscribers.is_set():
+                # Idle users cost nothing here: nothing runs until a NOTIFY arrives
+                select.select([dbapi_connection], [], [], self.heartbeat)
+                dbapi_connection.poll()
+                changed = set()
+                while dbapi_connection.notifies:
+                    payload = dbapi_connection.notifies.pop(0).payload
+                    if payload == '*':
+                        with self._lock:
+                            changed.update(self._watched_users())
+                        continue
+                    try:
+                        changed.update(json.loads(payload))
+                    except ValueError:
+                        pass
+                if changed:
+                    self._wake_waiters(changed)
+                    self._publish(changed)
+        finally:
+            connection.invalidate()  # LISTEN state must not go back to the pool
+
+
+def get_broadcaster(app=None):
+    """Return the app's notification broadcaster, creating it on first use."""
+    app = app or current_app._get_current_object()
+    broadcaster = app.extensions.get('barterex_notification_events')
+    if broadcaster is None:
+        broadcaster = NotificationBroadcaster(
+            app,
+            poll_interval=app.config.get('NOTIFICATION_STREAM_POLL_INTERVAL', 5),
+            heartbeat=app.config.get('NOTIFICATION_STREAM_HEARTBEAT', 15),
+        )
+        app.extensions['barterex_notification_events'] = broadcaster
+    return broadcaster
+
+
+# ==================== PUBLISHING ====================
+
+def publish_notification_changes(session, user_ids):
+    """
+    Push to user_ids (None: every user) once session's transaction commits.
+    Called by the notification counter listener in notifications.py.
+    """
+    if session.get_bind().dialect.name == 'postgresql':
+        # Delivered to every LISTENing process when this transaction commits
+        if user_ids is None:
+            payloads = ['*']
+        else:
+            user_ids = sorted(user_ids)
+            payloads = [json.dumps(user_ids[start:start + NOTIFY_USERS_PER_PAYLOAD])
+                        for start in range(0, len(user_ids), NOTIFY_USERS_PER_PAYLOAD)]
+        for payload in payloads:
+            session.connection().execute(text("SELECT pg_notify(:channel, :payload)"),
+                                         {'channel': NOTIFICATION_EVENTS_CHANNEL, 'payload': payload})
+    elif user_ids is None:
+        session.info['notification_events'] = None
+    else:
+        pending = session.info.setdefault('notification_events', set())
+        if pending is not None:
+            pending.update(user_ids)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _notify_after_commit(session):
+    if 'notification_events' not in session.info:
+        return
+    user_ids = session.info.pop('notification_events')
+    try:
+        broadcaster = current_app.extensions.get('barterex_notification_events')
+    except RuntimeError:
+        return  # no app context: other processes' broadcasters poll
+    if broadcaster is not None:
+        broadcaster.notify(user_ids)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('notification_events', None)
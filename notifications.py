@@ -8,12 +8,18 @@ Features:
 - Track notification delivery status
 - Handle real-time toast notifications
 - Support multiple notification categories
+- Keep per-user notification counters (User.notification_count and
+  User.unread_notification_count) and User.notification_version in step
+  with every write, so badges and polls read the user row instead of counting
+- Push changes to the user's open notification streams (notification_events.py)
 """
 
 from models import db, User, Notification, Order, Item
+from notification_events import publish_notification_changes
+from collections import Counter
 from datetime import datetime, timedelta
+from sqlalchemy import event, inspect, select, update
 import json
-from flask import render_template_string
 import logging
 
 logger = logging.getLogger(__name__)
@@ -287,7 +293,7 @@ class NotificationService:
         if notification_type:
             query = query.filter_by(notification_type=notification_type)
         
-        return query.order_by(Notification.timestamp.desc()).limit(limit).all()
+        return query.order_by(Notification.created_at.desc()).limit(limit).all()
     
     @staticmethod
     def get_unread_count(user_id):
@@ -300,10 +306,7 @@ class NotificationService:
         Returns:
             int: Number of unread notifications
         """
-        return Notification.query.filter_by(
-            user_id=user_id,
-            is_read=False
-        ).count()
+        return db.session.query(User.unread_notification_count).filter(User.id == user_id).scalar() or 0
     
     @staticmethod
     def mark_as_read(notification_id, user_id=None):
@@ -425,8 +428,8 @@ class NotificationService:
             if not user:
                 return False
             
-            # Merge with existing preferences
-            current_prefs = user.notification_preferences or {}
+            # Merge into a copy: the JSON column only saves a new value
+            current_prefs = dict(user.notification_preferences or {})
             current_prefs.update(preferences)
             user.notification_preferences = current_prefs
             
@@ -455,6 +458,129 @@ class NotificationService:
         return user.notification_preferences or {}
 
 
+# ==================== COUNTERS ====================
+
+# Recount expressions for User's notification counters (served by idx_notification_user_read_created)
+def _count_notifications(*criteria):
+    return select(db.func.count(Notification.id)).where(Notification.user_id == User.id, *criteria).scalar_subquery()
+
+
+def refresh_notification_counters(user_ids=None):
+    """Recount the notification counters of user_ids (every user when None) and bump their versions, in the current transaction."""
+    stmt = update(User).values(
+        notification_count=_count_notifications(),
+        unread_notification_count=_count_notifications(Notification.is_read == False),
+        notification_version=User.notification_version + 1,
+    ).execution_options(synchronize_session=False)
+    if user_ids is None:
+        db.session.execute(stmt)
+        return
+    user_ids = sorted(user_ids)
+    for start in range(0, len(user_ids), 500):
+        db.session.execute(stmt.where(User.id.in_(user_ids[start:start + 500])))
+
+
+def _pending_counters(session):
+    return session.info.setdefault('notification_counters', {
+        'added': Counter(), 'unread_added': Counter(), 'recount': set(), 'recount_all': False,
+    })
+
+
+@event.listens_for(db.session, 'before_flush')
+def _track_notification_writes(session, flush_context, instances):
+    pending = None
+    for obj in session.new:
+        if isinstance(obj, Notification) and obj.user_id is not None:
+            pending = pending or _pending_counters(session)
+            pending['added'][obj.user_id] += 1
+            if not obj.is_read:  # None until the column default applies
+                pending['unread_added'][obj.user_id] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Notification) and obj.user_id is not None:
+            pending = pending or _pending_counters(session)
+            pending['recount'].add(obj.user_id)
+    for obj in session.dirty:
+        if not isinstance(obj, Notification):
+            continue
+        state = inspect(obj)
+        if state.attrs.is_read.history.has_changes() or state.attrs.user_id.history.has_changes():
+            pending = pending or _pending_counters(session)
+            pending['recount'].update(uid for uid in (obj.user_id, *state.attrs.user_id.history.deleted) if uid)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _track_notification_statements(orm_execute_state):
+    """Bulk INSERT / UPDATE / DELETE statements on notifications."""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if orm_execute_state.execution_options.get('notification_counters_updated'):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not Notification:
+        return
+    
+    session = orm_execute_state.session
+    pending = _pending_counters(session)
+    params = orm_execute_state.parameters
+    rows = params if isinstance(params, list) else [params] if params else []
+    
+    if orm_execute_state.is_insert:
+        if not rows:  # INSERT ... SELECT: recipients unknown here
+            pending['recount_all'] = True
+        for row in rows:
+            if row.get('user_id') is not None:
+                pending['added'][row['user_id']] += 1
+                if not row.get('is_read'):
+                    pending['unread_added'][row['user_id']] += 1
+        return
+    
+    # UPDATE / DELETE: recount whoever the statement touches, found before it runs
+    where = orm_execute_state.statement.whereclause
+    if where is not None:
+        affected = select(Notification.user_id).where(where).distinct()
+    elif rows and all('id' in row for row in rows):  # executemany by primary key
+        affected = select(Notification.user_id).where(Notification.id.in_([row['id'] for row in rows])).distinct()
+    else:
+        pending['recount_all'] = True
+        return
+    pending['recount'].update(uid for uid in session.execute(affected).scalars() if uid is not None)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _apply_notification_counters(session):
+    session.flush()
+    pending = session.info.pop('notification_counters', None)
+    if not pending:
+        return
+    if pending['recount_all']:
+        refresh_notification_counters()
+        publish_notification_changes(session, None)
+        return
+    publish_notification_changes(session, set(pending['added']) | pending['recount'])
+    if pending['recount']:
+        refresh_notification_counters(pending['recount'])
+    # Inserts alone are applied as increments, so creating a notification never counts the table
+    added = {uid: n for uid, n in pending['added'].items() if uid not in pending['recount']}
+    if added:
+        unread_added = {uid: pending['unread_added'][uid] for uid in added if pending['unread_added'][uid]}
+        values = {
+            'notification_count': User.notification_count + db.case(added, value=User.id, else_=0),
+            'notification_version': User.notification_version + 1,
+        }
+        if unread_added:
+            values['unread_notification_count'] = (
+                User.unread_notification_count + db.case(unread_added, value=User.id, else_=0)
+            )
+        db.session.execute(
+            update(User).where(User.id.in_(added)).values(**values).execution_options(synchronize_session=False)
+        )
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_notification_counters(session):
+    session.info.pop('notification_counters', None)
+
+
 # Convenience functions for quick access
 def create_notification(user_id, message, **kwargs):
     """Create a notification"""
@@ -527,8 +653,9 @@ def notify_credit_purchase(user_id, amount_naira, credits_purchased, previous_ba
         # Send email notification
         try:
             from datetime import datetime
-            from flask import current_app
+            from email_templates import render_email
             
+            # Link URLs and current_year come from render_email's shared context
             email_data = {
                 'user_name': user.username,
                 'amount': amount_naira,
@@ -537,36 +664,27 @@ def notify_credit_purchase(user_id, amount_naira, credits_purchased, previous_ba
                 'new_balance': new_balance,
                 'reference': reference,
                 'transaction_date': datetime.utcnow().strftime('%B %d, %Y at %I:%M %p'),
-                'marketplace_url': f"{current_app.config.get('BASE_URL', 'http://localhost:5000')}/marketplace",
-                'dashboard_url': f"{current_app.config.get('BASE_URL', 'http://localhost:5000')}/dashboard",
-                'help_url': f"{current_app.config.get('BASE_URL', 'http://localhost:5000')}/help",
-                'current_year': datetime.now().year
             }
             
-            # Render email template
-            email_html = render_template_string(
-                open('templates/emails/credit_purchase.html').read(),
-                **email_data
-            )
-            
-            # Send email via Flask-Mail (if configured)
-            from flask_mail import Mail, Message
+            # Render email template (compiled once, CSS pre-inlined)
+            email_html = render_email('emails/credit_purchase.html', **email_data)
             
-            mail = Mail(current_app)
-            msg = Message(
-                subject=f'Credit Purchase Confirmation - {credits_purchased} Credits Added',
-                recipients=[user.email],
-                html=email_html
-            )
+            # Queue for the mail delivery worker (see mail_queue.py)
+            from mail_queue import queue_email
             
             try:
-                mail.send(msg)
+                queue_email(
+                    f'Credit Purchase Confirmation - {credits_purchased} Credits Added',
+                    [user.email],
+                    email_html
+                )
                 if notification:
                     notification.is_email_sent = True
-                    db.session.commit()
-                logger.info(f"Credit purchase email sent to {user.email}")
+                db.session.commit()
+                logger.info(f"Credit purchase email queued for {user.email}")
             except Exception as email_err:
-                logger.warning(f"Failed to send credit purchase email to {user.email}: {str(email_err)}")
+                db.session.rollback()
+                logger.warning(f"Failed to queue credit purchase email to {user.email}: {str(email_err)}")
                 # Don't fail the notification if email fails
         
         except Exception as email_template_err:
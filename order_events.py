@@ -0,0 +1,267 @@
+"""
+Shared change feed for the admin order SSE stream.
+
+Every open admin orders page holds an EventSource on /admin/orders/stream.
+Instead of a polling loop per connection, each process runs one broadcaster
+thread that computes the order counts with a single aggregate query and fans
+the serialized event out to per-connection queues. Connections only wait on
+their queue, so under the gevent worker (gunicorn.conf.py) 100 open
+dashboards cost 100 idle greenlets and one query loop.
+
+The broadcaster wakes up when orders change:
+- PostgreSQL: commits that add an order or change its status send
+  NOTIFY barterex_order_events; the broadcaster LISTENs on a dedicated
+  connection, so changes from any process arrive at once.
+- Other databases: the same commits wake this process's broadcaster
+  directly; changes made by other processes show up on the next poll
+  (ORDER_STREAM_POLL_INTERVAL).
+
+Counts are only re-sent when they or the orders change; idle connections get
+an SSE comment every ORDER_STREAM_HEARTBEAT seconds to keep proxies open.
+
+Usage:
+    return get_broadcaster().stream(), {'Content-Type': 'text/event-stream'}
+"""
+
+import json
+import queue
+import select
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, event, func, inspect, text
+
+from app import db
+from models import Order
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+ORDER_EVENTS_CHANNEL = 'barterex_order_events'
+RECENT_UPDATES_SECONDS = 30
+SUBSCRIBER_QUEUE_SIZE = 16
+
+
+def order_counts():
+    """Order totals per dashboard status plus orders changed recently, in one query."""
+    def count_if(condition):
+        return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+    cutoff = datetime.utcnow() - timedelta(seconds=RECENT_UPDATES_SECONDS)
+    row = db.session.query(
+        func.count(Order.id),
+        count_if(Order.status == 'Pending'),
+        count_if(Order.status == 'Shipped'),
+        count_if(Order.status == 'Out for Delivery'),
+        count_if(Order.status == 'Delivered'),
+        count_if(Order.updated_at >= cutoff),
+    ).one()
+    return {
+        'total_orders': row[0],
+        'pending_count': row[1],
+        'shipped_count': row[2],
+        'out_for_delivery': row[3],
+        'delivered_count': row[4],
+        'recent_updates': row[5],
+    }
+
+
+def _format_event(data):
+    return f"data: {json.dumps(data)}\n\n"
+
+
+class OrderBroadcaster:
+    """One background loop per process feeding every SSE subscriber."""
+
+    def __init__(self, app, poll_interval=5, heartbeat=15):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._has_subscribers = threading.Event()
+        self._pending_changes = []
+        self._counts = None
+        self._thread = None
+
+    # ---- subscribers ----
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(q)
+            self._has_subscribers.set()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='order-events', daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+            if not self._subscribers:
+                self._has_subscribers.clear()
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def stream(self):
+        """SSE generator for one connection: the current counts, then shared updates."""
+        q = self.subscribe()
+        try:
+            counts = self._counts
+            if counts is None:
+                with self.app.app_context():
+                    counts = order_counts()
+                    db.session.remove()
+            yield _format_event({'type': 'initial', **counts, 'timestamp': datetime.utcnow().isoformat()})
+            while True:
+                try:
+                    yield q.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(q)
+
+    def _broadcast(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Slow client: drop its oldest event, counts in the newest one supersede it
+                try:
+                    q.get_nowait()
+                    q.put_nowait(message)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    # ---- change feed ----
+
+    def notify(self, changes):
+        """Wake the loop for orders changed in this process ([{'id', 'status'}, ...])."""
+        with self._lock:
+            self._pending_changes.extend(changes)
+        self._wakeup.set()
+
+    def _take_changes(self):
+        with self._lock:
+            changes, self._pending_changes = self._pending_changes, []
+        return changes
+
+    def _publish(self, changes):
+        with self.app.app_context():
+            try:
+                counts = order_counts()
+            finally:
+                db.session.remove()
+        if counts == self._counts and not changes:
+            return
+        self._counts = counts
+        self._broadcast(_format_event({
+            'type': 'update',
+            **counts,
+            'changed': changes,
+            'timestamp': datetime.utcnow().isoformat(),
+        }))
+
+    def _run(self):
+        while True:
+            self._has_subscribers.wait()
+            try:
+                with self.app.app_context():
+                    use_listen = db.engine.dialect.name == 'postgresql'
+                if use_listen:
+                    self._run_listen()
+                else:
+                    self._run_poll()
+            except Exception as e:
+                logger.error(f"Order event broadcaster error: {e}", exc_info=True)
+                time.sleep(self.poll_interval)
+
+    def _run_poll(self):
+        while self._has_subscribers.is_set():
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if self._has_subscribers.is_set():
+                self._publish(self._take_changes())
+
+    def _run_listen(self):
+        with self.app.app_context():
+            connection = db.engine.raw_connection()
+        try:
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {ORDER_EVENTS_CHANNEL}")
+
+            while self._has_subscribers.is_set():
+                # NOTIFY wakes us immediately; the timeout keeps a slow poll as a safety net
+                select.select([dbapi_connection], [], [], self.poll_interval)
+                dbapi_connection.poll()
+                changes = []
+                while dbapi_connection.notifies:
+                    notification = dbapi_connection.notifies.pop(0)
+                    try:
+                        changes.extend(json.loads(notification.payload))
+                    except ValueError:
+                        pass
+                self._publish(changes)
+        finally:
+            connection.invalidate()  # LISTEN state must not go back to the pool
+
+
+def get_broadcaster(app=None):
+    """Return the app's order broadcaster, creating it on first use."""
+    app = app or current_app._get_current_object()
+    broadcaster = app.extensions.get('barterex_order_events')
+    if broadcaster is None:
+        broadcaster = OrderBroadcaster(
+            app,
+            poll_interval=app.config.get('ORDER_STREAM_POLL_INTERVAL', 5),
+            heartbeat=app.config.get('ORDER_STREAM_HEARTBEAT', 15),
+        )
+        app.extensions['barterex_order_events'] = broadcaster
+    return broadcaster
+
+
+# ==================== ORDER WRITES ====================
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_order_changes(session, flush_context):
+    changes = []
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Order):
+            state = inspect(obj)
+            if obj in session.new or state.attrs.status.history.has_changes():
+                changes.append({'id': obj.id, 'status': obj.status})
+    if not changes:
+        return
+
+    if session.get_bind().dialect.name == 'postgresql':
+        # Delivered to every LISTENing process when this transaction commits
+        session.connection().execute(text("SELECT pg_notify(:channel, :payload)"),
+                                     {'channel': ORDER_EVENTS_CHANNEL, 'payload': json.dumps(changes)})
+    else:
+        session.info.setdefault('order_events', []).extend(changes)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _notify_after_commit(session):
+    changes = session.info.pop('order_events', None)
+    if changes:
+        try:
+            broadcaster = current_app.extensions.get('barterex_order_events')
+        except RuntimeError:
+            return  # no app context: other processes' broadcasters poll
+        if broadcaster is not None:
+            broadcaster.notify(changes)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('order_events', None)
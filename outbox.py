@@ -0,0 +1,334 @@
+"""
+Transactional outbox for post-commit side effects.
+
+Request handlers call enqueue() inside their own transaction instead of
+creating notifications, sending email or awarding bonuses inline, so a side
+effect is recorded if and only if the change that caused it commits. A
+background worker (one daemon thread per process, or `flask outbox run`)
+claims due events, runs the registered handler and marks them done in the
+handler's transaction. Failures are retried with exponential backoff and
+parked as 'failed' after OUTBOX_MAX_ATTEMPTS.
+
+Delivery is at-least-once: a handler whose commit fails runs again, so
+handlers should be safe to repeat. Emails are queued with
+mail_queue.queue_email() in the handler's transaction, so a retried event
+does not send them twice.
+
+Usage:
+    enqueue('notification', user_id=user.id, message='...')
+    db.session.commit()
+    wake_worker()
+
+    flask outbox run            # dedicated worker process
+    flask outbox run --once     # drain what is due and exit (cron)
+"""
+
+import time
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, or_, update
+
+from app import db
+from models import OutboxEvent, Notification, Order, User, Item
+from email_templates import render_email
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+outbox_cli = AppGroup('outbox', help='Outbox worker commands.')
+
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BATCH_SIZE = 20
+OUTBOX_LEASE_SECONDS = 300  # a 'processing' row older than this belongs to a dead worker
+OUTBOX_MAX_BACKOFF = 3600
+
+_handlers = {}
+
+
+def handler(event_type):
+    """Register a function as the handler for event_type (payload is passed as kwargs)"""
+    def decorator(func):
+        _handlers[event_type] = func
+        return func
+    return decorator
+
+
+def enqueue(event_type, **payload):
+    """Add an event to the current transaction. The caller commits."""
+    if event_type not in _handlers:
+        raise ValueError(f"Unknown outbox event type: {event_type}")
+    event = OutboxEvent(event_type=event_type, payload=payload)
+    db.session.add(event)
+    return event
+
+
+# ==================== PROCESSING ====================
+
+def _due_filter(model, now, lease_seconds):
+    stale = now - timedelta(seconds=lease_seconds)
+    return or_(
+        and_(model.status == 'pending', model.available_at <= now),
+        and_(model.status == 'processing', model.locked_at < stale),
+    )
+
+
+def claim_due(model, limit, lease_seconds=OUTBOX_LEASE_SECONDS):
+    """
+    Mark up to limit due rows of a queue table as processing and commit.
+    
+    Works for any model with status/available_at/locked_at/attempts columns
+    (OutboxEvent, OutgoingEmail). Returns the ids this worker won.
+    """
+    now = datetime.utcnow()
+    due = _due_filter(model, now, lease_seconds)
+    candidate_ids = [row.id for row in db.session.query(model.id).filter(due).order_by(model.id).limit(limit)]
+
+    claimed = []
+    for row_id in candidate_ids:
+        # Conditional update: only one worker (thread or process) gets each row
+        result = db.session.execute(
+            update(model)
+            .where(model.id == row_id, due)
+            .values(status='processing', locked_at=now, attempts=model.attempts + 1)
+        )
+        if result.rowcount:
+            claimed.append(row_id)
+    db.session.commit()
+    return claimed
+
+
+def backoff_seconds(attempts, max_backoff=OUTBOX_MAX_BACKOFF):
+    """Retry delay after the given number of attempts: 10s, 20s, 40s, ... capped"""
+    return min(max_backoff, 2 ** attempts * 5)
+
+
+def _run_event(event_id):
+    event = db.session.get(OutboxEvent, event_id)
+    func = _handlers.get(event.event_type)
+    try:
+        if func is None:
+            raise LookupError(f"No outbox handler for {event.event_type}")
+        func(**(event.payload or {}))
+        event.status = 'done'
+        event.processed_at = datetime.utcnow()
+        event.locked_at = None
+        event.last_error = None
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        event = db.session.get(OutboxEvent, event_id)
+        event.last_error = f"{type(e).__name__}: {e}"
+        event.locked_at = None
+        if event.attempts >= OUTBOX_MAX_ATTEMPTS:
+            event.status = 'failed'
+            logger.error(f"Outbox event {event_id} ({event.event_type}) failed permanently after {event.attempts} attempts: {e}", exc_info=True)
+        else:
+            event.status = 'pending'
+            event.available_at = datetime.utcnow() + timedelta(seconds=backoff_seconds(event.attempts))
+            logger.warning(f"Outbox event {event_id} ({event.event_type}) attempt {event.attempts} failed, will retry: {e}")
+        db.session.commit()
+        return False
+
+
+def process_pending(limit=OUTBOX_BATCH_SIZE):
+    """Claim and run one batch of due events. Returns the number claimed."""
+    claimed = claim_due(OutboxEvent, limit)
+    if not claimed:
+        return 0
+
+    base_url = current_app.config.get('BASE_URL', 'http://localhost:5000')
+    for event_id in claimed:
+        # Handlers render email templates that use url_for(..., _external=True)
+        with current_app.test_request_context(base_url=base_url):
+            _run_event(event_id)
+    db.session.remove()
+    return len(claimed)
+
+
+class OutboxWorker:
+    """Daemon thread that drains the outbox, woken early by wake()."""
+
+    def __init__(self, app, poll_interval=5):
+        self.app = app
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='outbox-worker', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    while process_pending():
+                        pass
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}", exc_info=True)
+
+
+def get_worker(app=None):
+    """Return the app's outbox worker, creating it on first use."""
+    app = app or current_app._get_current_object()
+    worker = app.extensions.get('barterex_outbox')
+    if worker is None:
+        worker = OutboxWorker(app, poll_interval=app.config.get('OUTBOX_POLL_INTERVAL', 5))
+        app.extensions['barterex_outbox'] = worker
+    return worker
+
+
+def wake_worker():
+    """Call after committing enqueued events so they run without waiting for the next poll."""
+    if not current_app.config.get('OUTBOX_WORKER_ENABLED', True):
+        return
+    try:
+        get_worker().wake()
+    except Exception as e:
+        # Events stay pending and are picked up by the next poll / outbox process
+        logger.warning(f"Could not wake outbox worker: {e}")
+
+
+# ==================== HANDLERS ====================
+
+@handler('notification')
+def handle_notification(user_id, message, **fields):
+    """In-app notification (fields: notification_type, category, action_url, data, priority)"""
+    # Notification.message is String(255); long item summaries would fail forever on Postgres
+    db.session.add(Notification(user_id=user_id, message=message[:255], **fields))
+
+
+@handler('order_confirmation_email')
+def handle_order_confirmation_email(order_id):
+    from mail_queue import queue_email
+
+    order = db.session.get(Order, order_id)
+    if order is None or not order.user or not order.user.email:
+        logger.warning(f"Order confirmation skipped - order {order_id} missing or user has no email")
+        return
+
+    html = render_email(
+        'emails/order_confirmation.html',
+        username=order.user.username,
+        order_id=order.order_number,
+        order_date=order.date_ordered.strftime('%B %d, %Y at %I:%M %p') if order.date_ordered else '',
+        delivery_method=order.delivery_method,
+        delivery_address=order.delivery_address or 'Not specified',
+        pickup_station=order.pickup_station,
+        items=[order_item.item for order_item in order.items],
+        total_credits=order.total_credits,
+    )
+    # Queued in this event's transaction; the mail worker delivers it after commit
+    queue_email(f"Order Confirmation #{order.order_number} - Barterex", [order.user.email], html)
+
+
+@handler('receipt')
+def handle_receipt(order_id):
+    """Pre-generate the order's PDF receipt so downloads are a file read"""
+    from receipts import build_receipt
+
+    order = db.session.get(Order, order_id)
+    if order is None:
+        return
+    path, _ = build_receipt(order)
+    if path is None:
+        raise RuntimeError(f"Could not generate receipt for order {order_id}")
+
+
+@handler('referral_bonus')
+def handle_referral_bonus(user_id, bonus_type, amount=100):
+    from referral_rewards import award_referral_bonus
+
+    result = award_referral_bonus(user_id, bonus_type, amount=amount)
+    if result['success']:
+        logger.info(f"Referral bonus awarded: {result['message']}")
+
+
+@handler('level_up')
+def handle_level_up(user_id, level_up_info):
+    from trading_points import add_level_up_notification
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        add_level_up_notification(user, level_up_info)
+
+
+@handler('item_approval_email')
+def handle_item_approval_email(item_id):
+    from flask import url_for
+    from mail_queue import queue_email
+
+    item = db.session.get(Item, item_id)
+    if item is None or not item.user or not item.user.email:
+        logger.warning(f"Approval email skipped - item {item_id} missing or owner has no email")
+        return
+
+    html = render_email(
+        'emails/item_approved.html',
+        username=item.user.username,
+        item_name=item.name,
+        item_value=item.value,
+        approval_url=url_for('marketplace.marketplace', _external=True),
+        item_number=item.item_number,
+    )
+    queue_email(f"✅ Your Item '{item.name}' Has Been Approved!", [item.user.email], html)
+
+
+@handler('wishlist_matching')
+def handle_wishlist_matching(item_ids=None, item_id=None):
+    """Record wishlist matches for newly approved items and send instant digests (commits per item)"""
+    from services.wishlist_service import bulk_find_matches_for_items
+
+    # item_id: single-item events queued before digests existed
+    bulk_find_matches_for_items(item_ids or [item_id])
+
+
+@handler('wishlist_backfill')
+def handle_wishlist_backfill(wishlist_id):
+    """Match a new wishlist against the listings already live"""
+    from services.wishlist_service import backfill_wishlist
+
+    backfill_wishlist(wishlist_id)
+
+
+@handler('broadcast_email')
+def handle_broadcast_email(**payload):
+    """Queue one chunk of a broadcast's emails and enqueue the next chunk"""
+    from broadcasts import queue_broadcast_emails
+
+    queue_broadcast_emails(**payload)
+
+
+# ==================== CLI ====================
+
+@outbox_cli.command('run')
+@click.option('--once', is_flag=True, help='Process everything currently due, then exit.')
+@click.option('--batch-size', default=OUTBOX_BATCH_SIZE, show_default=True, help='Events claimed per round.')
+@click.option('--interval', default=None, type=int, help='Seconds between idle polls (default: OUTBOX_POLL_INTERVAL).')
+def run(once, batch_size, interval):
+    """Run the outbox worker in the foreground."""
+    interval = interval or current_app.config.get('OUTBOX_POLL_INTERVAL', 5)
+    total = 0
+    while True:
+        processed = process_pending(batch_size)
+        total += processed
+        if processed:
+            continue
+        if once:
+            break
+        time.sleep(interval)
+    click.echo(f"Processed {total} outbox event(s)")
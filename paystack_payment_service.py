@@ -194,6 +194,27 @@ class PaystackPaymentService:
             traceback.print_exc()
             return {'success': False, 'error': f'Server error: {str(e)}'}
     
+    @staticmethod
+    def _claim_completion(payment, expected_status):
+        """
+        Move payment from expected_status to 'completed' with a conditional UPDATE.
+        Only one of several concurrent verifications gets True and credits the account.
+        """
+        claimed = Payment.query.filter(
+            Payment.id == payment.id, Payment.status == expected_status
+        ).update({Payment.status: 'completed'}, synchronize_session=False)
+        db.session.expire(payment, ['status'])
+        return claimed == 1
+    
+    @staticmethod
+    def get_payment_by_reference(reference):
+        """Payment for a Paystack reference (or a legacy Monnify one), or None"""
+        # Check both paystack_reference and monnify_reference for backwards compatibility
+        payment = Payment.query.filter_by(paystack_reference=reference).first()
+        if not payment:
+            payment = Payment.query.filter_by(monnify_reference=reference).first()
+        return payment
+    
     @staticmethod
     def verify_payment(reference):
         """
@@ -206,31 +227,21 @@ class PaystackPaymentService:
             dict: Payment verification result
         """
         try:
-            # Check both paystack_reference and monnify_reference for backwards compatibility
-            payment = Payment.query.filter_by(
-                paystack_reference=reference
-            ).first()
-            
-            if not payment:
-                payment = Payment.query.filter_by(
-                    monnify_reference=reference
-                ).first()
+            payment = PaystackPaymentService.get_payment_by_reference(reference)
             
             if not payment:
                 return {'success': False, 'error': 'Payment record not found'}
             
             # TEST MODE: Auto-complete test payments
             if PaystackPaymentService.TEST_MODE and reference.startswith('TEST_'):
-                if payment.status == 'test_pending':
-                    payment.status = 'completed'
+                if payment.status == 'test_pending' and PaystackPaymentService._claim_completion(payment, 'test_pending'):
                     payment.paid_at = datetime.utcnow()
                     payment.payment_method = 'test_card'
                     payment.payment_metadata = {'mode': 'test', 'verified': True}
                     
-                    # Credit user's account
-                    user = User.query.get(payment.user_id)
-                    old_balance = user.credits
-                    user.credits += payment.credits_purchased
+                    # Credit user's account (atomic increment)
+                    new_balance = User.change_credits(payment.user_id, payment.credits_purchased)
+                    old_balance = new_balance - payment.credits_purchased
                     
                     # Create transaction record
                     transaction = CreditTransaction(
@@ -240,7 +251,7 @@ class PaystackPaymentService:
                         reason='test_payment',
                         description=f'[TEST] Purchased {payment.credits_purchased} credits for ₦{payment.amount_naira:,.0f}',
                         balance_before=old_balance,
-                        balance_after=user.credits
+                        balance_after=new_balance
                     )
                     
                     db.session.add(transaction)
@@ -256,7 +267,7 @@ class PaystackPaymentService:
                             amount_naira=payment.amount_naira,
                             credits_purchased=payment.credits_purchased,
                             previous_balance=old_balance,
-                            new_balance=user.credits,
+                            new_balance=new_balance,
                             reference=reference
                         )
                     except Exception as notif_err:
@@ -266,7 +277,7 @@ class PaystackPaymentService:
                         'success': True,
                         'message': 'Test payment verified and credits added',
                         'credits_added': payment.credits_purchased,
-                        'new_balance': user.credits
+                        'new_balance': new_balance
                     }
                 else:
                     return {
@@ -274,6 +285,15 @@ class PaystackPaymentService:
                         'error': f'Test payment has already been processed (status: {payment.status})'
                     }
             
+            # Already credited (repeat webhook / page refresh) - never call Paystack or credit twice.
+            # No balance: the caller may not be the payment's owner
+            if payment.status == 'completed':
+                return {
+                    'success': True,
+                    'message': 'Payment already verified',
+                    'credits_added': payment.credits_purchased
+                }
+            
             # PRODUCTION MODE: Verify with Paystack API
             headers = PaystackPaymentService.get_auth_header()
             
@@ -296,14 +316,21 @@ class PaystackPaymentService:
                     
                     # Check if payment was successful
                     if pay_status == 'success':
-                        payment.status = 'completed'
+                        if not PaystackPaymentService._claim_completion(payment, payment.status):
+                            # A concurrent verification got there first and credited the account
+                            if payment.status == 'completed':
+                                return {
+                                    'success': True,
+                                    'message': 'Payment already verified',
+                                    'credits_added': payment.credits_purchased
+                                }
+                            return {'success': False, 'error': f'Payment status changed to {payment.status} during verification'}
                         payment.paid_at = datetime.utcnow()
                         payment.payment_method = response_data.get('channel', 'card')  # card, bank_transfer, etc.
                         
-                        # Credit user's account
-                        user = User.query.get(payment.user_id)
-                        old_balance = user.credits
-                        user.credits += payment.credits_purchased
+                        # Credit user's account (atomic increment)
+                        new_balance = User.change_credits(payment.user_id, payment.credits_purchased)
+                        old_balance = new_balance - payment.credits_purchased
                         
                         # Create transaction record
                         transaction = CreditTransaction(
@@ -313,7 +340,7 @@ class PaystackPaymentService:
                             reason='paystack_payment',
                             description=f'Purchased {payment.credits_purchased} credits for ₦{payment.amount_naira:,.0f}',
                             balance_before=old_balance,
-                            balance_after=user.credits
+                            balance_after=new_balance
                         )
                         
                         db.session.add(transaction)
@@ -327,7 +354,7 @@ class PaystackPaymentService:
                                 amount_naira=payment.amount_naira,
                                 credits_purchased=payment.credits_purchased,
                                 previous_balance=old_balance,
-                                new_balance=user.credits,
+                                new_balance=new_balance,
                                 reference=reference
                             )
                         except Exception as notif_err:
@@ -337,7 +364,7 @@ class PaystackPaymentService:
                             'success': True,
                             'message': 'Payment verified and credits added',
                             'credits_added': payment.credits_purchased,
-                            'new_balance': user.credits
+                            'new_balance': new_balance
                         }
                     else:
                         payment.status = 'failed'
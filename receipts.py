@@ -0,0 +1,105 @@
+"""
+Cached PDF receipts.
+
+Building a receipt with reportlab takes tens of milliseconds, so each
+version of a receipt is built once and stored on disk as
+RECEIPT_CACHE_DIR/<order_id>-<version>.pdf. The version is a hash of
+everything printed on the receipt (status, items, totals, delivery and
+customer details), so a status change or edit produces a new file and the
+old one is removed.
+
+Receipts are pre-generated by the outbox 'receipt' event, enqueued when an
+order is created or changes status. A download that finds no file (worker
+behind, cache dir wiped) builds it inline. The version doubles as the
+download's ETag.
+
+Usage:
+    enqueue('receipt', order_id=order.id)       # alongside the order change
+    path, version = build_receipt(order)        # file read, or build if missing
+"""
+
+import glob
+import hashlib
+import json
+import os
+import tempfile
+
+from flask import current_app
+
+from transaction_clarity import generate_pdf_receipt
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+# Bump when generate_pdf_receipt's layout changes so cached files are rebuilt
+RECEIPT_LAYOUT_VERSION = 1
+
+
+def receipt_dir(app=None):
+    app = app or current_app
+    return app.config.get('RECEIPT_CACHE_DIR') or os.path.join(app.instance_path, 'receipts')
+
+
+def receipt_version(order):
+    """Short hash of the fields generate_pdf_receipt prints for this order."""
+    user = order.user
+    fields = {
+        'layout': RECEIPT_LAYOUT_VERSION,
+        'order_number': order.order_number,
+        'status': order.status,
+        'date_ordered': order.date_ordered.isoformat() if order.date_ordered else None,
+        'delivery': [order.delivery_method, order.delivery_address,
+                     order.estimated_delivery_date.date().isoformat() if order.estimated_delivery_date else None],
+        'customer': [user.username, user.email] if user else None,
+        'items': [[oi.item.item_number, oi.item.name, oi.item.condition, oi.item.value]
+                  for oi in sorted(order.items, key=lambda oi: oi.id or 0)],
+        'totals': [order.total_credits, order.credits_used,
+                   order.credits_balance_before, order.credits_balance_after],
+    }
+    digest = hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def receipt_path(order_id, version, app=None):
+    return os.path.join(receipt_dir(app), f"{order_id}-{version}.pdf")
+
+
+def build_receipt(order):
+    """
+    Make sure the current version of the order's receipt is on disk.
+
+    Returns (path, version), or (None, version) if the PDF could not be
+    generated. Writes go through a temp file + rename, so concurrent
+    builders and readers never see a partial PDF.
+    """
+    version = receipt_version(order)
+    path = receipt_path(order.id, version)
+    if os.path.exists(path):
+        return path, version
+
+    buffer = generate_pdf_receipt(order, order.user)
+    if buffer is None:
+        return None, version
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # Older versions of this order's receipt are stale now
+    for stale in glob.glob(os.path.join(directory, f"{order.id}-*.pdf")):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+    logger.info(f"Receipt cached - Order: {order.order_number}, Version: {version}")
+    return path, version
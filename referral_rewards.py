@@ -4,6 +4,7 @@ Awards credits to referrer when referred user completes specific actions.
 """
 
 from datetime import datetime
+from sqlalchemy import update
 from app import db
 from models import User, Referral, CreditTransaction, Notification
 
@@ -78,13 +79,28 @@ def award_referral_bonus(referred_user_id, bonus_type, amount=100):
                 'message': 'Referrer not found'
             }
         
-        # Award credits to referrer
-        referrer.credits += amount
-        setattr(referral, bonus_field, True)
-        
-        # Set the date field if it exists
+        # Claim the bonus flag with a conditional UPDATE: of two concurrent awards only one matches
+        flag_column = getattr(Referral, bonus_field)
+        values = {bonus_field: True}
         if date_field:
-            setattr(referral, date_field, datetime.utcnow())
+            values[date_field] = datetime.utcnow()
+        claimed = db.session.execute(
+            update(Referral)
+            .where(Referral.id == referral.id, db.or_(flag_column == False, flag_column.is_(None)))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.expire(referral, list(values))
+        if not claimed:
+            return {
+                'success': False,
+                'referrer_id': referral.referrer_id,
+                'amount_awarded': 0,
+                'message': f'{bonus_type.capitalize()} bonus already awarded for this referral'
+            }
+        
+        # Award credits to referrer (atomic increment, no stale read-modify-write)
+        User.change_credits(referrer.id, amount)
         
         # Create credit transaction record
         transaction = CreditTransaction(
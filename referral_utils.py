@@ -2,6 +2,7 @@
 Referral and bonus management utilities
 """
 
+from sqlalchemy import update
 from models import User, Referral, CreditTransaction, Notification
 from app import db
 from datetime import datetime
@@ -95,15 +96,34 @@ def award_referral_signup_bonus(referred_user):
                 'amount': 0
             }
         
-        # Award the bonus
-        BONUS_AMOUNT = 100
-        referrer.credits += BONUS_AMOUNT
-        referrer.referral_bonus_earned += BONUS_AMOUNT
-        
-        # Mark bonus as earned
-        referral.signup_bonus_earned = True
+        # Mark bonus as earned - conditional UPDATE so a concurrent call cannot award it twice
+        claimed = db.session.execute(
+            update(Referral)
+            .where(Referral.id == referral.id, Referral.signup_bonus_earned == False)
+            .values(signup_bonus_earned=True)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.expire(referral, ['signup_bonus_earned'])
+        if not claimed:
+            return {
+                'success': False,
+                'message': 'No pending referral bonus found',
+                'referrer': None,
+                'amount': 0
+            }
         referral.signup_bonus_earned_at = datetime.utcnow()
         
+        # Award the bonus (atomic increments)
+        BONUS_AMOUNT = 100
+        User.change_credits(referrer.id, BONUS_AMOUNT)
+        db.session.execute(
+            update(User)
+            .where(User.id == referrer.id)
+            .values(referral_bonus_earned=db.func.coalesce(User.referral_bonus_earned, 0) + BONUS_AMOUNT)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.expire(referrer, ['referral_bonus_earned'])
+        
         # Log the transaction
         transaction = CreditTransaction(
             user_id=referrer.id,
@@ -1,22 +1,28 @@
-from flask import Blueprint, render_template, redirect, url_for, request, session, flash, send_file
+from flask import Blueprint, render_template, redirect, url_for, request, session, flash, send_file, Response, stream_with_context, current_app
 from flask_wtf.csrf import generate_csrf
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy.orm import joinedload
-from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy import func
 import json
 import csv
 import io
 import zipfile
+import zlib
 
 from app import db
 from models import Admin, User, Item, Order, OrderItem, PickupStation, Notification, SystemSettings, ActivityLog, ContactMessage
 from forms import AdminRegisterForm, AdminLoginForm, PickupStationForm
 from werkzeug.security import generate_password_hash, check_password_hash
 from logger_config import setup_logger
+from email_templates import render_email
 from exceptions import ValidationError, DatabaseError, AuthenticationError, AuthorizationError
 from error_handlers import handle_errors, safe_database_operation
+from outbox import enqueue, wake_worker
+from admin_stats import get_admin_stats
+from order_events import get_broadcaster, order_counts
+import approval_queue
+import broadcasts
 
 logger = setup_logger(__name__)
 
@@ -39,13 +45,10 @@ def admin_login_required(f):
 def inject_admin_context():
     """Inject admin-wide context variables into all admin templates"""
     try:
-        # Get count of pending items
-        pending_items_count = Item.query.filter_by(status='pending').count()
-        # Get count of unread messages
-        pending_messages_count = ContactMessage.query.filter_by(is_read=False, status='pending').count()
+        stats = get_admin_stats()
         return dict(
-            pending_items_count=pending_items_count,
-            pending_messages_count=pending_messages_count
+            pending_items_count=stats['pending_items'],
+            pending_messages_count=stats['pending_messages']
         )
     except Exception as e:
         logger.error(f"Error in admin context processor: {str(e)}")
@@ -220,34 +223,22 @@ def admin_dashboard():
 
         items = query.order_by(Item.id.desc()).paginate(page=page, per_page=10)
 
-        total_users = User.query.count()
-        total_items = Item.query.count()
-        approved_items = Item.query.filter_by(status='approved').count()
-        pending_items = Item.query.filter_by(status='pending').count()
-        rejected_items = Item.query.filter_by(status='rejected').count()
-        traded_items = Item.query.filter_by(is_available=False).count()
-        total_credits_traded = db.session.query(db.func.sum(Item.value)).filter_by(is_available=False).scalar() or 0
-        
-        # Count pending unban appeals
-        pending_appeals = User.query.filter(
-            User.is_banned == True,
-            User.appeal_message != None,
-            User.unban_request_date != None
-        ).count()
+        # Shared snapshot: one aggregate query per table, refreshed every few seconds or on writes
+        stats = get_admin_stats()
 
         logger.info(f"Admin dashboard accessed - Page: {page}, Search: '{search}', Status: {status}")
 
         return render_template(
             'admin/dashboard.html',
             items=items,
-            total_users=total_users,
-            total_items=total_items,
-            approved_items=approved_items,
-            pending_items=pending_items,
-            rejected_items=rejected_items,
-            traded_items=traded_items,
-            total_credits_traded=total_credits_traded,
-            pending_appeals=pending_appeals,
+            total_users=stats['total_users'],
+            total_items=stats['total_items'],
+            approved_items=stats['approved_items'],
+            pending_items=stats['pending_items'],
+            rejected_items=stats['rejected_items'],
+            traded_items=stats['traded_items'],
+            total_credits_traded=stats['total_credits_traded'],
+            pending_appeals=stats['pending_appeals'],
             search=search,
             status=status
         )
@@ -500,7 +491,7 @@ def ban_user(user_id):
 
         # Send ban notification email with detailed information
         try:
-            html_body = render_template('emails/account_banned.html', 
+            html_body = render_email('emails/account_banned.html', 
                                       username=user.username,
                                       reason=reason,
                                       ban_date=user.ban_date,
@@ -574,7 +565,7 @@ def unban_user(user_id):
 
         # Send unban notification email
         try:
-            html_body = render_template('emails/account_unbanned.html', 
+            html_body = render_email('emails/account_unbanned.html', 
                                       username=user.username)
             send_email_async(
                 subject="Your account has been restored",
@@ -665,7 +656,7 @@ def approve_unban(user_id):
             
             # Send unban notification email
             try:
-                html_body = render_template('emails/account_unbanned.html', 
+                html_body = render_email('emails/account_unbanned.html', 
                                           username=user.username)
                 send_email_async(
                     subject="Your account has been restored",
@@ -810,24 +801,20 @@ def edit_user(user_id):
 @admin_login_required
 @handle_errors
 def approve_items():
+    """Next page of the prioritized approval queue, claimed for this admin"""
     try:
-        # ✅ Use joinedload to eagerly load the images relationship to avoid N+1 queries
-        # and ensure images are available in templates
-        items = Item.query.filter_by(status='pending').options(joinedload(Item.images)).all()
-        pending_count = Item.query.filter_by(status='pending').count()
-        logger.info(f"Item approvals page accessed - Pending items: {len(items)}, Count query: {pending_count}")
-        
-        # Debug: Log all item statuses to understand database state
-        all_items = Item.query.all()
-        status_breakdown = {}
-        for item in all_items:
-            status = item.status
-            if status not in status_breakdown:
-                status_breakdown[status] = 0
-            status_breakdown[status] += 1
-        logger.debug(f"Database status breakdown: {status_breakdown}")
-        
-        return render_template('admin/approvals.html', items=items)
+        admin_id = session.get('admin_id')
+        after = request.args.get('after')
+        try:
+            cursor = approval_queue.decode_cursor(after) if after else None
+        except ValueError:
+            cursor = None
+        
+        items, next_cursor = approval_queue.next_page(admin_id, after=cursor)
+        counts = approval_queue.queue_counts(admin_id)
+        logger.info(f"Item approvals page accessed - Showing: {len(items)}, Pending: {counts['pending']}, Admin ID: {admin_id}")
+        
+        return render_template('admin/approvals.html', items=items, next_cursor=next_cursor, queue_counts=counts)
     except Exception as e:
         logger.error(f"Error loading approvals page: {str(e)}", exc_info=True)
         flash('An error occurred while loading approvals.', 'danger')
@@ -853,6 +840,10 @@ def approve_item(item_id):
             flash(f"Item '{item.name}' is already approved.", "info")
             return redirect(url_for('admin.approve_items'))
 
+        if approval_queue.claimed_by_other(item, session.get('admin_id')):
+            flash(f"Item '{item.name}' is being reviewed by another admin.", "warning")
+            return redirect(url_for('admin.approve_items'))
+
         # Validate and parse item value
         try:
             value = float(request.form['value'])
@@ -862,28 +853,20 @@ def approve_item(item_id):
             logger.warning(f"Invalid item value provided - Item ID: {item_id}, Value: {request.form.get('value')}, Admin ID: {session.get('admin_id')}")
             raise ValidationError("Item value must be a positive number", field="value")
             
-        # Update item approval status
-        item.value = value
-        item.is_approved = True
-        item.is_available = True
-        item.status = 'approved'
-
-        # Award credits to user (only once, since we checked is_approved above)
-        item.user.credits += int(value)
-        # Mark item as modified to ensure changes persist through subsequent operations
-        flag_modified(item, 'status')
-        flag_modified(item, 'is_approved')
-        flag_modified(item, 'is_available')
-        flag_modified(item, 'value')
+        # Approve with a conditional UPDATE: a concurrent approval of the same item matches
+        # no row, so the owner can only be credited once
+        if not Item.approve(item.id, value):
+            logger.warning(f"Item approved concurrently - Item ID: {item_id}, Admin ID: {session.get('admin_id')}")
+            flash(f"Item '{item.name}' is already approved.", "info")
+            return redirect(url_for('admin.approve_items'))
+
+        # Award credits to user (atomic increment)
+        new_balance = User.change_credits(item.user_id, int(value))
         
         # Log to audit log
         log_item_approval(item_id, item.name, value, user_id=item.user_id, user_name=item.user.username)
         
-        logger.info(f"Item approved - Item ID: {item_id}, Name: {item.name}, Value: {value}, User Credits: {item.user.credits}, Admin ID: {session.get('admin_id')}")
-        
-        # CRITICAL: Detach item from session to prevent it from being reloaded by subsequent flushes
-        # in award_points_for_upload and award_referral_bonus functions
-        db.session.expunge(item)
+        logger.info(f"Item approved - Item ID: {item_id}, Name: {item.name}, Value: {value}, User Credits: {new_balance}, Admin ID: {session.get('admin_id')}")
 
         # Award trading points for upload approval
         level_up_info = award_points_for_upload(item.user, item.name)
@@ -893,10 +876,6 @@ def approve_item(item_id):
         if referral_result['success']:
             logger.info(f"Referral bonus awarded: {referral_result['message']}")
         
-        # Re-attach item to session after award operations
-        # Merge reattaches the item with all its changes intact
-        item = db.session.merge(item)
-        
         # Create level up notification and send email if applicable
         if level_up_info:
             create_level_up_notification(item.user, level_up_info)
@@ -917,17 +896,10 @@ def approve_item(item_id):
         
         db.session.add(notification)
         
-        # Find and notify users with matching wishlists
-        try:
-            from services.wishlist_service import find_wishlist_matches, send_wishlist_notification
-            matches = find_wishlist_matches(item)
-            for wishlist, user in matches:
-                send_wishlist_notification(wishlist, item, user)
-            if matches:
-                logger.info(f"Sent {len(matches)} wishlist notifications for approved item {item_id}")
-        except Exception as e:
-            logger.warning(f"Error processing wishlist matches for item {item_id}: {str(e)}", exc_info=True)
-            # Don't fail item approval if wishlist processing has issues
+        # Wishlist matching and match digests run on the background queue
+        enqueue('wishlist_matching', item_ids=[item.id])
+        db.session.commit()
+        wake_worker()
         
         # ✅ Send approval email to notify user their item was approved
         try:
@@ -935,7 +907,7 @@ def approve_item(item_id):
             approval_url = url_for('marketplace.marketplace', _external=True)
             
             # Render email template with proper app context
-            html_body = render_template(
+            html_body = render_email(
                 'emails/item_approved.html',
                 username=item.user.username,
                 item_name=item.name,
@@ -964,6 +936,98 @@ def approve_item(item_id):
     return redirect(url_for('admin.approve_items'))
 
 
+@admin_bp.route('/api/items/bulk-approve', methods=['POST'])
+@admin_login_required
+def bulk_approve_items():
+    """
+    Approve many items in one transaction.
+    
+    Body: {"items": [{"item_id": 1, "value": 1500}, ...]} (up to
+    BULK_APPROVE_MAX_ITEMS). Items that are already approved or claimed by
+    another admin are returned in `skipped`. Emails, wishlist matching and
+    referral bonuses run on the background queue.
+    """
+    payload = request.get_json(silent=True) or {}
+    entries = payload.get('items')
+    if not isinstance(entries, list) or not entries:
+        return {'success': False, 'error': 'items must be a non-empty list of {item_id, value}'}, 400
+    if len(entries) > approval_queue.BULK_APPROVE_MAX_ITEMS:
+        return {'success': False, 'error': f'At most {approval_queue.BULK_APPROVE_MAX_ITEMS} items per request'}, 400
+    
+    values = {}
+    for entry in entries:
+        try:
+            item_id = int(entry['item_id'])
+            value = float(entry['value'])
+        except (KeyError, TypeError, ValueError):
+            return {'success': False, 'error': f'Invalid entry: {entry!r}'}, 400
+        if value <= 0:
+            return {'success': False, 'error': f'Item {item_id}: value must be a positive number'}, 400
+        values[item_id] = value
+    
+    admin_id = session.get('admin_id')
+    try:
+        approved = approval_queue.bulk_approve(values, admin_id, ip_address=request.remote_addr)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Bulk approval failed - Items: {len(values)}, Admin ID: {admin_id}: {str(e)}", exc_info=True)
+        return {'success': False, 'error': 'Bulk approval failed, no items were approved'}, 500
+    wake_worker()
+    
+    approved_ids = [item['id'] for item in approved]
+    approved_set = set(approved_ids)
+    return {
+        'success': True,
+        'approved': approved_ids,
+        'skipped': [item_id for item_id in values if item_id not in approved_set],
+    }
+
+
+@admin_bp.route('/api/notifications/broadcast', methods=['POST'])
+@admin_login_required
+def broadcast_notification():
+    """
+    Send an in-app notice to a segment of users.
+
+    Body: {"message": "...", "segment": "all" | "state" | "tier" | "active",
+    "value": "Lagos" | "Expert" | 30, "title": "...", "action_url": "...",
+    "priority": "normal", "send_email": false}. Notifications are written in
+    one statement; emails are queued on the background queue.
+    """
+    payload = request.get_json(silent=True) or {}
+    message = (payload.get('message') or '').strip()
+    if not message:
+        return {'success': False, 'error': 'message is required'}, 400
+    priority = payload.get('priority') or 'normal'
+    if priority not in ('low', 'normal', 'high', 'urgent'):
+        return {'success': False, 'error': 'priority must be one of: low, normal, high, urgent'}, 400
+    segment = payload.get('segment') or 'all'
+    try:
+        broadcasts.validate_segment(segment, payload.get('value'))
+    except ValueError as e:
+        return {'success': False, 'error': str(e)}, 400
+
+    admin_id = session.get('admin_id')
+    try:
+        recipients = broadcasts.broadcast(
+            message, admin_id, segment, payload.get('value'),
+            title=(payload.get('title') or '').strip() or None,
+            priority=priority,
+            action_url=(payload.get('action_url') or '').strip() or None,
+            send_email=bool(payload.get('send_email')),
+            ip_address=request.remote_addr,
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Broadcast failed - Segment: {segment}, Admin ID: {admin_id}: {str(e)}", exc_info=True)
+        return {'success': False, 'error': 'Broadcast failed, no notifications were sent'}, 500
+    wake_worker()
+
+    return {'success': True, 'recipients': recipients}
+
+
 @admin_bp.route('/reject/<int:item_id>', methods=['POST'])
 @admin_login_required
 @handle_errors
@@ -976,6 +1040,10 @@ def reject_item(item_id):
         item = Item.query.get_or_404(item_id)
         reason = request.form.get("rejection_reason", "").strip()
 
+        if approval_queue.claimed_by_other(item, session.get('admin_id')):
+            flash(f"Item '{item.name}' is being reviewed by another admin.", "warning")
+            return redirect(url_for('admin.approve_items'))
+
         if not reason:
             logger.warning(f"Item rejection without reason - Item ID: {item_id}, Admin ID: {session.get('admin_id')}")
             raise ValidationError("You must provide a rejection reason", field="rejection_reason")
@@ -1002,7 +1070,7 @@ def reject_item(item_id):
             # Render email template with proper app context
             approval_url = url_for('items.upload_item', _external=True)
             
-            html_body = render_template(
+            html_body = render_email(
                 'emails/item_rejected.html',
                 username=user.username,
                 item_name=item.name,
@@ -1483,7 +1551,10 @@ def update_order_status(order_id):
             
             db.session.add(note)
 
+        if order.status != old_status:
+            enqueue('receipt', order_id=order.id)
         db.session.commit()
+        wake_worker()
         
         # Log to audit log
         log_audit_action(
@@ -1506,6 +1577,92 @@ def update_order_status(order_id):
         return redirect(url_for('admin.manage_orders'))
 
 
+AUDIT_EXPORT_BATCH_ROWS = 1000
+
+
+class _CSVLine:
+    """File-like target that hands back what csv.writer writes instead of buffering it."""
+    def write(self, value):
+        return value
+
+
+def _stream_audit_log_csv(filters, compress=False):
+    """
+    Yield the filtered audit log as CSV (optionally gzip), newest first.
+    
+    Rows are fetched AUDIT_EXPORT_BATCH_ROWS at a time (server-side cursor on
+    PostgreSQL) as plain tuples with the admin name joined in, and each batch
+    is encoded and yielded before the next is read, so memory stays flat
+    however many rows match.
+    """
+    from models import AuditLog
+    
+    writer = csv.writer(_CSVLine())
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+    
+    def encode(text):
+        data = text.encode('utf-8')
+        return compressor.compress(data) if compressor else data
+    
+    rows = db.session.query(
+        AuditLog.timestamp,
+        Admin.username,
+        AuditLog.action_type,
+        AuditLog.target_type,
+        AuditLog.target_id,
+        AuditLog.target_name,
+        AuditLog.description,
+        AuditLog.reason,
+        AuditLog.before_value,
+        AuditLog.after_value,
+        AuditLog.ip_address
+    ).outerjoin(Admin, Admin.id == AuditLog.admin_id).filter(*filters).order_by(
+        AuditLog.timestamp.desc(), AuditLog.id.desc()
+    ).execution_options(yield_per=AUDIT_EXPORT_BATCH_ROWS)
+    
+    yield encode(writer.writerow([
+        'Timestamp',
+        'Admin',
+        'Action',
+        'Target Type',
+        'Target ID',
+        'Target Name',
+        'Description',
+        'Reason',
+        'Before Value',
+        'After Value',
+        'IP Address'
+    ]))
+    
+    batch = []
+    for (timestamp, admin_name, action, target_type, target_id, target_name,
+         description, reason, before_value, after_value, ip_address) in rows:
+        batch.append(writer.writerow([
+            timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            admin_name or 'Unknown',
+            action,
+            target_type,
+            target_id or '',
+            target_name or '',
+            description or '',
+            reason or '',
+            before_value or '',
+            after_value or '',
+            ip_address or ''
+        ]))
+        if len(batch) >= AUDIT_EXPORT_BATCH_ROWS:
+            chunk = encode(''.join(batch))
+            batch = []
+            if chunk:
+                yield chunk
+    
+    tail = encode(''.join(batch)) if batch else b''
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
+
+
 @admin_bp.route('/audit-log', methods=['GET'])
 @admin_login_required
 @handle_errors
@@ -1514,8 +1671,6 @@ def audit_log():
     try:
         from models import AuditLog, User
         from datetime import datetime, timedelta
-        import csv
-        from io import StringIO
         
         # Get filter parameters
         admin_id = request.args.get('admin_id', type=int)
@@ -1524,19 +1679,19 @@ def audit_log():
         date_to = request.args.get('date_to')
         export = request.args.get('export')  # CSV export flag
         
-        # Build query
-        query = AuditLog.query
+        # Build filters
+        filters = []
         
         if admin_id:
-            query = query.filter_by(admin_id=admin_id)
+            filters.append(AuditLog.admin_id == admin_id)
         
         if action_type:
-            query = query.filter_by(action_type=action_type)
+            filters.append(AuditLog.action_type == action_type)
         
         if date_from:
             try:
                 from_date = datetime.strptime(date_from, '%Y-%m-%d')
-                query = query.filter(AuditLog.timestamp >= from_date)
+                filters.append(AuditLog.timestamp >= from_date)
             except ValueError:
                 pass
         
@@ -1544,10 +1699,26 @@ def audit_log():
             try:
                 to_date = datetime.strptime(date_to, '%Y-%m-%d')
                 to_date = to_date.replace(hour=23, minute=59, second=59)
-                query = query.filter(AuditLog.timestamp <= to_date)
+                filters.append(AuditLog.timestamp <= to_date)
             except ValueError:
                 pass
         
+        # CSV Export - the whole filtered range, streamed (not just the current page)
+        if export == 'csv':
+            compress = request.args.get('gzip', '').lower() in ['1', 'true', 'yes']
+            filename = f'audit_log_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv' + ('.gz' if compress else '')
+            logger.info(f"Audit log export - Admin: {session.get('admin_id')}, Filters: admin_id={admin_id}, action={action_type}, date_range={date_from} to {date_to}, gzip={compress}")
+            return Response(
+                stream_with_context(_stream_audit_log_csv(filters, compress)),
+                mimetype='application/gzip' if compress else 'text/csv',
+                headers={
+                    'Content-Disposition': f'attachment; filename={filename}',
+                    'X-Accel-Buffering': 'no'
+                }
+            )
+        
+        query = AuditLog.query.filter(*filters)
+        
         # Apply pagination
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
@@ -1563,49 +1734,6 @@ def audit_log():
         action_types = [a[0] for a in action_types_query if a[0]]
         action_types.sort()
         
-        # CSV Export
-        if export == 'csv':
-            output = StringIO()
-            writer = csv.writer(output)
-            
-            # Header
-            writer.writerow([
-                'Timestamp',
-                'Admin',
-                'Action',
-                'Target Type',
-                'Target ID',
-                'Target Name',
-                'Description',
-                'Reason',
-                'Before Value',
-                'After Value',
-                'IP Address'
-            ])
-            
-            # Rows
-            for log in audit_logs:
-                writer.writerow([
-                    log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                    log.admin.username if log.admin else 'Unknown',
-                    log.action_type,
-                    log.target_type,
-                    log.target_id or '',
-                    log.target_name or '',
-                    log.description or '',
-                    log.reason or '',
-                    log.before_value or '',
-                    log.after_value or '',
-                    log.ip_address or ''
-                ])
-            
-            # Return CSV response
-            from flask import make_response
-            response = make_response(output.getvalue())
-            response.headers['Content-Disposition'] = f'attachment; filename=audit_log_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-            response.headers['Content-Type'] = 'text/csv'
-            return response
-        
         logger.info(f"Audit log viewed - Admin: {session.get('admin_id')}, Filters: admin_id={admin_id}, action={action_type}, date_range={date_from} to {date_to}")
         
         return render_template(
@@ -2075,71 +2203,11 @@ def orders_stream():
     """
     Server-Sent Events (SSE) endpoint for real-time order updates.
     Streams live order status changes and counts to the dashboard.
-    """
-    def generate_order_updates():
-        """Generate order updates as server-sent events."""
-        import time
-        last_check = datetime.utcnow()
-        
-        # Send initial data
-        try:
-            total_orders = Order.query.count()
-            pending_count = Order.query.filter_by(status='Pending').count()
-            shipped_count = Order.query.filter_by(status='Shipped').count()
-            out_for_delivery = Order.query.filter_by(status='Out for Delivery').count()
-            delivered_count = Order.query.filter_by(status='Delivered').count()
-            
-            initial_data = {
-                'type': 'initial',
-                'total_orders': total_orders,
-                'pending_count': pending_count,
-                'shipped_count': shipped_count,
-                'out_for_delivery': out_for_delivery,
-                'delivered_count': delivered_count,
-                'timestamp': datetime.utcnow().isoformat()
-            }
-            yield f'data: {json.dumps(initial_data)}\n\n'
-        except Exception as e:
-            logger.error(f"Error generating initial order data: {str(e)}")
-        
-        # Keep connection alive and send updates every 5 seconds
-        while True:
-            try:
-                time.sleep(5)
-                
-                # Get current counts
-                current_total = Order.query.count()
-                current_pending = Order.query.filter_by(status='Pending').count()
-                current_shipped = Order.query.filter_by(status='Shipped').count()
-                current_out_for_delivery = Order.query.filter_by(status='Out for Delivery').count()
-                current_delivered = Order.query.filter_by(status='Delivered').count()
-                
-                # Check for recent updates (last 30 seconds)
-                recent_updates = Order.query.filter(
-                    Order.date_ordered >= (datetime.utcnow().timestamp() - 30)
-                ).all()
-                
-                update_data = {
-                    'type': 'update',
-                    'total_orders': current_total,
-                    'pending_count': current_pending,
-                    'shipped_count': current_shipped,
-                    'out_for_delivery': current_out_for_delivery,
-                    'delivered_count': current_delivered,
-                    'recent_updates': len(recent_updates),
-                    'timestamp': datetime.utcnow().isoformat()
-                }
-                
-                yield f'data: {json.dumps(update_data)}\n\n'
-                
-            except GeneratorExit:
-                # Client disconnected
-                break
-            except Exception as e:
-                logger.error(f"Error in orders_stream: {str(e)}")
-                break
     
-    return generate_order_updates(), {
+    All connections share one broadcaster per process (order_events), which
+    runs the count query once per change/poll and fans the event out.
+    """
+    return get_broadcaster().stream(), {
         'Content-Type': 'text/event-stream',
         'Cache-Control': 'no-cache',
         'X-Accel-Buffering': 'no',
@@ -2147,58 +2215,95 @@ def orders_stream():
     }
 
 
+def _order_cursor(order):
+    """Opaque keyset cursor for an order: '<updated_at ISO>_<id>'."""
+    return _cursor_at(order.updated_at, order.id)
+
+
+def _cursor_at(updated_at, order_id=0):
+    return f"{updated_at.isoformat()}_{order_id}"
+
+
+def _parse_order_cursor(value):
+    """Return (updated_at, id) from a cursor, or raise ValueError."""
+    timestamp, _, order_id = value.rpartition('_')
+    return datetime.fromisoformat(timestamp), int(order_id)
+
+
+def _order_update_payload(order):
+    return {
+        'id': order.id,
+        'order_number': order.order_number,
+        'status': order.status,
+        'user_id': order.user_id,
+        'username': order.user.username if order.user else 'Unknown',
+        'total_credits': order.total_credits,
+        'delivery_method': order.delivery_method,
+        'date_ordered': order.date_ordered.isoformat() if order.date_ordered else None,
+        'updated_at': order.updated_at.isoformat() if order.updated_at else None,
+    }
+
+
 @admin_bp.route('/api/order-updates', methods=['GET'])
 @admin_login_required
 def get_order_updates():
     """
-    JSON API endpoint for getting latest order updates.
-    Returns orders that changed in the last N minutes.
+    JSON API endpoint for incremental order updates.
     Used as fallback if SSE connection drops.
+    
+    Without `since`, returns the most recently changed orders, the status
+    counts and a cursor. With `since=<cursor>`, returns only orders changed
+    after the cursor (oldest first, up to per_page, `has_more` if there are
+    more) and the new cursor; counts are included only when something changed.
+    
+    updated_at is set at flush, not commit, so a slow checkout can commit a
+    row stamped before orders another poll already passed. The cursor
+    therefore never moves past now - ORDER_UPDATES_SETTLE_SECONDS; orders
+    changed more recently are returned too, and again on the next poll
+    (clients dedupe by id and updated_at).
     """
     try:
-        minutes = request.args.get('minutes', 5, type=int)
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 25, type=int)
-        
-        # Get orders updated in last N minutes
-        cutoff_time = datetime.utcnow()
-        recent_orders = Order.query.order_by(
-            Order.date_ordered.desc()
-        ).limit(100).all()
+        per_page = min(max(request.args.get('per_page', 25, type=int), 1), 100)
+        since = request.args.get('since')
+        horizon = datetime.utcnow() - timedelta(seconds=current_app.config.get('ORDER_UPDATES_SETTLE_SECONDS', 30))
         
-        # Get summary statistics
-        total_orders = Order.query.count()
-        pending_count = Order.query.filter_by(status='Pending').count()
-        shipped_count = Order.query.filter_by(status='Shipped').count()
-        out_for_delivery = Order.query.filter_by(status='Out for Delivery').count()
-        delivered_count = Order.query.filter_by(status='Delivered').count()
+        query = Order.query.options(joinedload(Order.user)).filter(Order.updated_at != None)
         
-        orders_data = []
-        for order in recent_orders[:25]:
-            orders_data.append({
-                'id': order.id,
-                'order_number': order.order_number,
-                'status': order.status,
-                'user_id': order.user_id,
-                'username': order.user.username if order.user else 'Unknown',
-                'total_credits': order.total_credits,
-                'delivery_method': order.delivery_method,
-                'date_ordered': order.date_ordered.isoformat() if order.date_ordered else None,
-                'estimated_delivery': order.estimated_delivery_date.isoformat() if order.estimated_delivery_date else None
-            })
+        if since:
+            try:
+                since_at, since_id = _parse_order_cursor(since)
+            except ValueError:
+                return {'success': False, 'error': 'Invalid cursor'}, 400
+            
+            # Keyset on (updated_at, id), served by idx_order_updated_at
+            query = query.filter(db.or_(
+                Order.updated_at > since_at,
+                db.and_(Order.updated_at == since_at, Order.id > since_id)
+            )).order_by(Order.updated_at, Order.id)
+            rows = query.filter(Order.updated_at <= horizon).limit(per_page + 1).all()
+            has_more = len(rows) > per_page
+            orders = rows[:per_page]
+            if has_more:
+                cursor = _order_cursor(orders[-1])
+            else:
+                # Settled orders are exhausted: add the unsettled ones, but keep the cursor at the horizon
+                orders += query.filter(Order.updated_at > horizon).limit(per_page - len(orders)).all()
+                cursor = since if since_at > horizon else _cursor_at(horizon)
+        else:
+            orders = query.order_by(Order.updated_at.desc(), Order.id.desc()).limit(per_page).all()
+            has_more = False
+            cursor = _cursor_at(horizon)
         
-        return {
+        response = {
             'success': True,
-            'stats': {
-                'total_orders': total_orders,
-                'pending_count': pending_count,
-                'shipped_count': shipped_count,
-                'out_for_delivery': out_for_delivery,
-                'delivered_count': delivered_count
-            },
-            'recent_orders': orders_data,
+            'cursor': cursor,
+            'has_more': has_more,
+            'orders': [_order_update_payload(order) for order in orders],
             'timestamp': datetime.utcnow().isoformat()
         }
+        if orders or not since:
+            response['stats'] = order_counts()
+        return response
     except Exception as e:
         logger.error(f"Error getting order updates: {str(e)}", exc_info=True)
         return {'success': False, 'error': str(e)}, 500
@@ -2,7 +2,6 @@ from flask import Blueprint, render_template, redirect, url_for, flash, current_
 from flask_login import login_user, logout_user, current_user, login_required
 from werkzeug.security import generate_password_hash, check_password_hash
 from itsdangerous import URLSafeTimedSerializer
-from threading import Thread
 from datetime import datetime, timedelta
 
 from models import User, CreditTransaction, Notification
@@ -11,6 +10,8 @@ from logger_config import setup_logger
 from exceptions import AuthenticationError, UserBannedError, EmailSendError
 from error_handlers import handle_errors, safe_database_operation
 from app import db
+from mail_queue import queue_email
+from email_templates import render_email
 
 logger = setup_logger(__name__)
 
@@ -18,32 +19,14 @@ auth_bp = Blueprint('auth', __name__)
 
 # ==================== HELPER FUNCTIONS ====================
 
-def send_async_email(app, msg):
-    """Send email in background thread to avoid blocking requests"""
-    with app.app_context():
-        try:
-            from flask_mail import Mail
-            mail = Mail(app)
-            mail.send(msg)
-            logger.info(f"✅ Email sent successfully to {msg.recipients}")
-        except Exception as e:
-            logger.error(f"❌ Email sending failed: {e}", exc_info=True)
-
 def send_email_async(subject, recipients, html_body, sender=None):
-    """Helper function to send emails asynchronously"""
-    try:
-        from flask_mail import Message
-        msg = Message(
-            subject=subject,
-            sender=sender or (current_app.config.get('MAIL_DEFAULT_SENDER', 'noreply@barterex.com')),
-            recipients=recipients if isinstance(recipients, list) else [recipients]
-        )
-        msg.html = html_body
-        logger.debug(f"Sending email to {recipients} with subject: {subject}")
-        Thread(target=send_async_email, args=(current_app._get_current_object(), msg), daemon=True).start()
-        logger.info(f"Email task queued for {recipients}")
-    except Exception as e:
-        logger.error(f"❌ Failed to queue email: {e}", exc_info=True)
+    """Queue an email for the background delivery worker (see mail_queue.py).
+
+    The queue row is added to the current transaction; the caller commits it
+    together with the rest of its work.
+    """
+    queue_email(subject, recipients, html_body, sender=sender)
+    logger.info(f"Email task queued for {recipients}")
 
 def generate_reset_token(email, expires_sec=3600):
     s = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
@@ -82,14 +65,13 @@ def register():
             
             # ✅ Generate email verification token
             verification_token = user.generate_email_verification_token()
-            db.session.commit()
             
             # ✅ Send verification email BEFORE handling referrals
             from flask import url_for
             verification_link = url_for('auth.verify_email', token=verification_token, _external=True)
             support_url = url_for('marketplace.marketplace', _external=True)
             
-            html = render_template(
+            html = render_email(
                 "emails/verify_email.html", 
                 username=user.username,
                 verification_token=verification_token,
@@ -101,6 +83,7 @@ def register():
                 recipients=[user.email],
                 html_body=html
             )
+            db.session.commit()
             
             logger.info(f"Verification email sent to new user: {user.username} ({user.email})")
             
@@ -182,12 +165,13 @@ def verify_email(token):
         logger.info(f"✅ Email verified for user: {user.username}")
         
         # Send welcome email after verification
-        html = render_template("emails/welcome_email.html", username=user.username)
+        html = render_email("emails/welcome_email.html", username=user.username)
         send_email_async(
             subject="🎉 Welcome to Barterex!",
             recipients=[user.email],
             html_body=html
         )
+        db.session.commit()
         
         flash('✅ Email verified successfully! Your account is now active. You can log in now.', 'success')
         return redirect(url_for('auth.login'))
@@ -235,14 +219,13 @@ def resend_verification():
         
         # Generate new verification token
         verification_token = user.generate_email_verification_token()
-        db.session.commit()
         
         # Send verification email
         from flask import url_for
         verification_link = url_for('auth.verify_email', token=verification_token, _external=True)
         support_url = url_for('marketplace.marketplace', _external=True)
         
-        html = render_template(
+        html = render_email(
             "emails/verify_email.html", 
             username=user.username,
             verification_token=verification_token,
@@ -254,6 +237,7 @@ def resend_verification():
             recipients=[user.email],
             html_body=html
         )
+        db.session.commit()
         
         logger.info(f"Verification email resent to user: {user.username}")
         flash('✅ Verification email sent! Please check your inbox.', 'success')
@@ -404,7 +388,7 @@ def forgot_password():
             token = generate_reset_token(user.email)
             reset_url = url_for('auth.reset_password', token=token, _external=True)
 
-            html = render_template(
+            html = render_email(
                 "emails/reset_password_email.html",
                 username=user.username,
                 reset_url=reset_url
@@ -414,6 +398,7 @@ def forgot_password():
                 recipients=[user.email],
                 html_body=html
             )
+            db.session.commit()
 
         flash('If that email exists, a reset link has been sent.', 'info')
         return redirect(url_for('auth.login'))
@@ -3,19 +3,25 @@ from flask_login import login_required, current_user, logout_user
 from flask_wtf.csrf import generate_csrf
 import os
 import time
+import uuid
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
 
 from app import db, app
-from models import Item, ItemImage, Cart, CartItem, Trade, Order, OrderItem, PickupStation, Notification
+from models import User, Item, ItemImage, Cart, CartItem, Trade, Order, OrderItem, OrderNumberCounter, PickupStation, Notification, Referral
 from forms import UploadItemForm, OrderForm
 from routes.auth import send_email_async
 from logger_config import setup_logger
 from exceptions import ValidationError, InsufficientCreditsError, ItemNotAvailableError, FileUploadError, DatabaseError, CheckoutError
-from error_handlers import handle_errors, safe_database_operation, retry_operation
+from error_handlers import handle_errors, safe_database_operation, retry_operation, retry_on_conflict, is_conflict_error
 from transaction_clarity import calculate_estimated_delivery, generate_transaction_explanation
 from file_upload_validator import validate_upload, generate_safe_filename
-from trading_points import award_points_for_purchase, create_level_up_notification
+from storage import get_storage
+from trading_points import award_points_for_purchase
+from outbox import enqueue, wake_worker
+from approval_queue import set_review_priority
+import idempotency
+from idempotency import IdempotencyInProgress
 from upload_validation_helper import (
     validate_upload_request, validate_image_type, validate_image_size, 
     validate_image_dimensions, get_user_friendly_error_message
@@ -59,7 +65,6 @@ def create_notification(user_id, message):
     
     notification = Notification(user_id=user_id, message=message)
     db.session.add(notification)
-    db.session.commit()
 
     user = User.query.get(user_id)
     if user and user.email:
@@ -91,6 +96,7 @@ def create_notification(user_id, message):
             recipients=[user.email],
             html_body=html
         )
+    db.session.commit()
 
 # ==================== ROUTES ====================
 
@@ -171,6 +177,7 @@ def upload_item():
             db.session.flush()
             
             uploaded_images = []
+            saved_keys = []  # Stored files to clean up if the upload is aborted
             upload_error_occurred = False
             validation_errors = []  # Collect all errors to show together
             
@@ -216,13 +223,12 @@ def upload_item():
                                 upload_error_occurred = True
                                 continue
                             
-                            # Upload image to local storage
+                            # Upload image through the configured storage backend (local disk or S3)
                             try:
                                 unique_filename = generate_safe_filename(file, current_user.id, item_id=new_item.id, index=index)
-                                image_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                                os.makedirs(os.path.dirname(image_path), exist_ok=True)
                                 file.seek(0)  # Reset file pointer
-                                file.save(image_path)
+                                get_storage().save(file, unique_filename, content_type=file.mimetype)
+                                saved_keys.append(unique_filename)
 
                                 # Store ONLY the filename, not the full path - the image_url filter will construct the proper URL
                                 image_url = unique_filename
@@ -230,10 +236,10 @@ def upload_item():
                                 height = None
                                 file_size = None
 
-                                logger.info(f"Image uploaded to local storage - Item: {new_item.id}, File: {unique_filename}")
+                                logger.info(f"Image stored ({get_storage().name}) - Item: {new_item.id}, File: {unique_filename}")
                             except Exception as e:
                                 db.session.rollback()
-                                logger.error(f"Local storage failed: {e}")
+                                logger.error(f"Image storage failed: {e}")
                                 user_message = get_user_friendly_error_message(str(e), 'images')
                                 validation_errors.append(f"• {file.filename}: {user_message}")
                                 upload_error_occurred = True
@@ -289,6 +295,8 @@ def upload_item():
             # If any images failed to upload, abort the entire transaction
             if upload_error_occurred:
                 db.session.rollback()
+                for key in saved_keys:
+                    get_storage().delete(key)
                 logger.warning(f"Item upload aborted due to image errors - User: {current_user.username}")
                 
                 # Flash all validation errors for user visibility
@@ -310,6 +318,9 @@ def upload_item():
             if uploaded_images:
                 new_item.image_url = uploaded_images[0].image_url
             
+            # Place the item in the approval queue (seller tier, image quality flags)
+            set_review_priority(new_item)
+            
             try:
                 db.session.commit()
                 logger.info(f"Item submitted for approval - Item: {new_item.id}, User: {current_user.username}, Images: {len(uploaded_images)}")
@@ -351,9 +362,9 @@ def upload_item():
 @safe_database_operation("add_to_cart")
 def add_to_cart(item_id):
     try:
-        # CRITICAL: Use row-level lock to prevent race condition
-        # Item could be purchased by another user between validation and add_to_cart
-        item = Item.query.filter_by(id=item_id).with_for_update().first_or_404()
+        # No row lock: the cart does not change the item, and finalize_purchase only
+        # sells it with a conditional UPDATE if it is still available at checkout
+        item = Item.query.filter_by(id=item_id).first_or_404()
 
         if not item.is_available:
             logger.warning(f"Attempt to add unavailable item to cart - Item: {item_id}, User: {current_user.username}")
@@ -530,6 +541,7 @@ def checkout():
         # Store pending items in session (for delivery setup before purchase)
         # Do NOT purchase yet - user must set up delivery first
         session['pending_checkout_items'] = [ci.item_id for ci in available_items]
+        session['checkout_token'] = uuid.uuid4().hex  # idempotency key for finalize_purchase
         logger.info(f"Checkout initialized - User: {current_user.username}, Items: {len(available_items)}, Total: {total_cost}")
         
         # Redirect to delivery setup page (no purchase yet)
@@ -542,11 +554,25 @@ def checkout():
         return redirect(url_for('items.view_cart'))
 
 
+CHECKOUT_IDEMPOTENCY_SCOPE = 'finalize_purchase'
+
+
+def _replay_finalized_purchase(recorded, transaction_id):
+    """Response for a repeated finalize_purchase whose order already exists."""
+    logger.info(f"[TXN:{transaction_id}] Replaying finalized purchase - User: {current_user.username}, Order #: {recorded['order_number']}")
+    session.pop('pending_checkout_items', None)
+    session.pop('pending_delivery', None)
+    session.pop('checkout_token', None)
+    flash(f"✓ Purchase complete! {recorded['item_count']} item(s) purchased. Order #{recorded['order_number']}", "success")
+    return redirect(url_for('user.dashboard'))
+
+
 @items_bp.route('/finalize_purchase', methods=['POST'])
 @rate_limit("10 per minute")  # Rate limit: 10 requests per minute per IP
 @login_required
 @handle_errors
 @safe_database_operation("finalize_purchase")
+@retry_on_conflict()
 def finalize_purchase():
     """
     NEW FLOW: This is called AFTER user sets up delivery details.
@@ -555,15 +581,28 @@ def finalize_purchase():
     2. Deducting credits
     3. Linking items to user
     4. Creating trades
-    5. Clearing cart
-    """
-    import uuid
-    from referral_rewards import award_referral_bonus
+    5. Clearing cart and creating the order
+    All of the above commit together; notifications, emails, referral bonuses
+    and level-up messages are queued in the outbox and sent after the commit.
     
+    The checkout token (Idempotency-Key header, form field or session) is
+    recorded with the order, so a double-click or retried POST replays the
+    first result instead of purchasing again.
+    """
     # Generate unique transaction ID for audit trail
     transaction_id = str(uuid.uuid4())[:8]
     
+    checkout_token = (request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+                      or session.get('checkout_token'))
+    idempotency_key = f"{current_user.id}:{checkout_token}" if checkout_token else None
+    
     try:
+        # Already finalized with this token - replay without touching items or credits
+        if idempotency_key:
+            recorded = idempotency.lookup(CHECKOUT_IDEMPOTENCY_SCOPE, idempotency_key)
+            if recorded is not None:
+                return _replay_finalized_purchase(recorded, transaction_id)
+        
         # Get pending checkout items from session
         pending_item_ids = session.get('pending_checkout_items', [])
         
@@ -580,16 +619,25 @@ def finalize_purchase():
             flash("Items not found. Please start from checkout.", "info")
             return redirect(url_for('marketplace.marketplace'))
         
-        # CRITICAL: Acquire row-level locks on all items to prevent race condition
-        logger.debug(f"[TXN:{transaction_id}] Acquiring locks on items: {pending_item_ids}")
-        locked_items = Item.query.filter(Item.id.in_(pending_item_ids)).with_for_update().all()
-        locked_items_dict = {item.id: item for item in locked_items}
-        
-        # PHASE 1: VALIDATION - Re-check all items are still available
-        logger.debug(f"[TXN:{transaction_id}] Phase 1: Re-validating items")
+        # Claim the token in this transaction; a concurrent duplicate waits for our commit, then replays
+        if idempotency_key:
+            try:
+                recorded = idempotency.begin(CHECKOUT_IDEMPOTENCY_SCOPE, idempotency_key, user_id=current_user.id)
+            except IdempotencyInProgress:
+                logger.warning(f"[TXN:{transaction_id}] Duplicate finalize while first is in progress - User: {current_user.username}")
+                flash("Your purchase is already being processed. Check your orders in a moment.", "info")
+                return redirect(url_for('user.dashboard'))
+            if recorded is not None:
+                return _replay_finalized_purchase(recorded, transaction_id)
+        
+        items_by_id = {item.id: item for item in items_to_purchase}
+        
+        # PHASE 1: VALIDATION - fail fast on items that are already gone (no locks taken;
+        # the conditional UPDATEs in phase 3 are what guarantee correctness)
+        logger.debug(f"[TXN:{transaction_id}] Phase 1: Validating items")
         available = []
         for item_id in pending_item_ids:
-            item = locked_items_dict.get(item_id)
+            item = items_by_id.get(item_id)
             if not item:
                 logger.warning(f"[TXN:{transaction_id}] Item not found - Item: {item_id}")
                 raise CheckoutError(f"Item became unavailable (not found)")
@@ -617,446 +665,132 @@ def finalize_purchase():
             logger.warning(f"[TXN:{transaction_id}] Insufficient credits - Required: {total_cost}, Available: {current_user.credits}")
             raise InsufficientCreditsError(total_cost, current_user.credits)
         
-        # PHASE 3: PROCESS - Atomic credit deduction and item linking
-        logger.debug(f"[TXN:{transaction_id}] Phase 3: Processing purchase (deducting credits, linking items)")
+        # PHASE 3: PROCESS - conditional UPDATEs (all-or-nothing, any failure rolls back the transaction)
+        logger.debug(f"[TXN:{transaction_id}] Phase 3: Processing purchase (claiming items, deducting credits)")
         
+        # Claim each item only if it is still available; ascending ids keep lock order consistent
         purchased_items = []
-        level_up_notifications = []
-        failed_items = []
-        
-        # Single atomic credit deduction (all-or-nothing)
-        current_user.credits -= total_cost
+        for item in sorted(available, key=lambda i: i.id):
+            seller_id = getattr(item, "owner_id", None) or getattr(item, "user_id", None)
+            if not Item.mark_sold(item.id, current_user.id):
+                logger.warning(f"[TXN:{transaction_id}] Item sold concurrently - Item: {item.id}")
+                raise CheckoutError(f"Item '{item.name}' is no longer available.")
+            
+            # Create trade record
+            db.session.add(Trade(
+                sender_id=current_user.id,
+                receiver_id=seller_id,
+                item_id=item.id,
+                item_received_id=item.id,
+                status='completed'
+            ))
+            purchased_items.append(item)
+            logger.debug(f"[TXN:{transaction_id}] Item purchased - Item: {item.id}, Title: {item.name}")
+        
+        # Single atomic credit deduction (applies only if the balance still covers it)
+        new_balance = User.change_credits(current_user.id, -total_cost)
+        if new_balance is None:
+            logger.warning(f"[TXN:{transaction_id}] Credits spent concurrently - Required: {total_cost}, Available: {current_user.credits}")
+            raise InsufficientCreditsError(total_cost, current_user.credits)
         current_user.last_checkout_transaction_id = transaction_id
         current_user.last_checkout_timestamp = datetime.utcnow()
         
-        # Process each item with savepoint for per-item error recovery
-        for item in available:
-            savepoint = db.session.begin_nested()
-            
-            try:
-                # Get seller ID BEFORE any changes
-                seller_id = getattr(item, "owner_id", None) or getattr(item, "user_id", None)
-                
-                # Link item to buyer
-                item.user_id = current_user.id
-                item.is_available = False
-                
-                # Create trade record
-                trade = Trade(
-                    sender_id=current_user.id,
-                    receiver_id=seller_id,
-                    item_id=item.id,
-                    item_received_id=item.id,
-                    status='completed'
-                )
-                db.session.add(trade)
-
-                # Award trading points for purchase
-                level_up_info = award_points_for_purchase(current_user, f"item-{item.id}")
-                if level_up_info:
-                    level_up_notifications.append(level_up_info)
-                
-                # Commit this item's savepoint
-                savepoint.commit()
-                purchased_items.append(item)
-                logger.debug(f"[TXN:{transaction_id}] Item purchased - Item: {item.id}, Title: {item.name}")
-                
-            except Exception as e:
-                savepoint.rollback()
-                failed_items.append({
-                    'item_id': item.id,
-                    'title': item.name,
-                    'error': str(e)
-                })
-                logger.warning(f"[TXN:{transaction_id}] Item purchase failed - Item: {item.id}, Error: {str(e)}")
-        
-        # If no items were successfully purchased, refund credits
-        if not purchased_items and total_cost > 0:
-            current_user.credits += total_cost
-            logger.warning(f"[TXN:{transaction_id}] All items failed - Refunding credits: {total_cost}")
-            raise CheckoutError("Could not process any items in your order.")
-        
-        # Commit main transaction
-        db.session.commit()
-        
-        # Award referral bonus for purchase (after commit)
-        try:
-            referral_result = award_referral_bonus(current_user.id, 'purchase', amount=100)
-            if referral_result['success']:
-                logger.info(f"[TXN:{transaction_id}] Referral bonus awarded: {referral_result['message']}")
-        except Exception as e:
-            logger.warning(f"[TXN:{transaction_id}] Failed to award referral bonus: {str(e)}")
+        # Award trading points for each purchased item (atomic increments)
+        level_up_notifications = []
+        for item in purchased_items:
+            level_up_info = award_points_for_purchase(current_user, f"item-{item.id}")
+            if level_up_info:
+                level_up_notifications.append(level_up_info)
         
-        # Create level-up notifications (after commit)
-        for level_up_info in level_up_notifications:
-            try:
-                create_level_up_notification(current_user, level_up_info)
-            except Exception as e:
-                logger.error(f"[TXN:{transaction_id}] Failed to create level-up notification: {str(e)}")
-
-        # Remove items from cart since they're now purchased
+        # Remove purchased items from the cart (same transaction)
         cart = Cart.query.filter_by(user_id=current_user.id).first()
         if cart:
-            CartItem.query.filter(CartItem.cart_id == cart.id, CartItem.item_id.in_(pending_item_ids)).delete()
-            db.session.commit()
-
-        logger.info(f"[TXN:{transaction_id}] ✓ Purchase FINALIZED - User: {current_user.username}, Items: {len(purchased_items)}, Credits Deducted: {total_cost}")
-        if failed_items:
-            logger.warning(f"[TXN:{transaction_id}] ⚠ Some items failed: {failed_items}")
+            CartItem.query.filter(
+                CartItem.cart_id == cart.id, CartItem.item_id.in_(pending_item_ids)
+            ).delete(synchronize_session=False)
+        
+        # Create Order record - order number comes from the atomic per-day counter, same transaction
+        pending_delivery = session.get('pending_delivery', {})
+        delivery_method = pending_delivery.get('method', 'home delivery')
+        order_number = OrderNumberCounter.next_order_number()
+        
+        order = Order(
+            user_id=current_user.id,
+            delivery_method=delivery_method,
+            delivery_address=pending_delivery.get('delivery_address'),
+            pickup_station_id=pending_delivery.get('pickup_station_id'),
+            order_number=order_number,
+            total_credits=total_cost,
+            credits_used=total_cost,
+            credits_balance_before=new_balance + total_cost,
+            credits_balance_after=new_balance,
+            status='Pending',
+            date_ordered=datetime.utcnow(),
+            estimated_delivery_date=datetime.utcnow() + timedelta(days=7),
+            transaction_notes=f"Purchase of {len(purchased_items)} item(s)"
+        )
+        for item in purchased_items:
+            db.session.add(OrderItem(order=order, item=item))
+        db.session.add(order)
+        db.session.flush()  # order.id for the outbox payloads
+        
+        # PHASE 4: SIDE EFFECTS - recorded in the outbox, run by the worker after commit
+        items_summary = ", ".join([f"[{item.item_number}] {item.name}" for item in purchased_items])
+        enqueue(
+            'notification',
+            user_id=current_user.id,
+            message=f"✓ Order Confirmed! Order #{order_number} for {len(purchased_items)} item(s): {items_summary}. Total: ₦{total_cost:,.0f} Credits. Delivery: {delivery_method.title()}. Est. delivery: 7 business days.",
+            notification_type='order',
+            category='status_update',
+            data={'order_id': order.id, 'order_number': order_number}
+        )
+        if current_user.email:
+            enqueue('order_confirmation_email', order_id=order.id)
+        enqueue('receipt', order_id=order.id)
+        if Referral.query.filter_by(referred_user_id=current_user.id, purchase_bonus_earned=False).first():
+            enqueue('referral_bonus', user_id=current_user.id, bonus_type='purchase', amount=100)
+        for level_up_info in level_up_notifications:
+            enqueue('level_up', user_id=current_user.id, level_up_info=level_up_info)
         
-        # CRITICAL: Create Order record for transaction history
-        order_number = None
-        try:
-            # Get delivery information from session
-            pending_delivery = session.get('pending_delivery', {})
-            
-            # Generate order number: ORD-YYYYMMDD-XXXXX
-            order_counter = Order.query.filter(
-                Order.date_ordered >= datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-            ).count()
-            
-            order_date = datetime.utcnow().strftime('%Y%m%d')
-            order_number = f"ORD-{order_date}-{order_counter + 1:05d}"
-            
-            # Create Order record
-            order = Order(
-                user_id=current_user.id,
-                delivery_method=pending_delivery.get('method', 'home delivery'),
-                delivery_address=pending_delivery.get('delivery_address'),
-                pickup_station_id=pending_delivery.get('pickup_station_id'),
-                order_number=order_number,
-                total_credits=total_cost,
-                credits_used=total_cost,
-                credits_balance_before=current_user.credits + total_cost,
-                credits_balance_after=current_user.credits,
-                status='Pending',
-                date_ordered=datetime.utcnow(),
-                estimated_delivery_date=datetime.utcnow() + timedelta(days=7),
-                transaction_notes=f"Purchase of {len(purchased_items)} item(s)"
-            )
-            
-            # Link items to order
-            for item in purchased_items:
-                order_item = OrderItem(order=order, item=item)
-                db.session.add(order_item)
-            
-            db.session.add(order)
-            db.session.commit()
-            
-            logger.info(f"[TXN:{transaction_id}] Order created - Order ID: {order.id}, Order #: {order_number}")
-            
-        except Exception as e:
-            logger.error(f"[TXN:{transaction_id}] Failed to create order record: {str(e)}", exc_info=True)
-            flash("Warning: Order record could not be saved. Please contact support.", "warning")
+        # Recorded result for repeats of this checkout token
+        if idempotency_key:
+            idempotency.complete(CHECKOUT_IDEMPOTENCY_SCOPE, idempotency_key, {
+                'order_id': order.id,
+                'order_number': order_number,
+                'item_count': len(purchased_items),
+            })
+        
+        # Single commit: credits, items, trades, order, cart cleanup, outbox events and idempotency key
+        db.session.commit()
+        wake_worker()
+        
+        logger.info(f"[TXN:{transaction_id}] ✓ Purchase FINALIZED - User: {current_user.username}, Items: {len(purchased_items)}, Credits Deducted: {total_cost}, Order #: {order_number}")
         
         # Clear pending items from session
         session.pop('pending_checkout_items', None)
         session.pop('pending_delivery', None)
+        session.pop('checkout_token', None)
         
-        # CRITICAL: Create order confirmation notification and email
-        try:
-            pending_delivery = session.get('pending_delivery', {})
-            delivery_method = pending_delivery.get('method', 'home delivery')
-            delivery_info = ""
-            
-            if delivery_method == 'home delivery':
-                delivery_address = pending_delivery.get('delivery_address', 'Not specified')
-                delivery_info = f"Delivery Address: {delivery_address}"
-            else:  # pickup
-                pickup_station_id = pending_delivery.get('pickup_station_id')
-                if pickup_station_id:
-                    station = PickupStation.query.get(pickup_station_id)
-                    if station:
-                        delivery_info = f"Pickup Station: {station.name} ({station.state})"
-            
-            # Build items list for notification
-            items_list = "<br>".join([
-                f"• [{item.item_number}] {item.name} - ₦{item.value:,.0f} Credits"
-                for item in purchased_items
-            ])
-            
-            # Compact single-line notification message with item numbers
-            items_summary = ", ".join([f"[{item.item_number}] {item.name}" for item in purchased_items])
-            notification_message = f"✓ Order Confirmed! Order #{order_number} for {len(purchased_items)} item(s): {items_summary}. Total: ₦{total_cost:,.0f} Credits. Delivery: {delivery_method.title()}. Est. delivery: 7 business days."
-            
-            # Create notification in database
-            notification = Notification(user_id=current_user.id, message=notification_message)
-            db.session.add(notification)
-            db.session.commit()
-            
-            # Send confirmation email
-            if current_user.email:
-                email_html = f"""
-                <!DOCTYPE html>
-                <html>
-                <head>
-                    <style>
-                        body {{ font-family: 'Arial', sans-serif; line-height: 1.6; color: #333; background: #f8f9fa; }}
-                        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; background: white; border-radius: 10px; }}
-                        .header {{ background: linear-gradient(135deg, #ff7a00 0%, #ff9533 100%); color: white; padding: 20px; text-align: center; border-radius: 10px 10px 0 0; }}
-                        .header h1 {{ margin: 0; font-size: 28px; }}
-                        .order-details {{ background: #f8f9fa; padding: 20px; margin: 20px 0; border-left: 4px solid #ff7a00; }}
-                        .order-number {{ font-size: 18px; font-weight: bold; color: #ff7a00; }}
-                        .items-section {{ margin: 20px 0; }}
-                        .item {{ background: white; padding: 10px; margin: 8px 0; border-left: 3px solid #ff7a00; }}
-                        .summary {{ background: #f0f0f0; padding: 15px; margin: 15px 0; border-radius: 5px; }}
-                        .summary-row {{ display: flex; justify-content: space-between; margin: 8px 0; }}
-                        .total {{ font-size: 18px; font-weight: bold; color: #ff7a00; }}
-                        .delivery-info {{ background: #e8f5e9; padding: 15px; margin: 15px 0; border-radius: 5px; border-left: 4px solid #10b981; }}
-                        .next-steps {{ background: #fff3cd; padding: 15px; margin: 15px 0; border-radius: 5px; }}
-                        .next-steps h3 {{ margin-top: 0; color: #ff7a00; }}
-                        .next-steps ol {{ margin: 10px 0; padding-left: 20px; }}
-                        .next-steps li {{ margin: 8px 0; }}
-                        .footer {{ margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; text-align: center; font-size: 12px; color: #666; }}
-                        .button {{ display: inline-block; background: #ff7a00; color: white; padding: 12px 25px; text-decoration: none; border-radius: 5px; margin: 15px 0; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <div class="header">
-                            <h1>✓ Order Confirmed!</h1>
-                            <p>Your purchase has been successfully processed</p>
-                        </div>
-                        
-                        <div class="order-details">
-                            <p>Thank you for your purchase, <strong>{current_user.username}</strong>!</p>
-                            <p class="order-number">Order #: {order_number}</p>
-                            <p>Order Date: {datetime.utcnow().strftime('%B %d, %Y at %I:%M %p')}</p>
-                        </div>
-                        
-                        <div class="items-section">
-                            <h3 style="color: #333; border-bottom: 2px solid #ff7a00; padding-bottom: 10px;">Items Ordered ({len(purchased_items)})</h3>
-                            {''.join([f'<div class="item"><strong>[{item.item_number}] {item.name}</strong><br><span style="color: #ff7a00; font-weight: bold;">₦{item.value:,.0f} Credits</span></div>' for item in purchased_items])}
-                        </div>
-                        
-                        <div class="summary">
-                            <div class="summary-row">
-                                <span>Subtotal:</span>
-                                <span>₦{total_cost:,.0f}</span>
-                            </div>
-                            <div class="summary-row total">
-                                <span>Total Cost:</span>
-                                <span>₦{total_cost:,.0f} Credits</span>
-                            </div>
-                        </div>
-                        
-                        <div class="delivery-info">
-                            <h3 style="margin-top: 0; color: #10b981;">🚚 Delivery Information</h3>
-                            <p><strong>Delivery Method:</strong> {delivery_method.title()}</p>
-                            {'<p><strong>Delivery Address:</strong> ' + pending_delivery.get('delivery_address', 'Not specified') + '</p>' if delivery_method == 'home delivery' else ''}
-                            {f'<p><strong>Pickup Station:</strong> {PickupStation.query.get(pending_delivery.get("pickup_station_id")).name} ({PickupStation.query.get(pending_delivery.get("pickup_station_id")).state})</p>' if delivery_method == 'pickup' and pending_delivery.get('pickup_station_id') else ''}
-                            <p><strong>Estimated Delivery:</strong> 7 business days from order date</p>
-                        </div>
-                        
-                        <div class="next-steps">
-                            <h3>📋 What Happens Next?</h3>
-                            <ol>
-                                <li><strong>Order Confirmation:</strong> Your order has been recorded and is being processed</li>
-                                <li><strong>Item Preparation:</strong> The seller(s) will prepare your items for delivery</li>
-                                <li><strong>Shipping:</strong> Your items will be shipped to your {'delivery address' if delivery_method == 'home delivery' else 'pickup station'}</li>
-                                <li><strong>Tracking:</strong> You will receive updates about your order status</li>
-                                <li><strong>Delivery:</strong> Items will arrive within the estimated timeframe</li>
-                            </ol>
-                        </div>
-                        
-                        <div style="text-align: center; margin: 20px 0;">
-                            <a href="{url_for('user.dashboard', _external=True)}" class="button">Track Your Order</a>
-                        </div>
-                        
-                        <div class="footer">
-                            <p>This is an automated confirmation email. Please do not reply to this email.</p>
-                            <p>If you have any questions, please contact our support team.</p>
-                            <p>© 2026 Barterex. All rights reserved.</p>
-                        </div>
-                    </div>
-                </body>
-                </html>
-                """
-                
-                send_email_async(
-                    subject=f"Order Confirmation #{order_number} - Barterex",
-                    recipients=[current_user.email],
-                    html_body=email_html
-                )
-                logger.info(f"[TXN:{transaction_id}] Order confirmation email sent to {current_user.email}")
-            
-        except Exception as e:
-            logger.error(f"[TXN:{transaction_id}] Failed to create order notification/email: {str(e)}", exc_info=True)
-        
-        flash(f"✓ Purchase complete! {len(purchased_items)} item(s) purchased. Order #{order_number if order_number else 'unknown'}", "success")
+        flash(f"✓ Purchase complete! {len(purchased_items)} item(s) purchased. Order #{order_number}", "success")
         return redirect(url_for('user.dashboard'))
 
     except InsufficientCreditsError as e:
+        db.session.rollback()
         logger.warning(f"[TXN:{transaction_id}] Insufficient credits error: {str(e)}")
         flash(str(e.message), 'danger')
         return redirect(url_for('items.view_cart'))
     except CheckoutError as e:
+        db.session.rollback()
         logger.error(f"[TXN:{transaction_id}] Checkout error: {str(e)}")
         flash(str(e), 'danger')
         return redirect(url_for('items.view_cart'))
     except Exception as e:
+        db.session.rollback()
+        if is_conflict_error(e):
+            raise  # retry_on_conflict reruns the checkout
         logger.error(f"[TXN:{transaction_id}] Unexpected error during purchase finalization: {str(e)}", exc_info=True)
-        flash("Something went wrong while finalizing your purchase. Please contact support.", "danger")
+        flash("Something went wrong while finalizing your purchase. No credits were deducted - please try again.", "danger")
         return redirect(url_for('items.view_cart'))
-        
-        if not available:
-            logger.warning(f"[TXN:{transaction_id}] Checkout attempted with no available items - User: {current_user.username}")
-            flash("No available items in your cart.", "info")
-            return redirect(url_for('items.view_cart'))
-
-        # CRITICAL: Acquire row-level locks on all items to prevent race condition
-        # This ensures no other user can purchase the same items concurrently
-        item_ids = [ci.item_id for ci in available]
-        logger.debug(f"[TXN:{transaction_id}] Acquiring locks on items: {item_ids}")
-        
-        # Lock items with FOR UPDATE to prevent concurrent modifications
-        # This uses database-level locking: no other transaction can modify these rows
-        locked_items = Item.query.filter(Item.id.in_(item_ids)).with_for_update().all()
-        locked_items_dict = {item.id: item for item in locked_items}
-        
-        # Re-validate items after acquiring locks to prevent race condition
-        # (item could have been purchased by another user between validation and lock)
-        for ci in available:
-            item = locked_items_dict.get(ci.item_id)
-            if not item:
-                logger.warning(f"[TXN:{transaction_id}] Item not found during lock acquisition - Item: {ci.item_id}")
-                raise CheckoutError(f"Item became unavailable (not found in database)")
-            
-            if not item.is_available:
-                logger.warning(f"[TXN:{transaction_id}] Item became unavailable during validation - Item: {item.id}")
-                raise CheckoutError(f"Item '{item.name}' is no longer available.")
-            
-            seller_id = getattr(item, "owner_id", None) or getattr(item, "user_id", None)
-            if not seller_id:
-                logger.error(f"[TXN:{transaction_id}] Item has no owner - Item: {item.id}")
-                raise CheckoutError(f"Item '{item.name}' has invalid seller information.")
-            
-            # Check that item is not already owned by current user (shouldn't happen, but double-check)
-            if item.user_id == current_user.id:
-                logger.warning(f"[TXN:{transaction_id}] User already owns item - Item: {item.id}, User: {current_user.id}")
-                raise CheckoutError(f"You already own item '{item.name}'.")
-
-        # PHASE 2: CALCULATE - Compute total cost
-        logger.debug(f"[TXN:{transaction_id}] Phase 2: Calculating total cost")
-        # Use locked items for cost calculation (not original cart items)
-        total_cost = sum(locked_items_dict[ci.item_id].value for ci in available)
-        
-        if current_user.credits < total_cost:
-            logger.warning(f"[TXN:{transaction_id}] Insufficient credits - Required: {total_cost}, Available: {current_user.credits}")
-            raise InsufficientCreditsError(total_cost, current_user.credits)
-
-        # PHASE 3: PROCESS - Atomic credit deduction and item linking
-        logger.debug(f"[TXN:{transaction_id}] Phase 3: Processing checkout (deducting credits, linking items)")
-        
-        purchased_items = []
-        level_up_notifications = []
-        failed_items = []
-        
-        # Single atomic credit deduction (not per-item)
-        # This ensures all-or-nothing: either all items purchased or none
-        current_user.credits -= total_cost
-        current_user.last_checkout_transaction_id = transaction_id
-        current_user.last_checkout_timestamp = datetime.utcnow()
-        
-        # Process each item with savepoint for per-item error recovery
-        # Use locked items to ensure no race condition
-        for ci in available:
-            # Get locked item (guaranteed to be locked and not modified by other transactions)
-            item = locked_items_dict.get(ci.item_id)
-            savepoint = db.session.begin_nested()
-            
-            try:
-                # CRITICAL: Get seller ID BEFORE any changes
-                seller_id = getattr(item, "owner_id", None) or getattr(item, "user_id", None)
-                
-                # Link item to buyer
-                item.user_id = current_user.id
-                item.is_available = False
-                
-                # Create trade record
-                trade = Trade(
-                    sender_id=current_user.id,
-                    receiver_id=seller_id,
-                    item_id=item.id,
-                    item_received_id=item.id,
-                    status='completed'
-                )
-                db.session.add(trade)
-
-                # Award trading points for purchase (20 points per item)
-                level_up_info = award_points_for_purchase(current_user, f"item-{item.id}")
-                if level_up_info:
-                    level_up_notifications.append(level_up_info)
-
-                # Remove from cart
-                db.session.delete(ci)
-                
-                # Commit this item's savepoint
-                savepoint.commit()
-                purchased_items.append(item)
-                logger.debug(f"[TXN:{transaction_id}] Item processed - Item: {item.id}, Title: {item.name}")
-                
-            except Exception as e:
-                # Rollback only THIS item's changes, not the entire transaction
-                savepoint.rollback()
-                failed_items.append({
-                    'item_id': item.id,
-                    'title': item.name,
-                    'error': str(e)
-                })
-                logger.warning(f"[TXN:{transaction_id}] Item processing failed - Item: {item.id}, Error: {str(e)}")
-        
-        # If no items were successfully purchased, refund credits
-        if not purchased_items and total_cost > 0:
-            current_user.credits += total_cost
-            logger.warning(f"[TXN:{transaction_id}] All items failed - Refunding credits: {total_cost}")
-            raise CheckoutError("Could not process any items in your cart.")
-        
-        # Commit main transaction (credits deducted, items linked)
-        db.session.commit()
-        
-        # Award referral bonus for purchase (after commit)
-        try:
-            referral_result = award_referral_bonus(current_user.id, 'purchase', amount=100)
-            if referral_result['success']:
-                logger.info(f"[TXN:{transaction_id}] Referral bonus awarded: {referral_result['message']}")
-        except Exception as e:
-            logger.warning(f"[TXN:{transaction_id}] Failed to award referral bonus: {str(e)}")
-        
-        # Create level-up notifications (after commit)
-        for level_up_info in level_up_notifications:
-            try:
-                create_level_up_notification(current_user, level_up_info)
-            except Exception as e:
-                logger.error(f"[TXN:{transaction_id}] Failed to create level-up notification: {str(e)}")
-
-        # Log successful checkout
-        logger.info(f"[TXN:{transaction_id}] ✓ Checkout SUCCESSFUL - User: {current_user.username}, Items: {len(purchased_items)}, Credits Deducted: {total_cost}")
-        if failed_items:
-            logger.warning(f"[TXN:{transaction_id}] ⚠ Some items failed: {failed_items}")
-
-    except InsufficientCreditsError as e:
-        logger.warning(f"[TXN:{transaction_id}] Insufficient credits error: {str(e)}")
-        flash(str(e.message), 'danger')
-        return redirect(url_for('items.view_cart'))
-    except CheckoutError as e:
-        logger.error(f"[TXN:{transaction_id}] Checkout error: {str(e)}")
-        flash(str(e), 'danger')
-        return redirect(url_for('items.view_cart'))
-    except Exception as e:
-        logger.error(f"[TXN:{transaction_id}] Unexpected error during checkout: {str(e)}", exc_info=True)
-        flash("Something went wrong while processing your purchase. Please contact support if credits were deducted.", "danger")
-        return redirect(url_for('items.view_cart'))
-
-    if not purchased_items:
-        logger.warning(f"[TXN:{transaction_id}] No items purchased - redirecting to cart")
-        return redirect(url_for('items.view_cart'))
-
-    # Success: Set up delivery for purchased items
-    session['pending_order_items'] = [i.id for i in purchased_items]
-    flash(f"✓ Purchase complete! {len(purchased_items)} item(s) purchased. Now set up delivery.", "success")
-    logger.info(f"[TXN:{transaction_id}] Redirecting to order setup - Items: {[i.id for i in purchased_items]}")
-    return redirect(url_for('items.order_item'))
 
 
 @items_bp.route('/order_item', methods=['GET', 'POST'])
@@ -1104,6 +838,7 @@ def order_item():
             # Cache-control headers are applied globally in app.py after_request handler
             return render_template('order_review.html', 
                                  form=form, 
+                                 checkout_token=session.get('checkout_token'),
                                  items=items,
                                  delivery_method=delivery_method,
                                  delivery_address=delivery_address,
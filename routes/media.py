@@ -0,0 +1,107 @@
+"""
+Media serving for user-uploaded images.
+
+Uploaded filenames are unique (id/index/timestamp prefixed) and never
+rewritten, so responses carry a strong content-hash ETag and a one-year
+immutable Cache-Control. Requests on this blueprint skip the app-wide
+logging, maintenance and no-cache hooks and never touch the session.
+
+Delivery modes:
+- default: Werkzeug send_file (Range + conditional requests; gunicorn uses
+  sendfile() for the file wrapper)
+- USE_X_SENDFILE=True: Apache/lighttpd X-Sendfile offload (Flask built-in)
+- MEDIA_X_ACCEL_PREFIX=/protected-uploads/: nginx X-Accel-Redirect offload
+"""
+
+import os
+import hashlib
+import mimetypes
+import threading
+
+from flask import Blueprint, current_app, send_file, make_response, request
+from werkzeug.utils import secure_filename
+
+from storage import get_storage
+
+media_bp = Blueprint('media', __name__, url_prefix='/media')
+
+MEDIA_MAX_AGE = 31536000  # 1 year - filenames are content-unique
+
+# (path, mtime_ns, size) -> strong ETag, so each file is hashed once per process
+_etag_cache = {}
+_etag_lock = threading.Lock()
+_ETAG_CACHE_LIMIT = 10000
+
+
+def is_media_request(req):
+    """True for requests handled by this blueprint (used by app-wide hooks to skip work)"""
+    return req.blueprint == 'media'
+
+
+def _content_etag(path, stat):
+    cache_key = (path, stat.st_mtime_ns, stat.st_size)
+    with _etag_lock:
+        etag = _etag_cache.get(cache_key)
+    if etag:
+        return etag
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    etag = digest.hexdigest()[:32]
+
+    with _etag_lock:
+        if len(_etag_cache) >= _ETAG_CACHE_LIMIT:
+            _etag_cache.clear()
+        _etag_cache[cache_key] = etag
+    return etag
+
+
+def _not_found():
+    # Plain 404 - the app-wide handler would flash and render a full page
+    response = make_response('Not Found', 404)
+    response.mimetype = 'text/plain'
+    return response
+
+
+def _apply_cache_headers(response, etag):
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = MEDIA_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+
+@media_bp.route('/<path:filename>', methods=['GET', 'HEAD'])
+def serve_upload(filename):
+    """Serve an uploaded image by its storage key."""
+    key = secure_filename(filename.split('/')[-1])
+    if not key:
+        return _not_found()
+
+    storage = get_storage()
+    path = storage.local_path(key)
+    if not path or not os.path.exists(path):
+        # Remote backends: pull into the local cache once, then serve from disk
+        if storage.open(key) is None:
+            return _not_found()
+        path = storage.local_path(key)
+        if not path:
+            return _not_found()
+
+    stat = os.stat(path)
+    etag = _content_etag(path, stat)
+
+    accel_prefix = current_app.config.get('MEDIA_X_ACCEL_PREFIX')
+    if accel_prefix:
+        # Validate the conditional request here; nginx handles body, Range and sendfile
+        if etag in request.if_none_match:
+            return _apply_cache_headers(make_response('', 304), etag)
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{key}"
+        response.mimetype = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        return _apply_cache_headers(response, etag)
+
+    response = send_file(path, conditional=True, etag=etag, max_age=MEDIA_MAX_AGE, last_modified=stat.st_mtime)
+    return _apply_cache_headers(response, etag)
@@ -3,11 +3,14 @@ Notifications Blueprint - API endpoints and routes for notification system
 Handles real-time notifications, preferences, and notification management
 """
 
-from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash, current_app
+from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash, current_app, make_response
 from flask_login import login_required, current_user
 from models import db, User, Notification, Order
 from notifications import NotificationService
+from notification_events import get_broadcaster, serialize_notification
+from wishlist_digest import DIGEST_FREQUENCIES, DIGEST_PREFERENCE_KEY
 from functools import wraps
+import hashlib
 import json
 import logging
 
@@ -28,6 +31,62 @@ def handle_errors(f):
     return decorated_function
 
 
+# Long-poll requests (?wait=N) are held at most this long
+LONG_POLL_MAX_SECONDS = 30
+
+
+def _notification_etag(user_id, version):
+    """ETag for a user's notification data at version, for this endpoint's query (wait aside)"""
+    args = sorted((key, value) for key, value in request.args.items(multi=True) if key != 'wait')
+    digest = hashlib.sha1(f"{request.path}?{args}".encode('utf-8')).hexdigest()[:12]
+    return f"n{user_id}-{version}-{digest}"
+
+
+def _wait_for_change(version, timeout):
+    """Hold the request until the user's notification version moves; True if it did."""
+    user_id = current_user.id
+    
+    def current_version():
+        try:
+            return db.session.query(User.notification_version).filter(User.id == user_id).scalar()
+        finally:
+            db.session.close()  # no pooled connection held while waiting
+    
+    return get_broadcaster().wait(user_id, version, timeout, current_version=current_version)
+
+
+def versioned(f):
+    """
+    Conditional GET on the current user's notification_version.
+    
+    A request whose If-None-Match carries the current ETag gets a 304 without
+    running the view, so no list or count query. With ?wait=N (seconds) it is
+    instead held until the version changes or N seconds pass (long poll).
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user = current_user._get_current_object()
+        etag = _notification_etag(user.id, user.notification_version)
+        if request.if_none_match.contains(etag):
+            wait = min(request.args.get('wait', 0, type=int), LONG_POLL_MAX_SECONDS)
+            if wait <= 0 or not _wait_for_change(user.notification_version, wait):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+            # Changed while waiting: reload the counters the view reads
+            db.session.add(user)
+            db.session.refresh(user)
+        
+        version = user.notification_version
+        response = make_response(f(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(_notification_etag(user.id, version))
+            response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return decorated_function
+
+
 # ============================================================================
 # REAL-TIME NOTIFICATION ENDPOINTS
 # ============================================================================
@@ -55,48 +114,70 @@ def send_toast():
     })
 
 
+@notifications_bp.route('/stream', methods=['GET'])
+@login_required
+def notification_stream():
+    """
+    Server-Sent Events stream of the current user's new notifications.
+    
+    Pushed by the per-process broadcaster (notification_events) when a commit
+    touches this user's notifications; /real-time remains the polling fallback.
+    """
+    after_id = db.session.query(db.func.max(Notification.id)).filter(
+        Notification.user_id == current_user.id
+    ).scalar() or 0
+    stream = get_broadcaster().stream(
+        current_user.id,
+        after_id=after_id,
+        version=current_user.notification_version,
+        unread_count=current_user.unread_notification_count
+    )
+    return stream, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+        'Connection': 'keep-alive'
+    }
+
+
 @notifications_bp.route('/real-time', methods=['GET'])
 @login_required
+@versioned
 @handle_errors
 def get_realtime_notifications():
     """
     Get unread notifications for real-time updates (polling fallback)
-    Used by frontend for real-time notification polling
+    Used by frontend for real-time notification polling; conditional and
+    long-poll capable (If-None-Match, ?wait=N)
     """
     limit = request.args.get('limit', 10, type=int)
     notification_type = request.args.get('type', None)
     
-    notifications = NotificationService.get_user_notifications(
-        current_user.id,
-        limit=limit,
-        unread_only=True,
-        notification_type=notification_type
-    )
-    
-    unread_count = NotificationService.get_unread_count(current_user.id)
+    # The counter is on the already-loaded user row; nothing unread means no list query
+    unread_count = current_user.unread_notification_count
+    notifications = []
+    if unread_count:
+        notifications = NotificationService.get_user_notifications(
+            current_user.id,
+            limit=limit,
+            unread_only=True,
+            notification_type=notification_type
+        )
     
     return jsonify({
         'status': 'success',
         'unread_count': unread_count,
-        'notifications': [{
-            'id': n.id,
-            'message': n.message,
-            'type': n.notification_type,
-            'category': n.category,
-            'timestamp': n.timestamp.isoformat(),
-            'priority': n.priority,
-            'action_url': n.action_url,
-            'data': n.data or {}
-        } for n in notifications]
+        'notifications': [serialize_notification(n) for n in notifications]
     })
 
 
 @notifications_bp.route('/unread-count', methods=['GET'])
 @login_required
+@versioned
 @handle_errors
 def get_unread_count():
     """Get count of unread notifications"""
-    count = NotificationService.get_unread_count(current_user.id)
+    count = current_user.unread_notification_count
     
     return jsonify({
         'status': 'success',
@@ -292,6 +373,9 @@ def update_preferences():
     if not data:
         return jsonify({'error': 'No data provided'}), 400
     
+    if DIGEST_PREFERENCE_KEY in data and data[DIGEST_PREFERENCE_KEY] not in DIGEST_FREQUENCIES:
+        return jsonify({'error': f"{DIGEST_PREFERENCE_KEY} must be one of: {', '.join(DIGEST_FREQUENCIES)}"}), 400
+    
     success = NotificationService.update_user_preferences(current_user.id, data)
     
     if success:
@@ -378,6 +462,7 @@ def clear_old_notifications():
 
 @notifications_bp.route('/list', methods=['GET'])
 @login_required
+@versioned
 @handle_errors
 def list_notifications():
     """
@@ -397,11 +482,12 @@ def list_notifications():
     if category:
         query = query.filter_by(category=category)
     
-    total = query.count()
+    # Unfiltered totals come from the user's counter
+    total = query.count() if notification_type or category else current_user.notification_count
     
     notifications = query.order_by(
-        Notification.timestamp.desc()
-    ).limit(limit).offset(offset).all()
+        Notification.created_at.desc()
+    ).limit(limit).offset(offset).all() if total else []
     
     return jsonify({
         'status': 'success',
@@ -6,11 +6,85 @@ Includes Paystack integration for credit purchases
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
 from flask_login import login_required, current_user
 from paystack_payment_service import PaystackPaymentService
-from models import Payment, db
+from models import Payment, User, db
+import idempotency
+from idempotency import IdempotencyInProgress
 import json
 
 payment_bp = Blueprint('payments', __name__, url_prefix='/payments')
 
+PAYMENT_IDEMPOTENCY_SCOPE = 'payment_verification'
+PAYMENT_IN_PROGRESS_ERROR = 'This payment is already being verified. Please refresh the page in a moment.'
+
+
+def verify_payment_once(reference):
+    """
+    PaystackPaymentService.verify_payment, run at most once per reference.
+    
+    The browser return (verify_payment / webhook GET) and Paystack's repeated
+    charge.success webhooks share one idempotency key, so only the first of
+    them calls Paystack and credits the account; the rest get the recorded
+    result. The claim is committed before the remote call so duplicates are
+    answered immediately instead of waiting on it. Unsuccessful results are
+    not recorded and can be retried.
+    
+    Only success and credits_added are recorded: the reference reaches the
+    unauthenticated webhook callback, so balances are read at render time
+    and only shown to the payment's owner.
+    """
+    payment = PaystackPaymentService.get_payment_by_reference(reference)
+    try:
+        recorded = idempotency.begin(PAYMENT_IDEMPOTENCY_SCOPE, reference,
+                                     user_id=payment.user_id if payment else None)
+        if recorded is not None:
+            return recorded
+        db.session.commit()
+    except IdempotencyInProgress:
+        return {'success': False, 'in_progress': True, 'error': PAYMENT_IN_PROGRESS_ERROR}
+    
+    result = PaystackPaymentService.verify_payment(reference)
+    try:
+        if result.get('success'):
+            result = {'success': True, 'credits_added': result['credits_added']}
+            idempotency.complete(PAYMENT_IDEMPOTENCY_SCOPE, reference, result)
+        else:
+            idempotency.release(PAYMENT_IDEMPOTENCY_SCOPE, reference)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f'[PAYMENT] Could not record verification result for {reference}: {str(e)}')
+    return result
+
+
+def _current_balance(reference):
+    """The signed-in user's current credits if they own the payment, else None"""
+    if not current_user.is_authenticated:
+        return None
+    payment = PaystackPaymentService.get_payment_by_reference(reference)
+    if payment is None or payment.user_id != current_user.id:
+        return None
+    return db.session.query(User.credits).filter(User.id == current_user.id).scalar()
+
+
+def _render_verification_result(result, reference):
+    if result['success']:
+        return render_template(
+            'payments/payment_success.html',
+            credits_added=result['credits_added'],
+            new_balance=_current_balance(reference),
+            reference=reference
+        )
+    if result.get('in_progress'):
+        return render_template(
+            'payments/payment_error.html',
+            error=result['error']
+        ), 409
+    return render_template(
+        'payments/payment_failed.html',
+        error=result['error'],
+        reference=reference
+    )
+
 @payment_bp.route('/fund-account', methods=['GET', 'POST'])
 @login_required
 def fund_account():
@@ -94,21 +168,15 @@ def verify_payment(reference):
         if is_test and reference.startswith('TEST_'):
             print(f'Verifying TEST payment: {reference}')
         
-        result = PaystackPaymentService.verify_payment(reference)
-        
-        if result['success']:
+        payment = PaystackPaymentService.get_payment_by_reference(reference)
+        if payment is not None and payment.user_id != current_user.id:
             return render_template(
-                'payments/payment_success.html',
-                credits_added=result['credits_added'],
-                new_balance=result['new_balance'],
-                reference=reference
-            )
-        else:
-            return render_template(
-                'payments/payment_failed.html',
-                error=result['error'],
-                reference=reference
-            )
+                'payments/payment_error.html',
+                error='This payment belongs to another account'
+            ), 403
+        
+        result = verify_payment_once(reference)
+        return _render_verification_result(result, reference)
             
     except Exception as e:
         print(f'Verify payment error: {str(e)}')
@@ -167,22 +235,9 @@ def webhook():
                     error='No payment reference provided'
                 ), 400
             
-            # Verify the payment
-            result = PaystackPaymentService.verify_payment(reference)
-            
-            if result['success']:
-                return render_template(
-                    'payments/payment_success.html',
-                    credits_added=result['credits_added'],
-                    new_balance=result['new_balance'],
-                    reference=reference
-                )
-            else:
-                return render_template(
-                    'payments/payment_failed.html',
-                    error=result['error'],
-                    reference=reference
-                )
+            # Verify the payment (replayed if the webhook or verify page got there first)
+            result = verify_payment_once(reference)
+            return _render_verification_result(result, reference)
         
         # Handle POST request (webhook from Paystack servers)
         elif request.method == 'POST':
@@ -200,7 +255,10 @@ def webhook():
             if event == 'charge.success':
                 reference = data.get('data', {}).get('reference')
                 if reference:
-                    result = PaystackPaymentService.verify_payment(reference)
+                    result = verify_payment_once(reference)
+                    if result.get('in_progress'):
+                        # Non-2xx makes Paystack redeliver later, when the result is recorded
+                        return jsonify({'success': False, 'error': result['error']}), 409
                     return jsonify({'success': True, 'result': result})
             
             return jsonify({'success': True})
@@ -13,8 +13,11 @@ from forms import UploadItemForm, ProfileUpdateForm, ChangePasswordForm, DeleteA
 from logger_config import setup_logger
 from exceptions import ResourceNotFoundError, ValidationError, AuthorizationError, FileUploadError
 from error_handlers import handle_errors, safe_database_operation
-from transaction_clarity import generate_pdf_receipt, generate_transaction_explanation
+from transaction_clarity import generate_transaction_explanation
+from receipts import build_receipt
+from outbox import enqueue, wake_worker
 from file_upload_validator import validate_upload, generate_safe_filename
+from storage import get_storage
 from input_validators import (
     validate_email, validate_phone, validate_address, 
     validate_item_name, validate_description, validate_search_query
@@ -191,15 +194,20 @@ def edit_item(item_id: int) -> Union[str, Response]:
                             enable_virus_scan=app.config.get('FILE_UPLOAD_ENABLE_VIRUS_SCAN', False)
                         )
                         
-                        if item.image_url:
-                            old_path = os.path.join(app.root_path, item.image_url.strip("/"))
-                            if os.path.exists(old_path):
-                                os.remove(old_path)
+                        storage = get_storage()
+                        old_image_url = item.image_url
 
                         unique_filename = generate_safe_filename(file, current_user.id)
-                        new_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                        file.save(new_path)
+                        storage.save(file, unique_filename, content_type=file.mimetype)
                         item.image_url = unique_filename
+
+                        if old_image_url:
+                            # Keep the primary gallery image in step with the replaced file
+                            for image in item.images:
+                                if image.image_url == old_image_url:
+                                    image.image_url = unique_filename
+                                    image.width = image.height = image.file_size = None
+                            storage.delete(old_image_url)
                         logger.info(f"Item image updated - Item: {item_id}, File: {unique_filename}")
                     except FileUploadError as e:
                         logger.warning(f"File validation failed: {str(e)}")
@@ -269,9 +277,10 @@ def notifications():
         
         notes = query.order_by(Notification.created_at.desc()).paginate(page=page, per_page=9)
         
-        total_count = Notification.query.filter_by(user_id=current_user.id).count()
-        unread_count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
-        read_count = Notification.query.filter_by(user_id=current_user.id, is_read=True).count()
+        # Per-user counters on the user row instead of three COUNTs
+        total_count = current_user.notification_count
+        unread_count = current_user.unread_notification_count
+        read_count = total_count - unread_count
         
         logger.info(f"Notifications accessed - User: {current_user.username}, Total: {total_count}, Unread: {unread_count}, Filter: {filter_type}")
         
@@ -376,8 +385,7 @@ def profile_settings() -> Union[str, Response]:
                         )
                         
                         unique_filename = generate_safe_filename(file, current_user.id)
-                        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                        file.save(file_path)
+                        get_storage().save(file, unique_filename, content_type=file.mimetype)
                         current_user.profile_picture = unique_filename
                         logger.info(f"Profile picture updated - User: {current_user.username}, File: {unique_filename}")
                     except FileUploadError as e:
@@ -483,21 +491,24 @@ def download_receipt(order_id):
             logger.warning(f"Unauthorized receipt download attempt - User: {current_user.username}, Order: {order_id}")
             raise AuthorizationError("You don't have access to this order's receipt")
         
-        # Generate PDF receipt
-        pdf_buffer = generate_pdf_receipt(order, current_user)
+        # Pre-generated by the outbox; built here only if it is missing or stale
+        receipt_file, version = build_receipt(order)
         
-        if pdf_buffer:
-            # Mark receipt as downloaded
-            order.receipt_downloaded = True
-            db.session.commit()
+        if receipt_file:
+            if not order.receipt_downloaded:
+                order.receipt_downloaded = True
+                db.session.commit()
             
             logger.info(f"Receipt downloaded - User: {current_user.username}, Order: {order_id}")
             
+            # ETag = receipt version: an unchanged receipt answers If-None-Match with 304
             return send_file(
-                pdf_buffer,
+                receipt_file,
                 mimetype='application/pdf',
                 as_attachment=True,
-                download_name=f"Receipt-{order.order_number}.pdf"
+                download_name=f"Receipt-{order.order_number}.pdf",
+                etag=version,
+                conditional=True
             )
         else:
             flash('Error generating receipt. Please try again.', 'danger')
@@ -563,7 +574,9 @@ def cancel_order(order_id):
             )
             db.session.add(transaction)
         
+        enqueue('receipt', order_id=order.id)
         db.session.commit()
+        wake_worker()
         
         # Send cancellation notification
         from models import Notification
@@ -680,8 +693,7 @@ def settings():
                                 enable_virus_scan=app.config.get('FILE_UPLOAD_ENABLE_VIRUS_SCAN', False)
                             )
                             unique_filename = generate_safe_filename(file, current_user.id)
-                            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                            file.save(file_path)
+                            get_storage().save(file, unique_filename, content_type=file.mimetype)
                             current_user.profile_picture = unique_filename
                             logger.info(f"Profile picture updated - User: {current_user.username}, File: {unique_filename}")
                         except FileUploadError as e:
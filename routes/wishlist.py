@@ -1,15 +1,59 @@
-from flask import Blueprint, request, jsonify, session, send_file
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
 from flask_login import login_required, current_user
 from models import db, Wishlist, WishlistMatch, Item
+from outbox import enqueue, wake_worker
 from datetime import datetime
 import logging
 import csv
-import io
 from sqlalchemy import or_, and_
 
 wishlist_bp = Blueprint('wishlist', __name__, url_prefix='/wishlist')
 logger = logging.getLogger(__name__)
 
+# Wishlist rows fetched per round trip while streaming the CSV export
+EXPORT_BATCH_ROWS = 500
+
+
+def _with_match_counts(user_id):
+    """
+    Query (Wishlist, match_count) for a user's wishlists.
+    
+    Counts come from one grouped subquery over this user's matches, joined in,
+    so listing a page never loads WishlistMatch rows and can sort by the count
+    in SQL across every page.
+    """
+    counts = db.session.query(
+        WishlistMatch.wishlist_id,
+        db.func.count(WishlistMatch.id).label('match_count')
+    ).join(Wishlist, Wishlist.id == WishlistMatch.wishlist_id).filter(
+        Wishlist.user_id == user_id
+    ).group_by(WishlistMatch.wishlist_id).subquery()
+    match_count = db.func.coalesce(counts.c.match_count, 0).label('match_count')
+    query = db.session.query(Wishlist, match_count).outerjoin(
+        counts, counts.c.wishlist_id == Wishlist.id
+    ).filter(Wishlist.user_id == user_id)
+    return query, match_count
+
+
+def _apply_filters(query, search, status_filter, search_type_filter):
+    """Apply the search, status and search type filters shared by the list view and the export"""
+    if search:
+        query = query.filter(
+            or_(
+                Wishlist.item_name.ilike(f'%{search}%'),
+                Wishlist.category.ilike(f'%{search}%')
+            )
+        )
+    
+    if status_filter == 'active':
+        query = query.filter(Wishlist.is_active == True)
+    elif status_filter == 'paused':
+        query = query.filter(Wishlist.is_active == False)
+    
+    if search_type_filter in ['item', 'category']:
+        query = query.filter(Wishlist.search_type == search_type_filter)
+    return query
+
 
 @wishlist_bp.route('/add', methods=['POST'])
 @login_required
@@ -54,7 +98,11 @@ def add_to_wishlist():
         )
         
         db.session.add(wishlist_item)
+        db.session.flush()
+        # Match against listings already live in the background, so adding never waits on the catalog
+        enqueue('wishlist_backfill', wishlist_id=wishlist_item.id)
         db.session.commit()
+        wake_worker()
         
         logger.info(f'User {current_user.id} added {search_type} to wishlist: {item_name or category}')
         
@@ -83,27 +131,8 @@ def view_wishlist():
         status_filter = request.args.get('status', 'all')  # all, active, paused
         search_type_filter = request.args.get('search_type', 'all')  # all, item, category
         
-        # Build base query
-        query = Wishlist.query.filter_by(user_id=current_user.id)
-        
-        # Apply search filter
-        if search:
-            query = query.filter(
-                or_(
-                    Wishlist.item_name.ilike(f'%{search}%'),
-                    Wishlist.category.ilike(f'%{search}%')
-                )
-            )
-        
-        # Apply status filter
-        if status_filter == 'active':
-            query = query.filter_by(is_active=True)
-        elif status_filter == 'paused':
-            query = query.filter_by(is_active=False)
-        
-        # Apply search type filter
-        if search_type_filter in ['item', 'category']:
-            query = query.filter_by(search_type=search_type_filter)
+        query, match_count = _with_match_counts(current_user.id)
+        query = _apply_filters(query, search, status_filter, search_type_filter)
         
         # Apply sorting
         if sort_by == 'name':
@@ -111,22 +140,20 @@ def view_wishlist():
         elif sort_by == 'status':
             sort_column = Wishlist.is_active
         elif sort_by == 'matches':
-            # Sort by number of matches (complex, done in Python)
-            sort_column = None
+            sort_column = match_count
         else:  # created_at (default)
             sort_column = Wishlist.created_at
         
-        # Apply sort column if exists
-        if sort_column is not None:
-            query = query.order_by(sort_column.desc() if sort_order == 'desc' else sort_column.asc())
+        # id breaks ties so rows never repeat or vanish between pages
+        if sort_order == 'desc':
+            query = query.order_by(sort_column.desc(), Wishlist.id.desc())
         else:
-            query = query.order_by(Wishlist.created_at.desc())
+            query = query.order_by(sort_column.asc(), Wishlist.id.asc())
         
         pagination = query.paginate(page=page, per_page=per_page)
         
         wishlists = []
-        for wishlist_item in pagination.items:
-            match_count = len(wishlist_item.matched_items) if wishlist_item.matched_items else 0
+        for wishlist_item, matches in pagination.items:
             wishlists.append({
                 'id': wishlist_item.id,
                 'item_name': wishlist_item.item_name,
@@ -138,13 +165,9 @@ def view_wishlist():
                 'created_at': wishlist_item.created_at.isoformat() if wishlist_item.created_at else None,
                 'last_notified_at': wishlist_item.last_notified_at.isoformat() if wishlist_item.last_notified_at else None,
                 'notification_count': wishlist_item.notification_count,
-                'match_count': match_count
+                'match_count': matches
             })
         
-        # Sort by matches if needed
-        if sort_by == 'matches':
-            wishlists.sort(key=lambda x: x['match_count'], reverse=(sort_order == 'desc'))
-        
         return jsonify({
             'success': True,
             'wishlists': wishlists,
@@ -170,13 +193,13 @@ def manage_wishlists():
         per_page = 12  # Items per page
         
         # Get user's wishlists with pagination
-        pagination = Wishlist.query.filter_by(
-            user_id=current_user.id
-        ).order_by(Wishlist.created_at.desc()).paginate(page=page, per_page=per_page)
+        query, _ = _with_match_counts(current_user.id)
+        pagination = query.order_by(
+            Wishlist.created_at.desc(), Wishlist.id.desc()
+        ).paginate(page=page, per_page=per_page)
         
         wishlists = []
-        for wishlist_item in pagination.items:
-            match_count = len(wishlist_item.matched_items) if wishlist_item.matched_items else 0
+        for wishlist_item, match_count in pagination.items:
             wishlists.append({
                 'id': wishlist_item.id,
                 'item_name': wishlist_item.item_name,
@@ -463,87 +486,94 @@ def bulk_delete():
         return jsonify({'error': 'Failed to delete wishlists'}), 500
 
 
+class _CSVLine:
+    """csv.writer target whose write() returns the line, so writerow() gives back the CSV text"""
+    def write(self, value):
+        return value
+
+
+def _stream_wishlist_csv(rows):
+    """
+    Yield wishlist export rows as UTF-8 CSV.
+    
+    rows is a query of plain tuples with the match count already aggregated;
+    it is read EXPORT_BATCH_ROWS at a time and each batch is yielded before
+    the next is fetched.
+    """
+    writer = csv.writer(_CSVLine())
+    yield writer.writerow([
+        'Item/Category Name',
+        'Search Type',
+        'Status',
+        'Email Notifications',
+        'In-App Notifications',
+        'Matches Found',
+        'Notifications Sent',
+        'Created Date',
+        'Last Notified Date'
+    ]).encode('utf-8')
+    
+    batch = []
+    for (item_name, category, search_type, is_active, notify_via_email, notify_via_app,
+         match_count, notification_count, created_at, last_notified_at) in rows:
+        batch.append(writer.writerow([
+            item_name or category,
+            search_type,
+            'Active' if is_active else 'Paused',
+            'Yes' if notify_via_email else 'No',
+            'Yes' if notify_via_app else 'No',
+            match_count,
+            notification_count or 0,
+            created_at.strftime('%Y-%m-%d %H:%M:%S') if created_at else '',
+            last_notified_at.strftime('%Y-%m-%d %H:%M:%S') if last_notified_at else 'Never'
+        ]))
+        if len(batch) >= EXPORT_BATCH_ROWS:
+            yield ''.join(batch).encode('utf-8')
+            batch = []
+    if batch:
+        yield ''.join(batch).encode('utf-8')
+
+
 @wishlist_bp.route('/export/csv', methods=['GET'])
 @login_required
 def export_csv():
-    """Export wishlists to CSV file"""
+    """Export wishlists to CSV file, streamed"""
     try:
         # Get all wishlists for the user (with optional filters)
         search = request.args.get('search', '').strip()
         status_filter = request.args.get('status', 'all')
         search_type_filter = request.args.get('search_type', 'all')
         
-        query = Wishlist.query.filter_by(user_id=current_user.id)
-        
-        # Apply filters
-        if search:
-            query = query.filter(
-                or_(
-                    Wishlist.item_name.ilike(f'%{search}%'),
-                    Wishlist.category.ilike(f'%{search}%')
-                )
-            )
-        
-        if status_filter == 'active':
-            query = query.filter_by(is_active=True)
-        elif status_filter == 'paused':
-            query = query.filter_by(is_active=False)
-        
-        if search_type_filter in ['item', 'category']:
-            query = query.filter_by(search_type=search_type_filter)
-        
-        wishlists = query.all()
+        query, match_count = _with_match_counts(current_user.id)
+        query = _apply_filters(query, search, status_filter, search_type_filter)
         
-        if not wishlists:
+        if query.first() is None:
             return jsonify({'error': 'No wishlists to export'}), 404
         
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow([
-            'Item/Category Name',
-            'Search Type',
-            'Status',
-            'Email Notifications',
-            'In-App Notifications',
-            'Matches Found',
-            'Notifications Sent',
-            'Created Date',
-            'Last Notified Date'
-        ])
-        
-        # Write data rows
-        for wishlist_item in wishlists:
-            match_count = len(wishlist_item.matched_items) if wishlist_item.matched_items else 0
-            writer.writerow([
-                wishlist_item.item_name or wishlist_item.category,
-                wishlist_item.search_type,
-                'Active' if wishlist_item.is_active else 'Paused',
-                'Yes' if wishlist_item.notify_via_email else 'No',
-                'Yes' if wishlist_item.notify_via_app else 'No',
-                match_count,
-                wishlist_item.notification_count or 0,
-                wishlist_item.created_at.strftime('%Y-%m-%d %H:%M:%S') if wishlist_item.created_at else '',
-                wishlist_item.last_notified_at.strftime('%Y-%m-%d %H:%M:%S') if wishlist_item.last_notified_at else 'Never'
-            ])
-        
-        # Prepare response
-        output.seek(0)
-        bytes_output = io.BytesIO()
-        bytes_output.write(output.getvalue().encode('utf-8'))
-        bytes_output.seek(0)
+        rows = query.with_entities(
+            Wishlist.item_name,
+            Wishlist.category,
+            Wishlist.search_type,
+            Wishlist.is_active,
+            Wishlist.notify_via_email,
+            Wishlist.notify_via_app,
+            match_count,
+            Wishlist.notification_count,
+            Wishlist.created_at,
+            Wishlist.last_notified_at
+        ).order_by(Wishlist.created_at.desc(), Wishlist.id.desc()).execution_options(yield_per=EXPORT_BATCH_ROWS)
         
         filename = f'wishlists_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.csv'
         
-        logger.info(f'User {current_user.id} exported {len(wishlists)} wishlists to CSV')
+        logger.info(f'User {current_user.id} exported wishlists to CSV')
         
-        return send_file(
-            bytes_output,
+        return Response(
+            stream_with_context(_stream_wishlist_csv(rows)),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}',
+                'X-Accel-Buffering': 'no'
+            }
         )
         
     except Exception as e:
@@ -20,7 +20,25 @@ test_files = [
     'test_email_config.py',
     'test_db_update.py',
     'test_approval.py',
-    'test_appeal.py'
+    'test_appeal.py',
+    'test_storage.py',
+    'test_order_numbers.py',
+    'test_mail_queue.py',
+    'test_idempotency.py',
+    'test_receipts.py',
+    'test_bulk_approval.py',
+    'test_wishlist_digest.py',
+    'test_notification_counters.py',
+    'test_broadcast_notifications.py',
+    'test_order_updates.py',
+    'test_approval_queue.py',
+    'test_admin_stats.py',
+    'test_wishlist_listing.py',
+    'test_media.py',
+    'test_audit_export.py',
+    'test_outbox.py',
+    'test_email_templates.py',
+    'test_image_backfill.py'
 ]
 
 def run_tests():
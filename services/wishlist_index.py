@@ -0,0 +1,290 @@
+"""
+In-memory inverted index over active wishlists, for matching approved items.
+
+Matching used to load every active wishlist and run difflib against each
+name. The index maps padded character trigrams of wishlist names to wishlist
+ids, and lower-cased categories to wishlist ids, so an item only scores the
+wishlists it shares trigrams with:
+
+    candidates -> length filter -> cheap upper bound -> similarity >= 0.7
+
+Similarity is rapidfuzz's normalized Indel ratio when rapidfuzz is installed
+and difflib's SequenceMatcher ratio otherwise; the length filter and upper
+bound (difflib's quick_ratio) never reject a pair that would score above the
+threshold, so they only skip work.
+
+The index is built from four columns of the active wishlists and kept per
+process. A commit that adds, changes or deletes a wishlist marks it stale so
+this process rebuilds on next use; other processes rebuild after
+WISHLIST_INDEX_TTL seconds. Matches are always re-checked against the
+database, so a stale index can only delay a match, never invent one.
+
+ListingSnapshot indexes live listings the same way, so a new wishlist can be
+run against the existing catalog (backfill) without scanning it per wishlist.
+
+Usage:
+    for wishlist_id, reason in get_wishlist_index().match(item.name, item.category): ...
+    for item_id, score in get_listing_snapshot().match(wishlist): ...
+"""
+
+import threading
+import time
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+from flask import current_app
+from sqlalchemy import event, inspect
+
+from app import db
+from models import Wishlist, Item
+from logger_config import setup_logger
+
+try:
+    from rapidfuzz.distance import Indel
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
+logger = setup_logger(__name__)
+
+MATCH_THRESHOLD = 0.7
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+def trigrams(text):
+    """Character trigrams of normalized text, padded so short words still produce some"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _length_compatible(len_a, len_b, threshold):
+    # Both ratios are at most 2*min/(len_a+len_b)
+    return 2 * min(len_a, len_b) >= threshold * (len_a + len_b)
+
+
+class TrigramIndex:
+    """Trigram inverted index over short names, searched by similarity."""
+
+    def __init__(self):
+        self._names = {}
+        self._trigrams = defaultdict(list)
+
+    def add(self, key, text):
+        name = normalize(text)
+        if not name:
+            return
+        self._names[key] = name
+        for gram in trigrams(name):
+            self._trigrams[gram].append(key)
+
+    def __len__(self):
+        return len(self._names)
+
+    def candidates(self, name):
+        """Keys of names sharing at least one trigram with name"""
+        candidates = set()
+        for gram in trigrams(name):
+            candidates.update(self._trigrams.get(gram, ()))
+        return candidates
+
+    def search(self, text, threshold=MATCH_THRESHOLD):
+        """Return [(key, score)] for indexed names whose similarity to text is >= threshold."""
+        name = normalize(text)
+        if not name:
+            return []
+        results = []
+        if RAPIDFUZZ_AVAILABLE:
+            for key in self.candidates(name):
+                indexed = self._names[key]
+                if not _length_compatible(len(indexed), len(name), threshold):
+                    continue
+                score = Indel.normalized_similarity(indexed, name, score_cutoff=threshold)
+                if score >= threshold:
+                    results.append((key, score))
+        else:
+            matcher = SequenceMatcher(None, '', name)  # text analysed once, indexed names swapped in
+            for key in self.candidates(name):
+                indexed = self._names[key]
+                if not _length_compatible(len(indexed), len(name), threshold):
+                    continue
+                matcher.set_seq1(indexed)
+                if matcher.quick_ratio() < threshold:
+                    continue
+                score = matcher.ratio()
+                if score >= threshold:
+                    results.append((key, score))
+        return results
+
+
+class WishlistIndex:
+    """Trigram -> wishlist ids for 'item' wishlists, category -> wishlist ids for 'category' ones."""
+
+    def __init__(self, rows):
+        self._names = TrigramIndex()
+        self._categories = defaultdict(list)
+        for wishlist_id, search_type, item_name, category in rows:
+            if search_type == 'item' and item_name:
+                self._names.add(wishlist_id, item_name)
+            elif search_type == 'category' and category:
+                self._categories[category.lower()].append(wishlist_id)
+
+    @classmethod
+    def build(cls):
+        rows = db.session.query(Wishlist.id, Wishlist.search_type, Wishlist.item_name, Wishlist.category) \
+            .filter(Wishlist.is_active == True).yield_per(5000)
+        return cls(rows)
+
+    def __len__(self):
+        return len(self._names) + sum(len(ids) for ids in self._categories.values())
+
+    def match(self, item_name, item_category, threshold=MATCH_THRESHOLD):
+        """Return [(wishlist_id, reason)] for wishlists matching an item's name or category."""
+        matches = [
+            (wishlist_id, f'Item name match (similarity: {score:.2f})')
+            for wishlist_id, score in self._names.search(item_name, threshold)
+        ]
+        if item_category:
+            for wishlist_id in self._categories.get(item_category.lower(), ()):
+                matches.append((wishlist_id, f'Category match: {item_category}'))
+        return matches
+
+
+class ListingSnapshot:
+    """The same structure the other way round: live listings by name trigram and category."""
+
+    def __init__(self, rows):
+        self._names = TrigramIndex()
+        self._categories = defaultdict(list)
+        for item_id, name, category in rows:
+            self._names.add(item_id, name)
+            if category:
+                self._categories[category.lower()].append(item_id)
+
+    @classmethod
+    def build(cls):
+        rows = db.session.query(Item.id, Item.name, Item.category) \
+            .filter(Item.is_approved == True, Item.is_available == True).yield_per(5000)
+        return cls(rows)
+
+    def __len__(self):
+        return len(self._names)
+
+    def match(self, wishlist, threshold=MATCH_THRESHOLD):
+        """Return [(item_id, score)] for live listings matching a wishlist (category matches score 1)."""
+        if wishlist.search_type == 'item' and wishlist.item_name:
+            return self._names.search(wishlist.item_name, threshold)
+        if wishlist.search_type == 'category' and wishlist.category:
+            return [(item_id, 1.0) for item_id in self._categories.get(wishlist.category.lower(), ())]
+        return []
+
+
+class IndexCache:
+    """Per-process index, rebuilt by one thread when older than ttl or invalidated."""
+
+    def __init__(self, builder, ttl=60):
+        self.builder = builder
+        self.ttl = ttl
+        self._index = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self):
+        return self._index is not None and time.monotonic() - self._built_at < self.ttl
+
+    def get(self):
+        if self._fresh():
+            return self._index
+
+        # Another thread is rebuilding: match against the previous index rather than wait
+        if not self._lock.acquire(blocking=self._index is None):
+            return self._index
+        try:
+            if not self._fresh():
+                started = time.monotonic()
+                self._index = self.builder.build()
+                self._built_at = time.monotonic()
+                logger.info(f"{self.builder.__name__} built - {len(self._index)} entries in {self._built_at - started:.2f}s")
+            return self._index
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        self._built_at = 0.0
+
+
+def get_index_cache(app=None):
+    """Return the app's wishlist index cache, creating it on first use."""
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('barterex_wishlist_index')
+    if cache is None:
+        cache = IndexCache(WishlistIndex, ttl=app.config.get('WISHLIST_INDEX_TTL', 60))
+        app.extensions['barterex_wishlist_index'] = cache
+    return cache
+
+
+def get_wishlist_index():
+    return get_index_cache().get()
+
+
+def get_listing_snapshot(app=None):
+    """
+    The app's live-listing snapshot, rebuilt after LISTING_SNAPSHOT_TTL seconds.
+    Not invalidated on item writes: callers re-check candidates in SQL, and items
+    approved since the snapshot are matched going forward by the wishlist index.
+    """
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('barterex_listing_snapshot')
+    if cache is None:
+        cache = IndexCache(ListingSnapshot, ttl=app.config.get('LISTING_SNAPSHOT_TTL', 60))
+        app.extensions['barterex_listing_snapshot'] = cache
+    return cache.get()
+
+
+# ==================== INVALIDATION ON WRITES ====================
+
+# Wishlist columns the index is built from; notification bookkeeping does not count
+_INDEXED_FIELDS = ('item_name', 'category', 'search_type', 'is_active')
+
+
+def _changes_index(obj):
+    if not isinstance(obj, Wishlist):
+        return False
+    state = inspect(obj)
+    return any(state.attrs[field].history.has_changes() for field in _INDEXED_FIELDS)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _mark_wishlist_writes(session, flush_context, instances):
+    if session.info.get('wishlist_index_dirty'):
+        return
+    if (any(isinstance(obj, Wishlist) for obj in session.new)
+            or any(isinstance(obj, Wishlist) for obj in session.deleted)
+            or any(_changes_index(obj) for obj in session.dirty)):
+        session.info['wishlist_index_dirty'] = True
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _mark_wishlist_bulk_writes(orm_execute_state):
+    if orm_execute_state.execution_options.get('wishlist_index_unchanged'):
+        return
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is Wishlist:
+            orm_execute_state.session.info['wishlist_index_dirty'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('wishlist_index_dirty', False):
+        try:
+            get_index_cache().invalidate()
+        except RuntimeError:
+            pass  # committed outside an app context; the TTL covers it
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('wishlist_index_dirty', None)
@@ -1,17 +1,27 @@
 """
-Wishlist service for finding matches and sending notifications
+Wishlist service for finding matches.
+
+Matches are recorded here; notifications go out as per-user digests
+(wishlist_digest.py).
 """
 
-from models import db, Wishlist, WishlistMatch, Item, Notification, User
+from models import db, Wishlist, WishlistMatch, Item, Notification
 from datetime import datetime
-from app import mail, app
-from flask_mail import Message
-from flask import render_template
+from services.wishlist_index import get_wishlist_index, get_listing_snapshot
+from wishlist_digest import send_digests
 from difflib import SequenceMatcher
+from sqlalchemy import select, insert
+from sqlalchemy.orm import joinedload
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Wishlist ids per IN query (stays under SQLite's bound-parameter limit)
+MATCH_QUERY_CHUNK = 1000
+
+# Existing listings recorded when a wishlist is added (newest first)
+BACKFILL_MAX_MATCHES = 100
+
 
 def calculate_similarity(str1, str2):
     """Calculate string similarity ratio (0-1)"""
@@ -24,6 +34,10 @@ def find_wishlist_matches(item):
     """
     Find all wishlists that match a newly approved item.
     Returns list of (wishlist, user) tuples for items that should be notified.
+    
+    Candidates come from the in-memory wishlist index (services.wishlist_index);
+    existing matches and the wishlists themselves are loaded with one IN query
+    per chunk rather than one query per wishlist.
     """
     try:
         logger.info(f'[WISHLIST] Starting wishlist matching for item: {item.id} - {item.name}')
@@ -33,47 +47,28 @@ def find_wishlist_matches(item):
             logger.warning(f'[WISHLIST] Item {item.id} is not approved or missing')
             return matches
         
-        # Find active wishlists that match this item
-        wishlists = Wishlist.query.filter_by(is_active=True).all()
-        logger.info(f'[WISHLIST] Found {len(wishlists)} active wishlists to check')
+        hits = dict(get_wishlist_index().match(item.name, item.category))
+        logger.info(f'[WISHLIST] Index returned {len(hits)} candidate wishlists')
+        if not hits:
+            return matches
         
-        for wishlist in wishlists:
-            should_match = False
-            match_reason = None
-            
-            # Check for item name match (if searching for specific items)
-            if wishlist.search_type == 'item' and wishlist.item_name:
-                similarity = calculate_similarity(wishlist.item_name, item.name)
-                logger.debug(f'[WISHLIST] Item search: Wishlist "{wishlist.item_name}" vs Item "{item.name}" - Similarity: {similarity:.2f}')
-                # Match if similarity is >= 70%
-                if similarity >= 0.7:
-                    should_match = True
-                    match_reason = f'Item name match (similarity: {similarity:.2f})'
+        for chunk in _chunks(list(hits), MATCH_QUERY_CHUNK):
+            existing = set(db.session.scalars(
+                select(WishlistMatch.wishlist_id)
+                .where(WishlistMatch.item_id == item.id, WishlistMatch.wishlist_id.in_(chunk))
+            ))
+            new_ids = [wishlist_id for wishlist_id in chunk if wishlist_id not in existing]
+            if not new_ids:
+                continue
             
-            # Check for category match
-            elif wishlist.search_type == 'category' and wishlist.category:
-                if item.category and item.category.lower() == wishlist.category.lower():
-                    should_match = True
-                    match_reason = f'Category match: {wishlist.category}'
-            
-            if should_match:
-                # Check if this match already exists
-                existing_match = WishlistMatch.query.filter_by(
-                    wishlist_id=wishlist.id,
-                    item_id=item.id
-                ).first()
-                
-                if not existing_match:
-                    logger.info(f'[WISHLIST] MATCH FOUND - Wishlist ID: {wishlist.id}, User: {wishlist.user.username}, Reason: {match_reason}')
-                    # Create new match
-                    match = WishlistMatch(
-                        wishlist_id=wishlist.id,
-                        item_id=item.id
-                    )
-                    db.session.add(match)
-                    matches.append((wishlist, wishlist.user))
-                else:
-                    logger.info(f'[WISHLIST] Match already exists for Wishlist ID: {wishlist.id}')
+            # The index may be a little stale: only wishlists still active in the database count
+            wishlists = Wishlist.query.options(joinedload(Wishlist.user)).filter(
+                Wishlist.id.in_(new_ids), Wishlist.is_active == True
+            ).all()
+            for wishlist in wishlists:
+                logger.debug(f'[WISHLIST] MATCH FOUND - Wishlist ID: {wishlist.id}, User: {wishlist.user_id}, Reason: {hits[wishlist.id]}')
+                db.session.add(WishlistMatch(wishlist_id=wishlist.id, item_id=item.id))
+                matches.append((wishlist, wishlist.user))
         
         db.session.commit()
         logger.info(f'[WISHLIST] Found {len(matches)} new wishlist matches for item {item.id}')
@@ -85,180 +80,89 @@ def find_wishlist_matches(item):
         return []
 
 
-def send_wishlist_notification(wishlist, item, user=None):
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def backfill_wishlist(wishlist_id):
     """
-    Send notification to user about matched wishlist item.
-    Sends both email and in-app notifications if enabled.
+    Match a new wishlist against listings that are already live (for background tasks).
+    
+    Candidates come from the in-memory listing snapshot and are re-checked in SQL;
+    up to BACKFILL_MAX_MATCHES newest listings are recorded with one bulk INSERT.
+    They are marked delivered (the user is browsing their wishlist right now), with a
+    single in-app notification summarising them. Returns the number of matches added.
     """
-    if not user:
-        user = wishlist.user
+    wishlist = db.session.get(Wishlist, wishlist_id)
+    if wishlist is None or not wishlist.is_active:
+        return 0
     
-    if not user:
-        logger.warning(f'[WISHLIST] No user found for wishlist {wishlist.id}')
-        return False
+    candidate_ids = sorted((item_id for item_id, _ in get_listing_snapshot().match(wishlist)), reverse=True)
+    new_ids = []
+    for chunk in _chunks(candidate_ids, MATCH_QUERY_CHUNK):
+        existing = set(db.session.scalars(
+            select(WishlistMatch.item_id)
+            .where(WishlistMatch.wishlist_id == wishlist.id, WishlistMatch.item_id.in_(chunk))
+        ))
+        live = set(db.session.scalars(
+            select(Item.id).where(Item.id.in_(chunk), Item.is_approved == True, Item.is_available == True)
+        ))
+        new_ids.extend(item_id for item_id in chunk if item_id in live and item_id not in existing)
+        if len(new_ids) >= BACKFILL_MAX_MATCHES:
+            break
+    new_ids = new_ids[:BACKFILL_MAX_MATCHES]
     
-    try:
-        logger.info(f'[WISHLIST] Processing wishlist notification - Wishlist ID: {wishlist.id}, Item: {item.name}, User: {user.username}')
-        logger.debug(f'[WISHLIST] Notification settings - notify_via_email: {wishlist.notify_via_email}, notify_via_app: {wishlist.notify_via_app}')
-        logger.debug(f'[WISHLIST] User email: {user.email}')
-        
-        notification_id = None
-        
-        # Create in-app notification if enabled
+    if new_ids:
+        now = datetime.utcnow()
+        db.session.execute(insert(WishlistMatch), [{
+            'wishlist_id': wishlist.id,
+            'item_id': item_id,
+            'notification_sent_at': now,
+            'email_sent': False,
+            'app_notification_sent': bool(wishlist.notify_via_app),
+        } for item_id in new_ids])
         if wishlist.notify_via_app:
-            logger.info(f'[WISHLIST] Creating in-app notification for user {user.id}')
-            try:
-                notification = Notification(
-                    user_id=user.id,
-                    message=f'Wishlist Match! {item.name} is now available',
-                    notification_type='wishlist_match',
-                    category='alert',
-                    data={'wishlist_id': wishlist.id, 'item_id': item.id}
-                )
-                db.session.add(notification)
-                db.session.flush()
-                notification_id = notification.id
-                logger.info(f'[WISHLIST] In-app notification created with ID: {notification_id}')
-            except Exception as notif_err:
-                logger.error(f'[WISHLIST] Error creating notification: {str(notif_err)}', exc_info=True)
-                raise
-        else:
-            logger.warning(f'[WISHLIST] In-app notification skipped - notify_via_app is False')
-        
-        # Send email notification if enabled
-        if wishlist.notify_via_email and user.email:
-            logger.info(f'[WISHLIST] Attempting to send email to {user.email}...')
-            try:
-                subject = f'Wishlist Alert: {item.name} is now available!'
-                result = send_wishlist_email(
-                    recipient=user.email,
-                    user_name=user.username,
-                    item_title=item.name,
-                    item_id=item.id,
-                    category=item.category,
-                    condition=item.condition,
-                    subject=subject,
-                    item=item
-                )
-                logger.info(f'[WISHLIST] Email send result: {result}')
-            except Exception as e:
-                logger.error(f'[WISHLIST] Failed to send email to {user.email}: {str(e)}', exc_info=True)
-        else:
-            logger.warning(f'[WISHLIST] Email notification skipped - notify_via_email: {wishlist.notify_via_email}, user.email: {user.email}')
-        
-        # Update wishlist and match records
-        wishlist.last_notified_at = datetime.utcnow()
-        wishlist.notification_count = (wishlist.notification_count or 0) + 1
-        
-        # Update WishlistMatch
-        match = WishlistMatch.query.filter_by(
-            wishlist_id=wishlist.id,
-            item_id=item.id,
-            notification_id=None
-        ).first()
-        
-        if match:
-            match.notification_sent_at = datetime.utcnow()
-            match.email_sent = wishlist.notify_via_email
-            match.app_notification_sent = wishlist.notify_via_app
-            match.notification_id = notification_id
-        
-        db.session.commit()
-        logger.info(f'[WISHLIST] Sent wishlist notification to user {user.id} for item {item.id}')
-        return True
-        
-    except Exception as e:
-        db.session.rollback()
-        logger.error(f'[WISHLIST] Error sending wishlist notification: {str(e)}', exc_info=True)
-        return False
+            label = wishlist.item_name if wishlist.search_type == 'item' else wishlist.category
+            count = f'{len(new_ids)} listing' + ('s' if len(new_ids) != 1 else '')
+            db.session.add(Notification(
+                user_id=wishlist.user_id,
+                message=f'{count} already on Barterex match your wishlist "{label}"'[:255],
+                notification_type='wishlist_match',
+                category='alert',
+                action_url='/wishlist/view',
+                data={'wishlist_ids': [wishlist.id], 'item_ids': new_ids},
+            ))
+    db.session.commit()
+    logger.info(f'[WISHLIST] Backfilled wishlist {wishlist.id}: {len(new_ids)} existing listing(s) matched')
+    return len(new_ids)
 
 
-def send_wishlist_email(recipient, user_name, item_title, item_id, category, condition, subject, item=None):
-    """Send wishlist match email to user using professional template"""
+def bulk_find_matches_for_items(item_ids):
+    """
+    Record wishlist matches for newly approved items, then deliver instant digests
+    (for background tasks). Users on hourly/daily digests get theirs from
+    `flask wishlist send-digests`.
+    """
+    items = Item.query.filter(Item.id.in_(item_ids)).all()
+    for item in items:
+        find_wishlist_matches(item)
     
-    try:
-        logger.info(f'[WISHLIST] Starting email send to {recipient} for item {item_id}')
-        
-        # Get full item details if not provided
-        if not item:
-            item = Item.query.get(item_id)
-        
-        # Get the item image if available
-        item_image = None
-        if item and item.images:
-            item_image = item.images[0].image_url
-        elif item:
-            item_image = item.image_url
-        
-        # Prepare template context
-        context = {
-            'user_name': user_name,
-            'wishlist_name': category if not item else item_title,
-            'item_name': item_title,
-            'item_category': category or 'Uncategorized',
-            'item_condition': condition or 'Available',
-            'item_location': item.location if item and item.location else 'Not specified',
-            'item_value': item.value if item and item.value else 0,
-            'item_image': item_image,
-            'item_description': item.description if item and item.description else None,
-            'view_item_url': f"{app.config.get('APP_URL', 'https://barterex.com')}/item/{item_id}",
-            'dashboard_url': f"{app.config.get('APP_URL', 'https://barterex.com')}/dashboard",
-            'wishlist_url': f"{app.config.get('APP_URL', 'https://barterex.com')}/wishlist",
-            'marketplace_url': f"{app.config.get('APP_URL', 'https://barterex.com')}/marketplace",
-            'unsubscribe_url': f"{app.config.get('APP_URL', 'https://barterex.com')}/settings/notifications"
-        }
-        
-        logger.debug(f'[WISHLIST] Email context prepared: {list(context.keys())}')
-        
-        # Render template and send email within app context
-        with app.app_context():
-            # Render template
-            try:
-                html_body = render_template('emails/wishlist_notification.html', **context)
-                logger.info(f'[WISHLIST] Template rendered successfully, body length: {len(html_body)} chars')
-            except Exception as template_err:
-                logger.error(f'[WISHLIST] Template rendering failed: {str(template_err)}', exc_info=True)
-                raise
-            
-            # Get sender configuration
-            sender = app.config.get('MAIL_DEFAULT_SENDER', ('Barterex', 'noreply@barterex.com'))
-            logger.info(f'[WISHLIST] Using sender: {sender}')
-            
-            # Create and send email
-            msg = Message(
-                subject=subject,
-                recipients=[recipient],
-                html=html_body,
-                sender=sender
-            )
-            
-            logger.info(f'[WISHLIST] Message object created, attempting to send...')
-            mail.send(msg)
-            logger.info(f'[WISHLIST] Wishlist notification email sent to {recipient} for item {item_id}')
-        
-        return True
-        
-    except Exception as e:
-        logger.error(f'[WISHLIST] Error sending wishlist email to {recipient} for item {item_id}: {str(e)}', exc_info=True)
-        return False
+    # Pending rather than just-created matches, so a retried event still delivers
+    user_ids = [row[0] for row in db.session.query(Wishlist.user_id).join(
+        WishlistMatch, WishlistMatch.wishlist_id == Wishlist.id
+    ).filter(
+        WishlistMatch.item_id.in_(item_ids),
+        WishlistMatch.notification_sent_at == None,
+    ).distinct()]
+    if user_ids:
+        users, matches = send_digests('instant', user_ids=user_ids)
+        logger.info(f'Processed wishlist matches for {len(items)} item(s): {matches} match(es) sent instantly to {users} user(s)')
 
 
 def bulk_find_matches_for_item(item_id):
     """Find all wishlist matches for a specific item (for background tasks)"""
-    try:
-        item = Item.query.get(item_id)
-        if not item:
-            return
-        
-        matches = find_wishlist_matches(item)
-        
-        for wishlist, user in matches:
-            send_wishlist_notification(wishlist, item, user)
-        
-        logger.info(f'Processed {len(matches)} wishlist notifications for item {item_id}')
-        
-    except Exception as e:
-        logger.error(f'Error in bulk find matches: {str(e)}')
+    bulk_find_matches_for_items([item_id])
 
 
 def deactivate_matched_wishlists(item_id):
@@ -0,0 +1,329 @@
+"""
+Image storage backends for Barterex.
+
+All user-uploaded images (item photos, profile pictures) go through a single
+storage interface so the app can run on local disk for a single instance or on
+an S3-compatible bucket (AWS S3, MinIO) when several instances share media.
+
+Keys are the bare filenames produced by generate_safe_filename() - the same
+value stored in Item.image_url / ItemImage.image_url / User.profile_picture.
+"""
+
+import os
+import io
+import time
+import shutil
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from logger_config import setup_logger
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+    BOTO3_AVAILABLE = True
+except ImportError:
+    ClientError = Exception
+    BOTO3_AVAILABLE = False
+
+logger = setup_logger(__name__)
+
+STORAGE_EXTENSION_KEY = 'barterex_storage'
+
+
+class StorageBackend:
+    """Interface shared by every storage backend."""
+
+    name = 'base'
+
+    def save(self, file_obj, key, content_type=None):
+        """Persist a file-like object (or FileStorage) under key. Returns key."""
+        raise NotImplementedError
+
+    def open(self, key):
+        """Return the stored bytes for key, or None if it does not exist."""
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove key. Missing keys are ignored."""
+        raise NotImplementedError
+
+    def url(self, key):
+        """Public URL a browser can use to fetch key."""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Path of a local copy of key, or None if there is none."""
+        return None
+
+    def wait(self, key=None, timeout=None):
+        """Block until background uploads finish. No-op for synchronous backends."""
+        return None
+
+
+def _normalize_key(key):
+    """Reduce any stored image reference to its bare filename key."""
+    if not key:
+        return key
+    key = str(key).strip().replace('\\', '/')
+    return key.split('/')[-1]
+
+
+def _write_file_obj(file_obj, path):
+    """Write a FileStorage / file-like / bytes object to path."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if isinstance(file_obj, (bytes, bytearray)):
+        with open(path, 'wb') as f:
+            f.write(file_obj)
+        return
+    if hasattr(file_obj, 'seek'):
+        file_obj.seek(0)
+    if hasattr(file_obj, 'save'):
+        file_obj.save(path)
+        return
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(file_obj, f)
+
+
+class LocalStorage(StorageBackend):
+    """Stores files in a local directory, served by the /media endpoint."""
+
+    name = 'local'
+
+    def __init__(self, root, url_prefix='/media'):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+
+    def local_path(self, key):
+        return os.path.join(self.root, _normalize_key(key))
+
+    def save(self, file_obj, key, content_type=None):
+        key = _normalize_key(key)
+        _write_file_obj(file_obj, self.local_path(key))
+        return key
+
+    def open(self, key):
+        path = self.local_path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def delete(self, key):
+        path = self.local_path(key)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def url(self, key):
+        return f'{self.url_prefix}/{_normalize_key(key)}'
+
+
+class S3Storage(StorageBackend):
+    """
+    Stores files in an S3-compatible bucket with a write-through local cache.
+
+    Uploads are written to the local cache first (so the request can analyse
+    the image immediately) and pushed to the bucket on a background thread.
+    Reads are served from the cache when present and filled from the bucket
+    otherwise. URLs are presigned GETs, memoised for half their lifetime so
+    rendered pages keep stable, cacheable image URLs.
+
+    A failed upload is retried with exponential backoff (upload_attempts
+    tries). If every try fails the key is remembered and retried again the
+    next time its URL is asked for, at most every upload_retry_after
+    seconds. Until an upload succeeds url() returns the local /media URL,
+    never a presigned URL for an object the bucket does not have.
+    """
+
+    name = 's3'
+
+    def __init__(self, bucket, cache_root, endpoint_url=None, region=None,
+                 presign_expires=3600, async_uploads=True, max_workers=4, client=None,
+                 url_prefix='/media', upload_attempts=5, upload_retry_delay=1.0,
+                 upload_retry_after=300):
+        if client is None:
+            if not BOTO3_AVAILABLE:
+                raise RuntimeError("S3 storage requires boto3 (pip install boto3)")
+            client = boto3.client(
+                's3',
+                endpoint_url=endpoint_url,
+                region_name=region,
+                config=BotoConfig(signature_version='s3v4', retries={'max_attempts': 3}),
+            )
+        self.client = client
+        self.bucket = bucket
+        self.cache = LocalStorage(cache_root, url_prefix=url_prefix)
+        self.presign_expires = presign_expires
+        self.async_uploads = async_uploads
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='s3-upload')
+        self.upload_attempts = max(1, upload_attempts)
+        self.upload_retry_delay = upload_retry_delay
+        self.upload_retry_after = upload_retry_after
+        self._pending = {}
+        self._failed = {}  # key -> (content_type, time of the last failed try)
+        self._url_cache = {}
+        self._lock = threading.Lock()
+
+    def local_path(self, key):
+        path = self.cache.local_path(key)
+        return path if os.path.exists(path) else None
+
+    def _upload(self, key, content_type):
+        path = self.cache.local_path(key)
+        extra = {'ContentType': content_type} if content_type else {}
+        try:
+            for attempt in range(1, self.upload_attempts + 1):
+                try:
+                    self.client.upload_file(path, self.bucket, key, ExtraArgs=extra)
+                except Exception as e:
+                    if attempt == self.upload_attempts:
+                        logger.error(f"Upload of {key} failed after {attempt} attempts, serving the local copy "
+                                     f"until a later retry succeeds: {e}", exc_info=True)
+                        with self._lock:
+                            self._failed[key] = (content_type, time.time())
+                        raise
+                    delay = self.upload_retry_delay * 2 ** (attempt - 1)
+                    logger.warning(f"Upload of {key} attempt {attempt} failed, retrying in {delay:.1f}s: {e}")
+                    time.sleep(delay)
+                else:
+                    with self._lock:
+                        self._failed.pop(key, None)
+                    logger.info(f"Image uploaded to bucket {self.bucket}: {key}")
+                    return
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _retry_failed(self, key):
+        # Called with self._lock held
+        content_type, failed_at = self._failed[key]
+        if time.time() - failed_at >= self.upload_retry_after and os.path.exists(self.cache.local_path(key)):
+            self._failed[key] = (content_type, time.time())
+            self._pending[key] = self._executor.submit(self._upload, key, content_type)
+
+    def save(self, file_obj, key, content_type=None):
+        key = _normalize_key(key)
+        content_type = content_type or getattr(file_obj, 'mimetype', None) or mimetypes.guess_type(key)[0]
+        self.cache.save(file_obj, key)
+        if not self.async_uploads:
+            self._upload(key, content_type)
+            return key
+        with self._lock:
+            self._pending[key] = self._executor.submit(self._upload, key, content_type)
+        return key
+
+    def wait(self, key=None, timeout=None):
+        """Block until the pending upload(s) finish. Used by CLI tasks and tests."""
+        with self._lock:
+            if key is None:
+                futures = list(self._pending.values())
+            else:
+                futures = [self._pending[key]] if key in self._pending else []
+        for future in futures:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def open(self, key):
+        key = _normalize_key(key)
+        data = self.cache.open(key)
+        if data is not None:
+            return data
+        try:
+            buffer = io.BytesIO()
+            self.client.download_fileobj(self.bucket, key, buffer)
+        except ClientError as e:
+            logger.warning(f"Image not found in bucket {self.bucket}: {key} ({e})")
+            return None
+        data = buffer.getvalue()
+        self.cache.save(data, key)
+        return data
+
+    def exists(self, key):
+        key = _normalize_key(key)
+        if self.cache.exists(key):
+            return True
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError:
+            return False
+
+    def delete(self, key):
+        key = _normalize_key(key)
+        self.wait(key)
+        self.cache.delete(key)
+        with self._lock:
+            self._url_cache.pop(key, None)
+            self._failed.pop(key, None)
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            logger.warning(f"Could not delete {key} from bucket {self.bucket}: {e}")
+
+    def url(self, key):
+        key = _normalize_key(key)
+        with self._lock:
+            # Not in the bucket yet - this instance can still serve its cached copy
+            if key in self._failed and key not in self._pending:
+                self._retry_failed(key)
+            if key in self._pending or key in self._failed:
+                return self.cache.url(key)
+            cached = self._url_cache.get(key)
+        now = time.time()
+        if cached and cached[1] > now:
+            return cached[0]
+        url = self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': key},
+            ExpiresIn=self.presign_expires,
+        )
+        with self._lock:
+            self._url_cache[key] = (url, now + self.presign_expires / 2)
+        return url
+
+
+def create_storage(config, root_path=''):
+    """Build the storage backend described by a Flask config mapping."""
+    upload_root = os.path.join(root_path, config.get('UPLOAD_FOLDER', 'static/uploads'))
+    backend = (config.get('STORAGE_BACKEND') or 'local').lower()
+
+    if backend == 's3':
+        return S3Storage(
+            bucket=config['S3_BUCKET'],
+            cache_root=upload_root,
+            endpoint_url=config.get('S3_ENDPOINT_URL'),
+            region=config.get('S3_REGION'),
+            presign_expires=config.get('S3_PRESIGN_EXPIRES', 3600),
+            async_uploads=config.get('STORAGE_ASYNC_UPLOADS', True),
+            url_prefix=config.get('MEDIA_URL_PREFIX', '/media'),
+            upload_attempts=config.get('S3_UPLOAD_ATTEMPTS', 5),
+            upload_retry_after=config.get('S3_UPLOAD_RETRY_AFTER', 300),
+        )
+    if backend != 'local':
+        logger.warning(f"Unknown STORAGE_BACKEND '{backend}', falling back to local storage")
+    return LocalStorage(upload_root, url_prefix=config.get('MEDIA_URL_PREFIX', '/media'))
+
+
+def get_storage(app=None):
+    """Return the storage backend for app (current_app by default), creating it once."""
+    if app is None:
+        from flask import current_app
+        app = current_app._get_current_object()
+    storage = app.extensions.get(STORAGE_EXTENSION_KEY)
+    if storage is None:
+        storage = create_storage(app.config, app.root_path)
+        app.extensions[STORAGE_EXTENSION_KEY] = storage
+        logger.info(f"Image storage backend initialised: {storage.name}")
+    return storage
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Admin dashboard counter snapshot tests.
+
+With a long ADMIN_STATS_TTL, counters only move when a commit invalidates
+the snapshot:
+
+- Item writes (ORM adds and changes, bulk update(Item) statements),
+  contact messages, new and deleted users and the user ban/appeal fields
+  invalidate it, and the next read shows the change.
+- A user update that only touches credits (ORM or User.change_credits)
+  keeps the cached snapshot: no counter queries run.
+- A rolled-back write does not invalidate it.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'admin_stats.db')}"
+
+from sqlalchemy import update
+
+from app import app, db
+from models import User, Item, ContactMessage
+import admin_stats
+from admin_stats import get_admin_stats
+
+app.config['OUTBOX_WORKER_ENABLED'] = False
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+app.config['ADMIN_STATS_TTL'] = 3600
+
+failures = []
+computed = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+# Count recomputations
+_compute = admin_stats.compute_admin_stats
+
+
+def counting_compute():
+    computed.append(1)
+    return _compute()
+
+
+admin_stats.compute_admin_stats = counting_compute
+
+
+def moves(label, key, delta, write):
+    """Run write (which commits) and check that stats[key] changed by delta on the next read."""
+    before = get_admin_stats()[key]
+    write()
+    after = get_admin_stats()[key]
+    check(f"{label}: {key} {before} -> {after}", after - before == delta)
+
+
+print("=" * 60)
+print("Admin stats snapshot")
+print("=" * 60)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    seller = User(username='seller', email='seller@example.com', password_hash='x', credits=0)
+    db.session.add(seller)
+    db.session.commit()
+    seller_id = seller.id
+
+    print("\ninvalidating writes")
+
+    def add_item():
+        db.session.add(Item(name='Lamp', category='Home', user_id=seller_id, status='pending',
+                            value=50, is_available=True))
+        db.session.commit()
+
+    moves("new item", 'pending_items', 1, add_item)
+    item_id = Item.query.filter_by(name='Lamp').one().id
+
+    def approve_orm():
+        item = db.session.get(Item, item_id)
+        item.status = 'approved'
+        db.session.commit()
+
+    moves("ORM item change", 'approved_items', 1, approve_orm)
+
+    def sell_bulk():
+        db.session.execute(update(Item).where(Item.id == item_id).values(is_available=False))
+        db.session.commit()
+
+    moves("bulk update(Item)", 'traded_items', 1, sell_bulk)
+
+    def add_message():
+        db.session.add(ContactMessage(name='Visitor', email='visitor@example.com', message='Hello'))
+        db.session.commit()
+
+    moves("contact message", 'pending_messages', 1, add_message)
+
+    def appeal():
+        user = db.session.get(User, seller_id)
+        user.is_banned = True
+        user.appeal_message = 'Please reconsider'
+        user.unban_request_date = datetime.utcnow()
+        db.session.commit()
+
+    moves("ban and appeal fields", 'pending_appeals', 1, appeal)
+
+    def add_user():
+        db.session.add(User(username='newbie', email='newbie@example.com', password_hash='x'))
+        db.session.commit()
+
+    moves("new user", 'total_users', 1, add_user)
+
+    def delete_user():
+        db.session.delete(User.query.filter_by(username='newbie').one())
+        db.session.commit()
+
+    moves("deleted user", 'total_users', -1, delete_user)
+
+    print("\ncached")
+    snapshot = get_admin_stats()
+    runs = len(computed)
+
+    user = db.session.get(User, seller_id)
+    user.credits = 500
+    db.session.commit()
+    check("credits-only ORM update keeps the snapshot", get_admin_stats() is snapshot and len(computed) == runs)
+
+    User.change_credits(seller_id, 25)
+    db.session.commit()
+    check("User.change_credits keeps the snapshot", get_admin_stats() is snapshot and len(computed) == runs)
+
+    db.session.add(Item(name='Chair', category='Home', user_id=seller_id, status='pending'))
+    db.session.flush()
+    db.session.rollback()
+    check("rolled-back item write keeps the snapshot", get_admin_stats() is snapshot and len(computed) == runs)
+
+    db.session.remove()
+    db.drop_all()
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Admin stats snapshot is invalidated by exactly the writes that change it")
+sys.exit(0)
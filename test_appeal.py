@@ -1,12 +1,33 @@
 #!/usr/bin/env python
 """
 Test script to manually create an appeal and verify it appears
+
+Runs against a throwaway SQLite database built with create_all(), so it does
+not depend on the state (or migration level) of instance/barter.db.
 """
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'appeal.db')}"
+
 from app import app, db
 from models import User
 from datetime import datetime
 
+app.config['OUTBOX_WORKER_ENABLED'] = False
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+
 with app.app_context():
+    db.drop_all()
+    db.create_all()
+    db.session.add(User(username='Ayara', email='ayara@example.com', password_hash='x',
+                        is_banned=True, ban_reason='Spam listings', ban_date=datetime.utcnow()))
+    db.session.commit()
+
     # Find the banned user
     user = User.query.filter_by(username='Ayara').first()
     
@@ -42,9 +63,16 @@ with app.app_context():
         for p in pending:
             print(f"  - {p.username}: {p.appeal_message[:60]}...")
         
-        if len(pending) > 0:
+        visible = len(pending) > 0
+        if visible:
             print("\n✅ Appeal is now visible to admins!")
         else:
             print("\n❌ Appeal is NOT visible to admins - there's a problem")
     else:
+        visible = False
         print("User not found or not banned")
+
+    db.session.remove()
+    db.drop_all()
+
+sys.exit(0 if visible else 1)
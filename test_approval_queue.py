@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+Approval queue tests (claims and keyset paging).
+
+- Two admins pulling the queue at the same time get disjoint pages.
+- A claim that has expired makes its items available to other admins again.
+- Paging with the cursor visits every pending item once, in priority order,
+  including items that share a review_priority_at.
+- /admin/approve and /admin/reject refuse an item under another admin's
+  live claim; the claiming admin can approve it.
+- Trusted sellers' items are ordered ahead of older items from new sellers.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'approval_queue.db')}"
+
+from app import app, db, limiter
+from models import User, Item, Admin, SystemSettings
+import approval_queue
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['MAIL_SUPPRESS_SEND'] = True
+app.config['OUTBOX_WORKER_ENABLED'] = False
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+app.extensions['mail'].suppress = True
+if limiter is not None:
+    limiter.enabled = False
+
+BASE_URL = 'https://localhost'
+ITEMS = 10
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+def ids(items):
+    return [item.id for item in items]
+
+
+def walk(admin_id, limit):
+    """Page through the whole queue; returns (item ids in order, pages)."""
+    seen, cursor, pages = [], None, 0
+    while True:
+        items, next_cursor = approval_queue.next_page(
+            admin_id, after=approval_queue.decode_cursor(cursor) if cursor else None, limit=limit)
+        seen += ids(items)
+        pages += 1
+        if next_cursor is None or pages > ITEMS:
+            return seen, pages
+        cursor = next_cursor
+
+
+print("=" * 60)
+print("Approval queue")
+print("=" * 60)
+
+base = datetime.utcnow() - timedelta(days=1)
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    SystemSettings.get_settings()
+
+    seller = User(username='seller', email='seller@example.com', password_hash='x', credits=0)
+    admins = [Admin(username=f'admin{n}', email=f'admin{n}@example.com', password='x') for n in range(3)]
+    db.session.add_all([seller] + admins)
+    db.session.flush()
+    items = []
+    for n in range(ITEMS):
+        # Pairs share a priority timestamp, so the id tie-breaker matters
+        items.append(Item(name=f'Item {n}', category='Home', user_id=seller.id, status='pending',
+                          submitted_at=base, review_priority_at=base + timedelta(minutes=n // 2)))
+    db.session.add_all(items)
+    db.session.commit()
+    seller_id = seller.id
+    first, second, third = (admin.id for admin in admins)
+    queue_order = [item.id for item in sorted(items, key=lambda item: (item.review_priority_at, item.id))]
+
+print("\nclaims")
+with app.app_context():
+    page_one, _ = approval_queue.next_page(first, limit=3)
+    page_two, _ = approval_queue.next_page(second, limit=3)
+    check("first admin gets the head of the queue", ids(page_one) == queue_order[:3])
+    check("second admin gets the next items, not the same ones", ids(page_two) == queue_order[3:6])
+    again, _ = approval_queue.next_page(first, limit=3)
+    check("an admin keeps their own claimed items", ids(again) == queue_order[:3])
+    check("claim() refuses an item another admin holds", not approval_queue.claim(page_one[0].id, second))
+    counts = approval_queue.queue_counts(second)
+    check("queue counts items in review by others", counts['pending'] == ITEMS and counts['in_review_by_others'] == 3)
+
+    # First admin closed the tab: the lease runs out
+    Item.query.filter(Item.id.in_(ids(page_one))).update(
+        {'review_claimed_until': datetime.utcnow() - timedelta(seconds=1)}, synchronize_session=False)
+    db.session.commit()
+    retaken, _ = approval_queue.next_page(second, limit=6)
+    check("expired claims are available again", ids(retaken) == queue_order[:6])
+    check("and are now held by the new admin",
+          all(item.review_claimed_by == second for item in Item.query.filter(Item.id.in_(queue_order[:3]))))
+
+print("\npaging")
+with app.app_context():
+    approval_queue.release_claims(second)
+    db.session.commit()
+    seen, pages = walk(third, limit=3)
+    check("every pending item visited once, in priority order", seen == queue_order)
+    check("four pages of three", pages == 4)
+
+    # Another admin holds items in the middle of the queue: the walk skips them, drops nothing else
+    approval_queue.release_claims(third)
+    db.session.commit()
+    for item_id in queue_order[4:6]:
+        approval_queue.claim(item_id, first)
+    db.session.commit()
+    seen, _ = walk(third, limit=3)
+    check("items claimed by others skipped, the rest all visited",
+          seen == queue_order[:4] + queue_order[6:])
+
+print("\napprove / reject")
+held_id = queue_order[4]
+client = app.test_client()
+with client.session_transaction(base_url=BASE_URL) as sess:
+    sess['admin_id'] = third
+client.post(f'/admin/approve/{held_id}', data={'value': '100'}, base_url=BASE_URL)
+client.post(f'/admin/reject/{held_id}', data={'rejection_reason': 'Blurry photos'}, base_url=BASE_URL)
+with app.app_context():
+    item = db.session.get(Item, held_id)
+    check("other admin's approve and reject refused",
+          item.status == 'pending' and not item.is_approved and db.session.get(User, seller_id).credits == 0)
+
+owner = app.test_client()
+with owner.session_transaction(base_url=BASE_URL) as sess:
+    sess['admin_id'] = first
+owner.post(f'/admin/approve/{held_id}', data={'value': '100'}, base_url=BASE_URL)
+with app.app_context():
+    item = db.session.get(Item, held_id)
+    check("claiming admin can approve", item.is_approved and db.session.get(User, seller_id).credits == 100)
+
+print("\npriority")
+with app.app_context():
+    newcomer = User(username='newcomer', email='newcomer@example.com', password_hash='x', tier='Beginner')
+    veteran = User(username='veteran', email='veteran@example.com', password_hash='x', tier='Expert')
+    db.session.add_all([newcomer, veteran])
+    db.session.flush()
+    older = Item(name='Old listing', category='Home', user_id=newcomer.id, status='pending',
+                 submitted_at=datetime.utcnow() - timedelta(hours=3))
+    newer = Item(name='New listing', category='Home', user_id=veteran.id, status='pending',
+                 submitted_at=datetime.utcnow())
+    db.session.add_all([older, newer])
+    db.session.flush()
+    approval_queue.set_review_priority(older)
+    approval_queue.set_review_priority(newer)
+    check("expert seller's newer item reviewed first", newer.review_priority_at < older.review_priority_at)
+    db.session.rollback()
+
+with app.app_context():
+    db.session.remove()
+    db.drop_all()
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Approval queue claims and paging are consistent")
+sys.exit(0)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Broadcast notification tests.
+
+- POST /admin/api/notifications/broadcast writes every recipient's
+  notification with one INSERT ... SELECT, for each segment (all, state,
+  tier, active); banned users are never included.
+- Recipients' notification counters match their notifications afterwards.
+- With send_email, emails are queued by the outbox in chunks (one per
+  recipient), skipping users who turned system emails off.
+- Invalid segments and empty messages are rejected without writing anything.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'broadcast_notifications.db')}"
+
+from sqlalchemy import event
+
+from app import app, db, limiter
+from models import User, Admin, Notification, OutgoingEmail, OutboxEvent, AuditLog
+from outbox import process_pending
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['OUTBOX_WORKER_ENABLED'] = False
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+app.config['BROADCAST_EMAIL_CHUNK'] = 2
+if limiter is not None:
+    limiter.enabled = False
+
+BASE_URL = 'https://localhost'
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+def recipients(message):
+    return {n.user_id for n in Notification.query.filter_by(message=message)}
+
+
+print("=" * 60)
+print("Broadcast notifications")
+print("=" * 60)
+
+now = datetime.utcnow()
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    users = {
+        'lagos': User(username='lagos', email='lagos@example.com', password_hash='x', state='Lagos',
+                      tier='Expert', last_login=now - timedelta(days=2)),
+        'abuja': User(username='abuja', email='abuja@example.com', password_hash='x', state='Abuja',
+                      tier='Beginner', last_login=now - timedelta(days=40)),
+        'quiet': User(username='quiet', email='quiet@example.com', password_hash='x', state='lagos',
+                      tier='Beginner', notification_preferences={'email_systems': False}),
+        'banned': User(username='banned', email='banned@example.com', password_hash='x', state='Lagos',
+                       tier='Expert', last_login=now, is_banned=True),
+    }
+    admin = Admin(username='admin', email='admin@example.com', password='x')
+    db.session.add_all(list(users.values()) + [admin])
+    db.session.commit()
+    ids = {name: user.id for name, user in users.items()}
+    admin_id = admin.id
+
+client = app.test_client()
+with client.session_transaction(base_url=BASE_URL) as sess:
+    sess['admin_id'] = admin_id
+
+
+def send(**body):
+    return client.post('/admin/api/notifications/broadcast', base_url=BASE_URL, json=body)
+
+
+print("\nsegments")
+inserts = []
+
+
+def count_inserts(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip().upper().startswith('INSERT INTO NOTIFICATION'):
+        inserts.append(executemany)
+
+
+with app.app_context():
+    event.listen(db.engine, 'before_cursor_execute', count_inserts)
+response = send(message='Maintenance tonight')
+with app.app_context():
+    event.remove(db.engine, 'before_cursor_execute', count_inserts)
+    check("all: every user but the banned one",
+          response.status_code == 200 and response.get_json()['recipients'] == 3
+          and recipients('Maintenance tonight') == {ids['lagos'], ids['abuja'], ids['quiet']})
+    check("notifications written with one INSERT ... SELECT", inserts == [False])
+    check("broadcast audited", AuditLog.query.filter_by(action_type='broadcast_notification').count() == 1)
+
+cases = [
+    ('state', 'LAGOS', {'lagos', 'quiet'}),
+    ('tier', 'Expert', {'lagos'}),
+    ('active', 7, {'lagos'}),
+]
+for segment, value, expected in cases:
+    message = f'Notice for {segment}'
+    response = send(message=message, segment=segment, value=value)
+    with app.app_context():
+        check(f"{segment}={value}: {sorted(expected)}",
+              response.status_code == 200 and recipients(message) == {ids[name] for name in expected})
+
+print("\ncounters")
+with app.app_context():
+    for name, user_id in ids.items():
+        user = db.session.get(User, user_id)
+        total = Notification.query.filter_by(user_id=user_id).count()
+        unread = Notification.query.filter_by(user_id=user_id, is_read=False).count()
+        check(f"{name}: {total} notification(s), counters match",
+              (user.notification_count, user.unread_notification_count) == (total, unread)
+              and user.notification_version == total)
+
+print("\nemail")
+with app.app_context():
+    emails_before = OutgoingEmail.query.count()
+response = send(message='New trading rules', title='Policy update', send_email=True)
+with app.app_context():
+    check("emails deferred to the outbox", OutgoingEmail.query.count() == emails_before)
+    rounds = 0
+    while process_pending():
+        rounds += 1
+    emails = OutgoingEmail.query.filter_by(subject='Policy update').all()
+    addresses = sorted(address for email in emails for address in email.recipients)
+    check("one email per recipient, opted-out and banned users skipped",
+          addresses == ['abuja@example.com', 'lagos@example.com'])
+    check("message rendered into the notice", all('New trading rules' in email.html_body for email in emails))
+    check("fan-out chained over chunks",
+          OutboxEvent.query.filter_by(event_type='broadcast_email').count() == 2 and rounds >= 2)
+
+print("\nvalidation")
+with app.app_context():
+    total_before = Notification.query.count()
+check("empty message rejected", send(message='  ').status_code == 400)
+check("unknown segment rejected", send(message='x', segment='city', value='Ikeja').status_code == 400)
+check("unknown tier rejected", send(message='x', segment='tier', value='Legend').status_code == 400)
+check("active without days rejected", send(message='x', segment='active', value='soon').status_code == 400)
+with app.app_context():
+    check("nothing written", Notification.query.count() == total_before)
+
+with app.app_context():
+    db.session.remove()
+    db.drop_all()
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Broadcasts reach their segment with one insert")
+sys.exit(0)
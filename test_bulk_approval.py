@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+Bulk item approval tests.
+
+- POST /admin/api/items/bulk-approve approves every listed pending item in
+  one transaction, credits each owner the sum of their item values and adds
+  upload points, with one audit row and one notification per item.
+- Already-approved items and items claimed by another admin are skipped.
+- Approval emails and wishlist matching are outbox events, not inline work.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'bulk_approval.db')}"
+
+from app import app, db, limiter
+from models import (User, Item, Admin, AuditLog, Notification, OutboxEvent, OutgoingEmail, Referral,
+                    SystemSettings, Wishlist, WishlistMatch)
+from outbox import process_pending
+from trading_points import POINTS_PER_UPLOAD_APPROVAL, CREDITS_PER_LEVEL_UP
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['MAIL_SUPPRESS_SEND'] = True
+app.config['OUTBOX_WORKER_ENABLED'] = False
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+app.extensions['mail'].suppress = True
+if limiter is not None:
+    limiter.enabled = False
+
+BASE_URL = 'https://localhost'
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+print("=" * 60)
+print("Bulk item approval")
+print("=" * 60)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    SystemSettings.get_settings()
+
+    alice = User(username='alice', email='alice@example.com', password_hash='x', credits=100)
+    # 95 points: the first approval takes bob to level 2
+    bob = User(username='bob', email='bob@example.com', password_hash='x', credits=0, trading_points=95)
+    referrer = User(username='referrer', email='referrer@example.com', password_hash='x')
+    admin = Admin(username='admin', email='admin@example.com', password='x')
+    other_admin = Admin(username='other', email='other@example.com', password='x')
+    db.session.add_all([alice, bob, referrer, admin, other_admin])
+    db.session.flush()
+    db.session.add(Referral(referrer_id=referrer.id, referred_user_id=bob.id, referral_code_used='REF1'))
+    db.session.add_all([
+        Wishlist(user_id=referrer.id, search_type='item', item_name='phone'),
+        Wishlist(user_id=referrer.id, search_type='category', category='home', item_name='home'),
+        Wishlist(user_id=referrer.id, search_type='item', item_name='bicycle'),
+    ])
+
+    items = [
+        Item(name='Lamp', category='Home', user_id=alice.id, status='pending'),
+        Item(name='Chair', category='Home', user_id=alice.id, status='pending'),
+        Item(name='Phone', category='Electronics', user_id=bob.id, status='pending'),
+        Item(name='Sold already', category='Home', user_id=bob.id, status='approved',
+             is_approved=True, value=50),
+        Item(name='Claimed', category='Home', user_id=bob.id, status='pending',
+             review_claimed_by=other_admin.id, review_claimed_until=datetime.utcnow() + timedelta(minutes=5)),
+    ]
+    db.session.add_all(items)
+    db.session.commit()
+    lamp, chair, phone, approved_item, claimed = [item.id for item in items]
+    alice_id, bob_id, admin_id = alice.id, bob.id, admin.id
+
+client = app.test_client()
+with client.session_transaction(base_url=BASE_URL) as sess:
+    sess['admin_id'] = admin_id
+
+print("\nvalidation")
+response = client.post('/admin/api/items/bulk-approve', base_url=BASE_URL,
+                       json={'items': [{'item_id': lamp, 'value': -5}]})
+check("non-positive value is rejected", response.status_code == 400)
+response = client.post('/admin/api/items/bulk-approve', base_url=BASE_URL, json={'items': []})
+check("empty batch is rejected", response.status_code == 400)
+
+print("\napproval")
+response = client.post('/admin/api/items/bulk-approve', base_url=BASE_URL, json={'items': [
+    {'item_id': lamp, 'value': 200},
+    {'item_id': chair, 'value': 300},
+    {'item_id': phone, 'value': 1000},
+    {'item_id': approved_item, 'value': 999},
+    {'item_id': claimed, 'value': 400},
+]})
+body = response.get_json()
+check("request succeeds", response.status_code == 200 and body['success'])
+check("pending items approved", sorted(body['approved']) == sorted([lamp, chair, phone]))
+check("approved and claimed items skipped", sorted(body['skipped']) == sorted([approved_item, claimed]))
+
+with app.app_context():
+    alice = db.session.get(User, alice_id)
+    bob = db.session.get(User, bob_id)
+    check("owner credited the sum of their items", alice.credits == 100 + 200 + 300)
+    check("upload points per item", alice.trading_points == 2 * POINTS_PER_UPLOAD_APPROVAL)
+    check("level up applied with its credits",
+          bob.level == 2 and bob.credits == 1000 + CREDITS_PER_LEVEL_UP)
+    check("items carry their values", db.session.get(Item, phone).value == 1000 and db.session.get(Item, phone).is_available)
+    check("already-approved item untouched", db.session.get(Item, approved_item).value == 50)
+    check("claimed item still pending", db.session.get(Item, claimed).status == 'pending')
+    check("one audit row per approved item",
+          AuditLog.query.filter_by(action_type='approve_item').count() == 3)
+    check("one notification per approved item", Notification.query.count() == 3)
+
+    events = [event.event_type for event in OutboxEvent.query.all()]
+    check("emails and wishlist matching deferred to the outbox",
+          events.count('item_approval_email') == 3 and events.count('wishlist_matching') == 1)
+    check("level up and referral bonus deferred", events.count('level_up') == 1 and events.count('referral_bonus') == 1)
+
+    while process_pending():
+        pass
+    check("all events processed", OutboxEvent.query.filter(OutboxEvent.status != 'done').count() == 0)
+    matched = {(match.wishlist.search_type, match.item_id) for match in WishlistMatch.query.all()}
+    check("wishlist matching ran in the background",
+          matched == {('item', phone), ('category', lamp), ('category', chair)})
+    check("approval emails queued", OutgoingEmail.query.filter(OutgoingEmail.subject.like('%Has Been Approved%')).count() == 3)
+
+response = client.post('/admin/api/items/bulk-approve', base_url=BASE_URL,
+                       json={'items': [{'item_id': lamp, 'value': 200}]})
+check("repeat request credits nobody twice", response.get_json()['approved'] == [])
+
+with app.app_context():
+    db.session.remove()
+    db.drop_all()
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Bulk approval applies every item in one transaction")
+sys.exit(0)
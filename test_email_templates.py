@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Email template tests (CSS inlining and `flask emails build`).
+
+- inline_css() applies tag, .class and #id rules (and combinations) to the
+  matching elements; an element's own style="" is kept last, so it wins.
+- Rules it cannot inline stay in a trimmed <style> block: @media blocks
+  (with !important added), pseudo-classes, descendant selectors and rules
+  for classes that are only set by Jinja expressions.
+- After `flask emails build`, render_email() loads the precompiled modules
+  and produces the same HTML as the uncompiled path for every template.
+"""
+import os
+import re
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'email_templates.db')}"
+
+from jinja2 import ChoiceLoader, Environment
+
+from app import app
+from email_templates import inline_css, get_email_renderer, render_email
+
+BASE_URL = 'https://barterex.example'
+failures = []
+
+HTML = """<html><head><style>
+/* comment */
+p { color: #333; margin: 0 }
+.note { font-size: 12px }
+p.note { font-weight: bold }
+#main { padding: 4px }
+.badge { color: white }
+a:hover { color: blue }
+div p { line-height: 2 }
+@media (max-width: 600px) { .note { font-size: 16px } #main { padding: 0 } }
+</style></head><body>
+<div id="main"><p class="note">Plain</p><p class="note" style="color: green">Own style</p>
+<span class="{{ kind }}">Dynamic</span><a href="#">Link</a></div>
+</body></html>"""
+
+item = SimpleNamespace(name='Vintage Camera', description='Working, lightly used', item_number='ITM-000123')
+SAMPLE_CONTEXT = {
+    'username': 'ada', 'user_name': 'ada', 'reason': 'Spam listings', 'ban_date': datetime(2026, 10, 1),
+    'unban_url': 'https://example.com/banned', 'approval_url': 'https://example.com/items/1',
+    'item_name': item.name, 'item_number': item.item_number, 'item_value': 2500,
+    'credits_awarded': 100, 'level': 5, 'tier': 'Silver', 'total_points': 540, 'new_balance': 1200,
+    'order_id': 'ORD-20261019-00042', 'order_date': 'October 19, 2026',
+    'delivery_method': 'pickup', 'delivery_address': '1 Test Street',
+    'pickup_station': SimpleNamespace(name='Ikeja Hub', address='12 Allen Avenue, Ikeja'),
+    'items': [item, item], 'total_credits': 5000, 'status': 'shipped', 'status_class': 'shipped',
+    'status_text': 'Shipped', 'status_message': 'On its way', 'updated_date': 'October 19, 2026',
+    'action_url': 'https://example.com/orders/42', 'item_category': 'Electronics', 'item_condition': 'Used',
+    'item_description': item.description, 'item_price': 2500, 'recommendation_reason': 'Based on your wishlist',
+    'reset_url': 'https://example.com/reset/abc', 'support_url': 'https://example.com/help',
+    'verification_link': 'https://example.com/verify/abc', 'verification_token': 'abc',
+    'amount': 5000, 'credits_purchased': 5000, 'previous_balance': 100, 'reference': 'MNFY-123',
+    'transaction_date': 'October 19, 2026 at 10:00 AM', 'wishlist_name': 'Cameras',
+    'item_location': 'Lagos', 'item_image': '/media/1_0_1700000000_camera.jpg',
+    'view_item_url': 'https://example.com/item/1', 'unsubscribe_url': 'https://example.com/settings',
+    'title': 'Scheduled maintenance', 'message': 'Back soon',
+}
+# level_up_notification reads now.year, item_approved calls now()
+EXTRA_CONTEXT = {
+    'emails/level_up_notification.html': {'now': datetime(2026, 10, 19)},
+    'emails/item_approved.html': {'now': lambda: datetime(2026, 10, 19)},
+}
+
+
+def context_for(name):
+    return {**SAMPLE_CONTEXT, **EXTRA_CONTEXT.get(name, {})}
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+def style_of(html, text):
+    """style="" of the element whose content starts with text."""
+    match = re.search(r'style="([^"]*)"[^>]*>' + re.escape(text), html)
+    return match.group(1) if match else ''
+
+
+print("=" * 60)
+print("Email templates")
+print("=" * 60)
+
+print("\ninline_css")
+inlined = inline_css(HTML)
+head, body = inlined.split('<body', 1)
+plain = style_of(inlined, 'Plain')
+check("tag rule applied", 'color: #333' in plain and 'margin: 0' in plain)
+check("class rule applied", 'font-size: 12px' in plain)
+check("tag.class rule applied", 'font-weight: bold' in plain)
+check("id rule applied", 'padding: 4px' in style_of(inlined, '<p class="note"'))
+own = style_of(inlined, 'Own style')
+check("existing style kept last, so it wins", own.endswith('color: green') and 'color: #333' in own)
+check("one style attribute per element", body.count('style=') == body.count('<p') + 1)
+check("@media kept with !important",
+      re.search(r'@media \(max-width: 600px\) \{.*font-size: 16px !important', head, re.S) is not None
+      and 'padding: 0 !important' in head)
+check("pseudo-class and descendant rules kept", 'a:hover { color: blue }' in head and 'div p { line-height: 2 }' in head)
+check("inlined rules dropped from <style>", 'font-weight: bold' not in head and head.count('<style>') == 1)
+check("rule for a Jinja-set class kept", '.badge { color: white }' in head)
+check("Jinja expression untouched", '<span class="{{ kind }}">' in body)
+rendered = Environment().from_string(inlined).render(kind='badge')
+check("Jinja-set class still styled after render", '<span class="badge">' in rendered and '.badge' in rendered)
+check("no <style> without rules to keep", inline_css('<style>p { color: red }</style><body><p>x</p></body>')
+      == '<body><p style="color: red;">x</p></body>')
+
+print("\nflask emails build")
+build_dir = os.path.join(tmp_dir, 'built')
+app.config['EMAIL_BUILD_DIR'] = build_dir
+app.extensions.pop('barterex_email_renderer', None)
+with app.test_request_context(base_url=BASE_URL):
+    names = get_email_renderer().precompile()
+    uncompiled = {name: render_email(name, **context_for(name)) for name in names}
+    check("uncompiled path uses the inlining loader", not isinstance(get_email_renderer().env.loader, ChoiceLoader))
+
+result = app.test_cli_runner().invoke(args=['emails', 'build'])
+check("build succeeds", result.exit_code == 0 and f"Compiled {len(names)} email templates" in result.output)
+check("modules and marker written", os.path.exists(os.path.join(build_dir, '.built'))
+      and any(name.endswith('.py') for name in os.listdir(build_dir)))
+
+with app.test_request_context(base_url=BASE_URL):
+    renderer = get_email_renderer()
+    check("renderer loads the precompiled modules", isinstance(renderer.env.loader, ChoiceLoader))
+    different = [name for name in names if render_email(name, **context_for(name)) != uncompiled[name]]
+    check(f"same HTML for all {len(names)} templates", not different)
+    check("CSS is inlined in the output", 'style="' in uncompiled['emails/welcome_email.html'])
+
+# Sources newer than the build: ignored, back to the inlining loader
+os.utime(os.path.join(build_dir, '.built'), (0, 0))
+app.extensions.pop('barterex_email_renderer', None)
+with app.test_request_context(base_url=BASE_URL):
+    check("stale build ignored", not isinstance(get_email_renderer().env.loader, ChoiceLoader))
+
+app.extensions.pop('barterex_email_renderer', None)
+shutil.rmtree(tmp_dir, ignore_errors=True)
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Email CSS is inlined once and precompiled templates render the same")
+sys.exit(0)
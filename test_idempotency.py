@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+Idempotency key tests for checkout and payment verification.
+
+- Five simultaneous /finalize_purchase POSTs with the same checkout token
+  (a double-clicked button) create one order and deduct credits once; a
+  later retry carrying only the form token replays the first result.
+- Repeating payment verification (verify page, webhook callback) credits
+  the account once and answers the repeats from the recorded result.
+- Only success and credits_added are recorded; the success page shows the
+  current balance, and only to the payment's owner.
+- A verification still in progress elsewhere gets 409, not a second credit.
+"""
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, '.')
+
+DUPLICATES = 5
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'idempotency.db')}"
+
+from app import app, db, limiter
+from models import User, Item, Order, Payment, IdempotencyKey, SystemSettings
+from paystack_payment_service import PaystackPaymentService
+from idempotency import get_cache
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['MAIL_SUPPRESS_SEND'] = True
+app.config['OUTBOX_WORKER_ENABLED'] = False
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+app.extensions['mail'].suppress = True
+if limiter is not None:
+    limiter.enabled = False
+PaystackPaymentService.TEST_MODE = True
+
+BASE_URL = 'https://localhost'
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+def logged_in_client(user_id, **session_values):
+    client = app.test_client()
+    with client.session_transaction(base_url=BASE_URL) as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+        sess.update(session_values)
+    return client
+
+
+print("=" * 60)
+print("Idempotency keys (checkout, payment verification)")
+print("=" * 60)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    SystemSettings.get_settings()
+
+    seller = User(username='seller', email='seller@example.com', password_hash='x')
+    buyer = User(username='buyer', email='buyer@example.com', password_hash='x', credits=1000)
+    db.session.add_all([seller, buyer])
+    db.session.flush()
+    item = Item(name='Camera', category='Electronics', value=300, user_id=seller.id,
+                is_available=True, is_approved=True, status='approved')
+    payment = Payment(user_id=buyer.id, paystack_reference='TEST_idem_1', amount_naira=500,
+                      credits_purchased=500, status='test_pending')
+    busy_payment = Payment(user_id=buyer.id, paystack_reference='TEST_idem_2', amount_naira=200,
+                           credits_purchased=200, status='test_pending')
+    db.session.add_all([item, payment, busy_payment])
+    db.session.commit()
+    buyer_id, seller_id, item_id = buyer.id, seller.id, item.id
+
+# ---- double-clicked finalize ----
+print("\nfinalize_purchase")
+barrier = threading.Barrier(DUPLICATES)
+statuses = []
+
+
+def finalize():
+    client = logged_in_client(
+        buyer_id, pending_checkout_items=[item_id], checkout_token='tok-1',
+        pending_delivery={'method': 'home delivery', 'delivery_address': '1 Test Street'},
+    )
+    barrier.wait()
+    statuses.append(client.post('/finalize_purchase', base_url=BASE_URL).status_code)
+
+
+threads = [threading.Thread(target=finalize) for _ in range(DUPLICATES)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+
+with app.app_context():
+    orders = Order.query.filter_by(user_id=buyer_id).all()
+    check(f"all {DUPLICATES} duplicate requests redirected", statuses.count(302) == DUPLICATES)
+    check(f"one order created (got {len(orders)})", len(orders) == 1)
+    check("credits deducted once", db.session.get(User, buyer_id).credits == 700)
+    order_number = orders[0].order_number if orders else None
+
+# Retry after the session was cleared: the form token alone replays the result
+with app.app_context():
+    get_cache().clear()
+client = logged_in_client(buyer_id)
+response = client.post('/finalize_purchase', data={'idempotency_key': 'tok-1'}, base_url=BASE_URL)
+with client.session_transaction(base_url=BASE_URL) as sess:
+    flashes = [message for _, message in sess.get('_flashes', [])]
+check("retry replays the recorded order", response.status_code == 302 and any(order_number in m for m in flashes))
+
+# ---- repeated payment verification ----
+print("\npayment verification")
+client = logged_in_client(buyer_id)
+first = client.get('/payments/verify-payment/TEST_idem_1', base_url=BASE_URL)
+second = client.get('/payments/verify-payment/TEST_idem_1', base_url=BASE_URL)
+callback = client.get('/payments/webhook?reference=TEST_idem_1', base_url=BASE_URL)
+check("first verification succeeds", first.status_code == 200 and b'1200' in first.data)
+check("repeats replay the success page", second.status_code == 200 and b'1200' in second.data
+      and callback.status_code == 200 and b'1200' in callback.data)
+
+with app.app_context():
+    check("account credited once", db.session.get(User, buyer_id).credits == 1200)
+    key = IdempotencyKey.query.filter_by(scope='payment_verification', key='TEST_idem_1', status='completed').first()
+    check("result recorded for the payment's owner, without a balance",
+          key is not None and key.user_id == buyer_id and key.response == {'success': True, 'credits_added': 500})
+
+    # The owner spends some credits: a refresh shows the current balance, not the first one
+    db.session.get(User, buyer_id).credits = 1100
+    db.session.commit()
+
+refresh = client.get('/payments/verify-payment/TEST_idem_1', base_url=BASE_URL)
+check("owner sees the current balance", b'New Balance' in refresh.data and b'1,100 Credits' in refresh.data)
+anonymous = app.test_client().get('/payments/webhook?reference=TEST_idem_1', base_url=BASE_URL)
+check("anonymous callback replays success without a balance",
+      anonymous.status_code == 200 and b'+500 Credits' in anonymous.data and b'New Balance' not in anonymous.data)
+other = logged_in_client(seller_id).get('/payments/verify-payment/TEST_idem_1', base_url=BASE_URL)
+check("another user cannot verify the payment", other.status_code == 403 and b'1,100' not in other.data)
+
+with app.app_context():
+    # Another worker holds the claim for this reference
+    db.session.add(IdempotencyKey(scope='payment_verification', key='TEST_idem_2'))
+    db.session.commit()
+
+busy = client.get('/payments/verify-payment/TEST_idem_2', base_url=BASE_URL)
+check("verification in progress elsewhere answers 409", busy.status_code == 409)
+
+with app.app_context():
+    check("in-progress payment not credited", db.session.get(User, buyer_id).credits == 1100)
+    db.session.remove()
+    db.drop_all()
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Repeated checkouts and payment verifications replay the first result")
+sys.exit(0)
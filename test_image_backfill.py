@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+`flask images backfill` tests.
+
+- Rows are processed in id order in --batch-size batches, and --limit stops
+  the run; width, height and file_size come from the image files.
+- Rows whose file is missing get a file_not_found quality flag.
+- A second run resumes after the checkpoint and does not reprocess rows
+  before it (including flagged rows that are still missing metadata);
+  --reset starts again from the first row.
+"""
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'image_backfill.db')}"
+
+from PIL import Image
+
+from app import app, db
+from models import User, Item, ItemImage
+from storage import LocalStorage, STORAGE_EXTENSION_KEY
+
+app.config['OUTBOX_WORKER_ENABLED'] = False
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+
+IMAGES = 7
+MISSING = {2, 5}  # positions whose file was never written
+UNTOUCHED = 'untouched'
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+def run(*args):
+    result = app.test_cli_runner().invoke(args=['images', 'backfill', '--workers', '2',
+                                                '--checkpoint', checkpoint_path, *args])
+    if result.exception:
+        print(result.output)
+    return result
+
+
+def rows():
+    db.session.expire_all()
+    return ItemImage.query.order_by(ItemImage.id).all()
+
+
+print("=" * 60)
+print("Image metadata backfill")
+print("=" * 60)
+
+upload_root = os.path.join(tmp_dir, 'uploads')
+os.makedirs(upload_root)
+app.extensions[STORAGE_EXTENSION_KEY] = LocalStorage(upload_root)
+checkpoint_path = os.path.join(tmp_dir, 'checkpoint.json')
+
+sizes = {}
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    seller = User(username='seller', email='seller@example.com', password_hash='x')
+    db.session.add(seller)
+    db.session.flush()
+    item = Item(name='Camera', category='Electronics', user_id=seller.id, status='approved')
+    db.session.add(item)
+    db.session.flush()
+    for n in range(IMAGES):
+        key = f'{item.id}_{n}_1700000000_photo{n}.png'
+        if n not in MISSING:
+            buffer = io.BytesIO()
+            Image.new('RGB', (800 + n, 600), (n * 30, 90, 160)).save(buffer, 'PNG')
+            with open(os.path.join(upload_root, key), 'wb') as f:
+                f.write(buffer.getvalue())
+            sizes[n] = (800 + n, 600, len(buffer.getvalue()))
+        db.session.add(ItemImage(item_id=item.id, image_url=key, order_index=n))
+    db.session.commit()
+    ids = [image.id for image in rows()]
+
+    print("\nfirst run (--batch-size 2 --limit 4)")
+    result = run('--batch-size', '2', '--limit', '4')
+    check("command succeeds", result.exit_code == 0)
+    check("two batches of two", result.output.count('  batch up to id') == 2)
+    images = rows()
+    check("metadata written for the files that exist",
+          all((images[n].width, images[n].height, images[n].file_size) == sizes[n] for n in range(4) if n not in MISSING))
+    flags = images[2].get_quality_flags()
+    check("missing file flagged", images[2].width is None and [f['type'] for f in flags] == ['file_not_found'])
+    check("rows past the limit untouched", all(image.width is None and image.quality_flags is None for image in images[4:]))
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    check("checkpoint after the last committed row", checkpoint['last_id'] == ids[3] and checkpoint['processed'] == 4)
+
+    # Rows before the checkpoint must not be read again: mark the flagged row
+    ItemImage.query.filter_by(id=ids[2]).update({'quality_flags': UNTOUCHED})
+    db.session.commit()
+
+    print("\nsecond run (resume)")
+    result = run('--batch-size', '2')
+    check("resumes after the checkpoint", result.exit_code == 0 and f"Resuming after ItemImage id {ids[3]}" in result.output)
+    check("only the remaining rows processed", f"Processed {IMAGES - 4} images" in result.output)
+    images = rows()
+    check("earlier rows not reprocessed", images[2].quality_flags == UNTOUCHED)
+    check("remaining rows filled in",
+          all((images[n].width, images[n].height, images[n].file_size) == sizes[n] for n in range(4, IMAGES) if n not in MISSING))
+    check("missing file past the checkpoint flagged", images[5].get_quality_flags()[0]['type'] == 'file_not_found')
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    check("checkpoint at the last row", checkpoint['last_id'] == ids[-1] and checkpoint['processed'] == IMAGES)
+
+    print("\n--reset")
+    result = run('--batch-size', '3', '--reset')
+    check("starts again from the first row missing metadata",
+          result.exit_code == 0 and 'Resuming' not in result.output and f"Processed {len(MISSING)} images" in result.output)
+    check("flagged row re-analysed", rows()[2].get_quality_flags()[0]['type'] == 'file_not_found')
+
+    db.session.remove()
+    db.drop_all()
+
+shutil.rmtree(tmp_dir, ignore_errors=True)
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Image backfill fills metadata in batches and resumes from its checkpoint")
+sys.exit(0)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Mail queue delivery tests against a local aiosmtpd server.
+
+Queues a burst of emails and checks they are all delivered over a single
+SMTP connection, that an unreachable server leaves mail pending for retry,
+and that refused recipients are parked as failed. Skipped when aiosmtpd is
+not installed (pip install aiosmtpd).
+"""
+import os
+import sys
+import socket
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, '.')
+
+try:
+    from aiosmtpd.controller import Controller
+    AIOSMTPD_AVAILABLE = True
+except ImportError:
+    AIOSMTPD_AVAILABLE = False
+
+if not AIOSMTPD_AVAILABLE:
+    print("- aiosmtpd not installed, skipping mail queue tests")
+    sys.exit(0)
+
+BURST = int(os.getenv('MAIL_BURST', 50))
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'mail_queue.db')}"
+
+from app import app, db, mail
+from models import OutgoingEmail
+from mail_queue import queue_email, MailDeliveryWorker
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith('bounce@'):
+            return '550 No such user'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        self.messages.append(envelope)
+        return '250 Message accepted'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+port = free_port()
+app.config.update(
+    MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_TLS=False, MAIL_USE_SSL=False,
+    MAIL_USERNAME=None, MAIL_PASSWORD=None, MAIL_SUPPRESS_SEND=False,
+    MAIL_QUEUE_WORKER_ENABLED=False, MAIL_RATE_LIMIT=0,
+)
+mail.init_app(app)
+
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+def queue_burst(count, prefix):
+    for n in range(count):
+        queue_email(f'{prefix} {n}', [f'user{n}@example.com'], f'<p>{prefix} {n}</p>')
+    db.session.commit()
+
+
+handler = RecordingHandler()
+controller = Controller(handler, hostname='127.0.0.1', port=port)
+
+print("=" * 60)
+print(f"Mail queue delivery ({BURST} emails, SMTP on port {port})")
+print("=" * 60)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    worker = MailDeliveryWorker(app)
+
+    # Server down: everything stays pending with a backoff
+    queue_burst(3, 'Offline')
+    worker.drain()
+    offline = OutgoingEmail.query.filter(OutgoingEmail.subject.like('Offline%')).all()
+    check("unreachable server leaves mail pending", all(e.status == 'pending' for e in offline))
+    check("failed attempt recorded with error and backoff",
+          all(e.attempts == 1 and e.last_error and e.available_at > datetime.utcnow() for e in offline))
+
+    controller.start()
+    try:
+        # Retry once the server is back
+        OutgoingEmail.query.update({OutgoingEmail.available_at: datetime.utcnow()})
+        db.session.commit()
+        queue_burst(BURST, 'Burst')
+        queue_email('Bounce', ['bounce@example.com'], '<p>bounce</p>')
+        db.session.commit()
+
+        sent = worker.drain()
+        worker.close()
+
+        statuses = dict(db.session.query(OutgoingEmail.status, db.func.count()).group_by(OutgoingEmail.status).all())
+        check(f"{BURST + 3} emails sent (got {sent})", sent == BURST + 3)
+        check("server received every message", len(handler.messages) == BURST + 3)
+        check("burst reused one SMTP connection", len(handler.sessions) == 1)
+        check("refused recipient parked as failed", statuses.get('failed') == 1)
+        check("nothing left pending", 'pending' not in statuses and 'processing' not in statuses)
+    finally:
+        controller.stop()
+        db.session.remove()
+        db.drop_all()
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Mail queue delivers in batches over a pooled connection and retries failures")
+sys.exit(0)
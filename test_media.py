@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Media serving tests (/media/<filename>).
+
+- Uploads are served with a strong content-hash ETag and a one-year
+  immutable Cache-Control; If-None-Match with that ETag gets a 304.
+- Missing and traversal-style keys (../x) get a plain-text 404 and never
+  reach files outside the upload root.
+- With MEDIA_X_ACCEL_PREFIX set, the body is left to nginx via
+  X-Accel-Redirect, with the same caching headers and 304 handling.
+"""
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'media.db')}"
+
+from app import app
+from storage import LocalStorage, STORAGE_EXTENSION_KEY
+
+KEY = '42_0_1700000000_photo.jpg'
+CONTENT = b'fake-image-bytes' * 64
+BASE_URL = 'https://localhost'
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+print("=" * 60)
+print("Media serving")
+print("=" * 60)
+
+upload_root = os.path.join(tmp_dir, 'uploads')
+os.makedirs(upload_root)
+with open(os.path.join(upload_root, KEY), 'wb') as f:
+    f.write(CONTENT)
+# Outside the upload root: must never be served
+with open(os.path.join(tmp_dir, 'secret.txt'), 'wb') as f:
+    f.write(b'secret')
+app.extensions[STORAGE_EXTENSION_KEY] = LocalStorage(upload_root)
+app.config['MEDIA_X_ACCEL_PREFIX'] = None
+client = app.test_client()
+
+print("\nsend_file")
+response = client.get(f'/media/{KEY}', base_url=BASE_URL)
+etag, weak = response.get_etag()
+check("file served", response.status_code == 200 and response.data == CONTENT)
+check("strong content-hash ETag", not weak and etag == hashlib.sha256(CONTENT).hexdigest()[:32])
+cache_control = response.cache_control
+check("immutable one-year Cache-Control",
+      cache_control.public and cache_control.immutable and cache_control.max_age == 31536000)
+check("no session cookie", 'Set-Cookie' not in response.headers)
+
+response = client.get(f'/media/{KEY}', base_url=BASE_URL, headers={'If-None-Match': f'"{etag}"'})
+check("If-None-Match with the ETag gets 304", response.status_code == 304 and response.data == b'')
+response = client.get(f'/media/{KEY}', base_url=BASE_URL, headers={'If-None-Match': '"stale"'})
+check("other ETag gets the file", response.status_code == 200 and response.data == CONTENT)
+
+print("\nnot found")
+for label, path in (('missing key', '/media/nope.jpg'),
+                    ('traversal key', '/media/../secret.txt'),
+                    ('encoded traversal', '/media/%2e%2e/secret.txt'),
+                    ('dot-dot only', '/media/..%2f..')):
+    response = client.get(path, base_url=BASE_URL)
+    check(f"{label}: plain-text 404", response.status_code == 404 and response.mimetype == 'text/plain'
+          and b'secret' not in response.data)
+
+print("\nX-Accel-Redirect")
+app.config['MEDIA_X_ACCEL_PREFIX'] = '/protected-uploads/'
+response = client.get(f'/media/{KEY}', base_url=BASE_URL)
+check("nginx offload header, empty body",
+      response.status_code == 200 and response.headers.get('X-Accel-Redirect') == f'/protected-uploads/{KEY}'
+      and response.data == b'')
+check("content type from the key", response.mimetype == 'image/jpeg')
+check("same ETag and Cache-Control", response.get_etag() == (etag, False) and response.cache_control.immutable)
+response = client.get(f'/media/{KEY}', base_url=BASE_URL, headers={'If-None-Match': f'"{etag}"'})
+check("304 answered without nginx", response.status_code == 304 and 'X-Accel-Redirect' not in response.headers)
+app.config['MEDIA_X_ACCEL_PREFIX'] = None
+
+shutil.rmtree(tmp_dir, ignore_errors=True)
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Uploads are served with strong validators and long-lived caching")
+sys.exit(0)
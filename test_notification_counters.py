@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+"""
+Notification counter tests.
+
+- User.notification_count / unread_notification_count follow every kind of
+  write: ORM adds, bulk inserts, mark read, mark all read, deletes and the
+  old-notification cleanup.
+- The polling endpoints answer from the counters; /real-time runs no list
+  query when nothing is unread.
+- /api/notifications/stream pushes new notifications and count changes to
+  the user's open connections on commit.
+- Polls carrying the current ETag get a 304 without a notification query;
+  with ?wait=N they are held until the notification version changes, also
+  when the change was committed by another process while this one is busy.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'notification_counters.db')}"
+
+from sqlalchemy import create_engine, event, insert, update
+
+from app import app, db, limiter
+from models import User, Notification
+from notifications import NotificationService
+from notification_events import get_broadcaster
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['OUTBOX_WORKER_ENABLED'] = False
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+if limiter is not None:
+    limiter.enabled = False
+
+BASE_URL = 'https://localhost'
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+def counters(user_id):
+    db.session.expire_all()
+    user = db.session.get(User, user_id)
+    actual = (Notification.query.filter_by(user_id=user_id).count(),
+              Notification.query.filter_by(user_id=user_id, is_read=False).count())
+    return (user.notification_count, user.unread_notification_count), actual
+
+
+def check_counters(label, user_id, expected):
+    stored, actual = counters(user_id)
+    check(f"{label}: {stored}", stored == actual == expected)
+
+
+print("=" * 60)
+print("Notification counters")
+print("=" * 60)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    alice = User(username='alice', email='alice@example.com', password_hash='x')
+    bob = User(username='bob', email='bob@example.com', password_hash='x')
+    db.session.add_all([alice, bob])
+    db.session.commit()
+    alice_id, bob_id = alice.id, bob.id
+
+    print("\nwrites")
+    first = NotificationService.create_notification(alice_id, 'one', send_email=False)
+    NotificationService.create_notification(alice_id, 'two', send_email=False)
+    check_counters("create_notification", alice_id, (2, 2))
+
+    db.session.add(Notification(user_id=alice_id, message='read already', is_read=True))
+    db.session.commit()
+    check_counters("ORM add of a read notification", alice_id, (3, 2))
+
+    db.session.execute(insert(Notification), [
+        {'user_id': alice_id, 'message': 'bulk'},
+        {'user_id': bob_id, 'message': 'bulk'},
+        {'user_id': bob_id, 'message': 'bulk'},
+    ])
+    db.session.commit()
+    check_counters("bulk insert", alice_id, (4, 3))
+    check_counters("bulk insert, other user", bob_id, (2, 2))
+
+    NotificationService.mark_as_read(first.id, alice_id)
+    check_counters("mark as read", alice_id, (4, 2))
+
+    NotificationService.mark_all_as_read(alice_id)
+    check_counters("mark all as read", alice_id, (4, 0))
+    check_counters("mark all leaves others alone", bob_id, (2, 2))
+
+    NotificationService.delete_notification(first.id, alice_id)
+    check_counters("delete", alice_id, (3, 0))
+
+    Notification.query.filter_by(user_id=alice_id).update({'timestamp': datetime.utcnow() - timedelta(days=60)})
+    db.session.commit()
+    NotificationService.clear_old_notifications(days=30)
+    check_counters("cleanup of old read notifications", alice_id, (0, 0))
+
+    db.session.add(Notification(user_id=bob_id, message='rolled back'))
+    db.session.flush()
+    db.session.rollback()
+    check_counters("rollback changes nothing", bob_id, (2, 2))
+
+print("\npolling")
+client = app.test_client()
+with client.session_transaction(base_url=BASE_URL) as sess:
+    sess['_user_id'] = str(alice_id)
+    sess['_fresh'] = True
+
+statements = []
+
+
+def record(conn, cursor, statement, *args):
+    statements.append(statement)
+
+
+with app.app_context():
+    event.listen(db.engine, 'before_cursor_execute', record)
+response = client.get('/api/notifications/real-time', base_url=BASE_URL)
+check("real-time with nothing unread",
+      response.get_json()['unread_count'] == 0 and response.get_json()['notifications'] == [])
+check("no notification query for an idle user", not any('FROM notification' in s for s in statements))
+
+with app.app_context():
+    event.remove(db.engine, 'before_cursor_execute', record)
+    NotificationService.create_notification(alice_id, 'new', send_email=False)
+response = client.get('/api/notifications/real-time', base_url=BASE_URL)
+check("real-time lists unread", response.get_json()['unread_count'] == 1 and len(response.get_json()['notifications']) == 1)
+response = client.get('/api/notifications/unread-count', base_url=BASE_URL)
+check("unread-count", response.get_json()['unread_count'] == 1)
+response = client.get('/api/notifications/list', base_url=BASE_URL)
+check("list total", response.get_json()['total'] == 1)
+response = client.get('/notifications?filter=all', base_url=BASE_URL)
+check("notifications page renders", response.status_code == 200)
+
+print("\nstream")
+app.config['NOTIFICATION_STREAM_HEARTBEAT'] = 1
+response = client.get('/api/notifications/stream', base_url=BASE_URL, buffered=False)
+chunks = iter(response.response)
+
+
+def next_event():
+    for chunk in chunks:
+        if chunk.startswith(b'data: '):
+            return json.loads(chunk[len(b'data: '):])
+
+
+event_data = next_event()
+check("initial event carries the unread count", event_data['type'] == 'initial' and event_data['unread_count'] == 1)
+with app.app_context():
+    NotificationService.create_notification(alice_id, 'pushed', send_email=False)
+    NotificationService.create_notification(bob_id, 'not for alice', send_email=False)
+event_data = next_event()
+check("new notification pushed", event_data['unread_count'] == 2
+      and [n['message'] for n in event_data['notifications']] == ['pushed'])
+with app.app_context():
+    NotificationService.mark_all_as_read(alice_id)
+event_data = next_event()
+check("reading pushes the new count", event_data['unread_count'] == 0 and event_data['notifications'] == [])
+response.close()
+
+print("\nconditional polls")
+statements.clear()
+response = client.get('/api/notifications/unread-count', base_url=BASE_URL)
+etag = response.headers.get('ETag')
+check("poll answers carry an ETag", response.status_code == 200 and etag)
+with app.app_context():
+    event.listen(db.engine, 'before_cursor_execute', record)
+response = client.get('/api/notifications/real-time', base_url=BASE_URL)
+real_time_etag = response.headers.get('ETag')
+check("ETag differs per endpoint", real_time_etag != etag)
+statements.clear()
+response = client.get('/api/notifications/real-time', base_url=BASE_URL, headers={'If-None-Match': real_time_etag})
+check("unchanged poll gets 304", response.status_code == 304 and not response.data)
+check("304 without a notification query", not any('FROM notification' in s for s in statements))
+with app.app_context():
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+results = {}
+
+
+def long_poll():
+    started = time.monotonic()
+    results['response'] = client.get('/api/notifications/real-time?wait=10', base_url=BASE_URL,
+                                     headers={'If-None-Match': real_time_etag})
+    results['seconds'] = time.monotonic() - started
+
+
+poller = threading.Thread(target=long_poll)
+poller.start()
+time.sleep(0.5)
+check("long poll is held while nothing changes", poller.is_alive())
+with app.app_context():
+    NotificationService.create_notification(alice_id, 'long polled', send_email=False)
+poller.join(10)
+response = results.get('response')
+check("long poll answers on change", response is not None and response.status_code == 200
+      and results['seconds'] < 5 and response.get_json()['unread_count'] == 1
+      and response.headers.get('ETag') != real_time_etag)
+response = client.get('/api/notifications/unread-count?wait=1', base_url=BASE_URL,
+                      headers={'If-None-Match': client.get('/api/notifications/unread-count', base_url=BASE_URL).headers['ETag']})
+check("long poll times out with 304", response.status_code == 304)
+
+print("\nchanges from other processes")
+with app.app_context():
+    get_broadcaster(app).poll_interval = 0.5
+    # Another worker's commit: it reaches this process only through the version poll
+    other_process = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+etag = client.get('/api/notifications/real-time', base_url=BASE_URL).headers['ETag']
+busy = threading.Event()
+
+
+def local_traffic():
+    # Steady local commits for another user keep waking the broadcaster early
+    while not busy.is_set():
+        with app.app_context():
+            NotificationService.create_notification(bob_id, 'local', send_email=False)
+        time.sleep(0.1)
+
+
+traffic = threading.Thread(target=local_traffic)
+traffic.start()
+results.clear()
+real_time_etag = etag
+poller = threading.Thread(target=long_poll)
+poller.start()
+time.sleep(1)
+with other_process.begin() as connection:
+    connection.execute(update(User).where(User.id == alice_id).values(
+        notification_version=User.notification_version + 1,
+        unread_notification_count=User.unread_notification_count + 1))
+poller.join(10)
+busy.set()
+traffic.join()
+other_process.dispose()
+response = results.get('response')
+check("long poll sees another process's commit despite local traffic",
+      response is not None and response.status_code == 200 and results['seconds'] < 5
+      and response.headers.get('ETag') != etag)
+
+with app.app_context():
+    db.session.remove()
+    db.drop_all()
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Notification counters follow every write")
+sys.exit(0)
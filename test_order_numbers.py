@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Concurrency test for order number generation.
+
+Fires 200 simultaneous /finalize_purchase requests (one buyer and one item
+each) and checks that every checkout gets an order whose number is unique and
+that today's sequence is exactly 1..N with no gaps. The checkouts' outbox
+events are then drained and must produce one confirmation notification each.
+
+Runs against a throwaway SQLite file by default; point TEST_DATABASE_URL at a
+scratch Postgres database to exercise real row locking:
+
+    TEST_DATABASE_URL=postgresql://localhost/barterex_test python test_order_numbers.py
+"""
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime
+
+sys.path.insert(0, '.')
+
+CHECKOUTS = int(os.getenv('CHECKOUTS', 200))
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = os.getenv(
+    'TEST_DATABASE_URL', f"sqlite:///{os.path.join(tmp_dir, 'order_numbers.db')}"
+)
+
+from app import app, db, limiter
+from models import User, Item, Order, OrderNumberCounter, OutboxEvent, Notification, SystemSettings
+from outbox import process_pending
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['MAIL_SUPPRESS_SEND'] = True
+app.config['OUTBOX_WORKER_ENABLED'] = False  # drained explicitly below
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+app.config['RECEIPT_CACHE_DIR'] = os.path.join(tmp_dir, 'receipts')
+app.extensions['mail'].suppress = True
+if limiter is not None:
+    limiter.enabled = False
+
+print("=" * 60)
+print(f"Order number concurrency test ({CHECKOUTS} simultaneous checkouts)")
+print(f"Database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+print("=" * 60)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    SystemSettings.get_settings()
+
+    seller = User(username='seller', email='seller@example.com', password_hash='x')
+    db.session.add(seller)
+    db.session.flush()
+
+    buyer_ids, item_ids = [], []
+    for n in range(CHECKOUTS):
+        buyer = User(username=f'buyer{n}', email=f'buyer{n}@example.com', password_hash='x', credits=1000)
+        item = Item(name=f'Item {n}', category='Electronics', value=100, user_id=seller.id,
+                    is_available=True, is_approved=True, status='approved')
+        db.session.add_all([buyer, item])
+        db.session.flush()
+        buyer_ids.append(buyer.id)
+        item_ids.append(item.id)
+    db.session.commit()
+
+barrier = threading.Barrier(CHECKOUTS)
+statuses = []
+statuses_lock = threading.Lock()
+
+
+def checkout(buyer_id, item_id):
+    client = app.test_client()
+    with client.session_transaction(base_url='https://localhost') as sess:
+        sess['_user_id'] = str(buyer_id)
+        sess['_fresh'] = True
+        sess['pending_checkout_items'] = [item_id]
+        sess['pending_delivery'] = {'method': 'home delivery', 'delivery_address': '1 Test Street'}
+    barrier.wait()
+    response = client.post('/finalize_purchase', base_url='https://localhost')
+    with statuses_lock:
+        statuses.append(response.status_code)
+
+
+threads = [threading.Thread(target=checkout, args=pair) for pair in zip(buyer_ids, item_ids)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+with app.app_context():
+    orders = Order.query.all()
+    numbers = [o.order_number for o in orders]
+    today = datetime.utcnow().strftime('%Y%m%d')
+    sequence = sorted(int(n.rsplit('-', 1)[1]) for n in numbers if n.startswith(f'ORD-{today}-'))
+    counter = db.session.get(OrderNumberCounter, today)
+
+    check(f"all {CHECKOUTS} requests redirected", statuses.count(302) == CHECKOUTS)
+    check(f"{CHECKOUTS} orders created (got {len(orders)})", len(orders) == CHECKOUTS)
+    check("order numbers are unique", len(set(numbers)) == len(numbers))
+    check("today's sequence is gap-free 1..N", sequence == list(range(1, len(sequence) + 1)))
+    check("counter matches issued numbers", counter is not None and counter.last_value == len(sequence))
+
+    pending = OutboxEvent.query.filter_by(status='pending').count()
+    check(f"outbox holds notification + email + receipt per order (got {pending})", pending == 3 * CHECKOUTS)
+    while process_pending():
+        pass
+    check("outbox drained", OutboxEvent.query.filter(OutboxEvent.status != 'done').count() == 0)
+    check("one order notification per checkout", Notification.query.filter_by(notification_type='order').count() == CHECKOUTS)
+
+    db.session.remove()
+    db.drop_all()
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Order numbers are unique and gap-free under concurrency")
+sys.exit(0)
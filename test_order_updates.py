@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Incremental order update API tests (/admin/api/order-updates).
+
+- Paging with since=<cursor> returns every changed order exactly once,
+  oldest first, with has_more until the settled orders are exhausted.
+- An order whose transaction commits late - stamped with an updated_at
+  before orders a poll already returned - is still returned by the next
+  poll: the cursor never moves past now - ORDER_UPDATES_SETTLE_SECONDS.
+- Counts are only included when something changed; bad cursors get 400.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'order_updates.db')}"
+
+from app import app, db, limiter
+from models import User, Admin, Order
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['OUTBOX_WORKER_ENABLED'] = False
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+app.config['ORDER_UPDATES_SETTLE_SECONDS'] = 30
+if limiter is not None:
+    limiter.enabled = False
+
+BASE_URL = 'https://localhost'
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+order_seq = 0
+
+
+def add_order(user_id, updated_at):
+    global order_seq
+    order_seq += 1
+    order = Order(user_id=user_id, delivery_method='pickup', order_number=f'ORD-TEST-{order_seq:05d}',
+                  updated_at=updated_at)
+    db.session.add(order)
+    db.session.commit()
+    return order.id
+
+
+print("=" * 60)
+print("Incremental order updates")
+print("=" * 60)
+
+now = datetime.utcnow()
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    buyer = User(username='buyer', email='buyer@example.com', password_hash='x')
+    admin = Admin(username='admin', email='admin@example.com', password='x')
+    db.session.add_all([buyer, admin])
+    db.session.commit()
+    buyer_id, admin_id = buyer.id, admin.id
+    # Five settled orders, two sharing a timestamp
+    stamps = [now - timedelta(minutes=m) for m in (10, 9, 8, 8, 7)]
+    settled_ids = [add_order(buyer_id, stamp) for stamp in stamps]
+
+client = app.test_client()
+with client.session_transaction(base_url=BASE_URL) as sess:
+    sess['admin_id'] = admin_id
+
+
+def poll(**params):
+    return client.get('/admin/api/order-updates', base_url=BASE_URL, query_string=params).get_json()
+
+
+print("\npaging")
+start = datetime.utcnow() - timedelta(minutes=20)
+cursor = f"{start.isoformat()}_0"
+seen, pages = [], 0
+while True:
+    data = poll(since=cursor, per_page=2)
+    pages += 1
+    seen += [order['id'] for order in data['orders']]
+    cursor = data['cursor']
+    if not data['has_more'] or pages > 10:
+        break
+check("every settled order returned once, in order", seen == settled_ids)
+check("three pages of two", pages == 3)
+
+data = poll(since=cursor)
+check("nothing new: no orders and no counts", data['orders'] == [] and 'stats' not in data)
+
+print("\nlate commit")
+with app.app_context():
+    recent_id = add_order(buyer_id, datetime.utcnow() - timedelta(seconds=1))
+data = poll(since=cursor)
+check("recent order returned", [order['id'] for order in data['orders']] == [recent_id] and 'stats' in data)
+cursor = data['cursor']
+
+# A checkout flushed before the recent order but committed only now
+with app.app_context():
+    late_id = add_order(buyer_id, datetime.utcnow() - timedelta(seconds=10))
+data = poll(since=cursor)
+ids = [order['id'] for order in data['orders']]
+check("late-committing order still returned", late_id in ids)
+check("unsettled order repeated for the client to dedupe", ids == [late_id, recent_id])
+
+print("\ninitial load and errors")
+data = poll()
+check("initial load returns the newest orders first", [order['id'] for order in data['orders']][:2] == [recent_id, late_id])
+check("initial cursor trails the newest orders", poll(since=data['cursor'])['orders'] != [])
+response = client.get('/admin/api/order-updates?since=garbage', base_url=BASE_URL)
+check("invalid cursor rejected", response.status_code == 400)
+
+with app.app_context():
+    db.session.remove()
+    db.drop_all()
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Order updates never skip late-committing orders")
+sys.exit(0)
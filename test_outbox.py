@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Outbox failure-path tests.
+
+- A failing handler's writes are rolled back; the event goes back to
+  'pending' with its last_error and a next attempt pushed out by
+  backoff_seconds(attempts), and is parked as 'failed' after
+  OUTBOX_MAX_ATTEMPTS.
+- The 'level_up' handler adds its notification and queued email in the
+  event's transaction: a failure inside it is retried, and a failed "done"
+  commit does not leave a second notification or email behind on the retry.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'outbox.db')}"
+
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+from app import app, db
+from models import User, Notification, OutboxEvent, OutgoingEmail
+import email_templates
+from outbox import enqueue, handler, process_pending, backoff_seconds, OUTBOX_MAX_ATTEMPTS
+
+app.config['OUTBOX_WORKER_ENABLED'] = False
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+
+LEVEL_UP = {'new_level': 2, 'new_tier': 'Beginner', 'credits_awarded': 50, 'points': 100}
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+@handler('test_always_fails')
+def handle_always_fails(user_id):
+    db.session.add(Notification(user_id=user_id, message='should be rolled back'))
+    raise RuntimeError('boom')
+
+
+def make_due(event_id):
+    db.session.query(OutboxEvent).filter_by(id=event_id).update({'available_at': datetime.utcnow()})
+    db.session.commit()
+
+
+print("=" * 60)
+print("Outbox failure path")
+print("=" * 60)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    user = User(username='trader', email='trader@example.com', password_hash='x', credits=100)
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+
+    print("\nfailing handler")
+    event = enqueue('test_always_fails', user_id=user_id)
+    db.session.commit()
+    event_id = event.id
+
+    started = datetime.utcnow()
+    process_pending()
+    event = db.session.get(OutboxEvent, event_id)
+    check("back to pending after the first failure", event.status == 'pending' and event.attempts == 1)
+    check("error recorded", event.last_error == 'RuntimeError: boom' and event.locked_at is None)
+    delay = (event.available_at - started).total_seconds()
+    check(f"next attempt backed off by {backoff_seconds(1)}s", abs(delay - backoff_seconds(1)) < 5)
+    check("handler's writes rolled back", Notification.query.filter_by(user_id=user_id).count() == 0)
+    check("not retried before the backoff", process_pending() == 0)
+
+    backed_off = True
+    for attempt in range(2, OUTBOX_MAX_ATTEMPTS):
+        make_due(event_id)
+        started = datetime.utcnow()
+        process_pending()
+        event = db.session.get(OutboxEvent, event_id)
+        delay = (event.available_at - started).total_seconds()
+        backed_off = backed_off and event.status == 'pending' and event.attempts == attempt \
+            and abs(delay - backoff_seconds(attempt)) < 5
+    check("delay grows with each attempt", backed_off)
+
+    make_due(event_id)
+    process_pending()
+    event = db.session.get(OutboxEvent, event_id)
+    check(f"'failed' after {OUTBOX_MAX_ATTEMPTS} attempts",
+          event.status == 'failed' and event.attempts == OUTBOX_MAX_ATTEMPTS)
+    make_due(event_id)
+    check("failed events are not claimed again", process_pending() == 0)
+
+    print("\nlevel_up handler")
+    render_email = email_templates.render_email
+
+    def broken_render(*args, **kwargs):
+        raise RuntimeError('template missing')
+
+    email_templates.render_email = broken_render
+    event = enqueue('level_up', user_id=user_id, level_up_info=LEVEL_UP)
+    db.session.commit()
+    event_id = event.id
+    process_pending()
+    email_templates.render_email = render_email
+    event = db.session.get(OutboxEvent, event_id)
+    check("a failure inside the handler reaches the outbox and is retried",
+          event.status == 'pending' and 'template missing' in (event.last_error or ''))
+    check("no notification left behind by the failed attempt",
+          Notification.query.filter_by(user_id=user_id).count() == 0)
+
+    # The "done" commit fails once: the retry must not duplicate anything
+    failed_commits = []
+
+    def fail_done_commit(session):
+        # Other before_commit listeners may flush first, so look at the identity map, not session.dirty
+        if not failed_commits and any(isinstance(obj, OutboxEvent) and obj.status == 'done'
+                                      for obj in session.identity_map.values()):
+            failed_commits.append(1)
+            raise RuntimeError('connection lost')
+
+    sa_event.listen(Session, 'before_commit', fail_done_commit)
+    try:
+        make_due(event_id)
+        process_pending()
+        event = db.session.get(OutboxEvent, event_id)
+        check("failed done commit is retried", failed_commits and event.status == 'pending')
+        make_due(event_id)
+        process_pending()
+    finally:
+        sa_event.remove(Session, 'before_commit', fail_done_commit)
+
+    event = db.session.get(OutboxEvent, event_id)
+    check("event done on the next attempt", event.status == 'done')
+    check("exactly one level up notification",
+          Notification.query.filter_by(user_id=user_id, notification_type='achievement').count() == 1)
+    check("exactly one level up email", OutgoingEmail.query.filter(OutgoingEmail.subject.like('%Level Up%')).count() == 1)
+
+    db.session.remove()
+    db.drop_all()
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Outbox failures back off, park as failed and retry without duplicates")
+sys.exit(0)
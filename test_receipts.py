@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Cached PDF receipt tests.
+
+- The outbox 'receipt' event pre-generates the PDF on disk when an order is
+  created; downloads serve that file with the receipt version as ETag.
+- A repeat download with If-None-Match gets 304.
+- An admin status change queues a rebuild under a new version and the
+  stale file is removed.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'receipts.db')}"
+
+from app import app, db, limiter
+from models import User, Item, Order, OrderItem, Admin, SystemSettings
+from outbox import enqueue, process_pending
+from receipts import receipt_version, receipt_path
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['MAIL_SUPPRESS_SEND'] = True
+app.config['OUTBOX_WORKER_ENABLED'] = False
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+app.config['RECEIPT_CACHE_DIR'] = os.path.join(tmp_dir, 'receipts')
+app.extensions['mail'].suppress = True
+if limiter is not None:
+    limiter.enabled = False
+
+BASE_URL = 'https://localhost'
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+print("=" * 60)
+print("Cached PDF receipts")
+print("=" * 60)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    SystemSettings.get_settings()
+
+    seller = User(username='seller', email='seller@example.com', password_hash='x')
+    buyer = User(username='buyer', email='buyer@example.com', password_hash='x', credits=700)
+    admin = Admin(username='admin', email='admin@example.com', password='x')
+    db.session.add_all([seller, buyer, admin])
+    db.session.flush()
+    item = Item(name='Camera', category='Electronics', value=300, user_id=seller.id,
+                is_available=False, is_approved=True, status='approved')
+    order = Order(user_id=buyer.id, delivery_method='home delivery', delivery_address='1 Test Street',
+                  order_number='ORD-20261019-00001', total_credits=300, credits_used=300,
+                  credits_balance_before=1000, credits_balance_after=700)
+    db.session.add_all([item, order])
+    db.session.add(OrderItem(order=order, item=item))
+    db.session.flush()
+    enqueue('receipt', order_id=order.id)
+    db.session.commit()
+    buyer_id, admin_id, order_id = buyer.id, admin.id, order.id
+    first_version = receipt_version(order)
+
+    process_pending()
+    first_path = receipt_path(order_id, first_version)
+    check("outbox pre-generated the receipt", os.path.exists(first_path))
+    first_mtime = os.path.getmtime(first_path)
+
+print("\ndownloads")
+client = app.test_client()
+with client.session_transaction(base_url=BASE_URL) as sess:
+    sess['_user_id'] = str(buyer_id)
+    sess['_fresh'] = True
+
+url = f'/order/{order_id}/download-receipt'
+response = client.get(url, base_url=BASE_URL)
+check("download serves the cached PDF", response.status_code == 200 and response.data.startswith(b'%PDF'))
+check("ETag is the receipt version", response.headers.get('ETag') == f'"{first_version}"')
+check("download did not rebuild the file", os.path.getmtime(first_path) == first_mtime)
+response.close()
+
+response = client.get(url, base_url=BASE_URL, headers={'If-None-Match': f'"{first_version}"'})
+check("repeat download with If-None-Match answers 304", response.status_code == 304)
+
+print("\nstatus change")
+admin_client = app.test_client()
+with admin_client.session_transaction(base_url=BASE_URL) as sess:
+    sess['admin_id'] = admin_id
+admin_client.post(f'/admin/update_order_status/{order_id}', base_url=BASE_URL)
+
+with app.app_context():
+    process_pending()
+    order = db.session.get(Order, order_id)
+    new_version = receipt_version(order)
+    check("status change produces a new version", order.status == 'Shipped' and new_version != first_version)
+    check("new version pre-generated", os.path.exists(receipt_path(order_id, new_version)))
+    check("stale version removed", not os.path.exists(first_path))
+
+response = client.get(url, base_url=BASE_URL, headers={'If-None-Match': f'"{first_version}"'})
+check("old ETag no longer matches", response.status_code == 200 and response.headers.get('ETag') == f'"{new_version}"')
+response.close()
+
+with app.app_context():
+    db.session.remove()
+    db.drop_all()
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Receipts are built once per version and served from disk")
+sys.exit(0)
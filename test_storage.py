@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+Storage backend tests.
+
+Always exercises LocalStorage. Exercises S3Storage against moto when it is
+installed, or against a running MinIO when S3_TEST_ENDPOINT_URL is set, e.g.:
+
+    docker run -p 9000:9000 minio/minio server /data
+    S3_TEST_ENDPOINT_URL=http://localhost:9000 AWS_ACCESS_KEY_ID=minioadmin \\
+        AWS_SECRET_ACCESS_KEY=minioadmin python test_storage.py
+
+S3Storage's handling of failed uploads (retries, local URLs until the object
+is in the bucket) is always exercised with a stub client.
+"""
+import os
+import sys
+import shutil
+import tempfile
+from io import BytesIO
+
+sys.path.insert(0, '.')
+
+from storage import LocalStorage, S3Storage, BOTO3_AVAILABLE
+
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+def exercise(storage):
+    key = storage.save(BytesIO(b'fake-image-bytes'), 'nested/path/42_0_1700000000_photo.jpg')
+    storage.wait()
+    check("save() normalises key to bare filename", key == '42_0_1700000000_photo.jpg')
+    check("exists() after save", storage.exists(key))
+    check("open() returns stored bytes", storage.open(key) == b'fake-image-bytes')
+    check("url() references the key", key in storage.url(key))
+    storage.delete(key)
+    check("exists() false after delete", not storage.exists(key))
+    check("open() returns None after delete", storage.open(key) is None)
+    storage.delete(key)  # deleting twice must not raise
+
+
+print("=" * 60)
+print("LocalStorage")
+print("=" * 60)
+tmp = tempfile.mkdtemp()
+try:
+    exercise(LocalStorage(tmp))
+finally:
+    shutil.rmtree(tmp, ignore_errors=True)
+
+print("\n" + "=" * 60)
+print("S3Storage")
+print("=" * 60)
+endpoint = os.getenv('S3_TEST_ENDPOINT_URL')
+try:
+    import moto
+    MOTO_AVAILABLE = True
+except ImportError:
+    MOTO_AVAILABLE = False
+
+if not BOTO3_AVAILABLE or not (endpoint or MOTO_AVAILABLE):
+    print("  - skipped (needs boto3 plus moto or S3_TEST_ENDPOINT_URL)")
+else:
+    import boto3
+
+    def run_s3():
+        client = boto3.client('s3', endpoint_url=endpoint, region_name='us-east-1')
+        bucket = 'barterex-test'
+        try:
+            client.create_bucket(Bucket=bucket)
+        except client.exceptions.BucketAlreadyOwnedByYou:
+            pass
+        cache = tempfile.mkdtemp()
+        try:
+            storage = S3Storage(bucket, cache, client=client, async_uploads=True)
+            exercise(storage)
+
+            # Write-through cache: a cold cache is refilled from the bucket
+            key = storage.save(BytesIO(b'cached'), 'cold.jpg')
+            storage.wait()
+            os.remove(os.path.join(cache, key))
+            check("open() refills cache from bucket", storage.open(key) == b'cached')
+            check("refilled copy is on local disk", storage.local_path(key) is not None)
+            check("presigned URL is memoised", storage.url(key) == storage.url(key))
+            storage.delete(key)
+        finally:
+            shutil.rmtree(cache, ignore_errors=True)
+
+    if endpoint:
+        run_s3()
+    else:
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+        with moto.mock_aws():
+            run_s3()
+
+print("\n" + "=" * 60)
+print("S3Storage failed uploads")
+print("=" * 60)
+
+
+class FlakyClient:
+    """Stands in for a boto3 client whose first `failures` uploads fail."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.uploads = 0
+        self.uploaded = set()
+
+    def upload_file(self, path, bucket, key, ExtraArgs=None):
+        self.uploads += 1
+        if self.uploads <= self.failures:
+            raise ConnectionError('bucket unreachable')
+        self.uploaded.add(key)
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://{Params['Bucket']}.example/{Params['Key']}?signed"
+
+
+cache = tempfile.mkdtemp()
+try:
+    client = FlakyClient(failures=2)
+    storage = S3Storage('bucket', cache, client=client, upload_attempts=3, upload_retry_delay=0)
+    key = storage.save(BytesIO(b'retried'), 'retried.jpg')
+    storage.wait()
+    check("upload retried until it succeeds", client.uploads == 3 and key in client.uploaded)
+    check("presigned URL once uploaded", storage.url(key).startswith('https://bucket.example/'))
+
+    client = FlakyClient(failures=3)
+    storage = S3Storage('bucket', cache, client=client, upload_attempts=3, upload_retry_delay=0,
+                        upload_retry_after=3600)
+    key = storage.save(BytesIO(b'stuck'), 'stuck.jpg')
+    storage.wait()
+    check("gives up after upload_attempts", client.uploads == 3 and key not in client.uploaded)
+    check("failed upload keeps the local /media URL", storage.url(key) == f'/media/{key}')
+    check("local copy still served", storage.open(key) == b'stuck')
+    storage.wait()
+    check("no retry before upload_retry_after", client.uploads == 3)
+
+    storage.upload_retry_after = 0
+    check("retried upload keeps the local URL while pending", storage.url(key) == f'/media/{key}')
+    storage.wait()
+    check("later retry uploads the file", client.uploads == 4 and key in client.uploaded)
+    check("presigned URL after the retry succeeds", storage.url(key).startswith('https://bucket.example/'))
+
+    client = FlakyClient(failures=1)
+    storage = S3Storage('bucket', cache, client=client, async_uploads=False, upload_attempts=1)
+    try:
+        storage.save(BytesIO(b'sync'), 'sync.jpg')
+        raised = False
+    except ConnectionError:
+        raised = True
+    check("synchronous upload failure raises", raised and storage.url('sync.jpg') == '/media/sync.jpg')
+finally:
+    shutil.rmtree(cache, ignore_errors=True)
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ All storage checks passed")
+sys.exit(0)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+"""
+Wishlist digest tests.
+
+- A bulk approval that matches several of a user's wishlists sends that user
+  one email and one in-app notification (instant digest), not one per match.
+- Users on hourly digests get nothing until `flask wishlist send-digests
+  --frequency hourly` runs, then one digest for everything pending.
+- Delivered matches are marked sent and are not delivered again.
+- A wishlist added through /wishlist/add is backfilled in the background
+  with listings that were already live, under one notification.
+- Two digest runs that overlap (outbox threads in different workers) deliver
+  each pending match once between them.
+"""
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'wishlist_digest.db')}"
+
+from app import app, db, limiter
+from models import User, Item, Admin, Notification, OutgoingEmail, Wishlist, WishlistMatch, SystemSettings
+from outbox import process_pending
+from wishlist_digest import send_digests
+from sqlalchemy import event
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['MAIL_SUPPRESS_SEND'] = True
+app.config['OUTBOX_WORKER_ENABLED'] = False
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+app.extensions['mail'].suppress = True
+if limiter is not None:
+    limiter.enabled = False
+
+BASE_URL = 'https://localhost'
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+def wishlist_emails(address):
+    return OutgoingEmail.query.filter(OutgoingEmail.recipients.like(f'%{address}%')).count()
+
+
+def wishlist_notifications(user_id):
+    return Notification.query.filter_by(user_id=user_id, notification_type='wishlist_match').all()
+
+
+print("=" * 60)
+print("Wishlist digests")
+print("=" * 60)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    SystemSettings.get_settings()
+
+    seller = User(username='seller', email='seller@example.com', password_hash='x')
+    instant = User(username='instant', email='instant@example.com', password_hash='x')
+    hourly = User(username='hourly', email='hourly@example.com', password_hash='x',
+                  notification_preferences={'wishlist_digest': 'hourly'})
+    admin = Admin(username='admin', email='admin@example.com', password='x')
+    db.session.add_all([seller, instant, hourly, admin])
+    db.session.flush()
+    for user in (instant, hourly):
+        db.session.add_all([
+            Wishlist(user_id=user.id, search_type='category', category='Electronics', item_name='electronics'),
+            Wishlist(user_id=user.id, search_type='item', item_name='camera'),
+        ])
+    items = [Item(name=name, category='Electronics', user_id=seller.id, status='pending')
+             for name in ('Camera', 'Phone', 'Radio')]
+    db.session.add_all(items)
+    db.session.commit()
+    item_ids = [item.id for item in items]
+    instant_id, hourly_id, admin_id = instant.id, hourly.id, admin.id
+
+client = app.test_client()
+with client.session_transaction(base_url=BASE_URL) as sess:
+    sess['admin_id'] = admin_id
+response = client.post('/admin/api/items/bulk-approve', base_url=BASE_URL,
+                       json={'items': [{'item_id': item_id, 'value': 100} for item_id in item_ids]})
+check("bulk approval succeeds", response.status_code == 200 and len(response.get_json()['approved']) == 3)
+
+print("\ninstant")
+with app.app_context():
+    while process_pending():
+        pass
+    # 3 category matches + 1 name match each
+    check("matches recorded for both users",
+          WishlistMatch.query.join(Wishlist).filter(Wishlist.user_id == instant_id).count() == 4
+          and WishlistMatch.query.join(Wishlist).filter(Wishlist.user_id == hourly_id).count() == 4)
+    notifications = wishlist_notifications(instant_id)
+    check("instant user gets one notification for four matches",
+          len(notifications) == 1 and len(notifications[0].data['item_ids']) == 4)
+    check("instant user gets one email", wishlist_emails('instant@example.com') == 1)
+    check("instant matches marked sent", WishlistMatch.query.join(Wishlist).filter(
+        Wishlist.user_id == instant_id, WishlistMatch.notification_sent_at == None).count() == 0)
+    check("hourly user not notified yet",
+          not wishlist_notifications(hourly_id) and wishlist_emails('hourly@example.com') == 0)
+
+print("\nhourly")
+runner = app.test_cli_runner()
+result = runner.invoke(args=['wishlist', 'send-digests', '--frequency', 'hourly'])
+check("hourly run reports one user", 'to 1 user(s) covering 4 match(es)' in result.output)
+
+with app.app_context():
+    check("hourly user gets one notification and one email",
+          len(wishlist_notifications(hourly_id)) == 1 and wishlist_emails('hourly@example.com') == 1)
+    wishlist = Wishlist.query.filter_by(user_id=hourly_id, search_type='category').one()
+    check("wishlist counters updated", wishlist.notification_count == 3 and wishlist.last_notified_at is not None)
+
+result = runner.invoke(args=['wishlist', 'send-digests', '--frequency', 'hourly'])
+check("nothing is delivered twice", 'to 0 user(s)' in result.output)
+
+print("\npreferences")
+user_client = app.test_client()
+with user_client.session_transaction(base_url=BASE_URL) as sess:
+    sess['_user_id'] = str(instant_id)
+    sess['_fresh'] = True
+response = user_client.put('/api/notifications/preferences', base_url=BASE_URL, json={'wishlist_digest': 'weekly'})
+check("unknown frequency rejected", response.status_code == 400)
+response = user_client.put('/api/notifications/preferences', base_url=BASE_URL, json={'wishlist_digest': 'daily'})
+with app.app_context():
+    saved = db.session.get(User, instant_id).notification_preferences or {}
+    check("frequency saved", response.status_code == 200 and saved.get('wishlist_digest') == 'daily')
+
+print("\nbackfill")
+response = user_client.post('/wishlist/add', base_url=BASE_URL, json={'search_type': 'item', 'item_name': 'radio'})
+check("wishlist added", response.status_code in (200, 201))
+with app.app_context():
+    wishlist_id = Wishlist.query.filter_by(user_id=instant_id, item_name='radio').one().id
+    check("backfill deferred to the outbox", WishlistMatch.query.filter_by(wishlist_id=wishlist_id).count() == 0)
+    before = len(wishlist_notifications(instant_id))
+    while process_pending():
+        pass
+    backfilled = WishlistMatch.query.filter_by(wishlist_id=wishlist_id).all()
+    check("existing listing matched", [match.item_id for match in backfilled] == [item_ids[2]])
+    check("backfilled matches not re-sent as a digest", all(match.notification_sent_at for match in backfilled))
+    check("one backfill notification", len(wishlist_notifications(instant_id)) == before + 1)
+
+print("\noverlapping runs")
+with app.app_context():
+    racer = User(username='racer', email='racer@example.com', password_hash='x')
+    db.session.add(racer)
+    db.session.flush()
+    wishlist = Wishlist(user_id=racer.id, search_type='category', category='Electronics', item_name='electronics')
+    db.session.add(wishlist)
+    db.session.flush()
+    db.session.add_all([WishlistMatch(wishlist_id=wishlist.id, item_id=item_id)
+                        for item_id in item_ids])
+    db.session.commit()
+    racer_id = racer.id
+
+# Both runs read the pending matches before either claims them
+claim_barrier = threading.Barrier(2, timeout=10)
+waited = threading.local()
+
+
+def hold_before_claim(conn, cursor, statement, parameters, context, executemany):
+    if statement.startswith('UPDATE wishlist_match') and not getattr(waited, 'done', False):
+        waited.done = True
+        claim_barrier.wait()
+
+
+run_results = []
+
+
+def run_digest():
+    with app.app_context():
+        run_results.append(send_digests('instant', user_ids=[racer_id]))
+
+
+with app.app_context():
+    event.listen(db.engine, 'before_cursor_execute', hold_before_claim)
+runs = [threading.Thread(target=run_digest) for _ in range(2)]
+for t in runs:
+    t.start()
+for t in runs:
+    t.join()
+with app.app_context():
+    event.remove(db.engine, 'before_cursor_execute', hold_before_claim)
+    check("both runs finished", len(run_results) == 2)
+    check("matches handled once between them", sorted(matches for _, matches in run_results) == [0, 3])
+    check("one notification and one email",
+          len(wishlist_notifications(racer_id)) == 1 and wishlist_emails('racer@example.com') == 1)
+    check("all matches marked sent", WishlistMatch.query.join(Wishlist).filter(
+        Wishlist.user_id == racer_id, WishlistMatch.notification_sent_at == None).count() == 0)
+
+with app.app_context():
+    db.session.remove()
+    db.drop_all()
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Wishlist matches are delivered as one digest per user")
+sys.exit(0)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+Wishlist list and export tests.
+
+- /wishlist/view?sort_by=matches orders by match count in SQL, so paging
+  through every page gives one consistent order (ties broken by id) with
+  no repeats or gaps, in both directions; counts never include another
+  user's matches.
+- /wishlist/export/csv streams one row per wishlist, in batches, with the
+  same match counts and the list filters applied; 404 when nothing matches.
+"""
+import csv
+import io
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, '.')
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'wishlist_listing.db')}"
+
+from app import app, db, limiter
+from models import User, Item, Wishlist, WishlistMatch
+import routes.wishlist
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['OUTBOX_WORKER_ENABLED'] = False
+app.config['MAIL_QUEUE_WORKER_ENABLED'] = False
+if limiter is not None:
+    limiter.enabled = False
+routes.wishlist.EXPORT_BATCH_ROWS = 2
+
+BASE_URL = 'https://localhost'
+# Matches per wishlist, in creation order; ties on 3 and 0
+MATCH_COUNTS = [3, 0, 5, 1, 3, 0, 2]
+failures = []
+
+
+def check(label, condition):
+    print(f"  {'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures.append(label)
+
+
+print("=" * 60)
+print("Wishlist listing and export")
+print("=" * 60)
+
+now = datetime.utcnow()
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    owner = User(username='owner', email='owner@example.com', password_hash='x')
+    other = User(username='other', email='other@example.com', password_hash='x')
+    db.session.add_all([owner, other])
+    db.session.flush()
+    items = [Item(name=f'Item {n}', category='Home', user_id=other.id, status='approved') for n in range(5)]
+    db.session.add_all(items)
+    db.session.flush()
+
+    expected = {}
+    for n, count in enumerate(MATCH_COUNTS):
+        wishlist = Wishlist(user_id=owner.id, search_type='item', item_name=f'wish {n}',
+                            is_active=n % 3 != 0, created_at=now - timedelta(hours=len(MATCH_COUNTS) - n))
+        db.session.add(wishlist)
+        db.session.flush()
+        db.session.add_all([WishlistMatch(wishlist_id=wishlist.id, item_id=items[i].id) for i in range(count)])
+        expected[wishlist.id] = (f'wish {n}', count, wishlist.is_active)
+    # Another user's matches must not leak into the owner's counts
+    stranger = Wishlist(user_id=other.id, search_type='item', item_name='wish 1')
+    db.session.add(stranger)
+    db.session.flush()
+    db.session.add_all([WishlistMatch(wishlist_id=stranger.id, item_id=item.id) for item in items])
+    db.session.commit()
+    owner_id = owner.id
+
+client = app.test_client()
+with client.session_transaction(base_url=BASE_URL) as sess:
+    sess['_user_id'] = str(owner_id)
+    sess['_fresh'] = True
+
+
+def walk(sort_order):
+    rows, page = [], 1
+    while True:
+        data = client.get('/wishlist/view', base_url=BASE_URL, query_string={
+            'sort_by': 'matches', 'sort_order': sort_order, 'per_page': 3, 'page': page}).get_json()
+        rows += [(row['id'], row['match_count']) for row in data['wishlists']]
+        if not data['has_next'] or page > 10:
+            return rows, data['total']
+        page += 1
+
+
+print("\nsorted by matches")
+by_count = sorted(expected, key=lambda wishlist_id: (expected[wishlist_id][1], wishlist_id))
+for sort_order, order in (('desc', by_count[::-1]), ('asc', by_count)):
+    rows, total = walk(sort_order)
+    check(f"{sort_order}: every wishlist once, in match order across pages",
+          [wishlist_id for wishlist_id, _ in rows] == order and total == len(expected))
+    check(f"{sort_order}: match counts are the owner's own",
+          all(count == expected[wishlist_id][1] for wishlist_id, count in rows))
+
+print("\nCSV export")
+response = client.get('/wishlist/export/csv', base_url=BASE_URL, buffered=False)
+chunks = list(response.response)
+body = b''.join(chunks).decode('utf-8')
+response.close()
+check("export is streamed", response.status_code == 200 and response.is_streamed
+      and response.mimetype == 'text/csv')
+check("rows sent in batches", len(chunks) >= 1 + len(expected) // 2)
+records = list(csv.reader(io.StringIO(body)))
+header, data_rows = records[0], records[1:]
+matches_col = header.index('Matches Found')
+newest_first = [expected[wishlist_id] for wishlist_id in sorted(expected, reverse=True)]
+check("one row per wishlist, newest first", [row[0] for row in data_rows] == [name for name, _, _ in newest_first])
+check("match counts in the export", [int(row[matches_col]) for row in data_rows] == [count for _, count, _ in newest_first])
+
+response = client.get('/wishlist/export/csv?status=paused', base_url=BASE_URL)
+paused = [row[0] for row in list(csv.reader(io.StringIO(response.get_data(as_text=True))))[1:]]
+check("filters apply to the export", sorted(paused) == sorted(name for name, _, active in expected.values() if not active))
+response = client.get('/wishlist/export/csv?search=nothing-like-this', base_url=BASE_URL)
+check("nothing to export is a 404", response.status_code == 404)
+
+with app.app_context():
+    db.session.remove()
+    db.drop_all()
+
+print()
+if failures:
+    print(f"✗ {len(failures)} check(s) failed")
+    sys.exit(1)
+print("✓ Wishlists sort by match count across pages and export as a stream")
+sys.exit(0)
@@ -9,7 +9,6 @@ from datetime import datetime, timezone
 from logger_config import setup_logger
 from rank_rewards import get_tier_info, get_tier_badge
 from routes.auth import send_email_async
-from flask import render_template
 
 logger = setup_logger(__name__)
 
@@ -93,6 +92,49 @@ def get_points_to_next_level(current_points):
     return max(0, points_needed)
 
 
+def _award_points(user, points):
+    """
+    Add points to user with an atomic UPDATE and apply any level up.
+    
+    The level is derived from the total the UPDATE returns, so concurrent
+    awards each see their own increment; level-up credits are added the same
+    way. Does not commit. Returns level_up info dict or None.
+    """
+    new_points = User.add_trading_points(user.id, points)
+    if new_points is None:
+        raise ValueError(f"User {user.id} not found")
+    return _apply_level_up(user.id, new_points - points, new_points)
+
+
+def _apply_level_up(user_id, old_points, new_points):
+    """Raise level and award level-up credits if new_points crosses a threshold. Returns level_up info or None."""
+    old_level = calculate_level_from_points(old_points)
+    new_level = calculate_level_from_points(new_points)
+    if new_level <= old_level:
+        return None
+    
+    old_tier = get_level_tier(old_level)
+    new_tier = get_level_tier(new_level)
+    User.raise_level(user_id, new_level, new_tier)
+    # Award credits for level up
+    User.change_credits(user_id, CREDITS_PER_LEVEL_UP)
+    
+    logger.info(
+        f"User leveled up! User ID: {user_id}, "
+        f"Level: {old_level} → {new_level} ({new_tier}), "
+        f"Points: {old_points} → {new_points}, "
+        f"Credits Awarded: {CREDITS_PER_LEVEL_UP}"
+    )
+    return {
+        'old_level': old_level,
+        'new_level': new_level,
+        'old_tier': old_tier,
+        'new_tier': new_tier,
+        'credits_awarded': CREDITS_PER_LEVEL_UP,
+        'points': new_points
+    }
+
+
 def award_points_for_upload(user, item_name):
     """
     Award points when user's item gets approved
@@ -105,56 +147,43 @@ def award_points_for_upload(user, item_name):
         dict with level_up info if applicable
     """
     try:
-        old_level = user.level
-        old_points = user.trading_points
-        old_tier = user.tier if hasattr(user, 'tier') else get_level_tier(old_level)
-        
-        # Award points
-        user.trading_points += POINTS_PER_UPLOAD_APPROVAL
-        new_level = calculate_level_from_points(user.trading_points)
-        user.level = new_level
-        new_tier = get_level_tier(new_level)
-        user.tier = new_tier  # Update tier field
-        
-        db.session.add(user)
-        db.session.flush()  # Flush to get updated values
-        
-        level_up_info = None
-        if new_level > old_level:
-            # Award credits for level up
-            user.credits += CREDITS_PER_LEVEL_UP
-            db.session.add(user)
-            
-            level_up_info = {
-                'old_level': old_level,
-                'new_level': new_level,
-                'old_tier': old_tier,
-                'new_tier': new_tier,
-                'credits_awarded': CREDITS_PER_LEVEL_UP,
-                'points': user.trading_points
-            }
-            
-            logger.info(
-                f"User leveled up! User ID: {user.id}, Username: {user.username}, "
-                f"Level: {old_level} → {new_level} ({new_tier}), "
-                f"Points: {old_points} → {user.trading_points}, "
-                f"Credits Awarded: {CREDITS_PER_LEVEL_UP}"
-            )
-        else:
+        level_up_info = _award_points(user, POINTS_PER_UPLOAD_APPROVAL)
+        if not level_up_info:
             logger.info(
                 f"Points awarded for upload approval. User ID: {user.id}, Username: {user.username}, "
                 f"Item: '{item_name}', Points: {POINTS_PER_UPLOAD_APPROVAL}, "
                 f"Total Points: {user.trading_points}"
             )
-        
         return level_up_info
         
     except Exception as e:
+        # The caller owns the transaction; a failed statement makes its commit fail
         logger.error(f"Error awarding upload points to user {user.id}: {str(e)}", exc_info=True)
-        db.session.rollback()
         return None
 
 
+def award_points_for_uploads(approvals):
+    """
+    Award upload points for many approvals at once (bulk approval).
+    
+    Args:
+        approvals: {user_id: number of items approved}
+        
+    Returns:
+        {user_id: level_up info} for the users who levelled up. Does not commit.
+    """
+    totals = User.add_trading_points_many({
+        user_id: count * POINTS_PER_UPLOAD_APPROVAL for user_id, count in approvals.items()
+    })
+    level_ups = {}
+    for user_id, new_points in totals.items():
+        level_up_info = _apply_level_up(user_id, new_points - approvals[user_id] * POINTS_PER_UPLOAD_APPROVAL, new_points)
+        if level_up_info:
+            level_ups[user_id] = level_up_info
+    logger.info(f"Upload points awarded in bulk - Users: {len(totals)}, Level ups: {len(level_ups)}")
+    return level_ups
+
+
 def award_points_for_purchase(user, order_number):
     """
     Award points when user completes a purchase
@@ -167,59 +196,27 @@ def award_points_for_purchase(user, order_number):
         dict with level_up info if applicable
     """
     try:
-        old_level = user.level
-        old_points = user.trading_points
-        old_tier = user.tier if hasattr(user, 'tier') else get_level_tier(old_level)
-        
-        # Award points
-        user.trading_points += POINTS_PER_PURCHASE
-        new_level = calculate_level_from_points(user.trading_points)
-        user.level = new_level
-        new_tier = get_level_tier(new_level)
-        user.tier = new_tier  # Update tier field
-        
-        db.session.add(user)
-        db.session.flush()  # Flush to get updated values
-        
-        level_up_info = None
-        if new_level > old_level:
-            # Award credits for level up
-            user.credits += CREDITS_PER_LEVEL_UP
-            db.session.add(user)
-            
-            level_up_info = {
-                'old_level': old_level,
-                'new_level': new_level,
-                'old_tier': old_tier,
-                'new_tier': new_tier,
-                'credits_awarded': CREDITS_PER_LEVEL_UP,
-                'points': user.trading_points
-            }
-            
-            logger.info(
-                f"User leveled up! User ID: {user.id}, Username: {user.username}, "
-                f"Level: {old_level} → {new_level} ({new_tier}), "
-                f"Points: {old_points} → {user.trading_points}, "
-                f"Credits Awarded: {CREDITS_PER_LEVEL_UP}"
-            )
-        else:
+        level_up_info = _award_points(user, POINTS_PER_PURCHASE)
+        if not level_up_info:
             logger.info(
                 f"Points awarded for purchase. User ID: {user.id}, Username: {user.username}, "
                 f"Order: {order_number}, Points: {POINTS_PER_PURCHASE}, "
                 f"Total Points: {user.trading_points}"
             )
-        
         return level_up_info
         
     except Exception as e:
+        # The caller owns the transaction; a failed statement makes its commit fail
         logger.error(f"Error awarding purchase points to user {user.id}: {str(e)}", exc_info=True)
-        db.session.rollback()
         return None
 
 
-def create_level_up_notification(user, level_up_info):
+def add_level_up_notification(user, level_up_info):
     """
-    Create notification and send email for level up
+    Add the level up notification and queue its email in the caller's transaction.
+    
+    Nothing is committed and errors propagate, so the outbox 'level_up' handler
+    either records both (with the event marked done) or retries later.
     
     Args:
         user: User object
@@ -228,62 +225,69 @@ def create_level_up_notification(user, level_up_info):
     if not level_up_info:
         return
     
-    try:
-        new_level = level_up_info['new_level']
-        new_tier = level_up_info['new_tier']
-        credits_awarded = level_up_info['credits_awarded']
-        
-        # Get tier badge icon
-        tier_badge = get_tier_badge(new_level)
-        
-        # Create notification with badge icon
-        message = (
-            f"{tier_badge} Congratulations! You've reached Level {new_level} ({new_tier})! "
-            f"You earned {credits_awarded} credits as a reward. Keep trading to reach higher levels!"
-        )
-        
-        notification = Notification(
-            user_id=user.id,
-            message=message,
-            notification_type='achievement',
-            category='status_update',
-            priority='high',
-            data={
-                'level': new_level,
-                'tier': new_tier,
-                'badge': tier_badge,
-                'credits_awarded': credits_awarded,
-                'total_points': level_up_info['points']
-            }
-        )
-        
-        db.session.add(notification)
-        db.session.commit()
-        
-        # Send email notification
-        email_data = {
-            'username': user.username,
+    new_level = level_up_info['new_level']
+    new_tier = level_up_info['new_tier']
+    credits_awarded = level_up_info['credits_awarded']
+    
+    # Get tier badge icon
+    tier_badge = get_tier_badge(new_level)
+    
+    # Create notification with badge icon
+    message = (
+        f"{tier_badge} Congratulations! You've reached Level {new_level} ({new_tier})! "
+        f"You earned {credits_awarded} credits as a reward. Keep trading to reach higher levels!"
+    )
+    
+    notification = Notification(
+        user_id=user.id,
+        message=message,
+        notification_type='achievement',
+        category='status_update',
+        priority='high',
+        data={
             'level': new_level,
             'tier': new_tier,
+            'badge': tier_badge,
             'credits_awarded': credits_awarded,
-            'total_points': level_up_info['points'],
-            'new_balance': user.credits,
-            'now': datetime.now(timezone.utc)
+            'total_points': level_up_info['points']
         }
-        
-        try:
-            html = render_template('emails/level_up_notification.html', **email_data)
-            send_email_async(
-                subject=f"🎉 Level Up! You've Reached Level {new_level}",
-                recipients=[user.email],
-                html_body=html
-            )
-            logger.info(f"Level up email sent to {user.username}")
-        except Exception as e:
-            logger.warning(f"Could not send level up email to {user.username}: {str(e)}")
-        
-        logger.info(f"Level up notification created for user {user.id} ({user.username}) - Level {new_level}")
-        
+    )
+    db.session.add(notification)
+    
+    # Queue email notification
+    from email_templates import render_email
+    html = render_email(
+        'emails/level_up_notification.html',
+        username=user.username,
+        level=new_level,
+        tier=new_tier,
+        credits_awarded=credits_awarded,
+        total_points=level_up_info['points'],
+        new_balance=user.credits,
+        now=datetime.now(timezone.utc)
+    )
+    send_email_async(
+        subject=f"🎉 Level Up! You've Reached Level {new_level}",
+        recipients=[user.email],
+        html_body=html
+    )
+    
+    logger.info(f"Level up notification created for user {user.id} ({user.username}) - Level {new_level}")
+
+
+def create_level_up_notification(user, level_up_info):
+    """
+    Create notification and send email for level up, inline in a request
+    
+    Failures are logged rather than raised so they don't abort the caller's
+    request; the caller commits.
+    
+    Args:
+        user: User object
+        level_up_info: Dict with level_up details from award_points_*
+    """
+    try:
+        add_level_up_notification(user, level_up_info)
     except Exception as e:
+        # The caller owns the transaction; a failed statement makes its commit fail
         logger.error(f"Error creating level up notification for user {user.id}: {str(e)}", exc_info=True)
-        db.session.rollback()
@@ -0,0 +1,272 @@
+"""
+Digest delivery for wishlist matches.
+
+Matching an approved item only records WishlistMatch rows (with
+notification_sent_at NULL). Delivery groups a user's pending matches into
+one in-app notification and one email, at the frequency the user chose in
+their notification preferences ('wishlist_digest': instant, hourly or
+daily; default instant):
+
+- instant: delivered by the outbox 'wishlist_matching' event right after
+  matching, so a bulk approval gives each user one message, not one per item.
+- hourly / daily: delivered by a scheduled run of
+  `flask wishlist send-digests --frequency hourly` (or daily) from cron.
+
+Each batch of users is one transaction: a conditional UPDATE that claims
+the pending matches (so overlapping runs never deliver the same match
+twice), one INSERT for the notifications, one executemany UPDATE for the
+match rows, one UPDATE for the wishlist counters, and the emails queued on
+the mail queue in the same commit.
+
+Usage:
+    send_digests('instant', user_ids=[...])
+    flask wishlist send-digests --frequency daily
+"""
+
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import update
+from sqlalchemy.orm import contains_eager, joinedload
+
+from app import db
+from models import User, Wishlist, WishlistMatch, Notification
+from mail_queue import queue_email
+from email_templates import render_email
+from logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+wishlist_cli = AppGroup('wishlist', help='Wishlist notification commands.')
+
+DIGEST_FREQUENCIES = ('instant', 'hourly', 'daily')
+DEFAULT_DIGEST_FREQUENCY = 'instant'
+DIGEST_PREFERENCE_KEY = 'wishlist_digest'
+DIGEST_BATCH_USERS = 200
+MAX_ITEMS_IN_MESSAGE = 3
+
+_FREQUENCY_LABELS = {'instant': 'wishlist', 'hourly': 'hourly', 'daily': 'daily'}
+
+
+def digest_frequency(user):
+    """The user's chosen wishlist digest frequency."""
+    value = (user.notification_preferences or {}).get(DIGEST_PREFERENCE_KEY)
+    return value if value in DIGEST_FREQUENCIES else DEFAULT_DIGEST_FREQUENCY
+
+
+def _is_live(match):
+    item = match.item
+    return match.wishlist.is_active and item is not None and item.is_approved and item.is_available
+
+
+def _summary(names):
+    shown = ', '.join(names[:MAX_ITEMS_IN_MESSAGE])
+    if len(names) > MAX_ITEMS_IN_MESSAGE:
+        shown += f' and {len(names) - MAX_ITEMS_IN_MESSAGE} more'
+    return shown
+
+
+def _notification(user, matches):
+    names = [match.item.name for match in matches]
+    if len(matches) == 1:
+        message = f'Wishlist Match! {names[0]} is now available'
+    else:
+        message = f'{len(matches)} Wishlist Matches! {_summary(names)} are now available'
+    return Notification(
+        user_id=user.id,
+        message=message[:255],
+        notification_type='wishlist_match',
+        category='alert',
+        action_url='/wishlist/view',
+        data={
+            'wishlist_ids': sorted({match.wishlist_id for match in matches}),
+            'item_ids': [match.item_id for match in matches],
+        },
+    )
+
+
+def _queue_email(user, matches, frequency):
+    base_url = current_app.config.get('APP_URL', 'https://barterex.com')
+    html = render_email(
+        'emails/wishlist_digest.html',
+        user_name=user.username,
+        matches=[{
+            'wishlist_name': match.wishlist.item_name if match.wishlist.search_type == 'item' else match.wishlist.category,
+            'item_name': match.item.name,
+            'item_category': match.item.category or 'Uncategorized',
+            'item_location': match.item.location,
+            'item_value': match.item.value,
+            'view_item_url': f"{base_url}/item/{match.item_id}",
+        } for match in matches],
+        frequency_label=_FREQUENCY_LABELS[frequency],
+        dashboard_url=f"{base_url}/dashboard",
+        wishlist_url=f"{base_url}/wishlist",
+        marketplace_url=f"{base_url}/marketplace",
+        unsubscribe_url=f"{base_url}/settings/notifications",
+    )
+    if len(matches) == 1:
+        subject = f'Wishlist Alert: {matches[0].item.name} is now available!'
+    else:
+        subject = f'{len(matches)} wishlist matches are now available on Barterex'
+    queue_email(subject, [user.email], html)
+
+
+def _claim_pending(user_ids, now):
+    """
+    Mark the users' pending matches as sent and return the ids this run won.
+
+    Conditional on notification_sent_at still being NULL, so when two runs
+    (outbox threads in different workers) overlap, each match is claimed by
+    exactly one of them; the loser's UPDATE waits for the winner's commit and
+    then matches nothing.
+    """
+    candidate_ids = [row[0] for row in db.session.query(WishlistMatch.id).join(WishlistMatch.wishlist).filter(
+        Wishlist.user_id.in_(user_ids),
+        WishlistMatch.notification_sent_at == None,
+    )]
+    if not candidate_ids:
+        return []
+    stmt = (
+        update(WishlistMatch)
+        .where(WishlistMatch.id.in_(candidate_ids), WishlistMatch.notification_sent_at == None)
+        .values(notification_sent_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.get_bind().dialect.update_returning:
+        return db.session.execute(stmt.returning(WishlistMatch.id)).scalars().all()
+    # No RETURNING: claim row by row, as outbox.claim_due does
+    return [
+        match_id for match_id in candidate_ids
+        if db.session.execute(
+            update(WishlistMatch)
+            .where(WishlistMatch.id == match_id, WishlistMatch.notification_sent_at == None)
+            .values(notification_sent_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    ]
+
+
+def _deliver(users, frequency):
+    """Send one digest per user for the pending matches this run claims. Returns the number of matches handled."""
+    users_by_id = {user.id: user for user in users}
+    now = datetime.utcnow()
+    claimed = _claim_pending(list(users_by_id), now)
+    if not claimed:
+        return 0
+    pending = WishlistMatch.query.join(WishlistMatch.wishlist).options(
+        contains_eager(WishlistMatch.wishlist),
+        joinedload(WishlistMatch.item),
+    ).filter(
+        WishlistMatch.id.in_(claimed),
+    ).order_by(Wishlist.user_id, WishlistMatch.id).populate_existing().all()
+
+    by_user = defaultdict(list)
+    for match in pending:
+        by_user[match.wishlist.user_id].append(match)
+
+    notifications = {}
+    notified = set()
+    emailed = set()
+    for user_id, matches in by_user.items():
+        user = users_by_id[user_id]
+        live = [match for match in matches if _is_live(match)]
+        app_matches = [match for match in live if match.wishlist.notify_via_app]
+        email_matches = [match for match in live if match.wishlist.notify_via_email]
+        if app_matches:
+            notifications[user_id] = _notification(user, app_matches)
+            notified.update(match.id for match in app_matches)
+        if email_matches and user.email:
+            _queue_email(user, email_matches, frequency)
+            emailed.update(match.id for match in email_matches)
+
+    # One multi-row INSERT for every user's notification
+    db.session.add_all(notifications.values())
+    db.session.flush()
+
+    match_rows = []
+    wishlist_counts = Counter()
+    for user_id, matches in by_user.items():
+        notification = notifications.get(user_id)
+        for match in matches:
+            in_app = match.id in notified
+            match_rows.append({
+                'id': match.id,
+                'notification_sent_at': now,
+                'email_sent': match.id in emailed,
+                'app_notification_sent': in_app,
+                'notification_id': notification.id if in_app else None,
+            })
+            if in_app or match.id in emailed:
+                wishlist_counts[match.wishlist_id] += 1
+
+    # Pending matches that are no longer live (item sold, wishlist paused) are closed without notifying
+    if match_rows:
+        db.session.execute(update(WishlistMatch), match_rows)
+    if wishlist_counts:
+        db.session.execute(
+            update(Wishlist)
+            .where(Wishlist.id.in_(wishlist_counts))
+            .values(
+                last_notified_at=now,
+                notification_count=db.func.coalesce(Wishlist.notification_count, 0)
+                + db.case(dict(wishlist_counts), value=Wishlist.id, else_=0),
+            )
+            # Counters only: the wishlist index does not need a rebuild
+            .execution_options(synchronize_session=False, wishlist_index_unchanged=True)
+        )
+    return len(match_rows)
+
+
+def send_digests(frequency, user_ids=None, batch_users=DIGEST_BATCH_USERS):
+    """
+    Deliver pending wishlist matches for users whose digest frequency is frequency.
+
+    Limited to user_ids when given. Commits once per batch of users.
+    Returns (users notified, matches handled).
+    """
+    if frequency not in DIGEST_FREQUENCIES:
+        raise ValueError(f"Unknown digest frequency: {frequency}")
+
+    total_users = total_matches = 0
+    after_user_id = 0
+    while True:
+        query = db.session.query(Wishlist.user_id).join(WishlistMatch, WishlistMatch.wishlist_id == Wishlist.id).filter(
+            WishlistMatch.notification_sent_at == None,
+            Wishlist.user_id > after_user_id,
+        )
+        if user_ids is not None:
+            query = query.filter(Wishlist.user_id.in_(user_ids))
+        batch = [row[0] for row in query.distinct().order_by(Wishlist.user_id).limit(batch_users)]
+        if not batch:
+            break
+        after_user_id = batch[-1]
+
+        users = [user for user in User.query.filter(User.id.in_(batch)) if digest_frequency(user) == frequency]
+        if users:
+            try:
+                total_matches += _deliver(users, frequency)
+                db.session.commit()
+                total_users += len(users)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Wishlist digest batch failed ({frequency}, users {batch[0]}-{batch[-1]}): {e}", exc_info=True)
+                raise
+
+    if total_users:
+        logger.info(f"Wishlist digests sent - Frequency: {frequency}, Users: {total_users}, Matches: {total_matches}")
+    return total_users, total_matches
+
+
+# ==================== CLI ====================
+
+@wishlist_cli.command('send-digests')
+@click.option('--frequency', type=click.Choice(DIGEST_FREQUENCIES), required=True,
+              help='Deliver for users with this digest setting (schedule hourly and daily runs from cron).')
+@click.option('--batch-size', default=DIGEST_BATCH_USERS, show_default=True, help='Users per transaction.')
+def send_digests_command(frequency, batch_size):
+    """Send pending wishlist match digests."""
+    users, matches = send_digests(frequency, batch_users=batch_size)
+    click.echo(f"Sent {frequency} wishlist digests to {users} user(s) covering {matches} match(es)")